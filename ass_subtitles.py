@@ -0,0 +1,119 @@
+import os
+import math
+import logging
+from pathlib import Path
+from subtitle_track import SubtitleTrack
+
+logger = logging.getLogger(__name__)
+
+class AssSubtitleWriter:
+    """
+    Запись субтитров по словам в ASS файл для рендера через libass (фильтр ass).
+
+    Один файл на чанк вместо отдельного drawtext на каждое слово:
+    - тайминги слов берутся из SubtitleGenerator без изменений
+    - анимация подпрыгивания y = h-600-20*sin(2*PI*t*3) повторяется тегами \\move
+    """
+    def __init__(self, font_path: str = "Obelix Pro.ttf", width: int = 1080, height: int = 1920):
+        self.font_path = font_path
+        self.width = width
+        self.height = height
+
+        # Те же параметры, что и у drawtext в VideoEditor._add_animated_subtitles
+        self.fontsize = 70
+        self.border = 3
+        self.base_offset = 600     # y = h - 600
+        self.bounce_amplitude = 20 # 20 * sin(...)
+        self.bounce_frequency = 3  # 3 подпрыгивания в секунду
+
+        # Анимация кусочно-линейная: отрезок на четверть периода синусоиды
+        self.bounce_step = 1.0 / (self.bounce_frequency * 4)
+
+    @property
+    def font_name(self) -> str:
+        """Имя шрифта для стиля (libass ищет его в fontsdir)"""
+        return Path(self.font_path).stem
+
+    @property
+    def fonts_dir(self) -> str:
+        """Директория со шрифтом для параметра fontsdir фильтра ass"""
+        return str(Path(self.font_path).resolve().parent)
+
+    def write(self, subtitles: SubtitleTrack, output_path: str) -> str:
+        """Запись всех субтитров чанка в один ASS файл"""
+        lines = [
+            "[Script Info]",
+            "ScriptType: v4.00+",
+            f"PlayResX: {self.width}",
+            f"PlayResY: {self.height}",
+            "WrapStyle: 2",
+            "ScaledBorderAndShadow: yes",
+            "",
+            "[V4+ Styles]",
+            "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+            "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+            "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+            f"Style: Word,{self.font_name},{self.fontsize},&H00FFFFFF,&H00FFFFFF,&H00000000,&H00000000,"
+            f"0,0,0,0,100,100,0,0,1,{self.border},0,8,0,0,0,1",
+            "",
+            "[Events]",
+            "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+        ]
+
+        events = 0
+        for sub in subtitles:
+            text = self._escape_text(sub.text)
+            if not text:
+                continue
+            for start, end, y_start, y_end in self._bounce_segments(sub.start, sub.end):
+                move = f"\\move({self.width // 2},{y_start:.1f},{self.width // 2},{y_end:.1f})"
+                lines.append(
+                    f"Dialogue: 0,{self._seconds_to_ass_time(start)},{self._seconds_to_ass_time(end)},"
+                    f"Word,,0,0,0,,{{{move}}}{text}"
+                )
+                events += 1
+
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+        logger.info(f"📝 ASS субтитры записаны: {output_path} ({events} событий)")
+        return output_path
+
+    def _bounce_y(self, t: float) -> float:
+        """Позиция верхнего края текста, как в выражении drawtext"""
+        return self.height - self.base_offset - self.bounce_amplitude * math.sin(2 * math.pi * t * self.bounce_frequency)
+
+    def _bounce_segments(self, start: float, end: float) -> list:
+        """Разбиение интервала слова на отрезки по четверти периода подпрыгивания"""
+        segments = []
+        if end <= start:
+            return segments
+
+        # Внутренние границы выровнены по абсолютному времени, как и t в drawtext
+        t = start
+        boundary = (math.floor(start / self.bounce_step) + 1) * self.bounce_step
+        while t < end:
+            next_t = min(boundary, end)
+            segments.append((t, next_t, self._bounce_y(t), self._bounce_y(next_t)))
+            t = next_t
+            boundary += self.bounce_step
+        return segments
+
+    def _escape_text(self, text: str) -> str:
+        """Удаление символов, которые libass трактует как теги"""
+        return (
+            text.strip()
+            .replace('\\', '/')
+            .replace('{', '(')
+            .replace('}', ')')
+            .replace('\n', ' ')
+        )
+
+    def _seconds_to_ass_time(self, seconds: float) -> str:
+        """Конвертация секунд в формат времени ASS (H:MM:SS.cc)"""
+        centis = int(round(max(0.0, seconds) * 100))
+        hours = centis // 360000
+        minutes = (centis % 360000) // 6000
+        secs = (centis % 6000) // 100
+        return f"{hours}:{minutes:02d}:{secs:02d}.{centis % 100:02d}"
@@ -0,0 +1,71 @@
+import os
+import hashlib
+import logging
+import subprocess
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+class PcmAudio:
+    """
+    Звук исходника в формате входа Whisper (16 кГц, моно, float32) в файле на диске.
+
+    Файл отображается в память (memmap), slice() возвращает представление NumPy без копирования:
+    один проход ffmpeg по исходнику, дальше любые чанки/окна читаются из общего буфера.
+    Режим 'c' (копирование при записи): массив доступен на запись, поэтому torch.from_numpy
+    в openai-whisper не ругается на read-only буфер, а страницы файла не копируются без нужды.
+    """
+    def __init__(self, path: str, samples: np.ndarray):
+        self.path = path
+        self.samples = samples
+        self._fingerprint = None
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / SAMPLE_RATE
+
+    def slice(self, start: float = 0.0, duration: float = None) -> np.ndarray:
+        """Диапазон [start, start + duration) секунд - представление без копирования"""
+        begin = max(0, int(round(start * SAMPLE_RATE)))
+        end = len(self.samples) if duration is None else min(len(self.samples), begin + int(round(duration * SAMPLE_RATE)))
+        return self.samples[begin:end]
+
+    def fingerprint(self) -> str:
+        """SHA-256 декодированного звука: совпадает у повторно присланного видео независимо от имени файла"""
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            block = SAMPLE_RATE * 60
+            for begin in range(0, len(self.samples), block):
+                digest.update(self.samples[begin:begin + block])
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+    
+    def close(self, remove: bool = True):
+        """
+        Удаление файла. Отображение освобождается сборщиком мусора, когда не останется срезов
+        (удаленный файл остается доступен уже открытым отображениям).
+        """
+        self.samples = np.zeros(0, np.float32)
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+def extract_pcm(video_path: str, output_path: str) -> PcmAudio:
+    """Один проход ffmpeg: весь звук исходника -> f32le 16 кГц моно в output_path, отображенный в память"""
+    cmd = [
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-i', video_path,
+        '-vn', '-f', 'f32le', '-acodec', 'pcm_f32le', '-ac', '1', '-ar', str(SAMPLE_RATE),
+        '-y', output_path
+    ]
+    subprocess.run(cmd, capture_output=True, check=True)
+    size = os.path.getsize(output_path)
+    if size == 0:
+        # Видео без звука: пустой буфер (memmap нулевой длины не создается)
+        samples = np.zeros(0, np.float32)
+    else:
+        samples = np.memmap(output_path, dtype=np.float32, mode='c')
+    audio = PcmAudio(output_path, samples)
+    logger.info(f"🔊 Звук извлечен за один проход: {audio.duration:.1f} сек, {size / 1024 / 1024:.1f} МБ PCM")
+    return audio
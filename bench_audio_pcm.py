@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк подготовки звука для Whisper: отдельное декодирование каждого чанка (как делал Whisper
+для пути к файлу чанка) против одного прохода ffmpeg в PCM-буфер и срезов без копирования.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+import resource
+import numpy as np
+from pathlib import Path
+from audio_pcm import extract_pcm
+from subtitle_generator import SubtitleGenerator
+from bench_single_pass import generate_source
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+MB = 1024 * 1024
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def run_per_chunk(generator: SubtitleGenerator, source: str, ranges: list) -> dict:
+    """Каждый чанк декодируется и ресемплируется своим процессом ffmpeg"""
+    cpu_before = children_cpu()
+    started = time.perf_counter()
+    total = 0
+    for start, duration in ranges:
+        total += len(generator._load_audio_range(source, start, duration))
+    return {'mode': 'по чанкам', 'decodes': len(ranges), 'wall': time.perf_counter() - started,
+            'cpu': children_cpu() - cpu_before, 'samples': total, 'zero_copy': False}
+
+def run_single_pass(source: str, ranges: list, workdir: Path) -> dict:
+    """Один проход ffmpeg в memmap, чанки - представления общего буфера"""
+    cpu_before = children_cpu()
+    started = time.perf_counter()
+    audio = extract_pcm(source, str(workdir / 'bench_audio.f32'))
+    slices = [audio.slice(start, duration) for start, duration in ranges]
+    wall = time.perf_counter() - started
+    zero_copy = all(np.shares_memory(s, audio.samples) for s in slices if len(s))
+    result = {'mode': 'один проход', 'decodes': 1, 'wall': wall, 'cpu': children_cpu() - cpu_before,
+              'samples': sum(len(s) for s in slices), 'zero_copy': zero_copy}
+    audio.close()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=int, default=1800, help='Длительность синтетического исходника, сек')
+    parser.add_argument('--chunk-duration', type=int, default=300, help='Длительность чанка, сек')
+    parser.add_argument('--size', default='1280x720', help='Разрешение исходника')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--workdir', default='bench_work')
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir)
+    workdir.mkdir(exist_ok=True)
+    width, height = map(int, args.size.split('x'))
+    source = workdir / f"source_{args.size}_{args.duration}s.mp4"
+
+    if not source.exists():
+        print(f"🎬 Генерируем синтетический исходник {args.size}, {args.duration} сек...")
+        generate_source(source, args.duration, width, height, args.fps)
+
+    ranges = [(start, min(args.chunk_duration, args.duration - start))
+              for start in range(0, args.duration, args.chunk_duration)]
+    print(f"📦 Исходник {args.duration} сек, {len(ranges)} чанков по {args.chunk_duration} сек")
+
+    results = [
+        run_per_chunk(SubtitleGenerator(), str(source), ranges),
+        run_single_pass(str(source), ranges, workdir)
+    ]
+
+    print("\n📊 РЕЗУЛЬТАТЫ")
+    print(f"{'режим':<12} {'проходов ffmpeg':>16} {'время, с':>9} {'cpu, с':>8} {'сэмплов':>11} {'без копий':>10}")
+    for r in results:
+        print(f"{r['mode']:<12} {r['decodes']:>16} {r['wall']:>9.2f} {r['cpu']:>8.2f} {r['samples']:>11} "
+              f"{'да' if r['zero_copy'] else 'нет':>10}")
+
+    per_chunk, single = results
+    print(f"\n🚀 Один проход: x{per_chunk['wall'] / max(single['wall'], 1e-6):.2f} по времени, "
+          f"x{per_chunk['cpu'] / max(single['cpu'], 1e-6):.2f} по CPU ffmpeg")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
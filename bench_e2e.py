@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Сквозной бенчмарк конвейера без сети: синтетические исходники (lavfi testsrc2 + синус или
+речеподобный шум) разных разрешений, пропорций, fps и длительностей проходят через
+VideoProcessor.process_video_file с локальным сервером Drive (fake_drive_server.py) и заглушкой
+распознавания. Для каждого сценария - время и CPU по стадиям (CPU ffmpeg - по спанам трассы задачи).
+
+Результаты пишутся в JSON и сравниваются с сохраненным базовым прогоном: рост времени или CPU
+сверх допуска - регрессия, код выхода 1.
+
+    python bench_e2e.py --scenarios 480p,720p --update-baseline   # базовый прогон
+    python bench_e2e.py --scenarios 480p,720p                     # сравнение с ним
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import platform
+import resource
+import subprocess
+from pathlib import Path
+from fake_drive_server import FakeDriveServer
+from subtitle_track import SubtitleTrack
+from tracing import tracer
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+MB = 1024 * 1024
+
+# Сценарии: разрешение, fps, звук
+SCENARIOS = {
+    '480p': {'size': '854x480', 'fps': 30, 'audio': 'sine'},
+    '720p': {'size': '1280x720', 'fps': 30, 'audio': 'speech'},
+    '1080p60': {'size': '1920x1080', 'fps': 60, 'audio': 'speech'},
+    'vertical': {'size': '1080x1920', 'fps': 30, 'audio': 'speech'},
+    'square': {'size': '1080x1080', 'fps': 25, 'audio': 'sine'},
+    '4k': {'size': '3840x2160', 'fps': 30, 'audio': 'speech'},
+}
+
+# Метрики сценария, рост которых считается регрессией
+COMPARED = ('wall', 'cpu')
+
+def audio_source(kind: str, duration: int) -> str:
+    """lavfi звук: синус или речеподобный шум (слоги ~4 Гц, паузы между фразами, полоса речи)"""
+    if kind == 'sine':
+        return f"sine=frequency=440:duration={duration}"
+    return (f"anoisesrc=color=pink:amplitude=0.5:duration={duration},"
+            "volume='(0.3+0.7*abs(sin(2*PI*2*t)))*gt(sin(2*PI*0.2*t),-0.6)':eval=frame,"
+            "highpass=f=120,lowpass=f=3400")
+
+def generate_source(path: Path, scenario: dict, duration: int):
+    """Синтетическое видео через lavfi: testsrc2 + звук сценария"""
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size={scenario['size']}:rate={scenario['fps']}:duration={duration}",
+        '-f', 'lavfi', '-i', audio_source(scenario['audio'], duration),
+        '-c:v', 'libx264', '-preset', 'veryfast', '-c:a', 'aac', '-shortest',
+        '-y', str(path)
+    ]
+    subprocess.run(cmd, check=True)
+
+def stub_transcriber(processor, words_per_second: float):
+    """Распознавание без Whisper: детерминированные слова с заданной плотностью во времени исходника"""
+    async def generate(video_path: str, start: float = None, duration: float = None, audio=None):
+        start = start or 0.0
+        if duration is None:
+            duration = processor.video_editor.get_video_info(video_path)['duration'] - start
+        step = 1.0 / words_per_second
+        count = int(duration * words_per_second)
+        return SubtitleTrack.from_words([
+            {'start': start + i * step, 'end': start + (i + 0.9) * step, 'text': f"слово{i}"} for i in range(count)
+        ])
+
+    processor.subtitle_generator.generate = generate
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def ffmpeg_version() -> str:
+    try:
+        output = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
+        return output.split('\n')[0]
+    except OSError:
+        return None
+
+def stage_cpu(trace, stages: set) -> dict:
+    """CPU процессов ffmpeg по стадиям: спан ffmpeg засчитывается стадии-предку (иначе - other)"""
+    by_id = {span.id: span for span in trace.spans}
+    cpu = {}
+    for span in trace.spans:
+        if span.name != 'ffmpeg' or span.attrs.get('cpu') is None:
+            continue
+        stage = 'other'
+        parent = by_id.get(span.parent)
+        while parent is not None:
+            if parent.name in stages:
+                stage = parent.name
+                break
+            parent = by_id.get(parent.parent)
+        cpu[stage] = cpu.get(stage, 0.0) + span.attrs['cpu']
+    return cpu
+
+async def run_scenario(processor, name: str, source: Path, clip_duration: int) -> dict:
+    """Один прогон задачи: итог, время и CPU процесса и ffmpeg, стадии, критический путь"""
+    traces = {}
+    finish = tracer.finish
+
+    def keep_trace(job_id: str):
+        trace = tracer.get(job_id)
+        summary = finish(job_id)
+        traces[job_id] = (trace, summary)
+        return summary
+
+    tracer.finish = keep_trace
+    python_before = time.process_time()
+    children_before = children_cpu()
+    started = time.perf_counter()
+    try:
+        result = await processor.process_video_file(str(source), {'duration': clip_duration})
+    finally:
+        tracer.finish = finish
+    wall = time.perf_counter() - started
+    python_cpu = time.process_time() - python_before
+    children = children_cpu() - children_before
+
+    links_file = result.get('links_file')
+    if links_file and os.path.exists(links_file):
+        os.remove(links_file)
+    if not result.get('success') or not traces:
+        return {'success': False, 'error': result.get('error'), 'wall': wall}
+
+    (trace, summary), = traces.values()
+    report = result['stages']
+    cpu = stage_cpu(trace, set(report))
+    stages = {stage: {'wall': report[stage]['busy'], 'cpu': cpu.get(stage, 0.0), 'items': report[stage]['items'],
+                      'utilization': report[stage]['utilization']} for stage in report}
+    uploaded = sum(1 for r in result['upload_results'] if r.get('success'))
+    return {
+        'success': True,
+        'clips': result['total_clips'],
+        'uploaded': uploaded,
+        'wall': wall,
+        'cpu': python_cpu + children,
+        'python_cpu': python_cpu,
+        'ffmpeg_cpu': children,
+        'other_cpu': cpu.get('other', 0.0),
+        'stages': stages,
+        'critical_path': [[name, round(seconds, 3)] for name, seconds, _ in summary['critical_path']]
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta: float) -> list:
+    """Регрессии относительно базового прогона: метрика выросла больше чем на tolerance и min_delta секунд"""
+    regressions = []
+    if baseline.get('settings') != results['settings']:
+        print(f"⚠️ Настройки базового прогона отличаются ({baseline.get('settings')}), сравнение пропущено")
+        return regressions
+    if baseline.get('host', {}).get('cpu_count') != results['host']['cpu_count']:
+        print(f"⚠️ Базовый прогон снят на другом числе ядер ({baseline['host'].get('cpu_count')})")
+
+    print("\n📊 СРАВНЕНИЕ С БАЗОВЫМ ПРОГОНОМ")
+    print(f"{'сценарий':<10} {'метрика':<18} {'база':>9} {'сейчас':>9} {'изменение':>10}")
+    for name, current in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base or not base.get('success') or not current.get('success'):
+            continue
+        pairs = [(metric, base[metric], current[metric]) for metric in COMPARED]
+        for stage, stats in current['stages'].items():
+            if stage in base['stages']:
+                pairs += [(f"{stage}.{metric}", base['stages'][stage][metric], stats[metric]) for metric in COMPARED]
+        for metric, old, new in pairs:
+            change = (new - old) / old if old > 0 else 0.0
+            regressed = new - old > min_delta and change > tolerance
+            if regressed or metric in COMPARED:
+                print(f"{name:<10} {metric:<18} {old:>9.2f} {new:>9.2f} {change * 100:>+9.1f}%" + (" ❌" if regressed else ""))
+            if regressed:
+                regressions.append(f"{name} {metric}: {old:.2f} -> {new:.2f} ({change * 100:+.1f}%)")
+    return regressions
+
+def print_results(results: dict):
+    print("\n📊 РЕЗУЛЬТАТЫ")
+    print(f"{'сценарий':<10} {'размер':>10} {'fps':>4} {'клипов':>7} {'wall, с':>9} {'cpu, с':>9} {'x реалтайм':>11}  стадии (wall/cpu, с)")
+    duration = results['settings']['duration']
+    for name, r in results['scenarios'].items():
+        scenario = SCENARIOS[name]
+        if not r['success']:
+            print(f"{name:<10} {scenario['size']:>10} {scenario['fps']:>4} ❌ {r.get('error')}")
+            continue
+        stages = ', '.join(f"{stage} {s['wall']:.1f}/{s['cpu']:.1f}" for stage, s in r['stages'].items())
+        print(f"{name:<10} {scenario['size']:>10} {scenario['fps']:>4} {r['clips']:>7} {r['wall']:>9.1f} "
+              f"{r['cpu']:>9.1f} {duration / r['wall']:>11.2f}  {stages}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"Сценарии через запятую: {', '.join(SCENARIOS)}")
+    parser.add_argument('--duration', type=int, default=60, help='Длительность исходника, сек')
+    parser.add_argument('--clip-duration', type=int, default=20, help='Длительность клипа, сек')
+    parser.add_argument('--words-per-second', type=float, default=2.5, help='Плотность слов заглушки распознавания')
+    parser.add_argument('--repeat', type=int, default=1, help='Прогонов сценария (берется самый быстрый)')
+    parser.add_argument('--drive-bandwidth', type=float, default=None, help='Скорость локального Drive, МБ/с на соединение')
+    parser.add_argument('--workdir', default='bench_work')
+    parser.add_argument('--output', default='bench_e2e_results.json', help='JSON с результатами прогона')
+    parser.add_argument('--baseline', default='bench_e2e_baseline.json', help='JSON базового прогона')
+    parser.add_argument('--update-baseline', action='store_true', help='Сохранить прогон как базовый')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Допустимый рост метрики (доля)')
+    parser.add_argument('--min-delta', type=float, default=0.5, help='Рост меньше этого числа секунд - шум')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print(f"❌ Неизвестные сценарии: {', '.join(unknown)}")
+        return 2
+
+    workdir = Path(args.workdir).resolve()
+    workdir.mkdir(exist_ok=True)
+    # Журнал задач и рабочие директории - в директории бенчмарка, не рядом с ботом
+    os.environ['JOB_MANIFEST_DB'] = str(workdir / 'bench_jobs.db')
+    os.environ['WORKSPACE_DIR'] = str(workdir / 'work')
+    drive = FakeDriveServer(bandwidth=int(args.drive_bandwidth * MB) if args.drive_bandwidth else None).start()
+    os.environ['GOOGLE_DRIVE_API_ENDPOINT'] = drive.endpoint
+
+    results = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'host': {'cpu_count': os.cpu_count(), 'platform': platform.platform(), 'python': platform.python_version(),
+                 'ffmpeg': ffmpeg_version()},
+        'settings': {'duration': args.duration, 'clip_duration': args.clip_duration,
+                     'words_per_second': args.words_per_second, 'drive_bandwidth': args.drive_bandwidth},
+        'scenarios': {}
+    }
+    try:
+        from video_processor import VideoProcessor
+
+        processor = VideoProcessor()
+        stub_transcriber(processor, args.words_per_second)
+        for name in names:
+            scenario = SCENARIOS[name]
+            source = workdir / f"e2e_{name}_{args.duration}s.mp4"
+            if not source.exists():
+                print(f"🎬 Генерируем исходник {name}: {scenario['size']} {scenario['fps']} fps, {args.duration} сек...")
+                generate_source(source, scenario, args.duration)
+            runs = []
+            for n in range(args.repeat):
+                print(f"⏱️  Сценарий {name}, прогон {n + 1}/{args.repeat}...")
+                runs.append(await run_scenario(processor, name, source, args.clip_duration))
+            best = min(runs, key=lambda r: (not r['success'], r['wall']))
+            best['walls'] = [round(r['wall'], 3) for r in runs]
+            best['expected_clips'] = args.duration // args.clip_duration
+            if best['success'] and (best['clips'] != best['expected_clips'] or best['uploaded'] != best['clips']):
+                best['success'] = False
+                best['error'] = f"клипов {best['clips']}, загружено {best['uploaded']}, ожидалось {best['expected_clips']}"
+            results['scenarios'][name] = best
+    finally:
+        drive.stop()
+
+    print_results(results)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Результаты: {args.output}")
+
+    failed = [name for name, r in results['scenarios'].items() if not r['success']]
+    regressions = []
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 Базовый прогон обновлен: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta)
+    else:
+        print(f"ℹ️ Базового прогона {args.baseline} нет - сравнение пропущено (--update-baseline сохранит этот)")
+
+    if failed:
+        print(f"\n❌ Сценарии с ошибкой: {', '.join(failed)}")
+    if regressions:
+        print(f"\n❌ Регрессии ({len(regressions)}):")
+        for regression in regressions:
+            print(f"   {regression}")
+    if not failed and not regressions:
+        print("\n✅ Регрессий нет")
+    return 1 if failed or regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк рендера клипов на CPU: per_clip (ffmpeg на каждый клип) против single_pass (один проход на чанк)
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import logging
+import resource
+import subprocess
+from pathlib import Path
+from video_editor import VideoEditor
+from capabilities import get_capabilities, set_capabilities
+from subtitle_track import SubtitleTrack
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+def generate_source(path: Path, duration: int, width: int, height: int, fps: int):
+    """Синтетическое видео через lavfi: testsrc2 + синус"""
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-c:a', 'aac', '-shortest',
+        '-y', str(path)
+    ]
+    subprocess.run(cmd, check=True)
+
+def generate_subtitles(duration: int, words_per_second: float) -> SubtitleTrack:
+    """Синтетические субтитры по словам"""
+    subtitles = []
+    step = 1.0 / words_per_second
+    t = 0.0
+    i = 0
+    while t + step <= duration:
+        subtitles.append({'start': t, 'end': t + step * 0.9, 'text': f"слово{i}"})
+        t += step
+        i += 1
+    return SubtitleTrack.from_words(subtitles)
+
+def children_cpu_time() -> float:
+    """CPU время всех завершенных дочерних процессов (ffmpeg)"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+async def run_mode(editor: VideoEditor, mode: str, source: str, clip_duration: int, subtitles: SubtitleTrack, max_parallel: int) -> dict:
+    """Один прогон рендера в заданном режиме"""
+    shutil.rmtree(editor.output_dir, ignore_errors=True)
+    editor.output_dir.mkdir(parents=True, exist_ok=True)
+
+    cpu_before = children_cpu_time()
+    started = time.perf_counter()
+    if mode == 'single_pass':
+        clips = await editor.create_clips_single_pass(source, clip_duration, subtitles)
+    else:
+        clips = await editor.create_clips_parallel(source, clip_duration, subtitles, max_parallel=max_parallel)
+    wall = time.perf_counter() - started
+    cpu = children_cpu_time() - cpu_before
+
+    return {
+        'mode': mode,
+        'clips': len(clips),
+        'wall': wall,
+        'cpu': cpu,
+        'bytes': sum(os.path.getsize(c) for c in clips)
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=int, default=120, help='Длительность синтетического чанка, сек')
+    parser.add_argument('--clip-duration', type=int, default=30, help='Длительность клипа, сек')
+    parser.add_argument('--size', default='1280x720', help='Разрешение исходника')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--words-per-second', type=float, default=2.5)
+    parser.add_argument('--max-parallel', type=int, default=None, help='Потолок параллельности (по умолчанию подбирает планировщик)')
+    parser.add_argument('--workdir', default='bench_work')
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir)
+    workdir.mkdir(exist_ok=True)
+    width, height = map(int, args.size.split('x'))
+    source = workdir / f"source_{args.size}_{args.duration}s.mp4"
+
+    if not source.exists():
+        print(f"🎬 Генерируем синтетический исходник {args.size}, {args.duration} сек...")
+        generate_source(source, args.duration, width, height, args.fps)
+
+    editor = VideoEditor()
+    editor.output_dir = workdir / "output"
+    # Бенчмарк для CPU-узлов: принудительно отключаем GPU пайплайн
+    set_capabilities(get_capabilities().without_gpu())
+
+    subtitles = generate_subtitles(args.duration, args.words_per_second)
+    print(f"📝 Субтитров: {len(subtitles)}, ядер CPU: {os.cpu_count()}")
+
+    results = []
+    for mode in ('per_clip', 'single_pass'):
+        print(f"⏱️  Режим {mode}...")
+        results.append(await run_mode(editor, mode, str(source), args.clip_duration, subtitles, args.max_parallel))
+
+    print("\n📊 РЕЗУЛЬТАТЫ")
+    print(f"{'режим':<12} {'клипов':>7} {'wall, с':>9} {'cpu, с':>9} {'x реалтайм':>11} {'МБ':>8}")
+    for r in results:
+        realtime = (r['clips'] * args.clip_duration) / r['wall'] if r['wall'] > 0 else 0
+        print(f"{r['mode']:<12} {r['clips']:>7} {r['wall']:>9.1f} {r['cpu']:>9.1f} {realtime:>11.2f} {r['bytes'] / 1024 / 1024:>8.1f}")
+
+    per_clip, single_pass = results
+    if single_pass['wall'] > 0:
+        print(f"\n🚀 Ускорение single_pass: x{per_clip['wall'] / single_pass['wall']:.2f} по времени, "
+              f"x{per_clip['cpu'] / max(single_pass['cpu'], 1e-6):.2f} по CPU")
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк рендера субтитров: drawtext (фильтр на каждое слово) против ass (один файл libass)
+Измеряет fps кодирования клипа в зависимости от плотности субтитров
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import logging
+from pathlib import Path
+from video_editor import VideoEditor
+from capabilities import get_capabilities, set_capabilities
+from subtitle_track import SubtitleTrack
+from bench_single_pass import generate_source, generate_subtitles
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+def render_clip(editor: VideoEditor, backend: str, source: str, clip_duration: int, subtitles: SubtitleTrack) -> float:
+    """Рендер одного клипа выбранным бэкендом, возвращает время в секундах"""
+    config = {'subtitle_backend': backend}
+    output_path = str(editor.output_dir / f"bench_{backend}.mp4")
+
+    started = time.perf_counter()
+    subtitles_file = editor._prepare_subtitles_file(subtitles, config, f"bench_{backend}")
+    try:
+        editor._create_styled_clip_sync(source, output_path, 0, clip_duration, subtitles, 1, config, subtitles_file)
+    finally:
+        editor._remove_subtitles_file(subtitles_file)
+    return time.perf_counter() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clip-duration', type=int, default=20, help='Длительность клипа, сек')
+    parser.add_argument('--size', default='1280x720', help='Разрешение исходника')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--densities', default='0,1,2,4,8', help='Слов в секунду через запятую')
+    parser.add_argument('--backends', default='drawtext,ass')
+    parser.add_argument('--workdir', default='bench_work')
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir)
+    workdir.mkdir(exist_ok=True)
+    width, height = map(int, args.size.split('x'))
+    source = workdir / f"source_{args.size}_{args.clip_duration}s.mp4"
+    if not source.exists():
+        print(f"🎬 Генерируем синтетический исходник {args.size}, {args.clip_duration} сек...")
+        generate_source(source, args.clip_duration, width, height, args.fps)
+
+    editor = VideoEditor()
+    editor.output_dir = workdir / "output"
+    editor.output_dir.mkdir(parents=True, exist_ok=True)
+    set_capabilities(get_capabilities().without_gpu())
+
+    frames = args.clip_duration * args.fps
+    backends = args.backends.split(',')
+
+    print(f"\n📊 FPS КОДИРОВАНИЯ ({frames} кадров на клип)")
+    print(f"{'слов/сек':>9} {'слов':>6} " + " ".join(f"{b:>10}" for b in backends))
+    for density in (float(d) for d in args.densities.split(',')):
+        subtitles = generate_subtitles(args.clip_duration, density) if density > 0 else SubtitleTrack()
+        row = []
+        for backend in backends:
+            try:
+                elapsed = render_clip(editor, backend, str(source), args.clip_duration, subtitles)
+                row.append(f"{frames / elapsed:>10.1f}")
+            except Exception as e:
+                logging.error(f"Ошибка рендера {backend}: {e}")
+                row.append(f"{'ошибка':>10}")
+        print(f"{density:>9.1f} {len(subtitles):>6} " + " ".join(row))
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк плотности субтитров: клип с 0..500 словами через _create_styled_clip_sync.
+Для каждого числа слов и бэкенда субтитров (drawtext - узел на слово, ass - один фильтр libass):
+время построения графа ffmpeg-python и компиляции команды, размер argv (весь и самый длинный аргумент -
+в Linux один аргумент не длиннее MAX_ARG_STRLEN = 128 КБ), задержка запуска ffmpeg до первого кадра
+и установившийся fps кодирования.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import subprocess
+from pathlib import Path
+from video_editor import VideoEditor
+from capabilities import get_capabilities, set_capabilities
+from subtitle_track import SubtitleTrack
+from ffmpeg_runner import run_ffmpeg
+from bench_single_pass import generate_source
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+KB = 1024
+# Предел длины одного аргумента командной строки в Linux (32 страницы)
+MAX_ARG_STRLEN = 32 * 4096
+
+class MeasuringScheduler:
+    """
+    Замена планировщика рендера у VideoEditor: execute() засекает конец построения графа,
+    компиляцию команды, размер argv, первый кадр и fps между первым и последним отчетом -progress
+    """
+    def __init__(self, stats_period: float = None):
+        self.stats_period = stats_period
+        self.graph_ready = None
+        self.measure = None
+
+    def execute(self, stream, slot=None, timeout: float = None) -> dict:
+        self.graph_ready = time.perf_counter()
+        cmd = stream.compile() if hasattr(stream, 'compile') else list(stream)
+        compiled = time.perf_counter()
+        if self.stats_period:
+            cmd[1:1] = ['-stats_period', str(self.stats_period)]
+
+        samples = []
+
+        def on_progress(progress):
+            if progress['frame']:
+                samples.append((time.perf_counter(), progress['frame']))
+
+        launched = time.perf_counter()
+        result = run_ffmpeg(cmd, on_progress=on_progress, timeout=timeout)
+        finished = time.perf_counter()
+
+        steady_fps = None
+        if len(samples) >= 3:
+            # Первый отчет с кадрами - конец запуска (разбор графа, открытие входов, инициализация
+            # кодировщика); fps - между первым и последним отчетом
+            (t0, f0), (t1, f1) = samples[0], samples[-1]
+            steady_fps = (f1 - f0) / (t1 - t0) if t1 > t0 else None
+        self.measure = {
+            'compile': compiled - self.graph_ready,
+            'argv_bytes': sum(len(arg.encode('utf-8')) + 1 for arg in cmd),
+            'argv_count': len(cmd),
+            'max_arg_bytes': max(len(arg.encode('utf-8')) for arg in cmd),
+            'startup': samples[0][0] - launched if samples else None,
+            'steady_fps': steady_fps,
+            'fps': result['fps'],
+            'encode': finished - launched,
+            'frames': result['frames'],
+            'cpu': result['cpu']
+        }
+        return result
+
+def words_track(count: int, clip_duration: float) -> SubtitleTrack:
+    """count слов равномерно по клипу (при большой плотности показы слов перекрываются)"""
+    if count <= 0:
+        return SubtitleTrack()
+    step = clip_duration / count
+    return SubtitleTrack.from_words([
+        {'start': i * step, 'end': min(clip_duration, i * step + max(step, 0.3)), 'text': f"слово{i}"}
+        for i in range(count)
+    ])
+
+def stats_period_supported() -> bool:
+    """-stats_period (ffmpeg 4.4+) - отчеты -progress чаще 0.5 сек для точной задержки запуска"""
+    try:
+        output = subprocess.run(['ffmpeg', '-hide_banner', '-h', 'long'], capture_output=True, text=True).stdout
+    except OSError:
+        return False
+    return '-stats_period' in output
+
+def run_case(editor: VideoEditor, scheduler: MeasuringScheduler, backend: str, source: str, clip_duration: int,
+             words: int) -> dict:
+    """Один клип: построение графа (у ass - вместе с записью ASS файла) и рендер через _create_styled_clip_sync"""
+    config = {'subtitle_backend': backend}
+    subtitles = words_track(words, clip_duration)
+    output_path = str(editor.output_dir / f"density_{backend}_{words}.mp4")
+
+    started = time.perf_counter()
+    subtitles_file = editor._prepare_subtitles_file(subtitles, config, f"density_{backend}_{words}")
+    try:
+        editor._create_styled_clip_sync(source, output_path, 0, clip_duration, subtitles, 1, config, subtitles_file)
+    finally:
+        editor._remove_subtitles_file(subtitles_file)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    total = time.perf_counter() - started
+    return dict(scheduler.measure, backend=backend, words=words, build=scheduler.graph_ready - started, total=total)
+
+def print_table(results: list, frames: int):
+    print(f"\n📊 ПЛОТНОСТЬ СУБТИТРОВ ({frames} кадров на клип)")
+    print(f"{'бэкенд':<9} {'слов':>5} {'граф, мс':>9} {'компил., мс':>12} {'argv, КБ':>9} {'макс. арг, КБ':>14} "
+          f"{'запуск, с':>10} {'fps':>7} {'всего, с':>9}")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['backend']:<9} {r['words']:>5} ❌ {r['error']}")
+            continue
+        warning = " ⚠️" if r['max_arg_bytes'] > MAX_ARG_STRLEN else ""
+        startup = f"{r['startup']:>10.2f}" if r['startup'] is not None else f"{'-':>10}"
+        fps = r['steady_fps'] if r['steady_fps'] is not None else r['fps']
+        print(f"{r['backend']:<9} {r['words']:>5} {r['build'] * 1000:>9.1f} {r['compile'] * 1000:>12.1f} "
+              f"{r['argv_bytes'] / KB:>9.1f} {r['max_arg_bytes'] / KB:>14.1f}{warning} {startup} {fps:>7.1f} {r['total']:>9.1f}")
+    if any(r.get('max_arg_bytes', 0) > MAX_ARG_STRLEN for r in results):
+        print(f"\n⚠️ Аргумент длиннее {MAX_ARG_STRLEN // KB} КБ: в Linux такой запуск ffmpeg падает с E2BIG")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clip-duration', type=int, default=20, help='Длительность клипа, сек')
+    parser.add_argument('--size', default='1280x720', help='Разрешение исходника')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--words', default='0,10,25,50,100,200,300,500', help='Слов на клип через запятую')
+    parser.add_argument('--backends', default='drawtext,ass')
+    parser.add_argument('--workdir', default='bench_work')
+    parser.add_argument('--json', default=None, help='Сохранить результаты в JSON (для сравнения бэкендов)')
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir)
+    workdir.mkdir(exist_ok=True)
+    width, height = map(int, args.size.split('x'))
+    source = workdir / f"source_{args.size}_{args.clip_duration}s.mp4"
+    if not source.exists():
+        print(f"🎬 Генерируем синтетический исходник {args.size}, {args.clip_duration} сек...")
+        generate_source(source, args.clip_duration, width, height, args.fps)
+
+    editor = VideoEditor()
+    editor.output_dir = workdir / "output"
+    editor.output_dir.mkdir(parents=True, exist_ok=True)
+    set_capabilities(get_capabilities().without_gpu())
+    scheduler = MeasuringScheduler(stats_period=0.1 if stats_period_supported() else None)
+    editor.scheduler = scheduler
+
+    # Прогрев: probe исходника и проверка GPU кэшируются и не попадают во время построения графа
+    run_case(editor, scheduler, 'drawtext', str(source), 1, 0)
+
+    results = []
+    for backend in args.backends.split(','):
+        for words in (int(w) for w in args.words.split(',')):
+            print(f"⏱️  {backend}, {words} слов...")
+            try:
+                results.append(run_case(editor, scheduler, backend, str(source), args.clip_duration, words))
+            except Exception as e:
+                logging.error(f"Ошибка рендера {backend}, {words} слов: {e}")
+                results.append({'backend': backend, 'words': words, 'error': str(e)[-200:]})
+
+    print_table(results, args.clip_duration * args.fps)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты: {args.json}")
+    return 1 if any('error' in r for r in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк распознавания: Whisper на каждый чанк (TRANSCRIBE_MODE=chunk) против всего звука
+перекрывающимися окнами (TRANSCRIBE_MODE=whole). Нужен исходник с речью и установленный Whisper.
+Для каждого режима - время, число слов и слова у границ чанков (там per-chunk режим их режет).
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+from subtitle_generator import SubtitleGenerator, TranscriptTimeline
+from video_processor import VideoProcessor
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+def boundary_words(words: list, boundaries: list, margin: float = 2.0) -> int:
+    """Слова в пределах margin секунд от границ чанков"""
+    return sum(1 for w in words if any(abs(w.start - b) <= margin for b in boundaries))
+
+async def run_chunks(generator: SubtitleGenerator, audio, ranges: list) -> dict:
+    """Отдельный запуск Whisper на каждый чанк (срез того же буфера)"""
+    started = time.perf_counter()
+    words = []
+    for r in ranges:
+        track = await generator.generate(None, r['offset'], r['duration'], audio=audio)
+        words.extend(track)
+    return {'mode': 'chunk', 'runs': len(ranges), 'wall': time.perf_counter() - started, 'words': words}
+
+async def run_whole(generator: SubtitleGenerator, audio) -> dict:
+    """Весь звук окнами с перекрытием, одна общая дорожка"""
+    started = time.perf_counter()
+    timeline = await generator.transcribe_whole(audio, TranscriptTimeline())
+    return {'mode': 'whole', 'runs': len(timeline.windows), 'wall': time.perf_counter() - started,
+            'words': list(timeline.track())}
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('source', help='Видео или аудио с речью')
+    parser.add_argument('--clip-duration', type=int, default=30, help='Длительность клипа, сек')
+    parser.add_argument('--chunk-duration', type=int, default=300, help='Длительность чанка, сек')
+    args = parser.parse_args()
+
+    generator = SubtitleGenerator()
+    if not generator._load_model():
+        print("❌ Whisper недоступен")
+        return 1
+
+    processor = VideoProcessor()
+    ranges = processor.plan_virtual_chunks(args.source, args.clip_duration, chunk_duration=args.chunk_duration)
+    boundaries = [r['offset'] for r in ranges[1:]]
+
+    with tempfile.TemporaryDirectory() as directory:
+        audio = await generator.extract_audio(args.source, str(Path(directory) / 'audio.f32'))
+        print(f"📦 Звук {audio.duration:.1f} сек, чанков {len(ranges)}, границы: {boundaries}")
+        results = [await run_chunks(generator, audio, ranges), await run_whole(generator, audio)]
+        audio.close()
+
+    print("\n📊 РЕЗУЛЬТАТЫ")
+    print(f"{'режим':<7} {'запусков/окон':>14} {'время, с':>9} {'слов':>7} {'у границ':>9}")
+    for r in results:
+        print(f"{r['mode']:<7} {r['runs']:>14} {r['wall']:>9.1f} {len(r['words']):>7} "
+              f"{boundary_words(r['words'], boundaries):>9}")
+
+    chunk, whole = results
+    print(f"\n🚀 Весь звук: x{chunk['wall'] / max(whole['wall'], 1e-6):.2f} по времени, "
+          f"слов у границ чанков {boundary_words(whole['words'], boundaries)} против {boundary_words(chunk['words'], boundaries)}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк подготовки чанков: нарезка в temp/chunk_N.mp4 (files) против виртуальных чанков
+по индексу ключевых кадров (virtual). Для каждого режима - время подготовки, объем записи на диск
+и время чтения звука чанков для Whisper (следующая стадия конвейера).
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import logging
+import resource
+from pathlib import Path
+from video_processor import VideoProcessor
+from media_probe import probe_cache
+from capabilities import get_capabilities, set_capabilities
+from bench_single_pass import generate_source
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+MB = 1024 * 1024
+
+def children_usage() -> tuple:
+    """CPU время и блоки ввода/вывода завершенных дочерних процессов (ffmpeg/ffprobe)"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_inblock, usage.ru_oublock
+
+def read_audio(processor: VideoProcessor, ranges: list) -> float:
+    """Звук всех чанков в формате Whisper: [(путь, начало, длительность)], время в секундах"""
+    started = time.perf_counter()
+    for path, start, duration in ranges:
+        processor.subtitle_generator._load_audio_range(path, start, duration)
+    return time.perf_counter() - started
+
+async def run_files(processor: VideoProcessor, source: str, chunk_duration: int) -> dict:
+    """Текущий способ: физическая нарезка на файлы"""
+    shutil.rmtree(processor.temp_dir, ignore_errors=True)
+    processor.temp_dir.mkdir(exist_ok=True)
+    probe_cache.invalidate()
+
+    cpu_before, in_before, out_before = children_usage()
+    started = time.perf_counter()
+    chunks = await processor.split_into_chunks(source, chunk_duration=chunk_duration)
+    prepare = time.perf_counter() - started
+    cpu, inblock, outblock = (a - b for a, b in zip(children_usage(), (cpu_before, in_before, out_before)))
+
+    written = sum(os.path.getsize(c) for c in chunks if c != source)
+    audio = read_audio(processor, [(c, 0, processor.video_editor.get_video_info(c)['duration']) for c in chunks])
+    return {
+        'mode': 'files',
+        'chunks': len(chunks),
+        'prepare': prepare,
+        'cpu': cpu,
+        'written': written,
+        'blocks': (inblock + outblock) * 512,
+        'audio': audio
+    }
+
+async def run_virtual(processor: VideoProcessor, source: str, chunk_duration: int, clip_duration: int) -> dict:
+    """Виртуальные чанки: один проход ffprobe по пакетам, чтение диапазонов исходника"""
+    probe_cache.invalidate()
+
+    cpu_before, in_before, out_before = children_usage()
+    started = time.perf_counter()
+    ranges = processor.plan_virtual_chunks(source, clip_duration, chunk_duration=chunk_duration)
+    prepare = time.perf_counter() - started
+    cpu, inblock, outblock = (a - b for a, b in zip(children_usage(), (cpu_before, in_before, out_before)))
+
+    audio = read_audio(processor, [(source, r['offset'], r['duration']) for r in ranges])
+    return {
+        'mode': 'virtual',
+        'chunks': len(ranges),
+        'prepare': prepare,
+        'cpu': cpu,
+        'written': 0,
+        'blocks': (inblock + outblock) * 512,
+        'audio': audio
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=int, default=1200, help='Длительность синтетического исходника, сек')
+    parser.add_argument('--chunk-duration', type=int, default=300, help='Длительность чанка, сек')
+    parser.add_argument('--clip-duration', type=int, default=30, help='Длительность клипа, сек')
+    parser.add_argument('--size', default='1280x720', help='Разрешение исходника')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--workdir', default='bench_work')
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir)
+    workdir.mkdir(exist_ok=True)
+    width, height = map(int, args.size.split('x'))
+    source = workdir / f"source_{args.size}_{args.duration}s.mp4"
+
+    if not source.exists():
+        print(f"🎬 Генерируем синтетический исходник {args.size}, {args.duration} сек...")
+        generate_source(source, args.duration, width, height, args.fps)
+
+    # Сравнение для CPU-узлов: нарезка files идет stream copy, как на узле без NVENC
+    set_capabilities(get_capabilities().without_gpu())
+    processor = VideoProcessor()
+    processor.temp_dir = workdir / "temp"
+
+    source_size = os.path.getsize(source)
+    print(f"📦 Исходник: {source_size / MB:.1f} МБ, чанки по {args.chunk_duration} сек")
+
+    results = [
+        await run_files(processor, str(source), args.chunk_duration),
+        await run_virtual(processor, str(source), args.chunk_duration, args.clip_duration)
+    ]
+    shutil.rmtree(processor.temp_dir, ignore_errors=True)
+
+    print("\n📊 РЕЗУЛЬТАТЫ")
+    print(f"{'режим':<8} {'чанков':>7} {'подготовка, с':>14} {'cpu, с':>8} {'записано, МБ':>13} {'блоки I/O, МБ':>14} {'звук, с':>8} {'итого, с':>9}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['chunks']:>7} {r['prepare']:>14.2f} {r['cpu']:>8.2f} {r['written'] / MB:>13.1f} "
+              f"{r['blocks'] / MB:>14.1f} {r['audio']:>8.2f} {r['prepare'] + r['audio']:>9.2f}")
+
+    files, virtual = results
+    total_files = files['prepare'] + files['audio']
+    total_virtual = virtual['prepare'] + virtual['audio']
+    print(f"\n🚀 Виртуальные чанки: подготовка x{files['prepare'] / max(virtual['prepare'], 1e-6):.1f} быстрее, "
+          f"до начала распознавания x{total_files / max(total_virtual, 1e-6):.2f}, "
+          f"не записано {files['written'] / MB:.1f} МБ временных файлов")
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -1,9 +1,15 @@
 import os
+import asyncio
 import logging
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from dotenv import load_dotenv
 from video_processor import VideoProcessor
+from source_cache import source_cache
+from job_queue import JobQueue
+from job_manifest import STATUS_FAILED
+from progress_bus import progress_bus
+from metrics import start_metrics_server
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -22,6 +28,22 @@ class TelegramBot:
         self.user_settings = {}  # Хранение настроек пользователей
         self.waiting_for_cookies = set()  # Пользователи, ожидающие ввода cookies
         self.waiting_for_token = set()  # Пользователи, ожидающие ввода токена
+        self.application = None
+        
+        # Очередь задач: обработка вне обработчика сообщений, лимиты на пользователя, переживает перезапуск
+        self.job_queue = JobQueue(
+            os.getenv('JOB_MANIFEST_DB', 'jobs.db'),
+            workers=int(os.getenv('QUEUE_WORKERS', '2')),
+            per_user=int(os.getenv('QUEUE_PER_USER', '1')),
+            max_depth=int(os.getenv('QUEUE_MAX_DEPTH', '50')),
+            max_user_queued=int(os.getenv('QUEUE_MAX_PER_USER', '5')),
+            max_duration=float(os.getenv('QUEUE_MAX_DURATION_MIN', '240')) * 60,
+            max_attempts=int(os.getenv('QUEUE_MAX_ATTEMPTS', '3'))
+        )
+        
+        # Статус обработки - одно сообщение, редактируемое не чаще раза в PROGRESS_UPDATE_SEC секунд
+        self.progress_interval = max(1.0, float(os.getenv('PROGRESS_UPDATE_SEC', '5')))
+        self.metrics_server = None
         
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /start"""
@@ -42,6 +64,8 @@ class TelegramBot:
             "/cookies - Обновить cookies для YouTube\n"
             "/token - Обновить Google OAuth токен\n"
             "/settings - Показать текущие настройки\n"
+            "/resume - Продолжить прерванную обработку\n"
+            "/queue - Ваши задачи в очереди\n"
             "/help - Помощь\n\n"
             "📹 Отправь мне:\n"
             "• Ссылку на YouTube видео\n"
@@ -193,7 +217,9 @@ class TelegramBot:
             "/subtitle <текст> - Подзаголовок (например: 'Серия')\n"
             "/cookies - Обновить cookies для YouTube\n"
             "/token - Обновить Google OAuth токен\n"
-            "/settings - Показать текущие настройки\n\n"
+            "/settings - Показать текущие настройки\n"
+            "/resume [id] - Продолжить обработку, прерванную перезапуском бота\n"
+            "/queue - Место в очереди и ожидание\n\n"
             "📹 Как использовать:\n"
             "1. Настройте параметры командами выше\n"
             "2. Отправьте ссылку на YouTube или видео файл\n"
@@ -233,12 +259,18 @@ class TelegramBot:
         })
         
         if message.text and ('youtube.com' in message.text or 'youtu.be' in message.text):
-            # Обработка YouTube ссылки
-            await self.process_youtube_url(update, message.text, user_config)
+            # Обработка YouTube ссылки (через очередь задач)
+            await self.enqueue(update, {'url': message.text}, user_config)
             
         elif message.video:
-            # Обработка видео файла
-            await self.process_video_file(update, message.video, user_config)
+            # Обработка видео файла (через очередь задач)
+            video = message.video
+            await self.enqueue(update, {
+                'file_id': video.file_id,
+                'file_unique_id': video.file_unique_id,
+                'file_name': getattr(video, 'file_name', None),
+                'duration': getattr(video, 'duration', None)
+            }, user_config)
             
         else:
             await update.message.reply_text(
@@ -337,72 +369,402 @@ class TelegramBot:
                 "❌ Ошибка сохранения токена. Попробуйте еще раз командой /token"
             )
     
-    async def process_youtube_url(self, update: Update, url: str, config: dict):
-        """Обработка YouTube ссылки"""
-        await update.message.reply_text("🔄 Начинаю обработку YouTube видео...")
+    async def enqueue(self, update: Update, payload: dict, config: dict):
+        """Постановка задачи в очередь с ответом о месте и ожидании"""
+        user_id = update.effective_user.id
+        source_key, duration = await self.describe_source(payload)
+        
+        coalesce_key = None
+        if source_key is not None:
+            registry = self.video_processor.registry
+            coalesce_key = registry.key(source_key, self.video_processor.effective_config(config))
+            # Готовый результат такого же запроса отправляется сразу, без очереди
+            result = registry.recorded(coalesce_key)
+            if result is not None:
+                await update.message.reply_text("♻️ Это видео с такими же настройками уже обработано - отправляю готовые ссылки")
+                await self.send_results(update.effective_chat.id, result)
+                return
+        
+        ticket = self.job_queue.submit(user_id, update.effective_chat.id, payload, config, duration, coalesce_key)
+        if not ticket['accepted']:
+            await update.message.reply_text(f"⛔ Задача не принята: {ticket['reason']}")
+            return
+        
+        await update.message.reply_text(
+            f"📥 Задача #{ticket['id']} в очереди\n"
+            f"🔢 Место: {ticket['position']}\n"
+            f"⏳ Ожидание: {self.format_eta(ticket['eta'])}"
+        )
+    
+    async def describe_source(self, payload: dict) -> tuple:
+        """(ключ источника, длительность в секундах) для реестра задач и приема в очередь"""
+        if 'file_unique_id' in payload:
+            return f"telegram:{payload['file_unique_id']}", payload.get('duration')
+        if 'url' not in payload:
+            return None, None
+        
+        # Ключ и длительность - одним запросом без обработки форматов, стадия скачивания берет ключ из кэша
+        downloader = self.video_processor.youtube_downloader
+        try:
+            info = await asyncio.get_running_loop().run_in_executor(None, downloader.source_info, payload['url'])
+        except Exception as e:
+            logger.warning(f"Сведения об источнике не получены: {e}")
+            return None, None
+        return info['key'], info['duration']
+    
+    @staticmethod
+    def format_eta(seconds: float) -> str:
+        if seconds < 60:
+            return "меньше минуты"
+        if seconds < 3600:
+            return f"≈{seconds / 60:.0f} мин"
+        return f"≈{seconds / 3600:.1f} ч"
+    
+    STAGE_LABELS = {
+        'download': '⬇️ Скачивание',
+        'split': '✂️ Нарезка на чанки',
+        'transcribe': '🎤 Субтитры',
+        'render': '🎬 Рендер',
+        'upload': '☁️ Загрузка'
+    }
+    
+    @classmethod
+    def format_progress(cls, snapshot: dict) -> str:
+        """Текст статуса обработки по сводке шины прогресса"""
+        label = cls.STAGE_LABELS.get(snapshot['stage'], snapshot['stage'])
+        percent = snapshot['percent']
+        if percent is None:
+            lines = [f"{label}..."]
+        else:
+            filled = int(percent // 10)
+            lines = [f"{label}: {percent:.0f}% [{'█' * filled}{'░' * (10 - filled)}]"]
+        if snapshot['processes']:
+            lines.append(f"⚙️ ffmpeg: {snapshot['processes']} · {snapshot['fps']:.0f} fps · {snapshot['speed']:.1f}x")
+        if snapshot['expected_clips']:
+            lines.append(f"☁️ Загружено шотсов: {snapshot['uploaded']}/{snapshot['expected_clips']}")
+        if snapshot['eta'] is not None:
+            lines.append(f"⏱️ Осталось {cls.format_eta(snapshot['eta'])}")
+        return "\n".join(lines)
+    
+    async def track_progress(self, chat_id: int, run) -> dict:
+        """Выполнение обработки (корутина run) с живым статусом в чате"""
+        with progress_bus.watch() as watch:
+            reporter = asyncio.create_task(self.report_progress(chat_id, watch))
+            try:
+                return await run
+            finally:
+                reporter.cancel()
+                await asyncio.gather(reporter, return_exceptions=True)
+    
+    async def report_progress(self, chat_id: int, watch):
+        """Одно сообщение со статусом: создается при первом прогрессе и редактируется, пока задача идет"""
+        message = None
+        last_text = None
+        elapsed = 0.0
+        try:
+            while True:
+                await asyncio.sleep(self.progress_interval)
+                snapshot = progress_bus.snapshot(watch.job_id) if watch.job_id else None
+                if snapshot is None:
+                    continue
+                elapsed = snapshot['elapsed']
+                text = self.format_progress(snapshot)
+                if text == last_text:
+                    continue
+                try:
+                    if message is None:
+                        message = await self.application.bot.send_message(chat_id=chat_id, text=text)
+                    else:
+                        await message.edit_text(text)
+                    last_text = text
+                except Exception as e:
+                    # Лимиты Telegram на редактирование: пропускаем обновление, следующее придет через интервал
+                    logger.warning(f"Статус обработки не обновлен: {e}")
+        except asyncio.CancelledError:
+            if message is not None:
+                try:
+                    took = f"{elapsed:.0f} сек" if elapsed < 120 else f"{elapsed / 60:.0f} мин"
+                    await message.edit_text(f"🏁 Обработка закончена за {took}")
+                except Exception as e:
+                    logger.warning(f"Статус обработки не обновлен: {e}")
+            raise
+    
+    async def show_queue(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /queue - задачи пользователя в очереди"""
+        jobs = self.job_queue.user_jobs(update.effective_user.id)
+        if not jobs:
+            await update.message.reply_text("✅ Задач в очереди нет")
+            return
+        
+        lines = []
+        for job in jobs:
+            if job['status'] == 'running':
+                lines.append(f"▶️ #{job['id']} - обрабатывается")
+            else:
+                lines.append(f"⏳ #{job['id']} - место {job['position']}, ожидание {self.format_eta(job['eta'])}")
+        await update.message.reply_text("📥 Ваши задачи:\n" + "\n".join(lines))
+    
+    async def run_queued(self, job: dict) -> dict:
+        """Обработчик очереди: выполнение задачи и отправка результата в чат"""
+        payload = job['payload']
+        chat_id = job['chat_id']
+        
+        if 'resume' in payload:
+            return await self.process_resume(chat_id, payload['resume'], payload.get('path'))
         
+        if job['attempts'] > 1:
+            # Задача прервана перезапуском бота: продолжаем ее журнал, а не начинаем заново
+            manifest_id = self.find_interrupted(job)
+            if manifest_id:
+                await self.send_message(chat_id, f"♻️ Продолжаю задачу #{job['id']}, прерванную перезапуском бота")
+                return await self.process_resume(chat_id, manifest_id)
+        
+        if 'url' in payload:
+            return await self.process_youtube_url(chat_id, job['user_id'], payload['url'], job['config'])
+        return await self.process_video_file(chat_id, job['user_id'], payload, job['config'])
+    
+    def find_interrupted(self, job: dict) -> str:
+        """Журнал прерванной обработки той же задачи (тот же источник) или None"""
+        payload = job['payload']
+        if 'url' in payload:
+            source = {'url': payload['url']}
+        else:
+            entry = source_cache.lookup(f"telegram:{payload['file_unique_id']}")
+            if entry is None:
+                return None
+            source = {'path': entry['path']}
+        for interrupted in self.video_processor.unfinished_jobs(job['user_id']):
+            if interrupted['source'] == source:
+                return interrupted['job_id']
+        return None
+    
+    async def process_youtube_url(self, chat_id: int, user_id: int, url: str, config: dict) -> dict:
+        """Обработка YouTube ссылки"""
         try:
-            # Запускаем обработку видео (автоматически использует cookies если доступны)
-            result = await self.video_processor.process_youtube_video(url, config)
+            try:
+                source_key = await asyncio.get_running_loop().run_in_executor(
+                    None, self.video_processor.youtube_downloader.source_key, url
+                )
+            except Exception as e:
+                logger.warning(f"Ключ источника не определен: {e}")
+                source_key = None
+            
+            async def process() -> dict:
+                # Запускаем обработку видео (автоматически использует cookies если доступны)
+                return await self.video_processor.process_youtube_video(url, config, user_id=user_id, chat_id=chat_id)
+            
+            result = await self.track_progress(chat_id, self.run_coalesced(
+                chat_id, source_key, config, process, "🔄 Начинаю обработку YouTube видео..."
+            ))
             
             if result['success']:
-                await self.send_results(update, result)
+                await self.send_results(chat_id, result)
             else:
-                await update.message.reply_text(f"❌ Ошибка: {result['error']}")
+                await self.send_message(chat_id, f"❌ Ошибка: {result['error']}")
+            return result
                 
         except Exception as e:
             logger.error(f"Ошибка обработки YouTube: {e}")
-            await update.message.reply_text("❌ Произошла ошибка при обработке видео")
+            await self.send_message(chat_id, "❌ Произошла ошибка при обработке видео")
+            return {'success': False, 'error': str(e)}
     
-    async def process_video_file(self, update: Update, video, config: dict):
-        """Обработка видео файла"""
-        await update.message.reply_text("🔄 Начинаю обработку видео файла...")
-        
+    async def process_video_file(self, chat_id: int, user_id: int, video: dict, config: dict) -> dict:
+        """Обработка видео файла (video - file_id, file_unique_id и имя присланного файла)"""
         try:
-            # Скачиваем файл
-            file = await video.get_file()
-            file_path = f"temp_video_{update.effective_user.id}.mp4"
-            await file.download_to_drive(file_path)
+            async def download() -> dict:
+                # Скачиваем файл (file_id действует и после перезапуска бота)
+                file = await self.application.bot.get_file(video['file_id'])
+                file_path = f"temp_video_{user_id}_{video['file_unique_id']}.mp4"
+                await file.download_to_drive(file_path)
+                return {
+                    'success': True,
+                    'video_path': file_path,
+                    'title': video.get('file_name'),
+                    'duration': video.get('duration')
+                }
+            
+            # Тот же файл (file_unique_id), присланный повторно или другим пользователем, не скачивается заново
+            key = f"telegram:{video['file_unique_id']}"
             
-            # Запускаем обработку
-            result = await self.video_processor.process_video_file(file_path, config)
+            async def process() -> dict:
+                source = await source_cache.fetch(key, download)
+                if not source['success']:
+                    return source
+                
+                # Запускаем обработку (файл остается в кэше исходников)
+                try:
+                    return await self.video_processor.process_video_file(
+                        source['video_path'], config, user_id=user_id, chat_id=chat_id
+                    )
+                finally:
+                    source_cache.release(key)
             
-            # Удаляем временный файл
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            result = await self.track_progress(
+                chat_id, self.run_coalesced(chat_id, key, config, process, "🔄 Начинаю обработку видео файла...")
+            )
             
             if result['success']:
-                await self.send_results(update, result)
+                await self.send_results(chat_id, result)
             else:
-                await update.message.reply_text(f"❌ Ошибка: {result['error']}")
+                await self.send_message(chat_id, f"❌ Ошибка: {result['error']}")
+            return result
                 
         except Exception as e:
             logger.error(f"Ошибка обработки файла: {e}")
-            await update.message.reply_text("❌ Произошла ошибка при обработке видео")
+            await self.send_message(chat_id, "❌ Произошла ошибка при обработке видео")
+            return {'success': False, 'error': str(e)}
     
-    async def send_results(self, update: Update, result: dict):
-        """Отправка результатов пользователю"""
-        links_file = result.get('links_file')
-        total_clips = result.get('total_clips', 0)
+    async def run_coalesced(self, chat_id: int, source_key: str, config: dict, process, start_message: str) -> dict:
+        """
+        Обработка через реестр задач: то же видео с теми же настройками не обрабатывается повторно -
+        ответ берется из записанного результата или из уже идущей задачи другого пользователя
+        """
+        if source_key is None:
+            await self.send_message(chat_id, start_message)
+            return await process()
+        
+        registry = self.video_processor.registry
+        effective_config = self.video_processor.effective_config(config)
+        key = registry.key(source_key, effective_config)
+        
+        result = registry.recorded(key)
+        if result is not None:
+            await self.send_message(chat_id, "♻️ Это видео с такими же настройками уже обработано - отправляю готовые ссылки")
+            return result
+        
+        if registry.is_running(key):
+            await self.send_message(
+                chat_id, "🔗 Это видео с такими же настройками уже обрабатывается - пришлю ссылки, когда обработка завершится"
+            )
+        else:
+            await self.send_message(chat_id, start_message)
+        return await registry.run(key, process, source_key, effective_config)
+    
+    async def resume_job(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /resume - продолжение задачи, прерванной перезапуском бота"""
+        user_id = update.effective_user.id
+        jobs = self.video_processor.unfinished_jobs(user_id)
+        
+        if not jobs:
+            await update.message.reply_text("✅ Прерванных задач нет")
+            return
+        
+        if context.args:
+            job = next((j for j in jobs if j['job_id'] == context.args[0]), None)
+            if job is None:
+                await update.message.reply_text(
+                    "⚠️ Задача не найдена. Прерванные задачи:\n" +
+                    "\n".join(f"• {j['job_id']}" for j in jobs)
+                )
+                return
+        else:
+            # Без аргумента - последняя прерванная задача
+            job = jobs[0]
+        
+        # Продолжение тоже идет через очередь (общие лимиты и справедливость)
+        payload = {'resume': job['job_id'], 'path': job['source'].get('path')}
+        ticket = self.job_queue.submit(user_id, update.effective_chat.id, payload, {})
+        if not ticket['accepted']:
+            await update.message.reply_text(f"⛔ Задача не принята: {ticket['reason']}")
+            return
         
+        progress = job['progress']
         await update.message.reply_text(
-            f"✅ Обработка завершена!\n"
-            f"📊 Создано шотсов: {total_clips}\n"
-            f"📁 Все файлы загружены на Google Drive"
+            f"♻️ Продолжение задачи {job['job_id']} в очереди (место {ticket['position']}, "
+            f"ожидание {self.format_eta(ticket['eta'])})\n"
+            f"📦 Готово чанков: {progress['chunks_done']}/{progress['chunks']}\n"
+            f"☁️ Уже загружено шотсов: {progress['uploaded']}"
         )
+    
+    async def process_resume(self, chat_id: int, job_id: str, file_path: str = None) -> dict:
+        """Продолжение прерванной задачи из очереди"""
+        try:
+            result = await self.track_progress(chat_id, self.video_processor.resume_job(job_id))
+            
+            if result['success']:
+                # Присланный файл больше не нужен (как после обычной обработки)
+                if file_path and os.path.exists(file_path) and not source_cache.is_cached_path(file_path):
+                    os.remove(file_path)
+                await self.send_results(chat_id, result)
+            else:
+                await self.send_message(chat_id, f"❌ Ошибка: {result['error']}")
+            return result
+                
+        except Exception as e:
+            logger.error(f"Ошибка продолжения задачи: {e}")
+            await self.send_message(chat_id, "❌ Произошла ошибка при продолжении обработки")
+            return {'success': False, 'error': str(e)}
+    
+    async def send_message(self, chat_id: int, text: str):
+        """Сообщение в чат (задачи из очереди выполняются вне обработчика сообщения)"""
+        await self.application.bot.send_message(chat_id=chat_id, text=text)
+    
+    async def send_results(self, chat_id: int, result: dict):
+        """Отправка результатов пользователю"""
+        links_file = result.get('links_file')
+        total_clips = result.get('total_clips', 0)
         
-        if links_file and os.path.exists(links_file):
-            # Отправляем файл со ссылками
-            with open(links_file, 'rb') as f:
-                await update.message.reply_document(
-                    document=f,
-                    filename="video_links.txt",
-                    caption="📋 Ссылки на все созданные шотсы"
+        try:
+            await self.send_message(
+                chat_id,
+                f"✅ Обработка завершена!\n"
+                f"📊 Создано шотсов: {total_clips}\n"
+                f"📁 Все файлы загружены на Google Drive"
+            )
+            
+            if links_file and os.path.exists(links_file):
+                # Отправляем файл со ссылками
+                with open(links_file, 'rb') as f:
+                    await self.application.bot.send_document(
+                        chat_id=chat_id,
+                        document=f,
+                        filename="video_links.txt",
+                        caption="📋 Ссылки на все созданные шотсы"
+                    )
+        finally:
+            # Файл ссылок у каждой задачи и каждого ответа свой - после отправки он не нужен
+            if links_file and os.path.exists(links_file):
+                os.remove(links_file)
+    
+    async def start_queue(self, application: Application):
+        """Запуск обработчиков очереди вместе с ботом (сохраненные задачи продолжаются)"""
+        self.application = application
+        self.metrics_server = start_metrics_server()
+        await self.notify_abandoned()
+        await self.job_queue.start(self.run_queued)
+    
+    async def notify_abandoned(self):
+        """Задачи, снятые очередью после повторных падений бота: журнал закрывается, владельцу - сообщение"""
+        for job in self.job_queue.abandoned:
+            manifest_id = job['payload'].get('resume') or self.find_interrupted(job)
+            manifest = self.video_processor.manifests.open(manifest_id) if manifest_id else None
+            if manifest:
+                # Иначе /resume предложит ту же задачу и бот снова упадет
+                manifest.finish(STATUS_FAILED, 'обработка прерывалась падением бота')
+            try:
+                await self.send_message(
+                    job['chat_id'],
+                    f"❌ Задача #{job['id']} остановлена: обработка {job['attempts']} раз прерывалась падением бота. "
+                    f"Попробуйте видео короче или другие настройки"
                 )
+            except Exception as e:
+                logger.error(f"Не удалось сообщить о снятой задаче {job['id']}: {e}")
+        self.job_queue.abandoned = []
+    
+    async def stop_queue(self, application: Application):
+        await self.job_queue.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
     
     def run(self):
         """Запуск бота"""
-        application = Application.builder().token(self.token).build()
+        application = (
+            Application.builder()
+            .token(self.token)
+            .post_init(self.start_queue)
+            .post_shutdown(self.stop_queue)
+            .build()
+        )
         
         # Добавляем обработчики
         application.add_handler(CommandHandler("start", self.start))
@@ -412,6 +774,8 @@ class TelegramBot:
         application.add_handler(CommandHandler("cookies", self.set_cookies))
         application.add_handler(CommandHandler("token", self.set_token))
         application.add_handler(CommandHandler("settings", self.show_settings))
+        application.add_handler(CommandHandler("resume", self.resume_job))
+        application.add_handler(CommandHandler("queue", self.show_queue))
         application.add_handler(CommandHandler("help", self.help_command))
         application.add_handler(MessageHandler(filters.TEXT | filters.VIDEO, self.handle_message))
         
@@ -421,4 +785,4 @@ class TelegramBot:
 
 if __name__ == '__main__':
     bot = TelegramBot()
-    bot.run()
\ No newline at end of file
+    bot.run()
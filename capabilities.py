@@ -0,0 +1,180 @@
+import os
+import logging
+import threading
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+class Capabilities:
+    """
+    Возможности узла: кодеки/фильтры ffmpeg, GPU и флаги CPU.
+
+    Определяются один раз при старте (probe), дальше все модули читают готовый набор.
+    В тестах набор подменяется через set_capabilities(), например Capabilities.cpu_only().
+    """
+    def __init__(self, encoders=(), decoders=(), filters=(), hwaccels=(), nvidia_gpu: bool = False,
+                 torch_cuda: bool = None, cpu_count: int = None, cpu_flags=()):
+        self.encoders = frozenset(encoders)
+        self.decoders = frozenset(decoders)
+        self.filters = frozenset(filters)
+        self.hwaccels = frozenset(hwaccels)
+        self.nvidia_gpu = nvidia_gpu
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        self.cpu_flags = frozenset(cpu_flags)
+        # None - еще не проверяли (импорт torch дорогой, проверяем лениво один раз)
+        self._torch_cuda = torch_cuda
+
+    @classmethod
+    def probe(cls) -> 'Capabilities':
+        """Однократная проверка ffmpeg, nvidia-smi и CPU"""
+        caps = cls(
+            encoders=cls._ffmpeg_list('-encoders'),
+            decoders=cls._ffmpeg_list('-decoders'),
+            filters=cls._ffmpeg_list('-filters'),
+            hwaccels=cls._ffmpeg_hwaccels(),
+            nvidia_gpu=cls._nvidia_gpu_present(),
+            cpu_flags=cls._cpu_flags()
+        )
+        caps.log_summary()
+        return caps
+
+    @classmethod
+    def cpu_only(cls, filters=('ass', 'subtitles', 'drawtext', 'gblur', 'scale', 'overlay')) -> 'Capabilities':
+        """Набор для узла без GPU (для тестов и бенчмарков)"""
+        return cls(encoders={'libx264', 'aac'}, decoders={'h264', 'aac'}, filters=filters,
+                   nvidia_gpu=False, torch_cuda=False)
+
+    @classmethod
+    def nvidia(cls) -> 'Capabilities':
+        """Набор для узла с NVIDIA GPU (для тестов GPU пайплайна на CPU машине)"""
+        return cls(encoders={'libx264', 'h264_nvenc', 'aac'}, decoders={'h264', 'h264_cuvid', 'aac'},
+                   filters={'ass', 'subtitles', 'drawtext', 'gblur', 'scale', 'overlay', 'scale_npp', 'hwupload_cuda'},
+                   hwaccels={'cuda'}, nvidia_gpu=True, torch_cuda=True)
+
+    def without_gpu(self) -> 'Capabilities':
+        """Копия набора с отключенным GPU (принудительный CPU пайплайн)"""
+        return Capabilities(self.encoders - {'h264_nvenc', 'hevc_nvenc'}, self.decoders, self.filters,
+                            self.hwaccels - {'cuda'}, False, False, self.cpu_count, self.cpu_flags)
+
+    def has_encoder(self, name: str) -> bool:
+        return name in self.encoders
+
+    def has_decoder(self, name: str) -> bool:
+        return name in self.decoders
+
+    def has_filter(self, name: str) -> bool:
+        return name in self.filters
+
+    @property
+    def nvenc(self) -> bool:
+        """NVENC кодирование доступно (есть GPU и кодировщик в ffmpeg)"""
+        return self.nvidia_gpu and self.has_encoder('h264_nvenc')
+
+    @property
+    def gpu_pipeline(self) -> bool:
+        """Полный GPU пайплайн клипов: cuvid декодирование, scale_npp и NVENC"""
+        return self.nvenc and self.has_decoder('h264_cuvid') and self.has_filter('scale_npp')
+
+    @property
+    def libass(self) -> bool:
+        return self.has_filter('ass')
+
+    @property
+    def torch_cuda(self) -> bool:
+        if self._torch_cuda is None:
+            self._torch_cuda = self._check_torch_cuda() if self.nvidia_gpu else False
+        return self._torch_cuda
+
+    @property
+    def whisper_gpu(self) -> bool:
+        """GPU для Whisper: NVIDIA GPU и CUDA в PyTorch"""
+        return self.nvidia_gpu and self.torch_cuda
+
+    def log_summary(self):
+        logger.info("🧰 ВОЗМОЖНОСТИ УЗЛА:")
+        logger.info(f"   💻 CPU: {self.cpu_count} ядер, AVX2: {'да' if 'avx2' in self.cpu_flags else 'нет'}, "
+                    f"AVX-512: {'да' if 'avx512f' in self.cpu_flags else 'нет'}")
+        logger.info(f"   🎮 NVIDIA GPU: {'да' if self.nvidia_gpu else 'нет'}, NVENC: {'да' if self.nvenc else 'нет'}, "
+                    f"GPU пайплайн: {'да' if self.gpu_pipeline else 'нет'}")
+        logger.info(f"   🎞️  Фильтры: libass={'да' if self.libass else 'нет'}, "
+                    f"zscale={'да' if self.has_filter('zscale') else 'нет'}, "
+                    f"scale_npp={'да' if self.has_filter('scale_npp') else 'нет'}")
+
+    @staticmethod
+    def _run(cmd: list) -> str:
+        try:
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                encoding='utf-8',
+                errors='ignore',
+                timeout=10,
+                check=False
+            )
+            return result.stdout if result.returncode == 0 else ''
+        except Exception as e:
+            logger.warning(f"Ошибка запуска {cmd[0]}: {e}")
+            return ''
+
+    @classmethod
+    def _ffmpeg_list(cls, flag: str) -> set:
+        """Имена из 'ffmpeg -encoders/-decoders/-filters' (вторая колонка после флагов)"""
+        names = set()
+        output = cls._run(['ffmpeg', '-hide_banner', flag])
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[1] != '=' and not line.startswith(('Encoders', 'Decoders', 'Filters')):
+                if set(parts[0]) <= set('VASFXBDTEILC.|-N>'):
+                    names.add(parts[1])
+        return names
+
+    @classmethod
+    def _ffmpeg_hwaccels(cls) -> set:
+        output = cls._run(['ffmpeg', '-hide_banner', '-hwaccels'])
+        return {line.strip() for line in output.splitlines()[1:] if line.strip()}
+
+    @classmethod
+    def _nvidia_gpu_present(cls) -> bool:
+        return bool(cls._run(['nvidia-smi', '-L']).strip())
+
+    @staticmethod
+    def _cpu_flags() -> set:
+        try:
+            with open('/proc/cpuinfo', 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('flags'):
+                        return set(line.split(':', 1)[1].split())
+        except OSError:
+            pass
+        return set()
+
+    @staticmethod
+    def _check_torch_cuda() -> bool:
+        try:
+            import torch
+            if torch.cuda.is_available():
+                logger.info(f"✅ GPU доступен для Whisper: {torch.cuda.get_device_name(0)}")
+                return True
+            logger.info("❌ PyTorch CUDA недоступен")
+        except ImportError:
+            logger.info("❌ PyTorch не установлен")
+        return False
+
+_capabilities = None
+_capabilities_lock = threading.Lock()
+
+def get_capabilities() -> Capabilities:
+    """Общий набор возможностей процесса (probe при первом обращении)"""
+    global _capabilities
+    if _capabilities is None:
+        with _capabilities_lock:
+            if _capabilities is None:
+                _capabilities = Capabilities.probe()
+    return _capabilities
+
+def set_capabilities(capabilities: Capabilities):
+    """Подмена набора возможностей (тесты, бенчмарки, принудительный CPU)"""
+    global _capabilities
+    with _capabilities_lock:
+        _capabilities = capabilities
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Локальный сервер, имитирующий Google Drive API v3 для проверки загрузчика без сети и токена.
+
+Поддерживает создание папок, resumable загрузку (сессия, чанки с Content-Range, запрос статуса
+`bytes */N`) и выдачу доступа. Умеет изображать проблемы сети и квот:
+ограничение скорости на соединение, случайные 429/503 и обрыв соединения посреди чанка.
+
+Использование:
+    server = FakeDriveServer(bandwidth=20 * 1024 * 1024, error_rate=0.05).start()
+    os.environ['GOOGLE_DRIVE_API_ENDPOINT'] = server.endpoint
+    ...
+    server.stop()
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeDriveServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, bandwidth: int = None,
+                 error_rate: float = 0.0, error_status: int = 503, drop_after: int = None, drops: int = 0,
+                 seed: int = None):
+        """
+        bandwidth - байт/сек на одно соединение (None - без ограничения)
+        error_rate - доля чанков, на которые отвечаем error_status (429/503)
+        drop_after, drops - сколько раз оборвать соединение, когда сессия приняла drop_after байт
+        """
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.drop_after = drop_after
+        self.drops = drops
+
+        self.files = {}       # id -> метаданные
+        self.contents = {}    # id -> содержимое
+        self.sessions = {}    # upload_id -> {'metadata', 'size', 'data'}
+        self.permissions = {}
+        self.requests = 0
+        self.errors_sent = 0
+        self.drops_done = 0
+        self.bytes_received = 0
+        self.connections = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> 'FakeDriveServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def file_content(self, file_id: str) -> bytes:
+        return self.contents.get(file_id)
+
+    def find_file(self, name: str) -> dict:
+        for file in self.files.values():
+            if file.get('name') == name:
+                return file
+        return None
+
+    def _new_file(self, metadata: dict, content: bytes = None) -> dict:
+        file_id = uuid.uuid4().hex[:16]
+        file = {
+            'id': file_id,
+            'name': metadata.get('name'),
+            'mimeType': metadata.get('mimeType'),
+            'parents': metadata.get('parents', []),
+            'webViewLink': f"https://drive.google.com/file/d/{file_id}/view"
+        }
+        with self._lock:
+            self.files[file_id] = file
+            if content is not None:
+                self.contents[file_id] = content
+        return file
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors_sent += 1
+                return True
+        return False
+
+    def _should_drop(self, session: dict) -> bool:
+        with self._lock:
+            if self.drop_after is not None and self.drops_done < self.drops and len(session['data']) >= self.drop_after:
+                self.drops_done += 1
+                return True
+        return False
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                self._count()
+                path, query = self._parse()
+                body = self._read_body()
+
+                match = re.fullmatch(r'/drive/v3/files/([^/]+)/permissions', path)
+                if match:
+                    server.permissions.setdefault(match.group(1), []).append(json.loads(body or b'{}'))
+                    return self._json(200, {'id': 'anyoneWithLink', 'role': 'reader', 'type': 'anyone'})
+
+                if path == '/drive/v3/files':
+                    return self._json(200, server._new_file(json.loads(body or b'{}')))
+
+                if path == '/upload/drive/v3/files' and query.get('uploadType') == 'resumable':
+                    upload_id = uuid.uuid4().hex
+                    server.sessions[upload_id] = {
+                        'metadata': json.loads(body or b'{}'),
+                        'size': int(self.headers.get('X-Upload-Content-Length', 0) or 0),
+                        'data': bytearray()
+                    }
+                    host, port = server._server.server_address[:2]
+                    location = f"http://{host}:{port}/upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"
+                    return self._send(200, b'', {'Location': location})
+
+                self._json(404, {'error': {'code': 404, 'message': f'Not found: {path}'}})
+
+            def do_PUT(self):
+                self._count()
+                path, query = self._parse()
+                session = server.sessions.get(query.get('upload_id'))
+                if path != '/upload/drive/v3/files' or session is None:
+                    self._read_body()
+                    return self._json(404, {'error': {'code': 404, 'message': 'Upload session not found'}})
+
+                content_range = self.headers.get('Content-Range', '')
+                length = int(self.headers.get('Content-Length', 0) or 0)
+
+                # Запрос статуса сессии: bytes */N
+                status_query = re.fullmatch(r'bytes \*/(\d+|\*)', content_range)
+                if status_query:
+                    self._read_body()
+                    return self._session_status(session)
+
+                match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+|\*)', content_range)
+                if not match:
+                    self._read_body()
+                    return self._json(400, {'error': {'code': 400, 'message': 'Bad Content-Range'}})
+                start = int(match.group(1))
+
+                if server._should_drop(session):
+                    # Обрыв посреди чанка: читаем половину и закрываем соединение без ответа
+                    self._read_limited(length // 2)
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+
+                data = self._read_limited(length)
+                with server._lock:
+                    server.bytes_received += len(data)
+
+                if server._should_fail():
+                    return self._json(server.error_status, {'error': {'code': server.error_status, 'message': 'Rate Limit Exceeded'}})
+
+                if start != len(session['data']):
+                    # Чанк не с подтвержденного байта - сообщаем, что реально принято
+                    return self._session_status(session)
+
+                session['data'].extend(data)
+                self._session_status(session)
+
+            def _session_status(self, session: dict):
+                received = len(session['data'])
+                if session['size'] and received >= session['size']:
+                    if 'file' not in session:
+                        session['file'] = server._new_file(session['metadata'], bytes(session['data']))
+                    return self._json(200, session['file'])
+                headers = {'Range': f'bytes=0-{received - 1}'} if received else {}
+                self._send(308, b'', headers)
+
+            def _read_limited(self, length: int) -> bytes:
+                """Чтение тела с ограничением скорости соединения"""
+                if not server.bandwidth:
+                    return self.rfile.read(length)
+                data = bytearray()
+                block = 64 * 1024
+                started = time.monotonic()
+                while len(data) < length:
+                    part = self.rfile.read(min(block, length - len(data)))
+                    if not part:
+                        break
+                    data.extend(part)
+                    delay = len(data) / server.bandwidth - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                return bytes(data)
+
+            def _count(self):
+                with server._lock:
+                    server.requests += 1
+
+            def _parse(self):
+                parsed = urllib.parse.urlparse(self.path)
+                return parsed.path, dict(urllib.parse.parse_qsl(parsed.query))
+
+            def _read_body(self) -> bytes:
+                length = int(self.headers.get('Content-Length', 0) or 0)
+                return self.rfile.read(length) if length else b''
+
+            def _json(self, status: int, payload: dict):
+                self._send(status, json.dumps(payload).encode('utf-8'), {'Content-Type': 'application/json'})
+
+            def _send(self, status: int, body: bytes, headers: dict = None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+        return Handler
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Локальный имитатор Google Drive API')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--bandwidth-mb', type=float, default=None, help='МБ/с на соединение')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    bandwidth = int(args.bandwidth_mb * 1024 * 1024) if args.bandwidth_mb else None
+    fake = FakeDriveServer(port=args.port, bandwidth=bandwidth, error_rate=args.error_rate).start()
+    print(f"Fake Drive: {fake.endpoint} (GOOGLE_DRIVE_API_ENDPOINT={fake.endpoint})")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        fake.stop()
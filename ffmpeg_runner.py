@@ -0,0 +1,136 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+import subprocess
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ffmpeg_processes = metrics.gauge('ffmpeg_processes', 'Запущенные процессы ffmpeg')
+
+class FFmpegError(Exception):
+    """ffmpeg завершился с ошибкой (код возврата и хвост stderr)"""
+    def __init__(self, returncode: int, stderr: str):
+        self.returncode = returncode
+        self.stderr = stderr
+        super().__init__(f"ffmpeg завершился с кодом {returncode}: {stderr[-500:]}")
+
+def run_ffmpeg(cmd: list, on_progress=None, timeout: float = None) -> dict:
+    """
+    Запуск ffmpeg с выводом прогресса в stdout (-progress pipe:1).
+
+    on_progress(progress) вызывается на каждый блок прогресса:
+    {'frame', 'fps', 'out_time', 'speed', 'done'}.
+    При превышении timeout процесс убивается и бросается subprocess.TimeoutExpired.
+    Возвращает итог: {'frames', 'out_time', 'elapsed', 'fps', 'cpu'} (cpu - user+sys секунды процесса, если известны).
+    """
+    cmd = list(cmd)
+    cmd[1:1] = ['-hide_banner', '-nostats', '-progress', 'pipe:1']
+
+    started = time.monotonic()
+    last = {'frame': 0, 'fps': 0.0, 'out_time': 0.0, 'speed': None, 'done': False}
+    timed_out = threading.Event()
+    cpu = None
+
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            text=True,
+            encoding='utf-8',
+            errors='ignore'
+        )
+        ffmpeg_processes.inc()
+
+        def kill():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer:
+            timer.daemon = True
+            timer.start()
+
+        try:
+            block = {}
+            for line in process.stdout:
+                key, _, value = line.strip().partition('=')
+                if not key:
+                    continue
+                block[key] = value
+                if key == 'progress':
+                    last = _parse_progress(block, last)
+                    block = {}
+                    if on_progress:
+                        try:
+                            on_progress(last)
+                        except Exception as e:
+                            logger.warning(f"Ошибка обработчика прогресса ffmpeg: {e}")
+            returncode, cpu = _wait(process)
+        finally:
+            if timer:
+                timer.cancel()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            ffmpeg_processes.dec()
+
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, timeout)
+
+        if returncode != 0:
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode('utf-8', errors='ignore')
+            raise FFmpegError(returncode, stderr)
+
+    elapsed = time.monotonic() - started
+    return {
+        'frames': last['frame'],
+        'out_time': last['out_time'],
+        'elapsed': elapsed,
+        'fps': last['frame'] / elapsed if elapsed > 0 else 0.0,
+        'cpu': cpu
+    }
+
+def _wait(process: subprocess.Popen) -> tuple:
+    """Ожидание процесса: (код возврата, CPU секунды) - через wait4, где он есть (Linux, macOS)"""
+    if not hasattr(os, 'wait4'):
+        return process.wait(), None
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        # Процесс уже собран (например, убит по таймауту и дождан в другом потоке)
+        return process.wait(), None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return process.returncode, usage.ru_utime + usage.ru_stime
+
+def _parse_progress(block: dict, previous: dict) -> dict:
+    """Разбор блока key=value из -progress (нечисловые N/A сохраняют прошлое значение)"""
+    def number(key, cast, default):
+        try:
+            return cast(block[key])
+        except (KeyError, ValueError):
+            return default
+
+    out_time_us = number('out_time_us', int, None)
+    if out_time_us is None:
+        # Старые сборки ffmpeg пишут микросекунды в out_time_ms
+        out_time_us = number('out_time_ms', int, None)
+
+    speed = block.get('speed', '').rstrip('x')
+    try:
+        speed = float(speed)
+    except ValueError:
+        speed = previous['speed']
+
+    return {
+        'frame': number('frame', int, previous['frame']),
+        'fps': number('fps', float, previous['fps']),
+        'out_time': out_time_us / 1_000_000 if out_time_us is not None and out_time_us >= 0 else previous['out_time'],
+        'speed': speed,
+        'done': block.get('progress') == 'end'
+    }
@@ -1,191 +1,581 @@
 import os
+import time
+import queue
 import asyncio
 import logging
 import pickle
 import base64
+import threading
+import contextvars
+import sqlite3
+import urllib.parse
+from contextlib import contextmanager
 from pathlib import Path
+import httplib2
+import google_auth_httplib2
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 from google.auth.transport.requests import Request
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2.credentials import Credentials
+from upload_checkpoints import UploadCheckpointStore
+from metrics import metrics
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+# Размер чанка resumable загрузки должен быть кратен 256 КБ
+CHUNK_ALIGN = 256 * 1024
+# Ответы, при которых Drive просит снизить нагрузку
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+upload_bytes = metrics.counter('upload_bytes_total', 'Байты, отправленные на Google Drive')
+upload_speed = metrics.histogram(
+    'upload_bytes_per_second', 'Скорость загрузки одного клипа', buckets=tuple(mb * MB for mb in (0.5, 1, 2, 5, 10, 20, 50, 100))
+)
+
+class DriveServicePool:
+    """
+    Пул сервисов Google Drive.
+
+    У каждого сервиса свой httplib2.Http (httplib2 не потокобезопасен), поток берет сервис
+    эксклюзивно на время загрузки. Сервис с оборванным соединением (SSL и т.п.) в пул не возвращается.
+    """
+    def __init__(self, credentials, endpoint: str = None, timeout: int = 120):
+        self.credentials = credentials
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.created = 0
+        self.discarded = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def session(self):
+        """Сервис в эксклюзивное пользование: with pool.session() as service"""
+        try:
+            service = self._idle.get_nowait()
+        except queue.Empty:
+            service = self._build()
+
+        broken = False
+        try:
+            yield service
+        except HttpError:
+            # HTTP ответ получен - соединение исправно
+            raise
+        except Exception:
+            broken = True
+            raise
+        finally:
+            if broken:
+                with self._lock:
+                    self.discarded += 1
+            else:
+                self._idle.put(service)
+
+    def fix_uri(self, uri: str) -> str:
+        """
+        Адрес запроса на заданный endpoint.
+        googleapiclient меняет у адресов загрузки только хост, схема остается https -
+        для локального http endpoint (тестовый сервер) подставляем схему и хост целиком.
+        """
+        if not self.endpoint:
+            return uri
+        parsed_endpoint = urllib.parse.urlparse(self.endpoint)
+        parsed_uri = urllib.parse.urlparse(uri)
+        return urllib.parse.urlunparse(parsed_uri._replace(scheme=parsed_endpoint.scheme, netloc=parsed_endpoint.netloc))
+
+    def _build(self):
+        # Как googleapiclient.http.build_http: 308 у resumable загрузки - не редирект, а "чанк принят"
+        base_http = httplib2.Http(timeout=self.timeout)
+        base_http.redirect_codes = base_http.redirect_codes - {308}
+        http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=base_http)
+        client_options = None
+        if self.endpoint:
+            client_options = {'api_endpoint': urllib.parse.urljoin(self.endpoint, 'drive/v3/')}
+        service = build('drive', 'v3', http=http, cache_discovery=False, client_options=client_options)
+        with self._lock:
+            self.created += 1
+        return service
+
+class UploadThrottle:
+    """
+    Адаптивная параллельность загрузок (AIMD).
+
+    - пока суммарная скорость за окно растет, добавляем соединение
+    - 429/5xx от Drive: параллельность вдвое меньше и пауза в росте
+    """
+    def __init__(self, max_concurrency: int = 4, initial: int = 2, window: float = 10.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = max(1, min(initial, self.max_concurrency))
+        self.window = window
+        self.tolerance = 0.05
+        self.hold_windows = 3
+
+        self.active = 0
+        self.waiting = 0
+        self.throttled = 0
+        self.last_throughput = 0.0
+
+        self._bytes = 0
+        self._window_start = time.monotonic()
+        self._prev_throughput = None
+        self._last_change = 0
+        self._hold = 0
+        self._lock = threading.Lock()
+        self._condition = None
+        self._loop = None
+
+    def record_bytes(self, sent: int):
+        """Учет отправленных байт (вызывается из потоков загрузки)"""
+        with self._lock:
+            self._bytes += sent
+        # Подстройка по окнам и во время длинных загрузок, ожидающие acquire перепроверяют лимит раз в секунду
+        self._maybe_adjust()
+
+    def on_throttle(self, status: int):
+        """Drive ответил 429/5xx: мультипликативное уменьшение"""
+        with self._lock:
+            self.throttled += 1
+            old_limit = self.limit
+            self.limit = max(1, self.limit // 2)
+            self._last_change = -1
+            self._hold = self.hold_windows
+        if self.limit != old_limit:
+            logger.warning(f"☁️ Drive ответил {status}, параллельность загрузок: {old_limit} → {self.limit}")
+
+    async def acquire(self):
+        condition = self._get_condition()
+        async with condition:
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    try:
+                        # Лимит может измениться из потока загрузки - периодически перепроверяем
+                        await asyncio.wait_for(condition.wait(), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self.waiting -= 1
+            self.active += 1
+
+    async def release(self):
+        condition = self._get_condition()
+        async with condition:
+            self.active -= 1
+            self._maybe_adjust()
+            condition.notify_all()
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Условие привязано к циклу событий, для нового цикла создаем заново
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+        return self._condition
+
+    def _maybe_adjust(self):
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._window_start
+            if elapsed < self.window:
+                return
+
+            sent = self._bytes
+            self._bytes = 0
+            self._window_start = now
+            if sent == 0:
+                return
+            throughput = sent / elapsed
+            self.last_throughput = throughput
+
+            # Рост пробуем только когда есть очередь на загрузку
+            if self.waiting == 0:
+                return
+
+            previous = self._prev_throughput
+            self._prev_throughput = throughput
+            old_limit = self.limit
+
+            if self._hold > 0:
+                self._hold -= 1
+                self._last_change = 0
+            elif previous is None or self._last_change <= 0 or throughput > previous * (1 + self.tolerance):
+                if self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._last_change = 1
+            elif throughput < previous * (1 - self.tolerance):
+                # Лишнее соединение только мешает - откатываем
+                self.limit = max(1, self.limit - 1)
+                self._last_change = -1
+                self._hold = self.hold_windows
+            else:
+                self._last_change = 0
+
+        if self.limit != old_limit:
+            logger.info(f"☁️ Параллельность загрузок: {old_limit} → {self.limit} ({throughput / MB:.1f} МБ/с)")
+
 class GoogleDriveUploader:
     def __init__(self):
-        self.service = None
+        self.pool = None
         self.folder_id = None
-        
+
+        # Локальный/тестовый endpoint вместо https://www.googleapis.com/ (например, http://127.0.0.1:8765/)
+        self.endpoint = os.getenv('GOOGLE_DRIVE_API_ENDPOINT')
+
+        # Параллельность загрузок подстраивается по скорости и ответам 429/5xx, не выше DRIVE_UPLOAD_CONCURRENCY
+        self.throttle = UploadThrottle(max_concurrency=int(os.getenv('DRIVE_UPLOAD_CONCURRENCY', 4)))
+
+        # Размер чанка resumable загрузки: ~target_chunk_seconds секунд передачи по одному соединению
+        self.chunk_size = int(os.getenv('DRIVE_UPLOAD_CHUNK_MB', 8)) * MB
+        self.min_chunk_size = 1 * MB
+        self.max_chunk_size = 64 * MB
+        self.target_chunk_seconds = 4.0
+        self._connection_speed = None  # EWMA скорости одного соединения, байт/сек
+
+        # Контрольные точки resumable сессий: после обрыва или перезапуска загрузка продолжается с подтвержденного байта
+        self.checkpoints = UploadCheckpointStore(os.getenv('DRIVE_UPLOAD_CHECKPOINTS', 'upload_checkpoints.db'))
+
+        # Метрики
+        self.bytes_uploaded = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self.resumed_uploads = 0
+        self.upload_seconds = 0.0
+        self.uploads = 0
+        self.failures = 0
+        self._stats_lock = threading.Lock()
+
     def _get_credentials(self):
         """Получение учетных данных Google"""
         try:
             # Получаем токен из переменной окружения
             token_base64 = os.getenv('GOOGLE_OAUTH_TOKEN_BASE64')
             if not token_base64:
+                if self.endpoint:
+                    # Тестовый сервер без авторизации
+                    return AnonymousCredentials()
                 raise ValueError("GOOGLE_OAUTH_TOKEN_BASE64 не найден в переменных окружения")
-            
+
             # Декодируем токен
             token_data = base64.b64decode(token_base64)
             credentials = pickle.loads(token_data)
-            
+
             # Обновляем токен если нужно
             if credentials.expired and credentials.refresh_token:
                 credentials.refresh(Request())
-            
+
             return credentials
-            
+
         except Exception as e:
             logger.error(f"Ошибка получения учетных данных: {e}")
             raise
-    
+
     def _init_service(self):
-        """Инициализация сервиса Google Drive"""
-        if self.service is None:
+        """Инициализация пула сервисов Google Drive (учетные данные общие, соединения свои у каждого)"""
+        if self.pool is None:
             credentials = self._get_credentials()
-            
-            # Обновляем токен если нужно
-            if credentials.expired and credentials.refresh_token:
-                credentials.refresh(Request())
-            
-            # Создаем сервис напрямую с credentials (новый API)
-            self.service = build('drive', 'v3', credentials=credentials, cache_discovery=False)
-    
-    async def upload_clips(self, clip_paths: list) -> list:
-        """Загрузка всех клипов на Google Drive"""
+            self.pool = DriveServicePool(credentials, endpoint=self.endpoint)
+            if self.endpoint:
+                logger.info(f"☁️ Google Drive API endpoint: {self.endpoint}")
+
+    async def create_folder(self, folder_name: str) -> str:
+        """Создание папки для клипов задачи (последующие upload_clips(new_folder=False) грузят в нее)"""
+        self.folder_id = None
+        self._init_service()
+        self.folder_id = await self._create_folder(folder_name)
+        return self.folder_id
+
+    async def upload_clips(self, clip_paths: list, clip_numbers: list = None, new_folder: bool = True) -> list:
+        """Загрузка клипов на Google Drive (по умолчанию в новую папку, номера 1..N)"""
+        clip_numbers = list(clip_numbers) if clip_numbers else list(range(1, len(clip_paths) + 1))
         try:
             self._init_service()
-            
+
             # Создаем папку для клипов
-            folder_name = f"Video_Clips_{len(clip_paths)}_clips"
-            self.folder_id = await self._create_folder(folder_name)
-            
-            # Загружаем клипы последовательно для избежания SSL проблем
-            semaphore = asyncio.Semaphore(1)  # Только 1 одновременная загрузка
-            
+            if new_folder or not self.folder_id:
+                folder_name = f"Video_Clips_{len(clip_paths)}_clips"
+                self.folder_id = await self._create_folder(folder_name)
+
+            # Параллельные загрузки, число соединений регулирует UploadThrottle
+            started = time.monotonic()
             tasks = []
-            for i, clip_path in enumerate(clip_paths):
-                task = self._upload_single_clip(semaphore, clip_path, i + 1)
+            for clip_path, clip_number in zip(clip_paths, clip_numbers):
+                task = self._upload_single_clip(clip_path, clip_number, self.folder_id)
                 tasks.append(task)
-            
+
             results = await asyncio.gather(*tasks, return_exceptions=True)
-            
+
             # Обрабатываем результаты
             upload_results = []
-            for i, result in enumerate(results):
+            for clip_number, result in zip(clip_numbers, results):
                 if isinstance(result, Exception):
-                    logger.error(f"Ошибка загрузки клипа {i+1}: {result}")
+                    logger.error(f"Ошибка загрузки клипа {clip_number}: {result}")
                     upload_results.append({
                         'success': False,
                         'error': str(result),
-                        'clip_number': i + 1
+                        'clip_number': clip_number
                     })
                 else:
                     upload_results.append(result)
-            
-            logger.info(f"Загружено {sum(1 for r in upload_results if r['success'])}/{len(clip_paths)} клипов")
+
+            elapsed = time.monotonic() - started
+            uploaded_bytes = sum(r.get('size', 0) for r in upload_results if r.get('success'))
+            logger.info(f"Загружено {sum(1 for r in upload_results if r['success'])}/{len(clip_paths)} клипов: "
+                        f"{uploaded_bytes / MB:.1f} МБ за {elapsed:.1f} сек ({uploaded_bytes / MB / max(elapsed, 1e-6):.1f} МБ/с)")
             return upload_results
-            
+
         except Exception as e:
             logger.error(f"Ошибка загрузки клипов: {e}")
-            return [{'success': False, 'error': str(e)} for _ in clip_paths]
-    
-    async def _upload_single_clip(self, semaphore: asyncio.Semaphore, clip_path: str, clip_number: int) -> dict:
+            return [{'success': False, 'error': str(e), 'clip_number': n} for n in clip_numbers]
+
+    async def upload_clip(self, clip_path: str, clip_number: int, folder_id: str = None) -> dict:
+        """
+        Загрузка одного клипа (для потоковой загрузки по мере рендера) в папку folder_id.
+        Без folder_id - в текущую папку загрузчика (одиночные загрузки); она общая для всех задач,
+        поэтому задачи передают свою папку явно и без нее клипы не грузят.
+        """
+        try:
+            self._init_service()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки клипа {clip_number}: {e}")
+            return {'success': False, 'error': str(e), 'clip_number': clip_number}
+        return await self._upload_single_clip(clip_path, clip_number, folder_id or self.folder_id)
+
+    def stats(self) -> dict:
+        """Метрики загрузок"""
+        with self._stats_lock:
+            return {
+                'uploads': self.uploads,
+                'failures': self.failures,
+                'bytes': self.bytes_uploaded,
+                'bytes_sent': self.bytes_sent,
+                'resumed': self.resumed_uploads,
+                'bytes_saved': self.bytes_saved,
+                'mb_per_s': self.bytes_sent / MB / self.upload_seconds if self.upload_seconds > 0 else 0.0,
+                'window_mb_per_s': self.throttle.last_throughput / MB,
+                'concurrency': self.throttle.limit,
+                'throttled': self.throttle.throttled,
+                'chunk_mb': self._next_chunk_size() / MB,
+                'sessions': self.pool.created if self.pool else 0
+            }
+
+    async def _upload_single_clip(self, clip_path: str, clip_number: int, folder_id: str = None) -> dict:
         """Загрузка одного клипа"""
-        async with semaphore:
-            try:
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(
-                    None,
-                    self._upload_clip_sync,
-                    clip_path, clip_number
-                )
-                return result
-                
-            except Exception as e:
-                logger.error(f"Ошибка загрузки клипа {clip_number}: {e}")
-                return {
-                    'success': False,
-                    'error': str(e),
-                    'clip_number': clip_number
-                }
-    
-    def _upload_clip_sync(self, clip_path: str, clip_number: int) -> dict:
+        with tracer.span('upload slot wait'):
+            await self.throttle.acquire()
+        try:
+            loop = asyncio.get_event_loop()
+            # Контекст задачи (трасса) переходит в поток загрузки
+            context = contextvars.copy_context()
+            result = await loop.run_in_executor(
+                None,
+                context.run,
+                self._upload_clip_sync,
+                clip_path, clip_number, folder_id
+            )
+            return result
+
+        except Exception as e:
+            logger.error(f"Ошибка загрузки клипа {clip_number}: {e}")
+            with self._stats_lock:
+                self.failures += 1
+            return {
+                'success': False,
+                'error': str(e),
+                'clip_number': clip_number
+            }
+        finally:
+            await self.throttle.release()
+
+    def _upload_clip_sync(self, clip_path: str, clip_number: int, folder_id: str = None) -> dict:
         """Синхронная загрузка клипа с повторными попытками"""
-        import time
-        
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                file_name = f"clip_{clip_number:03d}.mp4"
-                
-                # Метаданные файла
-                file_metadata = {
-                    'name': file_name,
-                    'parents': [self.folder_id] if self.folder_id else []
-                }
-                
-                # Загружаем файл
-                media = MediaFileUpload(clip_path, mimetype='video/mp4', resumable=True)
-                
-                file = self.service.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id,name,webViewLink'
-                ).execute()
-                
-                file_id = file.get('id')
-                
-                # Делаем файл общедоступным
-                self.service.permissions().create(
-                    fileId=file_id,
-                    body={'role': 'reader', 'type': 'anyone'}
-                ).execute()
-                
-                # Получаем прямую ссылку на скачивание
-                download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
-                view_url = file.get('webViewLink')
-                
-                logger.info(f"Загружен клип {clip_number}: {file_name}")
-                
-                return {
-                    'success': True,
-                    'file_id': file_id,
-                    'file_name': file_name,
-                    'download_url': download_url,
-                    'view_url': view_url,
-                    'clip_number': clip_number
-                }
-                
+                # Свой сервис из пула: соединение с ошибкой SSL выбрасывается, следующая попытка берет новое
+                with self.pool.session() as service:
+                    return self._upload_with_service(service, clip_path, clip_number, folder_id)
+
             except Exception as e:
                 if attempt < max_retries - 1:
                     wait_time = (attempt + 1) * 2  # 2, 4, 6 секунд
                     logger.warning(f"Попытка {attempt + 1} загрузки клипа {clip_number} неудачна: {e}. Повтор через {wait_time} сек...")
                     time.sleep(wait_time)
-                    
-                    # Переинициализируем сервис при SSL ошибках
-                    if "SSL" in str(e) or "WRONG_VERSION_NUMBER" in str(e):
-                        logger.info(f"SSL ошибка, переинициализируем сервис для клипа {clip_number}")
-                        self.service = None
-                        self._init_service()
                 else:
                     logger.error(f"Все попытки загрузки клипа {clip_number} исчерпаны: {e}")
                     raise
-    
+
+    def _upload_with_service(self, service, clip_path: str, clip_number: int, folder_id: str = None) -> dict:
+        """Resumable загрузка по чанкам на одном соединении пула в папку folder_id (None - корень Drive)"""
+        file_name = f"clip_{clip_number:03d}.mp4"
+        file_size = os.path.getsize(clip_path)
+
+        # Метаданные файла
+        file_metadata = {
+            'name': file_name,
+            'parents': [folder_id] if folder_id else []
+        }
+
+        chunk_size = self._next_chunk_size()
+        media = MediaFileUpload(clip_path, mimetype='video/mp4', chunksize=chunk_size, resumable=True)
+        request = service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields='id,name,webViewLink'
+        )
+        request.uri = self.pool.fix_uri(request.uri)
+
+        started = time.monotonic()
+        file = None
+        resumed_from = 0
+        checkpoint = self.checkpoints.get(clip_path, folder_id, file_name)
+        if checkpoint:
+            file, resumed_from = self._resume_session(request, checkpoint, clip_path, folder_id, file_name, file_size)
+            if resumed_from:
+                with self._stats_lock:
+                    self.resumed_uploads += 1
+                    self.bytes_saved += resumed_from
+                logger.info(f"♻️ Клип {clip_number}: продолжение загрузки с {resumed_from / MB:.1f} из {file_size / MB:.1f} МБ")
+
+        sent_total = 0
+        throttle_retries = 0
+        while file is None:
+            progress_before = request.resumable_progress
+            chunk_started = time.monotonic()
+            try:
+                with tracer.span('drive chunk', offset=progress_before, size=chunk_size):
+                    _, file = request.next_chunk()
+            except HttpError as e:
+                status = e.resp.status
+                if status not in THROTTLE_STATUSES or throttle_retries >= 5:
+                    raise
+                # Drive просит сбавить темп: меньше соединений, чанк повторяется с подтвержденного байта
+                throttle_retries += 1
+                self.throttle.on_throttle(status)
+                time.sleep(min(2 ** throttle_retries, 30))
+                continue
+            finally:
+                # Сессия и подтвержденный байт сохраняются после каждого чанка (и при обрыве)
+                if file is None and request.resumable_uri:
+                    self._save_checkpoint(clip_path, folder_id, file_name, request.resumable_uri, request.resumable_progress)
+
+            throttle_retries = 0
+            sent = (file_size if file is not None else request.resumable_progress) - progress_before
+            if sent > 0:
+                sent_total += sent
+                self.throttle.record_bytes(sent)
+                self._update_connection_speed(sent, time.monotonic() - chunk_started)
+
+        self.checkpoints.delete(clip_path, folder_id, file_name)
+        elapsed = time.monotonic() - started
+        file_id = file.get('id')
+
+        # Делаем файл общедоступным
+        permission_request = service.permissions().create(
+            fileId=file_id,
+            body={'role': 'reader', 'type': 'anyone'}
+        )
+        permission_request.uri = self.pool.fix_uri(permission_request.uri)
+        with tracer.span('drive permission'):
+            permission_request.execute()
+
+        # Получаем прямую ссылку на скачивание
+        download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
+        view_url = file.get('webViewLink')
+
+        with self._stats_lock:
+            self.uploads += 1
+            self.bytes_uploaded += file_size
+            self.bytes_sent += sent_total
+            self.upload_seconds += elapsed
+        upload_bytes.inc(sent_total)
+        if sent_total and elapsed > 0:
+            upload_speed.observe(sent_total / elapsed)
+
+        logger.info(f"Загружен клип {clip_number}: {file_name}, {file_size / MB:.1f} МБ за {elapsed:.1f} сек "
+                    f"({sent_total / MB / max(elapsed, 1e-6):.1f} МБ/с, чанк {chunk_size / MB:.0f} МБ)")
+
+        return {
+            'success': True,
+            'file_id': file_id,
+            'file_name': file_name,
+            'download_url': download_url,
+            'view_url': view_url,
+            'clip_number': clip_number,
+            'size': file_size,
+            'seconds': elapsed,
+            'resumed_from': resumed_from
+        }
+
+    def _resume_session(self, request, checkpoint: dict, clip_path: str, folder_id: str, file_name: str,
+                        file_size: int) -> tuple:
+        """
+        Продолжение сохраненной сессии: запрос статуса (PUT bytes */size) возвращает подтвержденный байт.
+        Возвращает (файл, если сервер уже принял все данные; смещение продолжения).
+        """
+        request.resumable_uri = checkpoint['session_uri']
+        headers = {'Content-Range': f'bytes */{file_size}', 'content-length': '0'}
+        try:
+            resp, content = request.http.request(request.resumable_uri, 'PUT', headers=headers)
+            _, file = request._process_response(resp, content)
+        except HttpError as e:
+            if e.resp.status in THROTTLE_STATUSES:
+                # Сессия может быть жива - контрольную точку оставляем до следующей попытки
+                raise
+            # 404/410: сессия истекла, загружаем заново
+            logger.warning(f"Сессия загрузки {file_name} недействительна ({e.resp.status}), загрузка с начала")
+            self.checkpoints.delete(clip_path, folder_id, file_name)
+            request.resumable_uri = None
+            request.resumable_progress = 0
+            request._in_error_state = False
+            return None, 0
+        return file, file_size if file is not None else request.resumable_progress
+
+    def _save_checkpoint(self, clip_path: str, folder_id: str, file_name: str, session_uri: str, offset: int):
+        try:
+            self.checkpoints.save(clip_path, folder_id, file_name, session_uri, offset)
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось сохранить контрольную точку загрузки {file_name}: {e}")
+
+    def _update_connection_speed(self, sent: int, seconds: float):
+        """EWMA скорости одного соединения по последнему чанку"""
+        if seconds <= 0:
+            return
+        speed = sent / seconds
+        with self._stats_lock:
+            if self._connection_speed is None:
+                self._connection_speed = speed
+            else:
+                self._connection_speed = 0.7 * self._connection_speed + 0.3 * speed
+
+    def _next_chunk_size(self) -> int:
+        """Чанк на ~target_chunk_seconds передачи: меньше запросов на быстрых каналах, меньше потерь на медленных"""
+        if self._connection_speed is None:
+            return self.chunk_size
+        size = int(self._connection_speed * self.target_chunk_seconds)
+        size = max(self.min_chunk_size, min(self.max_chunk_size, size))
+        return size // CHUNK_ALIGN * CHUNK_ALIGN
+
     async def _create_folder(self, folder_name: str) -> str:
         """Создание папки на Google Drive"""
         try:
             loop = asyncio.get_event_loop()
-            folder_id = await loop.run_in_executor(
-                None,
-                self._create_folder_sync,
-                folder_name
-            )
+            with tracer.span('drive folder'):
+                folder_id = await loop.run_in_executor(
+                    None,
+                    self._create_folder_sync,
+                    folder_name
+                )
             return folder_id
-            
+
         except Exception as e:
             logger.error(f"Ошибка создания папки: {e}")
             return None
-    
+
     def _create_folder_sync(self, folder_name: str) -> str:
         """Синхронное создание папки"""
         try:
@@ -193,23 +583,26 @@ class GoogleDriveUploader:
                 'name': folder_name,
                 'mimeType': 'application/vnd.google-apps.folder'
             }
-            
-            folder = self.service.files().create(
-                body=folder_metadata,
-                fields='id'
-            ).execute()
-            
+
+            with self.pool.session() as service:
+                request = service.files().create(
+                    body=folder_metadata,
+                    fields='id'
+                )
+                request.uri = self.pool.fix_uri(request.uri)
+                folder = request.execute()
+
             folder_id = folder.get('id')
             logger.info(f"Создана папка: {folder_name} (ID: {folder_id})")
-            
+
             return folder_id
-            
+
         except Exception as e:
             logger.error(f"Ошибка синхронного создания папки: {e}")
             raise
-    
+
     def get_folder_link(self) -> str:
         """Получение ссылки на папку"""
         if self.folder_id:
             return f"https://drive.google.com/drive/folders/{self.folder_id}"
-        return None
\ No newline at end of file
+        return None
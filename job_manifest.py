@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Статусы задачи: running - выполняется (после перезапуска процесса - прервана), остальные конечные
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+def file_sha256(path: str, block_size: int = 4 * 1024 * 1024) -> str:
+    """SHA-256 файла блоками (клипы до сотни МБ не читаются в память целиком)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class JobManifestStore:
+    """
+    Журнал задач обработки (SQLite): источник, план чанков, готовые чанки, клипы и загрузки.
+
+    Записи делаются по мере работы конвейера, поэтому после перезапуска процесса задача
+    продолжается с первого незавершенного чанка/клипа/загрузки.
+    """
+    def __init__(self, path: str = 'jobs.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    user_id INTEGER,
+                    chat_id INTEGER,
+                    status TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    video_path TEXT,
+                    video_size INTEGER,
+                    total_duration REAL,
+                    folder_id TEXT,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS chunks (
+                    job_id TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    start_time REAL NOT NULL,
+                    duration REAL NOT NULL,
+                    start_index INTEGER NOT NULL,
+                    expected_clips INTEGER NOT NULL,
+                    is_source INTEGER NOT NULL,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (job_id, chunk_index)
+                );
+                CREATE TABLE IF NOT EXISTS clips (
+                    job_id TEXT NOT NULL,
+                    clip_number INTEGER NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    PRIMARY KEY (job_id, clip_number)
+                );
+                CREATE TABLE IF NOT EXISTS uploads (
+                    job_id TEXT NOT NULL,
+                    clip_number INTEGER NOT NULL,
+                    result TEXT NOT NULL,
+                    PRIMARY KEY (job_id, clip_number)
+                );
+            """)
+
+    def create(self, source: dict, config: dict, user_id: int = None, chat_id: int = None) -> 'JobManifest':
+        """Новая задача: source - {'url': ...} или {'path': ...}"""
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (job_id, user_id, chat_id, status, source, config, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, user_id, chat_id, STATUS_RUNNING, json.dumps(source), json.dumps(config), now, now)
+        )
+        return JobManifest(self, job_id)
+
+    def open(self, job_id: str) -> 'JobManifest':
+        """Журнал существующей задачи или None"""
+        if self._query("SELECT 1 FROM jobs WHERE job_id=?", (job_id,)):
+            return JobManifest(self, job_id)
+        return None
+
+    def unfinished(self, user_id: int = None) -> list:
+        """Прерванные задачи (status running) - новые первыми"""
+        sql = "SELECT job_id FROM jobs WHERE status=?"
+        params = [STATUS_RUNNING]
+        if user_id is not None:
+            sql += " AND user_id=?"
+            params.append(user_id)
+        sql += " ORDER BY created DESC"
+        return [JobManifest(self, row[0]) for row in self._query(sql, params)]
+
+    def _execute(self, sql: str, params=()):
+        with self._lock, self._conn:
+            self._conn.execute(sql, params)
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+class JobManifest:
+    """Журнал одной задачи"""
+    def __init__(self, store: JobManifestStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+
+    def job(self) -> dict:
+        row = self.store._query(
+            "SELECT user_id, chat_id, status, source, config, video_path, video_size, total_duration, folder_id, error, created "
+            "FROM jobs WHERE job_id=?", (self.job_id,)
+        )[0]
+        return {
+            'job_id': self.job_id,
+            'user_id': row[0],
+            'chat_id': row[1],
+            'status': row[2],
+            'source': json.loads(row[3]),
+            'config': json.loads(row[4]),
+            'video_path': row[5],
+            'video_size': row[6],
+            'total_duration': row[7],
+            'folder_id': row[8],
+            'error': row[9],
+            'created': row[10]
+        }
+
+    def _update(self, **fields):
+        columns = ', '.join(f"{name}=?" for name in fields)
+        self.store._execute(
+            f"UPDATE jobs SET {columns}, updated=? WHERE job_id=?",
+            tuple(fields.values()) + (time.time(), self.job_id)
+        )
+
+    def set_video(self, video_path: str, total_duration: float = None):
+        """Исходное видео на диске (скачанное или присланное): при продолжении скачивание пропускается"""
+        self._update(video_path=video_path, video_size=os.path.getsize(video_path))
+        if total_duration is not None:
+            self._update(total_duration=total_duration)
+
+    def set_duration(self, total_duration: float):
+        self._update(total_duration=total_duration)
+
+    def set_folder(self, folder_id: str):
+        self._update(folder_id=folder_id)
+
+    def finish(self, status: str = STATUS_DONE, error: str = None):
+        self._update(status=status, error=error)
+
+    def video_available(self) -> bool:
+        """Исходное видео на месте и не изменилось"""
+        job = self.job()
+        path = job['video_path']
+        return bool(path) and os.path.exists(path) and os.path.getsize(path) == job['video_size']
+
+    def add_chunk(self, chunk_index: int, start_time: float, duration: float, start_index: int,
+                  expected_clips: int, is_source: bool):
+        """Чанк плана (номера клипов чанка зарезервированы с start_index)"""
+        self.store._execute(
+            "INSERT OR REPLACE INTO chunks (job_id, chunk_index, start_time, duration, start_index, expected_clips, is_source, done) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+            (self.job_id, chunk_index, start_time, duration, start_index, expected_clips, int(is_source))
+        )
+
+    def chunk_done(self, chunk_index: int, done: bool = True):
+        self.store._execute(
+            "UPDATE chunks SET done=? WHERE job_id=? AND chunk_index=?", (int(done), self.job_id, chunk_index)
+        )
+
+    def chunks(self) -> dict:
+        """План чанков: {индекс: {...}}"""
+        rows = self.store._query(
+            "SELECT chunk_index, start_time, duration, start_index, expected_clips, is_source, done "
+            "FROM chunks WHERE job_id=? ORDER BY chunk_index", (self.job_id,)
+        )
+        return {
+            row[0]: {
+                'index': row[0],
+                'start_time': row[1],
+                'duration': row[2],
+                'start_index': row[3],
+                'expected_clips': row[4],
+                'is_source': bool(row[5]),
+                'done': bool(row[6])
+            }
+            for row in rows
+        }
+
+    def add_clip(self, clip_number: int, chunk_index: int, path: str, size: int, sha256: str):
+        """Отрендеренный клип (размер и хэш проверяются перед повторным использованием)"""
+        self.store._execute(
+            "INSERT OR REPLACE INTO clips (job_id, clip_number, chunk_index, path, size, sha256) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.job_id, clip_number, chunk_index, path, size, sha256)
+        )
+
+    def clips(self) -> dict:
+        """Отрендеренные клипы: {номер: {...}}"""
+        rows = self.store._query(
+            "SELECT clip_number, chunk_index, path, size, sha256 FROM clips WHERE job_id=? ORDER BY clip_number", (self.job_id,)
+        )
+        return {
+            row[0]: {'clip_number': row[0], 'chunk_index': row[1], 'path': row[2], 'size': row[3], 'sha256': row[4]}
+            for row in rows
+        }
+
+    def clip_intact(self, clip: dict) -> bool:
+        """Локальный клип на месте и совпадает с записанным размером/хэшем"""
+        path = clip['path']
+        if not os.path.exists(path) or os.path.getsize(path) != clip['size']:
+            return False
+        return file_sha256(path) == clip['sha256']
+
+    def add_upload(self, result: dict):
+        """Результат загрузки клипа (успешные при продолжении не загружаются повторно)"""
+        self.store._execute(
+            "INSERT OR REPLACE INTO uploads (job_id, clip_number, result) VALUES (?, ?, ?)",
+            (self.job_id, result['clip_number'], json.dumps(result))
+        )
+
+    def uploads(self) -> dict:
+        """Результаты загрузок: {номер клипа: результат}"""
+        rows = self.store._query("SELECT clip_number, result FROM uploads WHERE job_id=?", (self.job_id,))
+        return {row[0]: json.loads(row[1]) for row in rows}
+
+    def uploaded(self) -> dict:
+        """Успешно загруженные клипы"""
+        return {number: result for number, result in self.uploads().items() if result.get('success')}
+
+    def progress(self) -> dict:
+        """Сводка для пользователя: чанки, клипы, загрузки"""
+        chunks = self.chunks()
+        return {
+            'chunks': len(chunks),
+            'chunks_done': sum(1 for chunk in chunks.values() if chunk['done']),
+            'expected_clips': sum(chunk['expected_clips'] for chunk in chunks.values()),
+            'clips': len(self.clips()),
+            'uploaded': len(self.uploaded())
+        }
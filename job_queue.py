@@ -0,0 +1,275 @@
+import json
+import time
+import heapq
+import asyncio
+import sqlite3
+import logging
+import threading
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Статусы задачи в очереди
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Оценка ожидания для видео неизвестной длительности
+DEFAULT_DURATION = 600.0
+
+class JobQueue:
+    """
+    Очередь задач обработки (SQLite) с пулом обработчиков.
+
+    - задачи переживают перезапуск: выполнявшиеся в момент остановки возвращаются в очередь,
+      после max_attempts запусков (задача каждый раз роняет процесс) считаются упавшими
+    - не больше per_user задач одного пользователя одновременно, пользователи обслуживаются по кругу
+      (десять длинных видео одного пользователя не задерживают остальных)
+    - прием ограничен глубиной очереди, числом задач пользователя в очереди и длительностью исходника
+    - одинаковые задачи (coalesce_key) не выполняются одновременно: вторая ждет в очереди
+      и отвечается из записанного результата первой
+    - позиция в очереди и оценка ожидания по скорости прошлых задач (сек обработки на сек видео)
+    """
+    def __init__(self, path: str = 'jobs.db', workers: int = 2, per_user: int = 1, max_depth: int = 50,
+                 max_user_queued: int = 5, max_duration: float = 4 * 3600, max_attempts: int = 3):
+        self.path = path
+        self.workers = workers
+        self.per_user = per_user
+        self.max_depth = max_depth
+        self.max_user_queued = max_user_queued
+        self.max_duration = max_duration
+        self.max_attempts = max_attempts
+        self.speed = 1.0
+        self._served = {}
+        self._tasks = []
+        self._handler = None
+        self._changed = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    chat_id INTEGER,
+                    payload TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    coalesce_key TEXT,
+                    duration REAL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    enqueued REAL NOT NULL,
+                    started REAL,
+                    finished REAL
+                )
+            """)
+            # Задача, на которой процесс падал max_attempts раз подряд (OOM, segfault в ffmpeg/Whisper),
+            # не запускается снова: иначе каждый перезапуск начинается с нее и бот падает по кругу
+            abandoned = self._conn.execute(
+                "SELECT id, user_id, chat_id, payload, attempts FROM queue WHERE status=? AND attempts>=? ORDER BY id",
+                (RUNNING, max_attempts)
+            ).fetchall()
+            self._conn.execute(
+                "UPDATE queue SET status=?, error=?, finished=? WHERE status=? AND attempts>=?",
+                (FAILED, 'обработка прерывалась падением процесса', time.time(), RUNNING, max_attempts)
+            )
+            # Остальные задачи, прерванные остановкой процесса, выполняются заново
+            interrupted = self._conn.execute(
+                "UPDATE queue SET status=?, started=NULL WHERE status=?", (QUEUED, RUNNING)
+            ).rowcount
+            rows = self._conn.execute(
+                "SELECT (finished - started) / duration FROM queue WHERE status=? AND duration > 0 "
+                "ORDER BY finished DESC LIMIT 20", (DONE,)
+            ).fetchall()
+        if rows:
+            self.speed = sum(row[0] for row in rows) / len(rows)
+        # Упавшие при запуске задачи - владельцам сообщает бот
+        self.abandoned = [{
+            'id': row[0], 'user_id': row[1], 'chat_id': row[2], 'payload': json.loads(row[3]), 'attempts': row[4]
+        } for row in abandoned]
+        if self.abandoned:
+            logger.warning(f"📥 Очередь: {len(self.abandoned)} задач прерывались {max_attempts} раз и сняты с выполнения")
+        if interrupted:
+            logger.info(f"📥 Очередь: {interrupted} прерванных задач возвращены в очередь")
+        metrics.gauge('job_queue_jobs', 'Задачи очереди по статусам', ('status',), callback=lambda: {
+            (status,): self.stats()[status] for status in (QUEUED, RUNNING, DONE, FAILED)
+        })
+
+    def submit(self, user_id: int, chat_id: int, payload: dict, config: dict,
+               duration: float = None, coalesce_key: str = None) -> dict:
+        """Постановка в очередь: {'accepted', 'id', 'position', 'eta'} или {'accepted': False, 'reason'}"""
+        if duration and self.max_duration and duration > self.max_duration:
+            return {'accepted': False, 'reason': f"видео длиннее {self.max_duration / 60:.0f} мин"}
+        with self._lock:
+            depth, user_queued = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(user_id=?), 0) FROM queue WHERE status=?", (user_id, QUEUED)
+            ).fetchone()
+        if depth >= self.max_depth:
+            return {'accepted': False, 'reason': f"очередь заполнена ({depth} задач), попробуйте позже"}
+        if user_queued >= self.max_user_queued:
+            return {'accepted': False, 'reason': f"у вас уже {user_queued} задач в очереди"}
+
+        with self._lock, self._conn:
+            job_id = self._conn.execute(
+                "INSERT INTO queue (user_id, chat_id, payload, config, coalesce_key, duration, status, enqueued) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, json.dumps(payload, ensure_ascii=False), json.dumps(config, ensure_ascii=False),
+                 coalesce_key, duration, QUEUED, time.time())
+            ).lastrowid
+        self._notify()
+        position, eta = self.position(job_id)
+        logger.info(f"📥 Очередь: задача {job_id} пользователя {user_id}, место {position}, ожидание ≈{eta:.0f} сек")
+        return {'accepted': True, 'id': job_id, 'position': position, 'eta': eta}
+
+    def _rows(self, status: str) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, user_id, chat_id, payload, config, coalesce_key, duration, started, attempts "
+                "FROM queue WHERE status=? ORDER BY id", (status,)
+            ).fetchall()
+        return [{
+            'id': row[0], 'user_id': row[1], 'chat_id': row[2], 'payload': json.loads(row[3]),
+            'config': json.loads(row[4]), 'coalesce_key': row[5], 'duration': row[6], 'started': row[7],
+            'attempts': row[8]
+        } for row in rows]
+
+    def _order(self, queued: list) -> list:
+        """Порядок выдачи без учета лимитов: по кругу между пользователями, давно обслуженные первыми"""
+        per_user = {}
+        for job in queued:
+            per_user.setdefault(job['user_id'], []).append(job)
+        users = sorted(per_user, key=lambda u: (self._served.get(u, 0.0), per_user[u][0]['id']))
+        order = []
+        while users:
+            for user in list(users):
+                order.append(per_user[user].pop(0))
+                if not per_user[user]:
+                    users.remove(user)
+        return order
+
+    def _claim(self) -> dict:
+        """Следующая задача: первая по кругу, у чьего пользователя есть свободный слот"""
+        running = self._rows(RUNNING)
+        busy = {}
+        for job in running:
+            busy[job['user_id']] = busy.get(job['user_id'], 0) + 1
+        running_keys = {job['coalesce_key'] for job in running if job['coalesce_key']}
+
+        for job in self._order(self._rows(QUEUED)):
+            if busy.get(job['user_id'], 0) >= self.per_user or job['coalesce_key'] in running_keys:
+                continue
+            now = time.time()
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "UPDATE queue SET status=?, started=?, attempts=attempts + 1 WHERE id=?", (RUNNING, now, job['id'])
+                )
+            self._served[job['user_id']] = now
+            job['started'] = now
+            job['attempts'] += 1
+            return job
+        return None
+
+    def _finish(self, job: dict, success: bool, error: str = None, measured: bool = True):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE queue SET status=?, error=?, finished=? WHERE id=?",
+                (DONE if success else FAILED, error, now, job['id'])
+            )
+        if success and measured and job['duration']:
+            # Скользящая оценка скорости обработки для прогнозов ожидания
+            self.speed = 0.7 * self.speed + 0.3 * (now - job['started']) / job['duration']
+
+    def _estimate(self, job: dict) -> float:
+        return self.speed * (job['duration'] or DEFAULT_DURATION)
+
+    def position(self, job_id: int) -> tuple:
+        """(место в очереди, оценка ожидания в секундах); (0, 0) - задача уже выполняется или завершена"""
+        order = self._order(self._rows(QUEUED))
+        index = next((i for i, job in enumerate(order) if job['id'] == job_id), None)
+        if index is None:
+            return 0, 0.0
+
+        # Обработчики освобождаются по мере завершения текущих задач, затем задач впереди
+        now = time.time()
+        free = [max(0.0, self._estimate(job) - (now - job['started'])) for job in self._rows(RUNNING)]
+        free = sorted(free)[:self.workers] + [0.0] * max(0, self.workers - len(free))
+        heapq.heapify(free)
+        for job in order[:index]:
+            heapq.heappush(free, heapq.heappop(free) + self._estimate(job))
+        return index + 1, free[0]
+
+    def user_jobs(self, user_id: int) -> list:
+        """Задачи пользователя в очереди и в работе: [{'id', 'status', 'position', 'eta', 'payload'}]"""
+        jobs = []
+        for status in (RUNNING, QUEUED):
+            for job in self._rows(status):
+                if job['user_id'] != user_id:
+                    continue
+                position, eta = self.position(job['id']) if status == QUEUED else (0, 0.0)
+                jobs.append({'id': job['id'], 'status': status, 'position': position, 'eta': eta,
+                             'payload': job['payload']})
+        return jobs
+
+    def _notify(self):
+        if self._changed is not None:
+            asyncio.get_running_loop().create_task(self._wake())
+
+    async def _wake(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def start(self, handler):
+        """
+        Запуск обработчиков: handler(job) - корутина с результатом {'success', 'error'}.
+        job['attempts'] > 1 - задача прервана остановкой процесса и выполняется повторно.
+        """
+        self._handler = handler
+        self._changed = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        logger.info(f"📥 Очередь: {self.workers} обработчиков, до {self.per_user} задач на пользователя")
+
+    async def stop(self):
+        """Остановка обработчиков; выполнявшиеся задачи остаются running и вернутся в очередь при запуске"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, number: int):
+        while True:
+            async with self._changed:
+                job = self._claim()
+                while job is None:
+                    await self._changed.wait()
+                    job = self._claim()
+
+            logger.info(f"▶️ Обработчик {number}: задача {job['id']} пользователя {job['user_id']}")
+            try:
+                result = await self._handler(job)
+                result = result or {}
+                # Ответ из чужого результата мгновенный и не говорит о скорости обработки
+                self._finish(job, bool(result.get('success')), result.get('error'), measured=not result.get('coalesced'))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка задачи {job['id']} из очереди: {e}")
+                self._finish(job, False, str(e))
+
+            # Освободился слот пользователя и, возможно, ключ одинаковых задач
+            async with self._changed:
+                self._changed.notify_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM queue GROUP BY status").fetchall())
+        return {
+            'queued': counts.get(QUEUED, 0),
+            'running': counts.get(RUNNING, 0),
+            'done': counts.get(DONE, 0),
+            'failed': counts.get(FAILED, 0),
+            'workers': self.workers,
+            'speed': self.speed
+        }
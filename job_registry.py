@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+class JobRegistry:
+    """
+    Реестр задач для объединения одинаковых запросов (SQLite).
+
+    - ключ: нормализованный источник (ключ кэша исходников) + действующие настройки
+      (длительность, заголовки, флаги, режим рендера, модель субтитров)
+    - одинаковый запрос во время обработки подписывается на идущую задачу и получает тот же результат
+    - успешный результат (файл ссылок, число шотсов) записывается, повторный запрос отвечается
+      из записи без скачивания, рендера и загрузки; записи старше max_age не используются
+    - каждый ответ получает свою временную копию файла ссылок, бот удаляет ее после отправки
+    """
+    def __init__(self, path: str = 'jobs.db', max_age: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self.started = 0
+        self.joined = 0
+        self.replayed = 0
+        self._running = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_results (
+                    key TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    job_id TEXT,
+                    total_clips INTEGER NOT NULL,
+                    upload_results TEXT NOT NULL,
+                    links TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+
+    @staticmethod
+    def key(source: str, config: dict) -> str:
+        """Ключ задачи: одинаков для одного источника с одинаковыми действующими настройками"""
+        canonical = json.dumps({'source': source, 'config': config}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def is_running(self, key: str) -> bool:
+        return key in self._running
+
+    def recorded(self, key: str) -> dict:
+        """Записанный результат такой же задачи (файл ссылок восстанавливается) или None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, total_clips, upload_results, links, created FROM job_results WHERE key=?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, total_clips, upload_results, links, created = row
+        if time.time() - created > self.max_age:
+            return None
+        self.replayed += 1
+        logger.info(f"♻️ Реестр задач: результат {key[:12]} уже есть (задача {job_id}), обработка не нужна")
+        return {
+            'success': True,
+            'job_id': job_id,
+            'total_clips': total_clips,
+            'links_file': self._write_links(links),
+            'upload_results': json.loads(upload_results),
+            'coalesced': 'recorded'
+        }
+
+    async def run(self, key: str, process, source: str = '', config: dict = None) -> dict:
+        """
+        Результат задачи по ключу: та же идущая задача (подписка) или новая через process().
+        process() - корутина с результатом конвейера {'success', 'job_id', 'total_clips', 'links_file', ...}.
+        """
+        running = self._running.get(key)
+        if running is not None:
+            # Такая же задача уже выполняется - ждем ее результат
+            self.joined += 1
+            logger.info(f"🔗 Реестр задач: {key[:12]} уже обрабатывается, ждем ее результат")
+            try:
+                result = await asyncio.shield(running)
+            except asyncio.CancelledError:
+                if not running.cancelled():
+                    raise
+                # Идущую задачу отменили (остановка очереди, отмена пользователем) - выполняем запрос сами
+                logger.info(f"🔗 Реестр задач: задача {key[:12]} отменена, обрабатываем запрос заново")
+                return await self.run(key, process, source, config)
+            return dict(self._with_links(result), coalesced='running')
+
+        self.started += 1
+        future = asyncio.get_running_loop().create_future()
+        self._running[key] = future
+        try:
+            result = await process()
+            if result.get('success'):
+                result = self._record(key, result, source, config or {})
+            future.set_result(result)
+            return self._with_links(result)
+        except Exception as e:
+            future.set_result({'success': False, 'error': str(e)})
+            raise
+        finally:
+            # Отмененная задача не дает результата - подписчики узнают об этом и не ждут вечно
+            if not future.done():
+                future.cancel()
+            del self._running[key]
+
+    def _record(self, key: str, result: dict, source: str, config: dict) -> dict:
+        """
+        Ссылки задачи для всех ответов: файл задачи читается и удаляется, каждый ответ получает свою копию.
+        Результат записывается для повторных запросов, только если загружены все шотсы.
+        """
+        links_file = result.get('links_file')
+        if not links_file:
+            return result
+        try:
+            with open(links_file, 'r', encoding='utf-8') as f:
+                links = f.read()
+            os.remove(links_file)
+        except OSError as e:
+            logger.warning(f"Файл ссылок задачи не прочитан: {e}")
+            return result
+
+        upload_results = result.get('upload_results', [])
+        complete = result.get('total_clips', 0) > 0 and len(upload_results) == result['total_clips'] \
+            and all(r.get('success') for r in upload_results)
+        if complete:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO job_results "
+                    "(key, source, config, job_id, total_clips, upload_results, links, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, source, json.dumps(config, ensure_ascii=False), result.get('job_id'),
+                     result['total_clips'], json.dumps(upload_results, ensure_ascii=False), links, time.time())
+                )
+        result = dict(result, links=links)
+        del result['links_file']
+        return result
+
+    def _with_links(self, result: dict) -> dict:
+        """Ответ с собственной копией файла ссылок (бот удаляет файл после отправки)"""
+        if 'links' not in result:
+            return result
+        result = dict(result, links_file=self._write_links(result['links']))
+        del result['links']
+        return result
+
+    def _write_links(self, links: str) -> str:
+        fd, links_file = tempfile.mkstemp(prefix='video_links_', suffix='.txt')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(links)
+        return links_file
+
+    def stats(self) -> dict:
+        with self._lock:
+            recorded = self._conn.execute("SELECT COUNT(*) FROM job_results").fetchone()[0]
+        return {
+            'running': len(self._running),
+            'recorded': recorded,
+            'started': self.started,
+            'joined': self.joined,
+            'replayed': self.replayed
+        }
@@ -0,0 +1,268 @@
+import os
+import time
+import logging
+import threading
+from bisect import bisect_right
+from fractions import Fraction
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import ffmpeg
+from metrics import metrics, stage_seconds, stage_failures
+
+logger = logging.getLogger(__name__)
+
+class KeyframeIndex:
+    """
+    Индекс ключевых кадров видео потока: отсортированные pts ключевых кадров и длительность.
+    Строится одним проходом ffprobe по пакетам (только демультиплексирование, без декодирования).
+    """
+    def __init__(self, keyframes: list, duration: float):
+        self.keyframes = keyframes
+        self.duration = duration
+
+    def seek_point(self, t: float) -> float:
+        """Последний ключевой кадр не позже t - с него начинается декодирование при переходе на t"""
+        i = bisect_right(self.keyframes, t)
+        return self.keyframes[i - 1] if i > 0 else 0.0
+
+    def decode_lead(self, t: float) -> float:
+        """Сколько секунд декодируется впустую при переходе на t"""
+        return t - self.seek_point(t)
+
+    def max_interval(self) -> float:
+        intervals = [b - a for a, b in zip(self.keyframes, self.keyframes[1:])]
+        return max(intervals) if intervals else self.duration
+
+class MediaProbeCache:
+    """
+    Кэш результатов ffprobe на уровне процесса.
+
+    - ключ: (абсолютный путь, размер, mtime_ns) - перезаписанный файл не вернет устаревшие данные
+    - LRU вытеснение при превышении max_entries
+    - счетчики попаданий/промахов для диагностики
+    """
+    def __init__(self, max_entries: int = 256, keyframe_scan_seconds: int = 30):
+        self.max_entries = max_entries
+        self.keyframe_scan_seconds = keyframe_scan_seconds
+        self._entries = OrderedDict()
+        self._keyframe_indexes = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, path: str) -> tuple:
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    def probe(self, path: str) -> dict:
+        """Метаданные файла из кэша или через ffprobe"""
+        key = self._key(path)
+        with self._lock:
+            info = self._entries.get(key)
+            if info is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(info)
+            self.misses += 1
+
+        started = time.monotonic()
+        try:
+            info = self._probe_file(path)
+        except Exception:
+            stage_failures.inc(stage='probe')
+            raise
+        stage_seconds.observe(time.monotonic() - started, stage='probe')
+
+        with self._lock:
+            self._entries[key] = info
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return dict(info)
+
+    def keyframe_index(self, path: str) -> KeyframeIndex:
+        """Индекс ключевых кадров всего файла (кэшируется тем же ключом, что и probe)"""
+        key = self._key(path)
+        with self._lock:
+            index = self._keyframe_indexes.get(key)
+            if index is not None:
+                self._keyframe_indexes.move_to_end(key)
+                self.hits += 1
+                return index
+            self.misses += 1
+
+        index = self._build_keyframe_index(path)
+
+        with self._lock:
+            self._keyframe_indexes[key] = index
+            while len(self._keyframe_indexes) > self.max_entries:
+                self._keyframe_indexes.popitem(last=False)
+                self.evictions += 1
+        return index
+
+    def probe_many(self, paths: list, max_workers: int = 8) -> dict:
+        """Пакетный probe нескольких файлов параллельно: {путь: метаданные}"""
+        results = {}
+        if not paths:
+            return results
+
+        def probe_safe(path):
+            try:
+                return path, self.probe(path)
+            except Exception as e:
+                logger.error(f"Ошибка probe {path}: {e}")
+                return path, None
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+            for path, info in executor.map(probe_safe, paths):
+                if info is not None:
+                    results[path] = info
+        return results
+
+    def invalidate(self, path: str = None):
+        """Удаление записей файла (или всего кэша)"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._keyframe_indexes.clear()
+                return
+            abs_path = os.path.abspath(path)
+            for key in [k for k in self._entries if k[0] == abs_path]:
+                del self._entries[key]
+            for key in [k for k in self._keyframe_indexes if k[0] == abs_path]:
+                del self._keyframe_indexes[key]
+
+    def stats(self) -> dict:
+        """Счетчики кэша"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / total if total else 0.0
+            }
+
+    def _probe_file(self, path: str) -> dict:
+        """Один запуск ffprobe: формат, потоки и пакеты первых секунд для интервала ключевых кадров"""
+        probe = ffmpeg.probe(
+            path,
+            show_entries='packet=stream_index,pts_time,flags',
+            read_intervals=f'%+{self.keyframe_scan_seconds}'
+        )
+
+        video_stream = next((s for s in probe['streams'] if s['codec_type'] == 'video'), None)
+        audio_stream = next((s for s in probe['streams'] if s['codec_type'] == 'audio'), None)
+        if not video_stream:
+            raise ValueError("Видео поток не найден")
+
+        fps_rational = self._parse_rate(video_stream.get('r_frame_rate')) or self._parse_rate(video_stream.get('avg_frame_rate'))
+        format_info = probe.get('format', {})
+        duration = format_info.get('duration') or video_stream.get('duration') or 0
+
+        return {
+            'duration': float(duration),
+            'width': int(video_stream['width']),
+            'height': int(video_stream['height']),
+            'fps': float(fps_rational) if fps_rational else 0.0,
+            'fps_rational': fps_rational,
+            'codec': video_stream.get('codec_name'),
+            'pix_fmt': video_stream.get('pix_fmt'),
+            'bit_rate': int(format_info['bit_rate']) if format_info.get('bit_rate') else None,
+            'keyframe_interval': self._keyframe_interval(probe.get('packets', []), video_stream['index']),
+            'has_audio': audio_stream is not None,
+            'audio_codec': audio_stream.get('codec_name') if audio_stream else None,
+            'sample_rate': int(audio_stream['sample_rate']) if audio_stream and audio_stream.get('sample_rate') else None,
+            'format_name': format_info.get('format_name'),
+            'streams': probe['streams']
+        }
+
+    def _build_keyframe_index(self, path: str) -> KeyframeIndex:
+        """Один проход ffprobe по всем пакетам видео потока"""
+        probe = ffmpeg.probe(
+            path,
+            select_streams='v:0',
+            show_entries='packet=pts_time,duration_time,flags'
+        )
+
+        keyframes = []
+        end = 0.0
+        for packet in probe.get('packets', []):
+            try:
+                pts = float(packet['pts_time'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            try:
+                end = max(end, pts + float(packet.get('duration_time', 0)))
+            except (TypeError, ValueError):
+                end = max(end, pts)
+            if 'K' in packet.get('flags', ''):
+                keyframes.append(pts)
+        keyframes.sort()
+
+        format_duration = probe.get('format', {}).get('duration')
+        duration = float(format_duration) if format_duration else end
+        logger.info(f"🔑 Индекс ключевых кадров {os.path.basename(path)}: {len(keyframes)} кадров, {duration:.1f} сек")
+        return KeyframeIndex(keyframes, duration)
+
+    def _parse_rate(self, rate: str):
+        """Частота кадров как рациональное число ('30000/1001' -> Fraction)"""
+        if not rate:
+            return None
+        try:
+            value = Fraction(rate)
+        except (ValueError, ZeroDivisionError):
+            return None
+        return value if value > 0 else None
+
+    def _keyframe_interval(self, packets: list, video_index: int):
+        """Медианный интервал между ключевыми кадрами видео (сек)"""
+        keyframes = []
+        for packet in packets:
+            if packet.get('stream_index') != video_index or 'K' not in packet.get('flags', ''):
+                continue
+            try:
+                keyframes.append(float(packet['pts_time']))
+            except (KeyError, TypeError, ValueError):
+                continue
+
+        keyframes.sort()
+        intervals = [b - a for a, b in zip(keyframes, keyframes[1:]) if b > a]
+        if not intervals:
+            return None
+        intervals.sort()
+        return intervals[len(intervals) // 2]
+
+def mp4_is_complete(path: str) -> bool:
+    """
+    Проверка, что MP4 дописан: есть moov и mdat, последний бокс заканчивается ровно на конце файла.
+    Читаются только заголовки боксов верхнего уровня, без запуска ffprobe.
+    """
+    try:
+        file_size = os.path.getsize(path)
+        boxes = set()
+        offset = 0
+        with open(path, 'rb') as f:
+            while offset + 8 <= file_size:
+                f.seek(offset)
+                header = f.read(8)
+                size = int.from_bytes(header[:4], 'big')
+                box_type = header[4:8]
+                if size == 1:
+                    size = int.from_bytes(f.read(8), 'big')
+                elif size == 0:
+                    size = file_size - offset
+                if size < 8:
+                    return False
+                boxes.add(box_type)
+                offset += size
+        return offset == file_size and b'moov' in boxes and b'mdat' in boxes
+    except OSError:
+        return False
+
+# Общий кэш процесса
+probe_cache = MediaProbeCache(max_entries=int(os.getenv('PROBE_CACHE_SIZE', 256)))
+metrics.gauge('probe_cache_hit_ratio', 'Доля попаданий кэша probe', callback=lambda: probe_cache.stats()['hit_ratio'])
@@ -0,0 +1,239 @@
+import os
+import math
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+def _labels_text(labelnames: tuple, values: tuple, extra: str = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """Метрика с метками: значения по кортежу значений меток (в порядке labelnames)"""
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name}: метки {sorted(labels)}, ожидались {list(self.labelnames)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self) -> list:
+        """[(суффикс имени, значения меток, доп. метка, значение)]"""
+        with self._lock:
+            return [('', key, None, value) for key, value in sorted(self._values.items())]
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_labels_text(self.labelnames, key, extra)} {_number(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+class Gauge(Metric):
+    """Значение, которое задается явно или читается функцией callback при каждом запросе /metrics"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), callback=None):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list:
+        if self.callback is None:
+            return super().samples()
+        # callback() - число (метрика без меток) или {кортеж значений меток: число}
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning(f"Метрика {self.name} не прочитана: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [('', key, None, value) for key, value in sorted(values.items()) if value is not None]
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = ()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+        return state['count'] if state else 0
+
+    def samples(self) -> list:
+        samples = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state['counts']):
+                    cumulative += count
+                    samples.append(('_bucket', key, f'le="{_number(bound)}"', cumulative))
+                samples.append(('_sum', key, None, state['sum']))
+                samples.append(('_count', key, None, state['count']))
+        return samples
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса в текстовом формате Prometheus.
+    Повторная регистрация имени возвращает ту же метрику (у gauge заменяется callback).
+    """
+    def __init__(self, prefix: str = 'clipbot_'):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif kwargs.get('callback') is not None:
+                metric.callback = kwargs['callback']
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = (), callback=None) -> Gauge:
+        return self._register(Gauge, name, help_text, labelnames, callback=callback)
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = ()) -> Histogram:
+        return self._register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Metric:
+        return self._metrics.get(self.prefix + name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+class MetricsServer:
+    """Локальный HTTP сервер с GET /metrics (в отдельном потоке)"""
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9108):
+        self.registry = registry
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self) -> 'MetricsServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"📈 Метрики: {self.endpoint}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def start_metrics_server() -> MetricsServer:
+    """Сервер метрик по METRICS_HOST/METRICS_PORT (METRICS_PORT=0 - выключен)"""
+    port = int(os.getenv('METRICS_PORT', '9108'))
+    if not port:
+        return None
+    try:
+        return MetricsServer(metrics, os.getenv('METRICS_HOST', '127.0.0.1'), port).start()
+    except OSError as e:
+        logger.warning(f"⚠️ Сервер метрик не запущен: {e}")
+        return None
+
+# Общий реестр процесса
+metrics = MetricsRegistry()
+
+# Метрики конвейера (остальные регистрируются рядом с источником данных)
+STAGE_BUCKETS = (0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+stage_seconds = metrics.histogram(
+    'stage_duration_seconds', 'Время обработки элемента стадией (download, probe, split, transcribe, render, upload)',
+    ('stage',), STAGE_BUCKETS
+)
+stage_failures = metrics.counter('stage_failures_total', 'Ошибки по стадиям', ('stage',))
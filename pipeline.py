@@ -0,0 +1,148 @@
+import time
+import asyncio
+import logging
+from metrics import stage_seconds, stage_failures
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Маркер конца потока элементов между стадиями
+_DONE = object()
+
+class StageStats:
+    """Счетчики стадии: занятость, простой в ожидании входа и блокировка на переполненной очереди"""
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.failures = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+
+    def report(self, wall: float) -> dict:
+        capacity = wall * self.workers
+        return {
+            'workers': self.workers,
+            'items': self.items,
+            'failures': self.failures,
+            'busy': self.busy,
+            'idle': self.idle,
+            'blocked': self.blocked,
+            'utilization': self.busy / capacity if capacity > 0 else 0.0
+        }
+
+class Stage:
+    """
+    Стадия конвейера: handler(item, emit) обрабатывает элемент и передает результаты дальше через emit.
+    Один элемент может дать несколько выходных (например, видео -> чанки).
+    """
+    def __init__(self, name: str, handler, workers: int = 1, queue_size: int = 2):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.stats = StageStats(name, workers)
+
+class Pipeline:
+    """
+    Конвейер стадий, связанных ограниченными asyncio очередями.
+
+    Пока одна стадия обрабатывает элемент N, предыдущая уже готовит N+1;
+    размер очереди ограничивает, насколько далеко она может уйти вперед.
+    Ошибка на элементе логируется и не останавливает остальные элементы.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.stages = []
+
+    def add_stage(self, name: str, handler, workers: int = 1, queue_size: int = 2) -> 'Pipeline':
+        self.stages.append(Stage(name, handler, workers, queue_size))
+        return self
+
+    async def run(self, items: list) -> dict:
+        """Прогон элементов через все стадии: результаты последней стадии и отчет по стадиям"""
+        started = time.monotonic()
+        results = []
+
+        # queues[i] - вход стадии i, у первой стадии вход заполнен сразу
+        queues = [asyncio.Queue()]
+        for stage in self.stages[1:]:
+            queues.append(asyncio.Queue(maxsize=stage.queue_size))
+        for item in items:
+            queues[0].put_nowait(item)
+        queues[0].put_nowait(_DONE)
+
+        tasks = []
+        for index, stage in enumerate(self.stages):
+            output = queues[index + 1] if index + 1 < len(queues) else None
+            remaining = {'workers': stage.workers}
+            for number in range(stage.workers):
+                tasks.append(asyncio.create_task(
+                    self._worker(stage, queues[index], output, results, remaining),
+                    name=f"{stage.name}-{number + 1}"
+                ))
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        wall = time.monotonic() - started
+        report = {stage.name: stage.stats.report(wall) for stage in self.stages}
+        self._log_report(report, wall)
+        return {'results': results, 'stages': report, 'wall': wall}
+
+    async def _worker(self, stage: Stage, input_queue: asyncio.Queue, output_queue: asyncio.Queue,
+                      results: list, remaining: dict):
+        stats = stage.stats
+
+        async def emit(value):
+            if output_queue is None:
+                results.append(value)
+                return
+            blocked_started = time.monotonic()
+            with tracer.span(f"{stage.name} wait queue"):
+                await output_queue.put(value)
+            blocked[0] += time.monotonic() - blocked_started
+
+        while True:
+            wait_started = time.monotonic()
+            item = await input_queue.get()
+            stats.idle += time.monotonic() - wait_started
+
+            if item is _DONE:
+                # Возвращаем маркер для остальных воркеров стадии, последний передает его дальше
+                input_queue.put_nowait(_DONE)
+                remaining['workers'] -= 1
+                if remaining['workers'] == 0 and output_queue is not None:
+                    await output_queue.put(_DONE)
+                return
+
+            blocked = [0.0]
+            handler_started = time.monotonic()
+            try:
+                with tracer.span(stage.name):
+                    await stage.handler(item, emit)
+                stats.items += 1
+            except Exception as e:
+                stats.failures += 1
+                stage_failures.inc(stage=stage.name)
+                logger.error(f"❌ Стадия {stage.name}: ошибка обработки элемента: {e}")
+            finally:
+                busy = time.monotonic() - handler_started - blocked[0]
+                stats.busy += busy
+                stats.blocked += blocked[0]
+                stage_seconds.observe(busy, stage=stage.name)
+
+    def _log_report(self, report: dict, wall: float):
+        logger.info(f"📈 ЗАГРУЗКА СТАДИЙ ({self.name}, {wall:.1f} сек):")
+        for name, stage in report.items():
+            logger.info(
+                f"   {name:<11} {stage['utilization']*100:5.1f}% занятость, "
+                f"работа {stage['busy']:.1f} сек, простой {stage['idle']:.1f} сек, "
+                f"блокировка {stage['blocked']:.1f} сек, элементов {stage['items']}"
+                + (f", ошибок {stage['failures']}" if stage['failures'] else "")
+            )
@@ -0,0 +1,218 @@
+import time
+import logging
+import itertools
+import threading
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Задача и стадия кода, который сейчас выполняется (наследуется задачами asyncio и потоками рендера)
+_current = ContextVar('progress_job', default=None)
+# Наблюдатель, который ждет job_id запущенной обработки (бот показывает по нему статус)
+_watch = ContextVar('progress_watch', default=None)
+
+class ProgressWatch:
+    """Ссылка на задачу обработки, запущенную внутри progress_bus.watch() (job_id появляется при старте)"""
+    def __init__(self):
+        self.job_id = None
+
+class JobProgress:
+    """
+    Прогресс задачи: стадия, секунды клипов, отрендеренные ffmpeg (по out_time из -progress),
+    активные процессы ffmpeg, загрузки, скорость рендера и оценка оставшегося времени.
+    """
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.stage = 'download'
+        self.stage_percent = None
+        self.total_seconds = 0.0
+        self.expected_clips = 0
+        self.rendered_seconds = 0.0
+        self.uploaded = 0
+        self.processes = {}
+        self.started = time.monotonic()
+        self.finished = False
+        self.rate = None
+        self._sample = None
+        self._token = None
+
+    def done_seconds(self) -> float:
+        active = sum(p['out_time'] for p in self.processes.values() if p['stage'] == 'render')
+        return self.rendered_seconds + active
+
+    def snapshot(self) -> dict:
+        """{'job_id', 'stage', 'percent', 'eta', 'fps', 'speed', 'processes', 'uploaded', 'expected_clips', 'elapsed'}"""
+        now = time.monotonic()
+        done = self.done_seconds()
+        processes = list(self.processes.values())
+
+        # Скорость рендера (секунд клипов в секунду) сглаживается между снимками
+        if self._sample is not None and now - self._sample[0] >= 1.0:
+            rate = max(0.0, done - self._sample[1]) / (now - self._sample[0])
+            self.rate = rate if self.rate is None else 0.7 * self.rate + 0.3 * rate
+            self._sample = (now, done)
+        elif self._sample is None and done > 0:
+            self._sample = (now, done)
+
+        if self.total_seconds:
+            percent = min(99.0, done / self.total_seconds * 100)
+        else:
+            percent = self.stage_percent
+        remaining = max(0.0, self.total_seconds - done)
+        eta = remaining / self.rate if self.rate and self.total_seconds else None
+        return {
+            'job_id': self.job_id,
+            'stage': self.stage,
+            'percent': 100.0 if self.finished else percent,
+            'eta': eta,
+            'fps': sum(p['fps'] or 0.0 for p in processes),
+            'speed': sum(p['speed'] or 0.0 for p in processes),
+            'processes': len(processes),
+            'uploaded': self.uploaded,
+            'expected_clips': self.expected_clips,
+            'elapsed': now - self.started
+        }
+
+class FFmpegReporter:
+    """Колбэк on_progress одного процесса ffmpeg: события на шину и учет в прогрессе задачи"""
+    def __init__(self, bus: 'ProgressBus', job: JobProgress, stage: str, duration: float = None):
+        self.bus = bus
+        self.job = job
+        self.stage = stage
+        self.duration = duration
+        self.process = next(bus._ids)
+        self.out_time = 0.0
+
+    def __call__(self, progress: dict):
+        self.out_time = progress['out_time'] or 0.0
+        with self.bus._lock:
+            self.job.processes[self.process] = {
+                'stage': self.stage, 'fps': progress['fps'], 'speed': progress['speed'], 'out_time': self.out_time
+            }
+            if self.duration and self.stage != 'render':
+                self.job.stage_percent = min(100.0, self.out_time / self.duration * 100)
+        self.bus.publish(dict(progress, job_id=self.job.job_id, stage=self.stage, process=self.process))
+
+    def close(self, success: bool = True):
+        """Процесс завершился: отрендеренные секунды засчитываются только успешному рендеру"""
+        with self.bus._lock:
+            self.job.processes.pop(self.process, None)
+            if success and self.stage == 'render':
+                self.job.rendered_seconds += self.out_time
+
+class ProgressBus:
+    """
+    Шина прогресса задач процесса.
+
+    - VideoProcessor отмечает стадии, план рендера и загрузки задачи
+    - каждый запуск ffmpeg (рендер, нарезка, слияние потоков при скачивании) публикует события
+      {'job_id', 'stage', 'process', 'frame', 'fps', 'speed', 'out_time', 'done'} подписчикам
+    - snapshot(job_id) - сводка для статуса пользователю (процент, скорость, оценка оставшегося времени)
+
+    Задача определяется по контексту (contextvars): обработка привязывается в start(), задачи asyncio
+    и потоки рендера наследуют привязку.
+    """
+    def __init__(self):
+        self._jobs = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def watch(self) -> 'ProgressWatchScope':
+        """Контекст, в котором запущенная обработка сообщает свой job_id наблюдателю"""
+        return ProgressWatchScope()
+
+    def start(self, job_id: str) -> JobProgress:
+        """Начало обработки в текущем контексте"""
+        job = JobProgress(job_id)
+        with self._lock:
+            self._jobs[job_id] = job
+        job._token = _current.set((job_id, job.stage))
+        watch = _watch.get()
+        if watch is not None:
+            watch.job_id = job_id
+        return job
+
+    def stage(self, job_id: str, stage: str):
+        """Стадия текущего кода (для событий ffmpeg) и задачи (для статуса)"""
+        _current.set((job_id, stage))
+        job = self._jobs.get(job_id)
+        if job is not None and job.stage != stage and not job.total_seconds:
+            job.stage = stage
+            job.stage_percent = None
+
+    def plan(self, job_id: str, expected_clips: int, clip_duration: float):
+        """Объем рендера задачи: от него считается процент"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.expected_clips = expected_clips
+            job.total_seconds = float(expected_clips * clip_duration)
+            job.stage = 'render'
+
+    def rendered(self, seconds: float, job_id: str = None):
+        """
+        Секунды клипов, отрендеренные не локальным ffmpeg текущей задачи: готовые до перезапуска
+        или сделанные воркерами распределенного рендера (job_id по умолчанию из контекста)
+        """
+        if job_id is None:
+            current = _current.get()
+            job_id = current[0] if current else None
+        job = self._jobs.get(job_id)
+        if job is not None:
+            with self._lock:
+                job.rendered_seconds += seconds
+
+    def uploaded(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.uploaded += 1
+
+    def finish(self, job_id: str):
+        """Конец обработки (вызывается в том же контексте, что и start)"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.finished = True
+            _current.reset(job._token)
+
+    def ffmpeg_reporter(self, duration: float = None) -> FFmpegReporter:
+        """Колбэк прогресса для ffmpeg, запущенного в контексте задачи (None вне задачи)"""
+        current = _current.get()
+        if current is None:
+            return None
+        job = self._jobs.get(current[0])
+        if job is None:
+            return None
+        return FFmpegReporter(self, job, current[1], duration)
+
+    def snapshot(self, job_id: str) -> dict:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            return job.snapshot()
+
+    def subscribe(self, callback):
+        """callback(event) вызывается из потока ffmpeg; возвращает функцию отписки"""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def publish(self, event: dict):
+        for callback in list(self._subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                logger.warning(f"Ошибка подписчика шины прогресса: {e}")
+
+class ProgressWatchScope:
+    def __enter__(self) -> ProgressWatch:
+        self.watch = ProgressWatch()
+        self._token = _watch.set(self.watch)
+        return self.watch
+
+    def __exit__(self, *exc):
+        _watch.reset(self._token)
+        return False
+
+# Общая шина процесса
+progress_bus = ProgressBus()
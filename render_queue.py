@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import sqlite3
+import logging
+import threading
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Статусы задачи рендера
+QUEUED = 'queued'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+class RenderTaskQueue:
+    """
+    Очередь задач рендера клипов (SQLite) для координатора и воркеров - отдельных процессов
+    на этом или других узлах (база и рабочие директории на общем хранилище).
+
+    - воркер берет задачу в аренду на lease секунд и продлевает ее heartbeat'ами
+    - задача с истекшей арендой (воркер упал или завис) выдается другому воркеру
+    - после max_attempts выдач или ошибок задача считается упавшей
+    - воркеры пишут свой heartbeat в render_workers: координатор видит, есть ли живые воркеры
+    """
+    def __init__(self, path: str = 'render_tasks.db', max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Базу открывают несколько процессов: WAL и ожидание блокировки вместо ошибки
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS render_tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    clip_number INTEGER,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    lease_until REAL,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    started REAL,
+                    finished REAL
+                );
+                CREATE INDEX IF NOT EXISTS render_tasks_status ON render_tasks (status, id);
+                CREATE TABLE IF NOT EXISTS render_workers (
+                    name TEXT PRIMARY KEY,
+                    host TEXT,
+                    pid INTEGER,
+                    started REAL NOT NULL,
+                    heartbeat REAL NOT NULL,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0
+                );
+            """)
+
+    def publish(self, payload: dict, clip_number: int = None) -> int:
+        """Публикация задачи рендера, возвращает ее id"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "INSERT INTO render_tasks (clip_number, payload, status, created) VALUES (?, ?, ?, ?)",
+                (clip_number, json.dumps(payload, ensure_ascii=False), QUEUED, time.time())
+            ).lastrowid
+
+    def claim(self, worker: str, lease: float) -> dict:
+        """
+        Аренда следующей задачи: ждущей или с истекшей арендой.
+        Несколько воркеров берут задачи одновременно: выдача - условный UPDATE, проигравший берет следующую.
+        """
+        now = time.time()
+        with self._lock:
+            candidates = self._conn.execute(
+                "SELECT id, worker FROM render_tasks WHERE (status=? OR (status=? AND lease_until<?)) AND attempts<? "
+                "ORDER BY id LIMIT 10", (QUEUED, LEASED, now, self.max_attempts)
+            ).fetchall()
+            for task_id, previous in candidates:
+                with self._conn:
+                    claimed = self._conn.execute(
+                        "UPDATE render_tasks SET status=?, worker=?, lease_until=?, attempts=attempts + 1, started=? "
+                        "WHERE id=? AND (status=? OR (status=? AND lease_until<?)) AND attempts<?",
+                        (LEASED, worker, now + lease, now, task_id, QUEUED, LEASED, now, self.max_attempts)
+                    ).rowcount
+                if not claimed:
+                    continue
+                row = self._conn.execute(
+                    "SELECT clip_number, payload, attempts FROM render_tasks WHERE id=?", (task_id,)
+                ).fetchone()
+                if previous and previous != worker and row[2] > 1:
+                    logger.warning(f"🔁 Задача рендера {task_id} выдана повторно: {previous} → {worker} (попытка {row[2]})")
+                return {'id': task_id, 'clip_number': row[0], 'payload': json.loads(row[1]), 'attempts': row[2]}
+        return None
+
+    def heartbeat(self, task_id: int, worker: str, lease: float) -> bool:
+        """Продление аренды; False - аренда потеряна (задача выдана другому воркеру или отменена)"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE render_tasks SET lease_until=? WHERE id=? AND worker=? AND status=?",
+                (time.time() + lease, task_id, worker, LEASED)
+            ).rowcount == 1
+
+    def complete(self, task_id: int, worker: str) -> bool:
+        """Задача выполнена (результат - файл на общем хранилище); False - аренда потеряна"""
+        with self._lock, self._conn:
+            done = self._conn.execute(
+                "UPDATE render_tasks SET status=?, finished=? WHERE id=? AND worker=? AND status=?",
+                (DONE, time.time(), task_id, worker, LEASED)
+            ).rowcount == 1
+            if done:
+                self._conn.execute("UPDATE render_workers SET done=done + 1 WHERE name=?", (worker,))
+        return done
+
+    def fail(self, task_id: int, worker: str, error: str):
+        """Ошибка рендера: задача возвращается в очередь, пока не исчерпаны попытки"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE render_tasks SET status=CASE WHEN attempts<? THEN ? ELSE ? END, worker=NULL, "
+                "lease_until=NULL, error=?, finished=? WHERE id=? AND worker=? AND status=?",
+                (self.max_attempts, QUEUED, FAILED, error, time.time(), task_id, worker, LEASED)
+            )
+            self._conn.execute("UPDATE render_workers SET failed=failed + 1 WHERE name=?", (worker,))
+
+    def reap(self) -> int:
+        """Задачи, аренда которых истекла на последней попытке, больше не выдаются - помечаем упавшими"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE render_tasks SET status=?, error=?, finished=? WHERE status=? AND lease_until<? AND attempts>=?",
+                (FAILED, 'аренда истекла на последней попытке', time.time(), LEASED, time.time(), self.max_attempts)
+            ).rowcount
+
+    def cancel(self, task_ids: list):
+        """Отмена задач (задача обработки остановлена): ждущие не выдаются, аренда выполняющихся не продлевается"""
+        if not task_ids:
+            return
+        marks = ','.join('?' * len(task_ids))
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE render_tasks SET status=?, finished=? WHERE id IN ({marks}) AND status IN (?, ?)",
+                (CANCELLED, time.time(), *task_ids, QUEUED, LEASED)
+            )
+
+    def tasks(self, task_ids: list) -> dict:
+        """Состояние задач: {id: {'status', 'attempts', 'worker', 'error'}}"""
+        if not task_ids:
+            return {}
+        marks = ','.join('?' * len(task_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, status, attempts, worker, error FROM render_tasks WHERE id IN ({marks})", tuple(task_ids)
+            ).fetchall()
+        return {row[0]: {'status': row[1], 'attempts': row[2], 'worker': row[3], 'error': row[4]} for row in rows}
+
+    def purge(self, max_age: float = 24 * 3600) -> int:
+        """Удаление давно завершенных задач"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM render_tasks WHERE status IN (?, ?, ?) AND finished<?",
+                (DONE, FAILED, CANCELLED, time.time() - max_age)
+            ).rowcount
+
+    def register_worker(self, name: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO render_workers (name, host, pid, started, heartbeat) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET host=excluded.host, pid=excluded.pid, "
+                "started=excluded.started, heartbeat=excluded.heartbeat",
+                (name, socket.gethostname(), os.getpid(), now, now)
+            )
+
+    def worker_heartbeat(self, name: str):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE render_workers SET heartbeat=? WHERE name=?", (time.time(), name))
+
+    def unregister_worker(self, name: str):
+        """Штатная остановка воркера: heartbeat обнуляется, воркер сразу считается неживым"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE render_workers SET heartbeat=0 WHERE name=?", (name,))
+
+    def live_workers(self, timeout: float) -> list:
+        """Воркеры с heartbeat не старше timeout секунд"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name FROM render_workers WHERE heartbeat>=? ORDER BY name", (time.time() - timeout,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM render_tasks GROUP BY status").fetchall())
+            redelivered = self._conn.execute("SELECT COUNT(*) FROM render_tasks WHERE attempts>1").fetchone()[0]
+        return {
+            'queued': counts.get(QUEUED, 0),
+            'leased': counts.get(LEASED, 0),
+            'done': counts.get(DONE, 0),
+            'failed': counts.get(FAILED, 0),
+            'cancelled': counts.get(CANCELLED, 0),
+            'redelivered': redelivered
+        }
+
+class RenderCoordinator:
+    """
+    Сторона бота: публикует задачи рендера и ждет их завершения.
+
+    Состояние всех ожидаемых задач опрашивается одним циклом (один запрос к базе за период).
+    Если живых воркеров нет дольше orphan_timeout, ждущие задачи отменяются с ошибкой,
+    чтобы задача обработки не висела бесконечно.
+    """
+    def __init__(self, queue: RenderTaskQueue, poll_interval: float = 0.5, worker_timeout: float = 30,
+                 orphan_timeout: float = 300):
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self.worker_timeout = worker_timeout
+        self.orphan_timeout = orphan_timeout
+        self._waiting = {}
+        self._poller = None
+        self._no_workers_since = None
+        self.queue.purge()
+        metrics.gauge('render_tasks', 'Задачи распределенного рендера по статусам', ('status',), callback=lambda: {
+            (status,): count for status, count in self.queue.stats().items() if status != 'redelivered'
+        })
+        metrics.gauge('render_workers', 'Живые воркеры рендера',
+                      callback=lambda: len(self.queue.live_workers(self.worker_timeout)))
+
+    async def render(self, payload: dict, clip_number: int = None) -> bool:
+        """Публикация задачи и ожидание: True - воркер записал результат, False - задача упала"""
+        task_id = self.queue.publish(payload, clip_number)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[task_id] = future
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self.queue.cancel([task_id])
+            raise
+        finally:
+            self._waiting.pop(task_id, None)
+
+    async def _poll(self):
+        while self._waiting:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                self._check()
+            except Exception as e:
+                logger.error(f"Ошибка опроса очереди рендера: {e}")
+
+    def _check(self):
+        self.queue.reap()
+        for task_id, task in self.queue.tasks(list(self._waiting)).items():
+            future = self._waiting.get(task_id)
+            if future is None or future.done():
+                continue
+            if task['status'] == DONE:
+                logger.info(f"✅ Клип задачи рендера {task_id} готов (воркер {task['worker']}, попыток {task['attempts']})")
+                future.set_result(True)
+            elif task['status'] in (FAILED, CANCELLED):
+                logger.error(f"❌ Задача рендера {task_id}: {task['error'] or task['status']}")
+                future.set_result(False)
+
+        # Без живых воркеров задачи никто не возьмет
+        if self.queue.live_workers(self.worker_timeout):
+            self._no_workers_since = None
+            return
+        now = time.monotonic()
+        if self._no_workers_since is None:
+            self._no_workers_since = now
+            logger.warning(f"⚠️ Нет живых воркеров рендера, ждут задач: {len(self._waiting)}")
+        elif now - self._no_workers_since > self.orphan_timeout:
+            logger.error(f"❌ Нет живых воркеров рендера {self.orphan_timeout:.0f} сек, задачи отменены")
+            self.queue.cancel(list(self._waiting))
+            self._no_workers_since = None
+
+    def stats(self) -> dict:
+        stats = self.queue.stats()
+        stats['waiting'] = len(self._waiting)
+        stats['workers'] = len(self.queue.live_workers(self.worker_timeout))
+        return stats
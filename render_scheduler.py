@@ -0,0 +1,301 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import functools
+import contextvars
+from ffmpeg_runner import run_ffmpeg
+from progress_bus import progress_bus
+from metrics import metrics
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+render_fps = metrics.histogram(
+    'render_fps', 'Средний fps кодирования одного запуска ffmpeg', ('kind',),
+    (1, 5, 10, 25, 50, 100, 200, 400, 800)
+)
+
+class RenderSlot:
+    """Разрешение на один запуск ffmpeg: число потоков кодировщика и тип задачи"""
+    def __init__(self, threads: int, gpu: bool = False, copy: bool = False):
+        self.threads = threads
+        self.gpu = gpu
+        self.copy = copy
+
+class RenderScheduler:
+    """
+    Планировщик всех запусков ffmpeg процесса.
+
+    - стартовая параллельность и -threads на процесс по числу ядер и разрешению исходника
+    - суммарный fps кодирования считается по выводу -progress всех запущенных ffmpeg
+    - параллельность подстраивается на лету (AIMD): +1 пока fps растет,
+      откат при падении fps или ошибках ffmpeg
+    - stream copy задачи (нарезка без перекодирования) идут отдельным лимитом
+    """
+    def __init__(self, cpu_count: int = None, max_parallel: int = None, threads: int = None,
+                 gpu_parallel: int = 4, io_parallel: int = 4, adjust_interval: float = 5.0):
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        self.max_parallel = max_parallel
+        self.fixed_threads = threads
+        self.gpu_parallel = gpu_parallel
+        self.io_parallel = io_parallel
+        self.adjust_interval = adjust_interval
+
+        # Параметры AIMD
+        self.tolerance = 0.05      # изменение fps меньше 5% считаем шумом
+        self.decrease_factor = 0.75
+        self.hold_windows = 6      # окон без проб после отката
+
+        self.limit = None
+        self.threads = None
+        self.ceiling = None
+        self.running = 0
+        self.running_io = 0
+        self.waiting = 0
+        self.adjustments = 0
+        self.last_fps = 0.0
+
+        self._profile = None
+        self._last_change = 0
+        self._hold = 0
+        self._prev_fps = None
+        self._frames = 0
+        self._frames_lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._condition = None
+        self._loop = None
+
+    def plan(self, width: int, height: int, gpu: bool = False) -> dict:
+        """Стартовая параллельность и потоки на процесс для разрешения исходника"""
+        ceiling = self.max_parallel or (self.gpu_parallel * 2 if gpu else self.cpu_count)
+        if gpu:
+            # Кодирует NVENC, на CPU остаются декодирование звука, фильтры и drawtext
+            threads = self.fixed_threads or 2
+            parallel = self.gpu_parallel
+        else:
+            # x264 плохо масштабируется на много потоков на малых кадрах:
+            # несколько процессов с 2-6 потоками дают больше суммарного fps, чем десятки по всем ядрам
+            megapixels = (width or 1920) * (height or 1080) / 1_000_000
+            if megapixels <= 1.0:
+                threads = 2
+            elif megapixels <= 2.2:
+                threads = 4
+            else:
+                threads = 6
+            threads = min(self.fixed_threads or threads, self.cpu_count)
+            parallel = self.cpu_count // threads
+        return {
+            'parallel': max(1, min(parallel, ceiling)),
+            'threads': threads,
+            'ceiling': max(1, ceiling)
+        }
+
+    async def run(self, func, *args, width: int = None, height: int = None, gpu: bool = False, copy: bool = False):
+        """Выполнение синхронной функции рендера в пуле потоков под слотом планировщика (func получает slot=)"""
+        with tracer.span('render slot wait', copy=copy):
+            slot = await self.acquire(width, height, gpu, copy)
+        try:
+            loop = asyncio.get_running_loop()
+            # Контекст задачи (шина прогресса, трасса) переходит в поток рендера
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(None, context.run, functools.partial(func, *args, slot=slot))
+        except Exception:
+            if not copy:
+                self._on_failure()
+            raise
+        finally:
+            await self.release(slot)
+
+    def execute(self, stream, slot: RenderSlot = None, timeout: float = None) -> dict:
+        """
+        Синхронный запуск ffmpeg (поток ffmpeg-python или список аргументов) с учетом прогресса:
+        кадры идут в окно AIMD, события процесса - на шину прогресса задачи
+        """
+        cmd = stream.compile() if hasattr(stream, 'compile') else list(stream)
+        last_frame = [0]
+        reporter = progress_bus.ffmpeg_reporter()
+
+        def on_progress(progress):
+            delta = progress['frame'] - last_frame[0]
+            last_frame[0] = progress['frame']
+            if delta > 0 and slot is not None and not slot.copy:
+                with self._frames_lock:
+                    self._frames += delta
+            if reporter:
+                reporter(progress)
+
+        success = False
+        kind = 'copy' if slot is not None and slot.copy else 'encode'
+        try:
+            with tracer.span('ffmpeg', kind=kind, output=os.path.basename(cmd[-1])) as span:
+                result = run_ffmpeg(cmd, on_progress=on_progress, timeout=timeout)
+                span.set(frames=result['frames'], fps=round(result['fps'], 1), cpu=result['cpu'])
+            success = True
+            if result['frames']:
+                render_fps.observe(result['fps'], kind=kind)
+            return result
+        finally:
+            if reporter:
+                reporter.close(success)
+
+    async def acquire(self, width: int = None, height: int = None, gpu: bool = False, copy: bool = False) -> RenderSlot:
+        """Ожидание свободного слота"""
+        condition = self._get_condition()
+        async with condition:
+            if not copy:
+                self._configure(width, height, gpu)
+            self.waiting += 1
+            try:
+                while not self._has_room(copy):
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout=self.adjust_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._maybe_adjust()
+            finally:
+                self.waiting -= 1
+
+            if copy:
+                self.running_io += 1
+                return RenderSlot(threads=1, gpu=False, copy=True)
+            self.running += 1
+            return RenderSlot(threads=self.threads, gpu=gpu)
+
+    async def release(self, slot: RenderSlot):
+        condition = self._get_condition()
+        async with condition:
+            if slot.copy:
+                self.running_io -= 1
+            else:
+                self.running -= 1
+                self._maybe_adjust()
+            condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            'limit': self.limit,
+            'threads': self.threads,
+            'running': self.running,
+            'waiting': self.waiting,
+            'fps': self.last_fps,
+            'adjustments': self.adjustments
+        }
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Условие привязано к циклу событий, для нового цикла (другой asyncio.run) создаем заново
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+        return self._condition
+
+    def _has_room(self, copy: bool) -> bool:
+        if copy:
+            return self.running_io < self.io_parallel
+        return self.running < self.limit
+
+    def _configure(self, width: int, height: int, gpu: bool):
+        """Перенастройка под новый профиль (разрешение/GPU), только когда рендер простаивает"""
+        profile = (width, height, gpu)
+        if profile == self._profile or (self.running > 0 and self.limit is not None):
+            return
+
+        plan = self.plan(width, height, gpu)
+        self._profile = profile
+        self.limit = plan['parallel']
+        self.threads = plan['threads']
+        self.ceiling = plan['ceiling']
+        self._last_change = 0
+        self._hold = 0
+        self._prev_fps = None
+        self._reset_window()
+        logger.info(f"⚙️ Планировщик рендера: {self.limit} параллельно x {self.threads} потоков "
+                    f"(исходник {width}x{height}, {'GPU' if gpu else 'CPU'}, {self.cpu_count} ядер, максимум {self.ceiling})")
+
+    def _reset_window(self):
+        with self._frames_lock:
+            self._frames = 0
+        self._window_start = time.monotonic()
+
+    def _maybe_adjust(self):
+        """Шаг AIMD по суммарному fps за окно (вызывается из цикла событий)"""
+        if self.limit is None:
+            return
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.adjust_interval:
+            return
+
+        with self._frames_lock:
+            frames = self._frames
+            self._frames = 0
+        self._window_start = now
+
+        # Измерение отражает лимит, только если все слоты были заняты и есть очередь
+        if frames == 0 or self.running < self.limit or self.waiting == 0:
+            return
+
+        fps = frames / elapsed
+        self.last_fps = fps
+        previous = self._prev_fps
+        self._prev_fps = fps
+        old_limit = self.limit
+
+        if previous is None:
+            self._increase()
+        elif self._last_change > 0:
+            if fps > previous * (1 + self.tolerance):
+                self._increase()
+            elif fps < previous * (1 - self.tolerance):
+                # Добавленный процесс снизил общий fps: мультипликативный откат
+                self.limit = max(1, min(self.limit - 1, int(self.limit * self.decrease_factor)))
+                self._last_change = -1
+                self._hold = self.hold_windows
+            else:
+                # Плато: возвращаем лишний процесс
+                self.limit = max(1, self.limit - 1)
+                self._last_change = -1
+                self._hold = self.hold_windows
+        elif self._hold > 0:
+            self._hold -= 1
+            self._last_change = 0
+        else:
+            self._increase()
+
+        if self.limit != old_limit:
+            self.adjustments += 1
+            logger.info(f"⚙️ Параллельность рендера: {old_limit} → {self.limit} (суммарно {fps:.0f} fps)")
+
+    def _increase(self):
+        if self.limit < self.ceiling:
+            self.limit += 1
+            self._last_change = 1
+        else:
+            self._last_change = 0
+
+    def _on_failure(self):
+        """Ошибка ffmpeg (нехватка памяти, сессий NVENC): уменьшаем параллельность"""
+        if self.limit is None or self.limit <= 1:
+            return
+        old_limit = self.limit
+        self.limit = max(1, int(self.limit * self.decrease_factor))
+        self._last_change = -1
+        self._hold = self.hold_windows
+        self.adjustments += 1
+        logger.warning(f"⚙️ Ошибка ffmpeg, параллельность рендера: {old_limit} → {self.limit}")
+
+def _env_int(name: str):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+# Общий планировщик процесса
+render_scheduler = RenderScheduler(
+    max_parallel=_env_int('RENDER_MAX_PARALLEL'),
+    threads=_env_int('RENDER_THREADS'),
+    gpu_parallel=int(os.getenv('RENDER_GPU_PARALLEL', 4))
+)
+metrics.gauge('render_parallel_limit', 'Текущая параллельность рендера (AIMD)', callback=lambda: render_scheduler.limit)
+metrics.gauge('render_running', 'Запущенные задачи рендера', callback=lambda: render_scheduler.running)
+metrics.gauge('render_waiting', 'Задачи рендера в ожидании слота', callback=lambda: render_scheduler.waiting)
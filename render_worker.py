@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Воркер распределенного рендера: берет задачи клипов из очереди рендера (render_queue.py)
+и рендерит их локально через планировщик ffmpeg узла.
+
+Запуск (на этом или другом узле, база очереди и рабочие директории на общем хранилище по тем же путям):
+    python render_worker.py --db render_tasks.db --concurrency 2
+"""
+
+import os
+import time
+import base64
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from render_queue import RenderTaskQueue
+from subtitle_track import SubtitleTrack
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+class RenderWorker:
+    """
+    Рендер задач из очереди: до concurrency задач одновременно, аренда каждой задачи продлевается
+    каждые lease/3 секунд. Клип пишется во временный файл воркера и переименовывается в итоговый,
+    только пока аренда за этим воркером: повторно выданная задача не перезапишет чужой результат.
+    """
+    def __init__(self, queue: RenderTaskQueue, name: str = None, concurrency: int = 2, lease: float = 60,
+                 poll_interval: float = 1.0):
+        from video_editor import VideoEditor
+
+        self.queue = queue
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.concurrency = concurrency
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.editor = VideoEditor()
+        # Воркер рендерит сам, даже если в окружении включен распределенный режим
+        self.editor.render_coordinator = None
+        self.done = 0
+        self.failed = 0
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Штатная остановка: новые задачи не берутся, начатые дорендериваются"""
+        if not self._stopping.is_set():
+            logger.info(f"🛑 Воркер {self.name}: остановка после текущих задач")
+        self._stopping.set()
+
+    async def run(self):
+        self.queue.register_worker(self.name)
+        logger.info(f"🛠️ Воркер рендера {self.name}: до {self.concurrency} задач, аренда {self.lease:.0f} сек")
+        heartbeat = asyncio.create_task(self._heartbeat())
+        slots = asyncio.Semaphore(self.concurrency)
+        running = set()
+        try:
+            while not self._stopping.is_set():
+                await slots.acquire()
+                task = self.queue.claim(self.name, self.lease)
+                if task is None:
+                    slots.release()
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                execution = asyncio.create_task(self._execute(task))
+                running.add(execution)
+                execution.add_done_callback(running.discard)
+                execution.add_done_callback(lambda _: slots.release())
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        finally:
+            heartbeat.cancel()
+            self.queue.unregister_worker(self.name)
+            logger.info(f"📊 Воркер {self.name}: готово {self.done}, ошибок {self.failed}")
+
+    async def _heartbeat(self):
+        """Heartbeat воркера: координатор видит, что воркеры живы"""
+        while True:
+            self.queue.worker_heartbeat(self.name)
+            await asyncio.sleep(self.lease / 3)
+
+    async def _keep_lease(self, task: dict, lost: asyncio.Event):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not self.queue.heartbeat(task['id'], self.name, self.lease):
+                logger.warning(f"⚠️ Воркер {self.name}: аренда задачи {task['id']} потеряна")
+                lost.set()
+                return
+
+    async def _execute(self, task: dict):
+        payload = task['payload']
+        output_path = Path(payload['output_path'])
+        part_path = output_path.with_name(f"{output_path.stem}.{self.name}.part{output_path.suffix}")
+        lost = asyncio.Event()
+        keeper = asyncio.create_task(self._keep_lease(task, lost))
+        started = time.monotonic()
+        logger.info(f"▶️ Воркер {self.name}: задача {task['id']}, клип {task['clip_number']} (попытка {task['attempts']})")
+        try:
+            await self.render(payload, str(part_path))
+            if lost.is_set() or not self.queue.heartbeat(task['id'], self.name, self.lease):
+                # Задача уже у другого воркера или отменена - результат не нужен
+                part_path.unlink(missing_ok=True)
+                return
+            os.replace(part_path, output_path)
+            if self.queue.complete(task['id'], self.name):
+                self.done += 1
+                logger.info(f"✅ Воркер {self.name}: клип {task['clip_number']} за {time.monotonic() - started:.1f} сек")
+        except Exception as e:
+            self.failed += 1
+            part_path.unlink(missing_ok=True)
+            logger.error(f"❌ Воркер {self.name}: задача {task['id']}: {e}")
+            self.queue.fail(task['id'], self.name, str(e)[-500:])
+        finally:
+            keeper.cancel()
+
+    async def render(self, payload: dict, output_path: str):
+        """Рендер клипа задачи (то же, что create_styled_clip в локальном режиме)"""
+        subtitles = payload.get('subtitles')
+        subtitles = SubtitleTrack.from_bytes(base64.b64decode(subtitles)) if subtitles else SubtitleTrack.from_words([])
+        await self.editor._render(
+            self.editor._create_styled_clip_sync,
+            payload['input_path'],
+            output_path,
+            payload['start_time'],
+            payload['duration'],
+            subtitles,
+            payload['clip_number'],
+            payload['config'],
+            payload.get('subtitles_file')
+        )
+
+async def main():
+    parser = argparse.ArgumentParser(description="Воркер распределенного рендера клипов")
+    parser.add_argument('--db', default=os.getenv('RENDER_QUEUE_DB', 'render_tasks.db'), help="база очереди рендера")
+    parser.add_argument('--name', default=None, help="имя воркера (по умолчанию хост-pid)")
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('RENDER_WORKER_CONCURRENCY', '2')),
+                        help="задач одновременно (ffmpeg процессы ограничивает планировщик узла)")
+    parser.add_argument('--lease', type=float, default=float(os.getenv('RENDER_LEASE_SEC', '60')),
+                        help="аренда задачи, сек (продлевается каждые lease/3)")
+    args = parser.parse_args()
+
+    worker = RenderWorker(RenderTaskQueue(args.db), args.name, args.concurrency, args.lease)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,225 @@
+import os
+import re
+import time
+import shutil
+import asyncio
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class SourceCache:
+    """
+    Кэш скачанных исходников на диске.
+
+    - ключ: "экстрактор:id" yt-dlp для ссылок или "telegram:file_unique_id" для присланных файлов
+    - одновременные запросы одного ключа ждут одну и ту же загрузку (in-flight)
+    - файлы, которые сейчас обрабатываются, закреплены (acquire/release) и не вытесняются
+    - LRU вытеснение при превышении бюджета диска, счетчики попаданий и сэкономленных байт
+    """
+    def __init__(self, directory: str = 'source_cache', max_bytes: int = 20 * 1024 ** 3):
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        self._inflight = {}
+        self._pins = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.directory / 'index.db'), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sources (
+                    key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    title TEXT,
+                    duration REAL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+
+    def _file_name(self, key: str, path: str) -> str:
+        """Имя файла в кэше по ключу (расширение исходного файла сохраняется)"""
+        safe_key = re.sub(r'[^A-Za-z0-9_.-]', '_', key)[:120]
+        return safe_key + (Path(path).suffix or '.mp4')
+
+    def lookup(self, key: str) -> dict:
+        """Запись кэша, если файл на месте и не изменился; иначе запись удаляется"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, size, title, duration FROM sources WHERE key=?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        path, size, title, duration = row
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            logger.warning(f"Файл кэша исходников пропал или изменился: {path}")
+            self._forget(key)
+            return None
+        return {'path': path, 'size': size, 'title': title, 'duration': duration}
+
+    async def fetch(self, key: str, download) -> dict:
+        """
+        Исходник по ключу: из кэша, из уже идущей загрузки или новой загрузкой.
+        download() - корутина с результатом загрузчика {'success', 'video_path', 'title', 'duration'}.
+        Возвращенный файл закреплен за вызывающим - после обработки нужен release(key).
+        """
+        entry = self.lookup(key)
+        if entry is not None:
+            self.hits += 1
+            self.bytes_saved += entry['size']
+            self._touch(key)
+            self.acquire(key)
+            logger.info(f"📦 Кэш исходников: попадание {key} ({entry['size'] / 1024 / 1024:.1f} МБ не скачиваются)")
+            return self._result(entry, cached=True)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # Тот же источник уже скачивается для другой задачи - ждем ее загрузку
+            self.joined += 1
+            logger.info(f"📦 Кэш исходников: {key} уже скачивается, ждем ту же загрузку")
+            try:
+                result = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # Задачу, которая скачивала, отменили - скачиваем сами (следующие ждут уже эту загрузку)
+                logger.info(f"📦 Кэш исходников: общая загрузка {key} отменена, скачиваем заново")
+                return await self.fetch(key, download)
+            if result.get('success'):
+                entry = self.lookup(key)
+                if entry is not None:
+                    self.bytes_saved += entry['size']
+                    self.acquire(key)
+                    return self._result(entry, cached=True)
+            return result
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            result = await download()
+            if result.get('success'):
+                # Перенос между файловыми системами копирует гигабайты - в пуле потоков
+                entry = await loop.run_in_executor(None, self._store, key, result)
+                self.acquire(key)
+                result = self._result(entry, cached=False)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_result({'success': False, 'error': str(e)})
+            raise
+        finally:
+            # Отмена загрузки (остановка очереди, отмена задачи) не дает результата - ожидающие узнают об этом
+            if not future.done():
+                future.cancel()
+            del self._inflight[key]
+
+    def _result(self, entry: dict, cached: bool) -> dict:
+        return {
+            'success': True,
+            'video_path': entry['path'],
+            'title': entry['title'],
+            'duration': entry['duration'],
+            'cached': cached
+        }
+
+    def _store(self, key: str, result: dict) -> dict:
+        """Перенос скачанного файла в кэш и вытеснение старых записей"""
+        path = str(self.directory / self._file_name(key, result['video_path']))
+        shutil.move(result['video_path'], path)
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources (key, path, size, title, duration, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, path, size, result.get('title'), result.get('duration'), now, now)
+            )
+        logger.info(f"📦 Кэш исходников: сохранен {key} ({size / 1024 / 1024:.1f} МБ)")
+        self._evict(keep=key)
+        return {'path': path, 'size': size, 'title': result.get('title'), 'duration': result.get('duration')}
+
+    def acquire(self, key: str):
+        """Закрепление файла за задачей (не вытесняется, пока обрабатывается)"""
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def release(self, key: str):
+        """Снятие закрепления после обработки; отложенное вытеснение выполняется сейчас"""
+        count = self._pins.get(key, 0) - 1
+        if count > 0:
+            self._pins[key] = count
+        else:
+            self._pins.pop(key, None)
+            self._evict()
+
+    def key_for_path(self, path: str) -> str:
+        """Ключ записи кэша по пути файла или None"""
+        with self._lock:
+            row = self._conn.execute("SELECT key FROM sources WHERE path=?", (str(path),)).fetchone()
+        return row[0] if row else None
+
+    def is_cached_path(self, path: str) -> bool:
+        """Файл принадлежит кэшу (его нельзя удалять после обработки)"""
+        return Path(path).resolve().parent == self.directory.resolve()
+
+    def _touch(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE sources SET last_used=? WHERE key=?", (time.time(), key))
+
+    def _forget(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sources WHERE key=?", (key,))
+
+    def _evict(self, keep: str = None):
+        """LRU: удаляем давно не использованные исходники, пока кэш больше бюджета (закрепленные пропускаем)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT key, path, size FROM sources ORDER BY last_used").fetchall()
+        total = sum(row[2] for row in rows)
+        for key, path, size in rows:
+            if total <= self.max_bytes:
+                break
+            if key == keep or key in self._pins:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Не удалось удалить исходник из кэша {path}: {e}")
+                continue
+            self._forget(key)
+            total -= size
+            self.evictions += 1
+            logger.info(f"🧹 Кэш исходников: вытеснен {key} ({size / 1024 / 1024:.1f} МБ)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sources").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'joined': self.joined,
+            'bytes_saved': self.bytes_saved,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0
+        }
+
+# Общий кэш исходников процесса
+source_cache = SourceCache(
+    os.getenv('SOURCE_CACHE_DIR', 'source_cache'),
+    max_bytes=int(float(os.getenv('SOURCE_CACHE_GB', '20')) * 1024 ** 3)
+)
+metrics.gauge('source_cache_hit_ratio', 'Доля попаданий кэша исходников', callback=lambda: source_cache.stats()['hit_ratio'])
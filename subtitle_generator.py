@@ -1,18 +1,109 @@
 import os
+import sqlite3
 import asyncio
+import contextvars
 import logging
 import tempfile
+import subprocess
 from pathlib import Path
+from subtitle_track import SubtitleTrack
+from audio_pcm import SAMPLE_RATE, PcmAudio, extract_pcm
+from transcript_cache import TranscriptCache
+from capabilities import get_capabilities
+from metrics import metrics, stage_failures
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
+class TranscriptTimeline:
+    """
+    Глобальная дорожка слов всего исходника (TRANSCRIBE_MODE=whole), растет по мере распознавания окон.
+
+    Окна идут по порядку и перекрываются: слова окна берутся между серединами его перекрытий
+    с соседями, поэтому слово на стыке попадает в дорожку один раз и не обрезается.
+    Стадия субтитров ждет, пока дорожка покроет конец чанка (wait_for), и берет из нее срез.
+    """
+    def __init__(self):
+        self.windows = []
+        self.words = []
+        self.covered = 0.0
+        self.finished = False
+        self.failed = False
+        self.cancelled = False
+        self._track = None
+        self._changed = asyncio.Event()
+
+    def plan(self, windows: list):
+        """Окна распознавания: [(начало, конец)] в секундах исходника"""
+        self.windows = windows
+
+    def _cuts(self, i: int) -> tuple:
+        """Границы слов окна i: середины перекрытий с соседними окнами"""
+        lo = 0.0 if i == 0 else (self.windows[i][0] + self.windows[i - 1][1]) / 2
+        hi = float('inf') if i == len(self.windows) - 1 else (self.windows[i + 1][0] + self.windows[i][1]) / 2
+        return lo, hi
+
+    def add_window(self, i: int, words: list):
+        """Слова окна i (время исходника) - вызывается в цикле событий по порядку окон"""
+        lo, hi = self._cuts(i)
+        kept = sorted((word for word in words if lo <= word['start'] < hi), key=lambda word: word['start'])
+        if kept and self.words:
+            # Слово на стыке, которое оба окна увидели чуть по разные стороны середины перекрытия
+            last, first = self.words[-1], kept[0]
+            if first['text'].lower() == last['text'].lower() and abs(first['start'] - last['start']) < 0.5:
+                kept = kept[1:]
+        self.words.extend(kept)
+        self.covered = hi
+        self._track = None
+        self._notify()
+
+    def finish(self, failed: bool = False):
+        self.finished = True
+        self.failed = failed
+        self._notify()
+
+    def cancel(self):
+        """Остановка распознавания после текущего окна (задача завершилась раньше)"""
+        self.cancelled = True
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for(self, end: float) -> bool:
+        """Ждем, пока дорожка покроет [0, end); False - распознавание целиком не удалось"""
+        while not self.finished and self.covered < end:
+            await self._changed.wait()
+        return not self.failed
+
+    def track(self) -> SubtitleTrack:
+        """Дорожка распознанных слов (строится заново только после новых окон)"""
+        if self._track is None:
+            self._track = SubtitleTrack.from_words(self.words)
+        return self._track
+
 class SubtitleGenerator:
     def __init__(self):
         # Загружаем легкую модель Whisper
         self.model = None
         self.model_name = "base"  # Можно использовать "tiny" для еще большей скорости
+        self.language = 'ru'
         self.whisper_available = False
         self._check_whisper()
+        
+        # Расшифровки по отпечатку звука: повторно присланное видео (после /duration, /title) не распознается заново
+        self.cache = TranscriptCache(
+            os.getenv('TRANSCRIPT_CACHE_DB', 'transcripts.db'),
+            max_bytes=int(os.getenv('TRANSCRIPT_CACHE_MB', '512')) * 1024 * 1024
+        )
+        metrics.gauge('transcript_cache_hit_ratio', 'Доля попаданий кэша расшифровок',
+                      callback=lambda: self.cache.stats()['hit_ratio'])
+        
+        # chunk - Whisper на каждый чанк, whole - весь звук исходника перекрывающимися окнами
+        self.transcribe_mode = os.getenv('TRANSCRIBE_MODE', 'chunk')
+        self.window_overlap = float(os.getenv('TRANSCRIBE_OVERLAP', '4'))
+        self.batch_size = int(os.getenv('TRANSCRIBE_BATCH_SIZE', '8'))
+        self.batched_pipeline = None
     
     def _check_whisper(self):
         """Проверка доступности Whisper"""
@@ -98,122 +189,91 @@ class SubtitleGenerator:
         return True
     
     def _check_gpu_support(self) -> bool:
-        """Проверка поддержки GPU для Whisper"""
-        try:
-            import subprocess
-            
-            # Проверяем наличие NVIDIA GPU
-            result = subprocess.run(['nvidia-smi'], capture_output=True, text=True, check=False)
-            if result.returncode != 0:
-                logger.info("❌ NVIDIA GPU не найден")
-                return False
-            
-            # Проверяем PyTorch CUDA
-            try:
-                import torch
-                if torch.cuda.is_available():
-                    gpu_name = torch.cuda.get_device_name(0)
-                    logger.info(f"✅ GPU доступен для Whisper: {gpu_name}")
-                    return True
-                else:
-                    logger.info("❌ PyTorch CUDA недоступен")
-                    return False
-            except ImportError:
-                logger.info("❌ PyTorch не установлен")
-                return False
-                
-        except Exception as e:
-            logger.warning(f"Ошибка проверки GPU для Whisper: {e}")
-            return False
+        """Проверка поддержки GPU для Whisper по возможностям узла"""
+        return get_capabilities().whisper_gpu
     
-    async def generate(self, video_path: str) -> list:
-        """Генерация субтитров для видео"""
+    async def generate(self, video_path: str, start: float = None, duration: float = None,
+                       audio: PcmAudio = None) -> SubtitleTrack:
+        """
+        Генерация субтитров для видео.
+        start/duration - диапазон исходника (виртуальный чанк): время субтитров - во времени исходника.
+        audio - звук исходника, извлеченный заранее (extract_audio): Whisper получает срез буфера
+        вместо повторного декодирования видео.
+        """
         try:
             loop = asyncio.get_event_loop()
+            # Контекст задачи (трасса) переходит в поток распознавания
+            context = contextvars.copy_context()
             subtitles = await loop.run_in_executor(
                 None,
+                context.run,
                 self._generate_sync,
-                video_path
+                video_path, start, duration, audio
             )
             return subtitles
             
         except Exception as e:
+            stage_failures.inc(stage='transcribe')
             logger.error(f"Ошибка генерации субтитров: {e}")
-            return []
+            return SubtitleTrack()
     
-    def _generate_sync(self, video_path: str) -> list:
+    async def extract_audio(self, video_path: str, output_path: str) -> PcmAudio:
+        """Весь звук исходника одним проходом ffmpeg (16 кГц, моно, float32) в файл, отображенный в память"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, extract_pcm, video_path, output_path)
+    
+    def _load_audio_range(self, video_path: str, start: float, duration: float):
+        """Звук диапазона исходника в формате входа Whisper (16 кГц, моно, float32) - без временного файла чанка"""
+        import numpy as np
+        cmd = [
+            'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+            '-ss', str(start), '-t', str(duration), '-i', video_path,
+            '-vn', '-f', 's16le', '-ac', '1', '-ar', '16000', '-'
+        ]
+        output = subprocess.run(cmd, capture_output=True, check=True).stdout
+        return np.frombuffer(output, np.int16).astype(np.float32) / 32768.0
+    
+    def _generate_sync(self, video_path: str, start: float = None, duration: float = None,
+                       audio: PcmAudio = None) -> SubtitleTrack:
         """Синхронная генерация субтитров"""
         try:
+            pcm = audio
+            if pcm is not None:
+                start = start or 0.0
+                duration = pcm.duration - start if duration is None else duration
+                cached = self._cache_get(pcm, start, duration)
+                tracer.current().set(cached=cached is not None)
+                if cached is not None:
+                    return cached
+            
             # Проверяем, удалось ли загрузить модель
             if not self._load_model():
                 logger.warning("Модель Whisper недоступна, возвращаем пустые субтитры")
-                return []
-            
-            logger.info(f"Генерация субтитров для: {video_path}")
+                return SubtitleTrack()
             
-            # Разные способы транскрипции в зависимости от типа Whisper
-            if hasattr(self, 'use_faster_whisper'):
-                # faster-whisper имеет другой API
-                segments, info = self.model.transcribe(
-                    video_path,
-                    language='ru',
-                    word_timestamps=True
-                )
-                # Конвертируем в формат OpenAI Whisper
-                result = {'segments': []}
-                for segment in segments:
-                    result['segments'].append({
-                        'start': segment.start,
-                        'end': segment.end,
-                        'text': segment.text,
-                        'words': [{'word': word.word, 'start': word.start, 'end': word.end} 
-                                 for word in segment.words] if hasattr(segment, 'words') else []
-                    })
+            if pcm is not None:
+                # Срез общего буфера без копирования - одинаково для openai-whisper и faster-whisper
+                audio = pcm.slice(start, duration)
+                logger.info(f"Генерация субтитров для: {video_path} [{start:.1f}-{start + len(audio) / 16000:.1f} сек, PCM]")
+            elif start is None:
+                logger.info(f"Генерация субтитров для: {video_path}")
+                audio = video_path
             else:
-                # Обычный OpenAI Whisper или whisper-jax
-                result = self.model.transcribe(
-                    video_path,
-                    language='ru',  # Русский язык
-                    word_timestamps=True,  # Временные метки для слов
-                    verbose=False
-                )
+                logger.info(f"Генерация субтитров для: {video_path} [{start:.1f}-{start + duration:.1f} сек]")
+                audio = self._load_audio_range(video_path, start, duration)
+            
+            with tracer.span('whisper', model=self.model_name):
+                result = self._transcribe(audio)
             
             # Сначала пробуем получить субтитры по словам из сегментов
-            word_subtitles = []
-            for segment in result['segments']:
-                if 'words' in segment and segment['words']:
-                    # Если в сегменте есть слова с временными метками
-                    for word_info in segment['words']:
-                        word = word_info.get('word', '').strip()
-                        start = word_info.get('start', segment['start'])
-                        end = word_info.get('end', segment['end'])
-                        
-                        if word:
-                            word_subtitles.append({
-                                'start': start,
-                                'end': end,
-                                'text': word
-                            })
-                else:
-                    # Если нет детальных слов, разбиваем текст сегмента на слова
-                    words = segment['text'].strip().split()
-                    if words:
-                        segment_duration = segment['end'] - segment['start']
-                        word_duration = segment_duration / len(words)
-                        
-                        for i, word in enumerate(words):
-                            start = segment['start'] + (i * word_duration)
-                            end = start + word_duration
-                            
-                            word_subtitles.append({
-                                'start': start,
-                                'end': end,
-                                'text': word
-                            })
+            word_subtitles = self._segment_words(result['segments'])
             
             if word_subtitles:
                 logger.info(f"Создано {len(word_subtitles)} субтитров по словам")
-                return word_subtitles
+                track = self._to_source_time(SubtitleTrack.from_words(word_subtitles), start)
+                if pcm is not None:
+                    self._cache_put(pcm, start, duration, track)
+                return track
             
             # Если не удалось получить слова, используем сегменты
             subtitles = []
@@ -226,13 +286,229 @@ class SubtitleGenerator:
                 subtitles.append(subtitle)
             
             logger.info(f"Создано {len(subtitles)} субтитров по сегментам")
-            return subtitles
+            track = self._to_source_time(SubtitleTrack.from_words(subtitles), start)
+            if pcm is not None:
+                self._cache_put(pcm, start, duration, track)
+            return track
             
         except Exception as e:
             logger.error(f"Ошибка синхронной генерации субтитров: {e}")
-            return []
+            return SubtitleTrack()
+    
+    def _transcribe(self, audio) -> dict:
+        """Распознавание пути к файлу или массива сэмплов, результат в формате OpenAI Whisper"""
+        # Разные способы транскрипции в зависимости от типа Whisper
+        if hasattr(self, 'use_faster_whisper'):
+            # faster-whisper имеет другой API
+            segments, info = self.model.transcribe(
+                audio,
+                language=self.language,
+                word_timestamps=True
+            )
+            # Конвертируем в формат OpenAI Whisper
+            return {'segments': [self._segment_dict(segment) for segment in segments]}
+        
+        # Обычный OpenAI Whisper или whisper-jax
+        return self.model.transcribe(
+            audio,
+            language=self.language,  # Русский язык
+            word_timestamps=True,  # Временные метки для слов
+            verbose=False
+        )
+    
+    def _cache_settings(self) -> str:
+        """Настройки, от которых зависит расшифровка: модель, язык, бэкенд"""
+        if hasattr(self, 'use_faster_whisper'):
+            backend = 'faster-whisper'
+        elif hasattr(self, 'use_whisper_jax'):
+            backend = 'whisper-jax'
+        else:
+            backend = 'openai-whisper'
+        return f"{self.model_name}|{self.language}|{backend}"
+    
+    def _cache_get(self, audio: PcmAudio, start: float, duration: float) -> SubtitleTrack:
+        """Расшифровка диапазона из кэша (время исходника) или None"""
+        # Звук бывает чуть короче видео: диапазон чанка обрезается по концу звука
+        duration = min(duration, audio.duration - start)
+        if duration <= 0:
+            return None
+        try:
+            track = self.cache.get(audio.fingerprint(), self._cache_settings(), start, duration)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"Ошибка чтения кэша расшифровок: {e}")
+            return None
+        stats = self.cache.stats()
+        if track is None:
+            logger.info(f"📒 Кэш расшифровок: промах [{start:.1f}-{start + duration:.1f} сек] "
+                        f"(попаданий {stats['hits']}, промахов {stats['misses']})")
+        else:
+            logger.info(f"📒 Кэш расшифровок: попадание [{start:.1f}-{start + duration:.1f} сек], {len(track)} слов, "
+                        f"Whisper не запускается (попаданий {stats['hits']}, промахов {stats['misses']})")
+        return track
+    
+    def _cache_put(self, audio: PcmAudio, start: float, duration: float, track: SubtitleTrack):
+        duration = min(duration, audio.duration - start)
+        if duration <= 0:
+            return
+        try:
+            self.cache.put(audio.fingerprint(), self._cache_settings(), start, duration, track)
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка записи кэша расшифровок: {e}")
+    
+    def _batched_available(self) -> bool:
+        """Пакетный вывод faster-whisper (BatchedInferencePipeline, faster-whisper >= 1.1)"""
+        if not hasattr(self, 'use_faster_whisper'):
+            return False
+        if self.batched_pipeline is None:
+            try:
+                from faster_whisper import BatchedInferencePipeline
+                self.batched_pipeline = BatchedInferencePipeline(model=self.model)
+            except ImportError:
+                self.batched_pipeline = False
+        return bool(self.batched_pipeline)
+    
+    def plan_windows(self, duration: float, window: float) -> list:
+        """Перекрывающиеся окна [(начало, конец)] на весь звук"""
+        step = max(1.0, window - self.window_overlap)
+        windows = []
+        start = 0.0
+        while True:
+            end = min(duration, start + window)
+            windows.append((start, end))
+            if end >= duration:
+                return windows
+            start += step
+    
+    async def transcribe_whole(self, audio: PcmAudio, timeline: TranscriptTimeline) -> TranscriptTimeline:
+        """
+        Распознавание всего звука исходника один раз: перекрывающиеся окна, пакетами через
+        BatchedInferencePipeline (faster-whisper) или по очереди. Слова окон сшиваются в timeline.
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            cached = await loop.run_in_executor(None, self._cache_get, audio, 0.0, audio.duration)
+            if cached is not None:
+                timeline.plan([(0.0, audio.duration)])
+                timeline.add_window(0, cached.to_dicts())
+                timeline.finish()
+                return timeline
+            
+            if not await loop.run_in_executor(None, self._load_model):
+                timeline.finish(failed=True)
+                return timeline
+            
+            # Пакетный вывод берет окна не длиннее 30 сек, обычный Whisper сам идет по длинному окну
+            batched = await loop.run_in_executor(None, self._batched_available)
+            timeline.plan(self.plan_windows(audio.duration, 30.0 if batched else 300.0))
+            logger.info(f"🎤 Распознаем весь звук ({audio.duration:.1f} сек): окон {len(timeline.windows)}, "
+                        f"перекрытие {self.window_overlap:.0f} сек, " +
+                        (f"пакетами по {self.batch_size}" if batched else "по очереди"))
+            
+            def report(i: int, words: list):
+                loop.call_soon_threadsafe(timeline.add_window, i, words)
+            
+            await loop.run_in_executor(None, self._transcribe_windows_sync, audio, timeline, batched, report)
+            logger.info(f"✅ Весь звук распознан: {len(timeline.words)} слов")
+            if not timeline.cancelled:
+                await loop.run_in_executor(None, self._cache_put, audio, 0.0, audio.duration, timeline.track())
+            timeline.finish(failed=timeline.cancelled)
+        except Exception as e:
+            stage_failures.inc(stage='transcribe')
+            logger.error(f"Ошибка распознавания всего звука: {e}")
+            timeline.finish(failed=True)
+        return timeline
+    
+    def _transcribe_windows_sync(self, audio: PcmAudio, timeline: TranscriptTimeline, batched: bool, report):
+        """Окна по порядку; report(i, слова во времени исходника) после каждого окна"""
+        windows = timeline.windows
+        if not batched:
+            for i, (start, end) in enumerate(windows):
+                if timeline.cancelled:
+                    return
+                result = self._transcribe(audio.slice(start, end - start))
+                words = self._segment_words(result['segments'])
+                report(i, [{'start': w['start'] + start, 'end': w['end'] + start, 'text': w['text']} for w in words])
+            return
+        
+        # Весь буфер и границы окон - одним вызовом: окна декодируются пакетами, сегменты приходят по порядку.
+        # Границы clip_timestamps - индексы отсчетов (BatchedInferencePipeline режет audio[start:end]).
+        # Сегмент знает свое окно по seek (начало окна в кадрах по 10 мс), времена уже во времени исходника
+        bounds = [(int(start * SAMPLE_RATE), int(end * SAMPLE_RATE)) for start, end in windows]
+        segments, info = self.batched_pipeline.transcribe(
+            audio.samples,
+            language=self.language,
+            word_timestamps=True,
+            batch_size=self.batch_size,
+            clip_timestamps=[{'start': begin, 'end': end} for begin, end in bounds]
+        )
+        window_by_seek = {int(begin / SAMPLE_RATE * 100): i for i, (begin, end) in enumerate(bounds)}
+        current, words = 0, []
+        for segment in segments:
+            if timeline.cancelled:
+                return
+            i = window_by_seek.get(segment.seek)
+            if i is None:
+                # seek другого формата - первое окно не раньше текущего, в котором начинается сегмент
+                i = next((j for j in range(current, len(windows)) if segment.start < windows[j][1]), current)
+            i = max(i, current)
+            while current < i:
+                report(current, words)
+                current, words = current + 1, []
+            words.extend(self._segment_words([self._segment_dict(segment)]))
+        while current < len(windows):
+            report(current, words)
+            current, words = current + 1, []
     
-    def _create_word_subtitles(self, words: list) -> list:
+    def _segment_dict(self, segment) -> dict:
+        """Сегмент faster-whisper в формате OpenAI Whisper"""
+        return {
+            'start': segment.start,
+            'end': segment.end,
+            'text': segment.text,
+            'words': [{'word': word.word, 'start': word.start, 'end': word.end} 
+                     for word in segment.words] if getattr(segment, 'words', None) else []
+        }
+    
+    def _segment_words(self, segments: list) -> list:
+        """Слова сегментов с временными метками (без меток - равномерно по длительности сегмента)"""
+        word_subtitles = []
+        for segment in segments:
+            if 'words' in segment and segment['words']:
+                # Если в сегменте есть слова с временными метками
+                for word_info in segment['words']:
+                    word = word_info.get('word', '').strip()
+                    start = word_info.get('start', segment['start'])
+                    end = word_info.get('end', segment['end'])
+                    
+                    if word:
+                        word_subtitles.append({
+                            'start': start,
+                            'end': end,
+                            'text': word
+                        })
+            else:
+                # Если нет детальных слов, разбиваем текст сегмента на слова
+                words = segment['text'].strip().split()
+                if words:
+                    segment_duration = segment['end'] - segment['start']
+                    word_duration = segment_duration / len(words)
+                    
+                    for i, word in enumerate(words):
+                        start = segment['start'] + (i * word_duration)
+                        end = start + word_duration
+                        
+                        word_subtitles.append({
+                            'start': start,
+                            'end': end,
+                            'text': word
+                        })
+        return word_subtitles
+    
+    def _to_source_time(self, subtitles: SubtitleTrack, start: float = None) -> SubtitleTrack:
+        """Время Whisper отсчитывается от начала диапазона - переводим во время исходника"""
+        return subtitles.shift(start) if start else subtitles
+    
+    def _create_word_subtitles(self, words: list) -> SubtitleTrack:
         """Создание субтитров по одному слову для лучшей анимации"""
         try:
             subtitles = []
@@ -253,23 +529,23 @@ class SubtitleGenerator:
                 }
                 subtitles.append(subtitle)
             
-            return subtitles
+            return SubtitleTrack.from_words(subtitles)
             
         except Exception as e:
             logger.error(f"Ошибка создания субтитров по словам: {e}")
-            return []
+            return SubtitleTrack()
     
-    def save_srt(self, subtitles: list, output_path: str):
+    def save_srt(self, subtitles: SubtitleTrack, output_path: str):
         """Сохранение субтитров в формате SRT"""
         try:
             with open(output_path, 'w', encoding='utf-8') as f:
                 for i, sub in enumerate(subtitles, 1):
-                    start_time = self._seconds_to_srt_time(sub['start'])
-                    end_time = self._seconds_to_srt_time(sub['end'])
+                    start_time = self._seconds_to_srt_time(sub.start)
+                    end_time = self._seconds_to_srt_time(sub.end)
                     
                     f.write(f"{i}\n")
                     f.write(f"{start_time} --> {end_time}\n")
-                    f.write(f"{sub['text']}\n\n")
+                    f.write(f"{sub.text}\n\n")
             
             logger.info(f"Субтитры сохранены: {output_path}")
             
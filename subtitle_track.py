@@ -0,0 +1,195 @@
+import struct
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+SubtitleWord = namedtuple('SubtitleWord', ['start', 'end', 'text'])
+
+class SubtitleTrack:
+    """
+    Компактная дорожка субтитров по словам с индексом по времени.
+
+    - start/end хранятся в отсортированных массивах array('d')
+    - тексты хранятся одной строкой с массивом смещений
+    - window(start, duration) находит слова клипа бинарным поиском за O(log n)
+    - window/shift возвращают представления над теми же массивами, без копирования
+    """
+    _MAGIC = b'STRK'
+    _VERSION = 1
+    _HEADER = '<4sHQQ'
+
+    def __init__(self, starts: array = None, ends: array = None, max_ends: array = None,
+                 texts: str = '', text_offsets: array = None, lo: int = 0, hi: int = None,
+                 origin: float = 0.0, bound_start: float = None, bound_end: float = None):
+        self._starts = starts if starts is not None else array('d')
+        self._ends = ends if ends is not None else array('d')
+        # Префиксный максимум end: неубывающий, поэтому по нему тоже можно искать бинарно
+        self._max_ends = max_ends if max_ends is not None else array('d')
+        self._texts = texts
+        self._text_offsets = text_offsets if text_offsets is not None else array('q', [0])
+
+        # Параметры представления: диапазон индексов, начало отсчета и границы обрезки (абсолютное время)
+        self._lo = lo
+        self._hi = len(self._starts) if hi is None else hi
+        self._origin = origin
+        self._bound_start = bound_start
+        self._bound_end = bound_end
+        self._count = None
+
+    @classmethod
+    def from_words(cls, words) -> 'SubtitleTrack':
+        """Построение дорожки из словарей {'start', 'end', 'text'} или SubtitleWord"""
+        items = []
+        for word in words:
+            if isinstance(word, dict):
+                items.append((float(word['start']), float(word['end']), str(word['text'])))
+            else:
+                items.append((float(word[0]), float(word[1]), str(word[2])))
+        items.sort(key=lambda item: item[0])
+
+        starts = array('d')
+        ends = array('d')
+        max_ends = array('d')
+        text_offsets = array('q', [0])
+        text_parts = []
+        current_max = float('-inf')
+        position = 0
+
+        for start, end, text in items:
+            starts.append(start)
+            ends.append(end)
+            current_max = max(current_max, end)
+            max_ends.append(current_max)
+            text_parts.append(text)
+            position += len(text)
+            text_offsets.append(position)
+
+        return cls(starts, ends, max_ends, ''.join(text_parts), text_offsets)
+
+    def _derive(self, lo: int, hi: int, origin: float, bound_start: float, bound_end: float) -> 'SubtitleTrack':
+        """Новое представление над теми же массивами"""
+        return SubtitleTrack(
+            self._starts, self._ends, self._max_ends, self._texts, self._text_offsets,
+            lo, hi, origin, bound_start, bound_end
+        )
+
+    def window(self, start: float, duration: float) -> 'SubtitleTrack':
+        """Слова, пересекающие [start, start + duration), со временем относительно start и обрезкой по границам"""
+        abs_start = self._origin + start
+        abs_end = abs_start + duration
+        if self._bound_start is not None:
+            abs_start_bound = max(self._bound_start, abs_start)
+        else:
+            abs_start_bound = abs_start
+        if self._bound_end is not None:
+            abs_end_bound = min(self._bound_end, abs_end)
+        else:
+            abs_end_bound = abs_end
+
+        if abs_end_bound <= abs_start_bound:
+            return self._derive(self._lo, self._lo, abs_start, abs_start_bound, abs_start_bound)
+
+        # Первое слово, которое могло закончиться позже начала окна; последнее - начавшееся до конца окна
+        lo = bisect_right(self._max_ends, abs_start_bound, self._lo, self._hi)
+        hi = bisect_left(self._starts, abs_end_bound, lo, self._hi)
+        return self._derive(lo, max(lo, hi), abs_start, abs_start_bound, abs_end_bound)
+
+    def restrict(self, start: float, duration: float) -> 'SubtitleTrack':
+        """Как window, но без смены начала отсчета: времена остаются в координатах дорожки"""
+        return self.window(start, duration).shift(start)
+
+    def shift(self, offset: float) -> 'SubtitleTrack':
+        """Сдвиг всех времен на offset секунд (без копирования данных)"""
+        return self._derive(self._lo, self._hi, self._origin - offset, self._bound_start, self._bound_end)
+
+    def _iter_indices(self):
+        """Индексы слов представления, пересекающих границы обрезки"""
+        starts, ends = self._starts, self._ends
+        bound_start, bound_end = self._bound_start, self._bound_end
+        for i in range(self._lo, self._hi):
+            if bound_start is not None and ends[i] <= bound_start:
+                continue
+            if bound_end is not None and starts[i] >= bound_end:
+                continue
+            yield i
+
+    def _word(self, i: int) -> SubtitleWord:
+        start = self._starts[i]
+        end = self._ends[i]
+        if self._bound_start is not None:
+            start = max(start, self._bound_start)
+        if self._bound_end is not None:
+            end = min(end, self._bound_end)
+        text = self._texts[self._text_offsets[i]:self._text_offsets[i + 1]]
+        return SubtitleWord(start - self._origin, end - self._origin, text)
+
+    def __iter__(self):
+        for i in self._iter_indices():
+            yield self._word(i)
+
+    def __len__(self) -> int:
+        if self._count is None:
+            self._count = sum(1 for _ in self._iter_indices())
+        return self._count
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __repr__(self) -> str:
+        return f"SubtitleTrack({len(self)} слов)"
+
+    def to_dicts(self) -> list:
+        """Список словарей {'start', 'end', 'text'} (для логов и совместимости)"""
+        return [word._asdict() for word in self]
+
+    def compact(self) -> 'SubtitleTrack':
+        """Материализация представления в самостоятельную дорожку"""
+        return SubtitleTrack.from_words(self)
+
+    def to_bytes(self) -> bytes:
+        """Компактная бинарная сериализация: массивы времен, смещения текстов и текст в UTF-8"""
+        track = self if (self._lo == 0 and self._hi == len(self._starts) and self._origin == 0
+                         and self._bound_start is None and self._bound_end is None) else self.compact()
+        texts = track._texts.encode('utf-8')
+        count = len(track._starts)
+
+        header = struct.pack(self._HEADER, self._MAGIC, self._VERSION, count, len(texts))
+        return header + track._starts.tobytes() + track._ends.tobytes() + track._text_offsets.tobytes() + texts
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'SubtitleTrack':
+        """Чтение дорожки, записанной to_bytes"""
+        magic, version, count, text_size = struct.unpack_from(cls._HEADER, data, 0)
+        if magic != cls._MAGIC or version != cls._VERSION:
+            raise ValueError("Неизвестный формат дорожки субтитров")
+
+        position = struct.calcsize(cls._HEADER)
+        arrays = []
+        for typecode, length in (('d', count), ('d', count), ('q', count + 1)):
+            values = array(typecode)
+            values.frombytes(data[position:position + values.itemsize * length])
+            position += values.itemsize * length
+            arrays.append(values)
+        starts, ends, text_offsets = arrays
+        texts = data[position:position + text_size].decode('utf-8')
+
+        max_ends = array('d')
+        current_max = float('-inf')
+        for end in ends:
+            current_max = max(current_max, end)
+            max_ends.append(current_max)
+        return cls(starts, ends, max_ends, texts, text_offsets)
+
+    def save(self, path: str):
+        """Сохранение дорожки в файл"""
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> 'SubtitleTrack':
+        """Загрузка дорожки из файла"""
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт набора возможностей узла: команды ffmpeg клипа, однопроходного рендера и нарезки чанка
+под Capabilities.nvidia() и Capabilities.cpu_only() (GPU пайплайн собирается и на машине без GPU)
+"""
+
+import os
+import logging
+import tempfile
+import subprocess
+from capabilities import Capabilities, set_capabilities
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+class RecordingScheduler:
+    """Замена планировщика рендера: execute() запоминает команду ffmpeg и ничего не запускает"""
+    def __init__(self):
+        self.commands = []
+
+    def execute(self, stream, slot=None, timeout: float = None) -> dict:
+        self.commands.append(stream.compile() if hasattr(stream, 'compile') else list(stream))
+        return {'frames': 0, 'fps': 0.0, 'cpu': 0.0}
+
+def make_source(path: str):
+    subprocess.run([
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', 'testsrc2=size=640x360:rate=25:duration=2',
+        '-f', 'lavfi', '-i', 'sine=frequency=440:duration=2',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', '-y', path
+    ], check=True)
+
+def option(cmd: list, name: str) -> str:
+    """Значение опции ffmpeg (последнее вхождение) или None"""
+    values = [cmd[i + 1] for i, arg in enumerate(cmd[:-1]) if arg == name]
+    return values[-1] if values else None
+
+def before_input(cmd: list, name: str) -> bool:
+    """Опция стоит перед -i (опция входа: декодер, hwaccel)"""
+    return name in cmd and cmd.index(name) < cmd.index('-i')
+
+def commands(processor, source: str, directory: str) -> dict:
+    """Команды клипа, однопроходного рендера и нарезки чанка при текущем наборе возможностей"""
+    from subtitle_track import SubtitleTrack
+
+    scheduler = RecordingScheduler()
+    editor = processor.video_editor
+    editor.scheduler = scheduler
+    processor.scheduler = scheduler
+    words = SubtitleTrack.from_words([{'start': 0.2, 'end': 0.8, 'text': 'слово'}])
+
+    editor._create_styled_clip_sync(source, os.path.join(directory, 'clip.mp4'), 0, 2, words, 1)
+    editor._render_chunk_single_pass_sync(source, 1, 2, words, 0, output_dir=directory)
+    processor._create_chunk_direct_command(source, os.path.join(directory, 'chunk.mp4'), 0, 2)
+    clip, single_pass, chunk = scheduler.commands
+    return {'clip': clip, 'single_pass': single_pass, 'chunk': chunk}
+
+def test_nvidia(processor, source: str, directory: str) -> bool:
+    """NVIDIA узел: cuvid декодирование, scale_npp/hwupload_cuda в графе, NVENC; чанк - CUDA hwaccel"""
+    print("🔍 Команды ffmpeg под Capabilities.nvidia()...")
+    set_capabilities(Capabilities.nvidia())
+    cmds = commands(processor, source, directory)
+    for name in ('clip', 'single_pass'):
+        cmd = cmds[name]
+        graph = option(cmd, '-filter_complex')
+        print(f"   {name}: -c:v {option(cmd, '-c:v')} (вход), -vcodec {option(cmd, '-vcodec')}")
+        if not (option(cmd, '-c:v') == 'h264_cuvid' and before_input(cmd, '-c:v')
+                and option(cmd, '-vcodec') == 'h264_nvenc' and 'scale_npp' in graph and 'hwupload_cuda' in graph
+                and option(cmd, '-crf') is None):
+            print(f"❌ {name}: не GPU пайплайн: {' '.join(cmd)}")
+            return False
+    chunk = cmds['chunk']
+    print(f"   chunk: -hwaccel {option(chunk, '-hwaccel')}, -c:v {option(chunk, '-c:v')}")
+    return (option(chunk, '-hwaccel') == 'cuda' and before_input(chunk, '-hwaccel')
+            and option(chunk, '-hwaccel_output_format') == 'cuda' and option(chunk, '-c:v') == 'h264_nvenc')
+
+def test_cpu_only(processor, source: str, directory: str) -> bool:
+    """Узел без GPU: x264, обычный scale, нарезка чанка stream copy без hwaccel"""
+    print("🔍 Команды ffmpeg под Capabilities.cpu_only()...")
+    set_capabilities(Capabilities.cpu_only())
+    cmds = commands(processor, source, directory)
+    for name in ('clip', 'single_pass'):
+        cmd = cmds[name]
+        graph = option(cmd, '-filter_complex')
+        print(f"   {name}: -vcodec {option(cmd, '-vcodec')}, -crf {option(cmd, '-crf')}")
+        if not (option(cmd, '-vcodec') == 'libx264' and 'scale_npp' not in graph and 'hwupload_cuda' not in graph
+                and not any(arg in ('h264_cuvid', 'h264_nvenc', '-hwaccel') for arg in cmd)):
+            print(f"❌ {name}: GPU в CPU пайплайне: {' '.join(cmd)}")
+            return False
+    chunk = cmds['chunk']
+    print(f"   chunk: -c {option(chunk, '-c')}, -hwaccel {option(chunk, '-hwaccel')}")
+    return option(chunk, '-c') == 'copy' and '-hwaccel' not in chunk and 'h264_nvenc' not in chunk
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['JOB_MANIFEST_DB'] = os.path.join(directory, 'jobs.db')
+        os.environ['WORKSPACE_DIR'] = os.path.join(directory, 'work')
+        source = os.path.join(directory, 'source.mp4')
+        make_source(source)
+        set_capabilities(Capabilities.cpu_only())
+        from video_processor import VideoProcessor
+
+        processor = VideoProcessor()
+        results = [
+            test_nvidia(processor, source, directory),
+            test_cpu_only(processor, source, directory)
+        ]
+    print("✅ Команды ffmpeg следуют набору возможностей" if all(results) else "❌ Есть ошибки выбора пайплайна")
+    return all(results)
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
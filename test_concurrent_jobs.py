@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Стресс-тест одновременных задач на одном узле: у каждой задачи своя рабочая директория,
+клипы не перезаписываются и не удаляются чужой задачей, каждая задача грузит клипы в свою папку,
+квота рабочей директории останавливает задачу, директории очищаются по завершении,
+без папки задачи клипы не попадают в общую папку загрузчика, битый исходник и ошибка скачивания
+завершают задачу ошибкой
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+import subprocess
+from fake_drive_server import FakeDriveServer
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+JOBS = int(os.getenv('STRESS_JOBS', '4'))
+CLIP_DURATION = 10
+SOURCE_DURATION = 40
+
+def make_source(path: str, frequency: int):
+    """Тестовое видео с тоном своей частоты (у каждой задачи свой исходник)"""
+    subprocess.run([
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size=640x360:rate=25:duration={SOURCE_DURATION}",
+        '-f', 'lavfi', '-i', f"sine=frequency={frequency}:duration={SOURCE_DURATION}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', '-y', path
+    ], check=True)
+
+def fake_subtitles(processor):
+    """Субтитры без Whisper: слово каждые 2 секунды диапазона"""
+    from subtitle_track import SubtitleTrack
+
+    async def generate(video_path: str, start: float = None, duration: float = None, audio=None):
+        start = start or 0.0
+        duration = duration if duration is not None else SOURCE_DURATION - start
+        words = [{'start': t, 'end': t + 1.0, 'text': f"слово{int(t)}"}
+                 for t in range(int(start), int(start + duration) - 1, 2)]
+        return SubtitleTrack.from_words(words)
+
+    processor.subtitle_generator.generate = generate
+
+def check_job(server, processor, result: dict, expected_clips: int) -> bool:
+    """Все клипы задачи загружены в ее папку, из ее рабочей директории, директория очищена"""
+    if not result['success']:
+        print(f"❌ Задача {result.get('job_id')}: {result['error']}")
+        return False
+    job_id = result['job_id']
+    uploads = [r for r in result['upload_results'] if r.get('success')]
+    files = [server.files[r['file_id']] for r in uploads]
+    folders = {tuple(f['parents']) for f in files}
+    numbers = sorted(r['clip_number'] for r in uploads)
+    workspace = processor.workspaces.root / job_id
+    with open(result['links_file'], encoding='utf-8') as f:
+        links = f.read()
+    ok = (numbers == list(range(1, expected_clips + 1)) and len(folders) == 1
+          and all(r['file_id'] in links for r in uploads) and not workspace.exists())
+    print(f"   {job_id}: клипов {numbers}, папок {len(folders)}, директория очищена: {not workspace.exists()}")
+    return ok
+
+async def test_concurrent(server, processor, sources: list) -> bool:
+    """N задач одновременно: одинаковые имена клипов в разных рабочих директориях"""
+    print(f"🔍 {len(sources)} задач одновременно...")
+    config = {'duration': CLIP_DURATION, 'title': 'ФРАГМЕНТ', 'subtitle': 'Часть'}
+    results = await asyncio.gather(*[
+        processor.process_video_file(source, config, user_id=n, chat_id=n) for n, source in enumerate(sources)
+    ])
+    expected = SOURCE_DURATION // CLIP_DURATION
+    checks = [check_job(server, processor, result, expected) for result in results]
+
+    # Папки Drive у задач разные, файлы ссылок тоже
+    folders = {tuple(server.files[r['upload_results'][0]['file_id']]['parents']) for r in results if r['success']}
+    links_files = {r.get('links_file') for r in results}
+    for links_file in links_files:
+        if links_file and os.path.exists(links_file):
+            os.remove(links_file)
+    return all(checks) and len(folders) == len(sources) and len(links_files) == len(sources)
+
+async def test_quota(processor, source: str) -> bool:
+    """Задача, превысившая квоту рабочей директории, останавливается с ошибкой и очищается"""
+    print("🔍 Превышение квоты рабочей директории...")
+    quota = processor.workspaces.quota_bytes
+    processor.workspaces.quota_bytes = 1024
+    try:
+        result = await processor.process_video_file(source, {'duration': CLIP_DURATION, 'title': 'Т', 'subtitle': 'Ч'})
+    finally:
+        processor.workspaces.quota_bytes = quota
+    print(f"   ошибка: {result.get('error')}")
+    leftovers = [p.name for p in processor.workspaces.root.iterdir()]
+    return not result['success'] and 'квоте' in result.get('error', '') and not leftovers
+
+async def test_folder_failure(server, processor, source: str) -> bool:
+    """Папка задачи не создалась: клипы не загружаются в текущую папку загрузчика (она общая для задач)"""
+    print("🔍 Ошибка создания папки задачи...")
+    uploader = processor.drive_uploader
+    shared = await uploader.create_folder('Shared_Folder')
+    create_folder = uploader._create_folder
+
+    async def failing_create_folder(folder_name: str) -> str:
+        return None
+
+    uploader._create_folder = failing_create_folder
+    try:
+        result = await processor.process_video_file(source, {'duration': CLIP_DURATION, 'title': 'Т', 'subtitle': 'Ч'})
+    finally:
+        uploader._create_folder = create_folder
+    if result.get('links_file') and os.path.exists(result['links_file']):
+        os.remove(result['links_file'])
+    uploads = result.get('upload_results', [])
+    in_shared = [f for f in server.files.values() if shared in f['parents']]
+    print(f"   загружено {sum(1 for r in uploads if r.get('success'))}/{len(uploads)}, в общей папке {len(in_shared)}")
+    return (result['success'] and len(uploads) == SOURCE_DURATION // CLIP_DURATION
+            and not any(r.get('success') for r in uploads) and not in_shared)
+
+async def test_broken_source(processor, directory: str) -> bool:
+    """Нечитаемый исходник и исключение при скачивании: задача завершается ошибкой, а не пустым успехом"""
+    print("🔍 Битый исходник и ошибка скачивания...")
+    before = {p.name for p in processor.workspaces.root.iterdir()}
+    broken = os.path.join(directory, 'broken.mp4')
+    with open(broken, 'wb') as f:
+        f.write(os.urandom(64 * 1024))
+    file_result = await processor.process_video_file(broken, {'duration': CLIP_DURATION})
+    print(f"   битый файл: {file_result.get('error')}")
+
+    downloader = processor.youtube_downloader
+    source_key, download = downloader.source_key, downloader.download_with_cookies
+
+    async def failing_download(url: str, temp_dir: str = None) -> dict:
+        raise RuntimeError('соединение сброшено')
+
+    downloader.source_key = lambda url: None
+    downloader.download_with_cookies = failing_download
+    try:
+        url_result = await processor.process_youtube_video('https://youtu.be/broken', {'duration': CLIP_DURATION})
+    finally:
+        downloader.source_key, downloader.download_with_cookies = source_key, download
+    print(f"   скачивание: {url_result.get('error')}")
+
+    leftovers = {p.name for p in processor.workspaces.root.iterdir()} - before
+    statuses = {row[0] for row in processor.manifests._query("SELECT status FROM jobs WHERE source LIKE '%broken%'")}
+    return (not file_result['success'] and not url_result['success'] and 'соединение сброшено' in url_result['error']
+            and statuses == {'failed'} and not leftovers)
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['JOB_MANIFEST_DB'] = os.path.join(directory, 'jobs.db')
+        os.environ['WORKSPACE_DIR'] = os.path.join(directory, 'work')
+        os.environ['CHUNK_MODE'] = 'files'
+        server = FakeDriveServer().start()
+        os.environ['GOOGLE_DRIVE_API_ENDPOINT'] = server.endpoint
+        try:
+            from video_processor import VideoProcessor
+
+            sources = []
+            for n in range(JOBS):
+                path = os.path.join(directory, f"source_{n}.mp4")
+                make_source(path, 300 + 100 * n)
+                sources.append(path)
+
+            processor = VideoProcessor()
+            fake_subtitles(processor)
+            results = [
+                await test_concurrent(server, processor, sources),
+                await test_quota(processor, sources[0]),
+                await test_folder_failure(server, processor, sources[0]),
+                await test_broken_source(processor, directory)
+            ]
+            stats = processor.workspaces.stats()
+            print(f"📊 рабочих директорий создано {stats['created']}, очищено {stats['released']}, "
+                  f"пик {stats['peak_bytes'] / 1024 / 1024:.1f} МБ, превышений квоты {stats['quota_errors']}")
+        finally:
+            server.stop()
+    print("✅ Одновременные задачи не мешают друг другу" if all(results) else "❌ Есть ошибки одновременных задач")
+    return all(results)
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки параллельной загрузки на Google Drive через локальный имитатор API:
+загрузка пачки клипов и стадия загрузки задачи (несколько клипов одновременно, одна папка)
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+import argparse
+import threading
+import subprocess
+from fake_drive_server import FakeDriveServer
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+MB = 1024 * 1024
+CLIP_DURATION = 5
+SOURCE_DURATION = 30
+
+def make_clips(directory: str, count: int, size_mb: float) -> list:
+    """Файлы со случайным содержимым вместо клипов"""
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"clip_{i + 1:03d}.mp4")
+        with open(path, 'wb') as f:
+            f.write(os.urandom(int(size_mb * MB)))
+        paths.append(path)
+    return paths
+
+async def test_parallel_upload(args):
+    """Загрузка клипов и сверка содержимого на сервере"""
+    bandwidth = int(args.bandwidth_mb * MB) if args.bandwidth_mb else None
+    server = FakeDriveServer(bandwidth=bandwidth, error_rate=args.error_rate, error_status=429, seed=1).start()
+    os.environ['GOOGLE_DRIVE_API_ENDPOINT'] = server.endpoint
+    os.environ.pop('GOOGLE_OAUTH_TOKEN_BASE64', None)
+
+    # Импорт после настройки окружения: endpoint читается в конструкторе
+    from google_drive_uploader import GoogleDriveUploader
+
+    print(f"🔍 Имитатор Drive: {server.endpoint}")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            clip_paths = make_clips(directory, args.clips, args.size_mb)
+
+            uploader = GoogleDriveUploader()
+            uploader.throttle.window = args.window
+            results = await uploader.upload_clips(clip_paths)
+
+            ok = True
+            for clip_path, result in zip(clip_paths, results):
+                if not result['success']:
+                    print(f"❌ Клип {result['clip_number']}: {result['error']}")
+                    ok = False
+                    continue
+                with open(clip_path, 'rb') as f:
+                    expected = f.read()
+                if server.file_content(result['file_id']) != expected:
+                    print(f"❌ Клип {result['clip_number']}: содержимое на сервере не совпадает")
+                    ok = False
+                if result['file_id'] not in server.permissions:
+                    print(f"❌ Клип {result['clip_number']}: доступ не выдан")
+                    ok = False
+
+            stats = uploader.stats()
+            print("📊 Статистика загрузки:")
+            for key, value in stats.items():
+                print(f"   {key}: {value:.2f}" if isinstance(value, float) else f"   {key}: {value}")
+            print(f"   соединений с сервером: {server.connections}, ответов с ошибкой: {server.errors_sent}")
+            print("✅ Все клипы загружены корректно" if ok else "❌ Есть ошибки загрузки")
+            return ok
+    finally:
+        server.stop()
+
+def make_source(path: str):
+    subprocess.run([
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size=320x180:rate=25:duration={SOURCE_DURATION}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:duration={SOURCE_DURATION}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', '-y', path
+    ], check=True)
+
+def fake_subtitles(processor):
+    """Субтитры без Whisper: слово каждую секунду диапазона"""
+    from subtitle_track import SubtitleTrack
+
+    async def generate(video_path: str, start: float = None, duration: float = None, audio=None):
+        start = start or 0.0
+        duration = duration if duration is not None else SOURCE_DURATION - start
+        return SubtitleTrack.from_words([{'start': t, 'end': t + 0.8, 'text': f"слово{int(t)}"}
+                                         for t in range(int(start), int(start + duration))])
+
+    processor.subtitle_generator.generate = generate
+
+async def test_job_uploads():
+    """Стадия загрузки задачи: клипы грузятся одновременно, папка задачи создается один раз"""
+    # Медленный канал: клипы успевают скопиться в очереди загрузки
+    server = FakeDriveServer(bandwidth=64 * 1024).start()
+    os.environ['GOOGLE_DRIVE_API_ENDPOINT'] = server.endpoint
+    os.environ.pop('GOOGLE_OAUTH_TOKEN_BASE64', None)
+    print("🔍 Стадия загрузки задачи...")
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ['JOB_MANIFEST_DB'] = os.path.join(directory, 'jobs.db')
+            os.environ['WORKSPACE_DIR'] = os.path.join(directory, 'work')
+            os.environ['DRIVE_UPLOAD_CHECKPOINTS'] = os.path.join(directory, 'checkpoints.db')
+            from video_processor import VideoProcessor
+
+            source = os.path.join(directory, 'source.mp4')
+            make_source(source)
+            processor = VideoProcessor()
+            fake_subtitles(processor)
+
+            # Сколько клипов передается одновременно
+            uploader = processor.drive_uploader
+            upload_sync = uploader._upload_clip_sync
+            in_flight = {'now': 0, 'peak': 0}
+            lock = threading.Lock()
+
+            def counting_upload(*args):
+                with lock:
+                    in_flight['now'] += 1
+                    in_flight['peak'] = max(in_flight['peak'], in_flight['now'])
+                try:
+                    return upload_sync(*args)
+                finally:
+                    with lock:
+                        in_flight['now'] -= 1
+
+            uploader._upload_clip_sync = counting_upload
+            result = await processor.process_video_file(source, {'duration': CLIP_DURATION})
+            links_file = result.get('links_file')
+            if links_file and os.path.exists(links_file):
+                os.remove(links_file)
+
+        folders = [f for f in server.files.values() if f['mimeType'] == 'application/vnd.google-apps.folder']
+        uploads = [r for r in result.get('upload_results', []) if r.get('success')]
+        parents = {tuple(server.files[r['file_id']]['parents']) for r in uploads}
+        print(f"   загружено {len(uploads)} клипов, одновременно до {in_flight['peak']}, "
+              f"папок {len(folders)}, клипы в папке задачи: {parents == {(folders[0]['id'],)} if folders else False}")
+        return (result['success'] and len(uploads) == SOURCE_DURATION // CLIP_DURATION
+                and in_flight['peak'] >= 2 and len(folders) == 1 and parents == {(folders[0]['id'],)})
+    finally:
+        server.stop()
+
+async def main(args):
+    results = [await test_parallel_upload(args), await test_job_uploads()]
+    print("✅ Загрузка на Drive работает" if all(results) else "❌ Есть ошибки загрузки на Drive")
+    return all(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Проверка загрузки на Google Drive через локальный имитатор')
+    parser.add_argument('--clips', type=int, default=8)
+    parser.add_argument('--size-mb', type=float, default=6)
+    parser.add_argument('--bandwidth-mb', type=float, default=5, help='ограничение МБ/с на соединение')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='доля чанков с ответом 429')
+    parser.add_argument('--window', type=float, default=4.0, help='окно подстройки параллельности, сек')
+    args = parser.parse_args()
+
+    success = asyncio.run(main(args))
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки реестра задач: подписка на идущую задачу, ответ из записанного результата,
+отмена идущей задачи
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+from job_registry import JobRegistry
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+CONFIG = {'duration': 30, 'title': 'ФРАГМЕНТ', 'subtitle': 'Часть', 'custom_title': False, 'custom_subtitle': False}
+
+class FakeProcessor:
+    """Конвейер с задержкой: пишет файл ссылок задачи (как VideoProcessor) и считает запуски"""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.runs = 0
+
+    def __call__(self, clips: int = 3, uploaded: int = None, success: bool = True):
+        async def process() -> dict:
+            self.runs += 1
+            await asyncio.sleep(0.2)
+            if not success:
+                return {'success': False, 'error': 'не скачалось'}
+            links_file = os.path.join(self.directory, f"video_links_job{self.runs}.txt")
+            upload_results = [
+                {'success': n <= (clips if uploaded is None else uploaded), 'clip_number': n,
+                 'download_url': f"https://drive.example/{self.runs}/{n}"}
+                for n in range(1, clips + 1)
+            ]
+            with open(links_file, 'w', encoding='utf-8') as f:
+                for r in upload_results:
+                    f.write(f"Фрагмент {r['clip_number']:03d}: {r['download_url']}\n")
+            return {'success': True, 'job_id': f"job{self.runs}", 'total_clips': clips,
+                    'links_file': links_file, 'upload_results': upload_results}
+        return process
+
+async def test_subscribers(registry: JobRegistry, processor: FakeProcessor) -> bool:
+    """Три пользователя прислали одну ссылку одновременно - одна обработка, у каждого своя копия тех же ссылок"""
+    print("🔍 Одновременные одинаковые запросы...")
+    key = registry.key('Youtube:abc', CONFIG)
+    results = await asyncio.gather(*[
+        registry.run(key, processor(), 'Youtube:abc', CONFIG) for _ in range(3)
+    ])
+    files = {r['links_file'] for r in results}
+    contents = set()
+    for path in files:
+        with open(path, encoding='utf-8') as f:
+            contents.add(f.read())
+        os.remove(path)
+    # Файл ссылок задачи скопирован в ответы и удален
+    job_file = os.path.join(processor.directory, 'video_links_job1.txt')
+    print(f"   обработок: {processor.runs}, копий файла ссылок: {len(files)}, различных: {len(contents)}")
+    return (processor.runs == 1 and len(files) == 3 and len(contents) == 1 and not os.path.exists(job_file)
+            and all(r['success'] for r in results))
+
+async def test_recorded(registry: JobRegistry, processor: FakeProcessor) -> bool:
+    """После завершения: тот же запрос - из записи (даже после перезапуска), другие настройки - новая обработка"""
+    print("🔍 Повторный запрос после завершения...")
+    other = dict(CONFIG, duration=60)
+    other_key = registry.key('Youtube:abc', other)
+    other_result = await registry.run(other_key, processor(), 'Youtube:abc', other)
+    os.remove(other_result['links_file'])
+
+    restarted = JobRegistry(registry.path)
+    result = restarted.recorded(registry.key('Youtube:abc', CONFIG))
+    if result is None:
+        print("❌ Результат не записан")
+        return False
+    with open(result['links_file'], encoding='utf-8') as f:
+        links = f.read()
+    os.remove(result['links_file'])
+    print(f"   обработок: {processor.runs}, задача {result['job_id']}, шотсов {result['total_clips']}")
+    return processor.runs == 2 and result['job_id'] == 'job1' and 'drive.example/1/' in links
+
+async def test_not_recorded(registry: JobRegistry, processor: FakeProcessor) -> bool:
+    """Ошибка достается всем подписчикам; ошибки и неполные загрузки не записываются"""
+    print("🔍 Ошибки и неполные загрузки...")
+    failed_key = registry.key('telegram:x', CONFIG)
+    results = await asyncio.gather(*[
+        registry.run(failed_key, processor(success=False), 'telegram:x', CONFIG) for _ in range(2)
+    ])
+    partial_key = registry.key('telegram:y', CONFIG)
+    partial = await registry.run(partial_key, processor(clips=3, uploaded=2), 'telegram:y', CONFIG)
+    os.remove(partial['links_file'])
+    return (all(not r['success'] for r in results) and partial['success']
+            and registry.recorded(failed_key) is None and registry.recorded(partial_key) is None)
+
+async def test_cancelled(registry: JobRegistry, processor: FakeProcessor) -> bool:
+    """Идущую задачу отменили: подписчик не зависает, а обрабатывает запрос сам"""
+    print("🔍 Отмена идущей задачи...")
+    key = registry.key('telegram:z', CONFIG)
+    runs = processor.runs
+    leader = asyncio.create_task(registry.run(key, processor(), 'telegram:z', CONFIG))
+    await asyncio.sleep(0.05)
+    subscriber = asyncio.create_task(registry.run(key, processor(), 'telegram:z', CONFIG))
+    await asyncio.sleep(0.05)
+    leader.cancel()
+    try:
+        result = await asyncio.wait_for(subscriber, timeout=5)
+    except asyncio.TimeoutError:
+        print("❌ Подписчик завис после отмены задачи")
+        return False
+    print(f"   обработок: {processor.runs - runs}, результат подписчика: {result['success']}")
+    os.remove(result['links_file'])
+    return (leader.cancelled() and result['success'] and 'coalesced' not in result
+            and processor.runs - runs == 2 and not registry.is_running(key))
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        registry = JobRegistry(os.path.join(directory, 'jobs.db'))
+        processor = FakeProcessor(directory)
+        results = [
+            await test_subscribers(registry, processor),
+            await test_recorded(registry, processor),
+            await test_not_recorded(registry, processor),
+            await test_cancelled(registry, processor)
+        ]
+        stats = registry.stats()
+        print(f"📊 запущено {stats['started']}, подписок {stats['joined']}, "
+              f"ответов из записи {stats['replayed']}, записано {stats['recorded']}")
+    print("✅ Реестр задач работает" if all(results) else "❌ Есть ошибки реестра задач")
+    return all(results)
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки очереди задач: справедливость между пользователями, лимиты приема,
+позиция и ожидание, продолжение после перезапуска, снятие задачи, на которой процесс падает
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+from job_queue import JobQueue
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+class FakeHandler:
+    """Обработчик задач: запоминает порядок запусков и одновременные задачи пользователей"""
+    def __init__(self, delay: float = 0.1):
+        self.delay = delay
+        self.order = []
+        self.active = {}
+        self.max_active = {}
+
+    async def __call__(self, job: dict) -> dict:
+        user = job['user_id']
+        self.order.append(job['payload']['name'])
+        self.active[user] = self.active.get(user, 0) + 1
+        self.max_active[user] = max(self.max_active.get(user, 0), self.active[user])
+        await asyncio.sleep(self.delay)
+        self.active[user] -= 1
+        return {'success': True}
+
+async def drain(queue: JobQueue, handler: FakeHandler, timeout: float = 10):
+    """Запуск обработчиков до опустошения очереди"""
+    await queue.start(handler)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        stats = queue.stats()
+        if stats['queued'] == 0 and stats['running'] == 0:
+            break
+        await asyncio.sleep(0.05)
+    await queue.stop()
+
+async def test_fairness(path: str) -> bool:
+    """Пользователь A поставил 4 задачи раньше B и C - B и C не ждут все задачи A"""
+    print("🔍 Справедливость между пользователями...")
+    queue = JobQueue(path, workers=1, per_user=1)
+    for name in ('a1', 'a2', 'a3', 'a4'):
+        queue.submit(1, 1, {'name': name}, {}, duration=60)
+    queue.submit(2, 2, {'name': 'b1'}, {}, duration=60)
+    queue.submit(3, 3, {'name': 'c1'}, {}, duration=60)
+
+    position, eta = queue.position(6)
+    print(f"   задача c1: место {position}, ожидание ≈{eta:.0f} сек")
+    handler = FakeHandler()
+    await drain(queue, handler)
+    print(f"   порядок: {handler.order}")
+    return handler.order[:3] == ['a1', 'b1', 'c1'] and position == 3 and eta > 0
+
+async def test_per_user_cap(path: str) -> bool:
+    """Четыре обработчика, но у пользователя не больше двух задач одновременно"""
+    print("🔍 Лимит одновременных задач пользователя...")
+    queue = JobQueue(path, workers=4, per_user=2)
+    for n in range(5):
+        queue.submit(1, 1, {'name': f"a{n}"}, {})
+    queue.submit(2, 2, {'name': 'b0'}, {})
+    handler = FakeHandler()
+    await drain(queue, handler)
+    print(f"   одновременно: {handler.max_active}")
+    return handler.max_active == {1: 2, 2: 1} and len(handler.order) == 6
+
+async def test_coalesce(path: str) -> bool:
+    """Одинаковые задачи не выполняются одновременно - вторая ждет завершения первой"""
+    print("🔍 Одинаковые задачи...")
+    queue = JobQueue(path, workers=2, per_user=1)
+    queue.submit(1, 1, {'name': 'first'}, {}, coalesce_key='same')
+    queue.submit(2, 2, {'name': 'second'}, {}, coalesce_key='same')
+    handler = FakeHandler()
+    await drain(queue, handler)
+    return handler.order == ['first', 'second'] and max(handler.max_active.values()) == 1
+
+def test_admission(path: str) -> bool:
+    """Слишком длинное видео, переполненная очередь и лимит задач пользователя в очереди"""
+    print("🔍 Контроль приема...")
+    queue = JobQueue(path, max_depth=3, max_user_queued=2, max_duration=3600)
+    too_long = queue.submit(1, 1, {'name': 'long'}, {}, duration=3 * 3600)
+    first = [queue.submit(1, 1, {'name': f"a{n}"}, {}) for n in range(3)]
+    queue.submit(2, 2, {'name': 'b0'}, {})
+    full = queue.submit(3, 3, {'name': 'c0'}, {})
+    for ticket in [too_long, first[2], full]:
+        print(f"   отказ: {ticket.get('reason')}")
+    return (not too_long['accepted'] and first[0]['accepted'] and first[1]['accepted']
+            and not first[2]['accepted'] and not full['accepted'])
+
+async def test_restart(path: str) -> bool:
+    """Задача, выполнявшаяся при остановке процесса, после перезапуска выполняется повторно"""
+    print("🔍 Перезапуск посреди задачи...")
+    queue = JobQueue(path, workers=1)
+    queue.submit(1, 1, {'name': 'interrupted'}, {})
+    queue.submit(1, 1, {'name': 'waiting'}, {})
+    await queue.start(FakeHandler(delay=5))
+    await asyncio.sleep(0.2)
+    await queue.stop()
+
+    restarted = JobQueue(path, workers=1)
+    handler = FakeHandler()
+    attempts = []
+    async def record(job: dict) -> dict:
+        attempts.append(job['attempts'])
+        return await handler(job)
+    await drain(restarted, record)
+    print(f"   после перезапуска: {handler.order}, попытки {attempts}")
+    return handler.order == ['interrupted', 'waiting'] and attempts == [2, 1]
+
+async def test_crash_loop(path: str) -> bool:
+    """Задача, на которой процесс падает каждый раз, после max_attempts запусков не выдается снова"""
+    print("🔍 Падение процесса на одной задаче...")
+    JobQueue(path, workers=1, max_attempts=2).submit(1, 1, {'name': 'crashing'}, {})
+    JobQueue(path, workers=1, max_attempts=2).submit(2, 2, {'name': 'next'}, {})
+    # Каждый запуск берет задачу и "падает" (обработчики останавливаются, задача остается running)
+    for _ in range(2):
+        queue = JobQueue(path, workers=1, max_attempts=2)
+        await queue.start(FakeHandler(delay=5))
+        await asyncio.sleep(0.2)
+        await queue.stop()
+
+    restarted = JobQueue(path, workers=1, max_attempts=2)
+    abandoned = [(job['payload']['name'], job['chat_id'], job['attempts']) for job in restarted.abandoned]
+    handler = FakeHandler()
+    await drain(restarted, handler)
+    print(f"   снята: {abandoned}, после перезапуска: {handler.order}")
+    stats = restarted.stats()
+    return abandoned == [('crashing', 1, 2)] and handler.order == ['next'] and stats['failed'] == 1
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        results = [
+            await test_fairness(os.path.join(directory, 'fairness.db')),
+            await test_per_user_cap(os.path.join(directory, 'cap.db')),
+            await test_coalesce(os.path.join(directory, 'coalesce.db')),
+            test_admission(os.path.join(directory, 'admission.db')),
+            await test_restart(os.path.join(directory, 'restart.db')),
+            await test_crash_loop(os.path.join(directory, 'crash.db'))
+        ]
+    print("✅ Очередь задач работает" if all(results) else "❌ Есть ошибки очереди задач")
+    return all(results)
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    raise SystemExit(0 if success else 1)
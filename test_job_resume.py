@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт продолжения задачи по журналу (/resume): частично выполненная задача записана в журнал,
+при продолжении загруженные клипы не грузятся повторно, целые локальные клипы не рендерятся,
+поврежденные и отсутствующие рендерятся заново, готовый чанк не распознается и не рендерится
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+import subprocess
+from fake_drive_server import FakeDriveServer
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+CLIP_DURATION = 5
+SOURCE_DURATION = 20
+CLIPS = SOURCE_DURATION // CLIP_DURATION
+
+def make_source(path: str):
+    subprocess.run([
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size=320x180:rate=25:duration={SOURCE_DURATION}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:duration={SOURCE_DURATION}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', '-y', path
+    ], check=True)
+
+def make_clip(path: str, content: bytes) -> dict:
+    """Локальный клип (содержимое не важно: при продолжении сверяются размер и хэш)"""
+    from job_manifest import file_sha256
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return {'path': path, 'size': len(content), 'sha256': file_sha256(path)}
+
+class Watcher:
+    """Какие клипы рендерятся, сколько раз запускается распознавание"""
+    def __init__(self, processor):
+        self.rendered = []
+        self.transcribed = 0
+        editor = processor.video_editor
+        render = editor._create_styled_clip_sync
+
+        def rendering(*args, **kwargs):
+            self.rendered.append(args[5])
+            return render(*args, **kwargs)
+
+        editor._create_styled_clip_sync = rendering
+        from subtitle_track import SubtitleTrack
+
+        async def generate(video_path: str, start: float = None, duration: float = None, audio=None):
+            self.transcribed += 1
+            start = start or 0.0
+            duration = duration if duration is not None else SOURCE_DURATION - start
+            return SubtitleTrack.from_words([{'start': t, 'end': t + 0.8, 'text': f"слово{int(t)}"}
+                                             for t in range(int(start), int(start + duration))])
+
+        processor.subtitle_generator.generate = generate
+
+async def partial_job(processor, source: str, directory: str, name: str, chunk_done: bool,
+                      uploaded: set, intact: set, damaged: set) -> tuple:
+    """
+    Журнал прерванной задачи: один чанк на весь исходник, папка задачи на Drive, загруженные клипы uploaded,
+    целые локальные клипы intact, клипы damaged записаны, но файл изменился после рендера
+    """
+    manifest = processor.manifests.create({'path': source}, {'duration': CLIP_DURATION})
+    manifest.set_video(source, SOURCE_DURATION)
+    folder_id = await processor.drive_uploader.create_folder(f"Resume_{name}")
+    manifest.set_folder(folder_id)
+    manifest.add_chunk(0, 0, SOURCE_DURATION, 0, CLIPS, True)
+    if chunk_done:
+        manifest.chunk_done(0)
+
+    clips_dir = os.path.join(directory, name)
+    saved = {}
+    for number in sorted(uploaded | intact | damaged):
+        clip = make_clip(os.path.join(clips_dir, f"clip_{number - 1:03d}.mp4"), f"{name} клип {number}".encode() * 1000)
+        manifest.add_clip(number, 0, clip['path'], clip['size'], clip['sha256'])
+        saved[number] = clip
+        if number in uploaded:
+            result = await processor.drive_uploader.upload_clip(clip['path'], number, folder_id)
+            manifest.add_upload(result)
+            os.remove(clip['path'])
+        elif number in damaged:
+            with open(clip['path'], 'ab') as f:
+                f.write(b'!')
+    return manifest, folder_id, saved
+
+def check(server, result: dict, folder_id: str, files_before: int, expected_new: int) -> bool:
+    """Все клипы задачи загружены в ее папку, на сервер пришли только недостающие"""
+    uploads = result.get('upload_results', [])
+    numbers = [r['clip_number'] for r in uploads if r.get('success')]
+    new_files = len(server.files) - files_before
+    parents = {tuple(server.files[r['file_id']]['parents']) for r in uploads if r.get('success')}
+    print(f"   загружено {numbers}, новых файлов на сервере {new_files}, папки {parents}")
+    return (result['success'] and numbers == list(range(1, CLIPS + 1)) and new_files == expected_new
+            and parents == {(folder_id,)})
+
+async def test_resume_render(server, processor, watcher: Watcher, source: str, directory: str) -> bool:
+    """Чанк не готов: клип 1 загружен, 2 цел на диске, 3 поврежден, 4 не рендерился - рендерятся только 3 и 4"""
+    print("🔍 Продолжение с незавершенным чанком...")
+    manifest, folder_id, saved = await partial_job(processor, source, directory, 'render', chunk_done=False,
+                                                   uploaded={1}, intact={2}, damaged={3})
+    files_before = len(server.files)
+    watcher.rendered.clear()
+    result = await processor.resume_job(manifest.job_id)
+    print(f"   отрендерены клипы {sorted(watcher.rendered)}")
+
+    # Клип 2 загружен из сохраненного файла, а не отрендерен заново
+    clip_2 = next((r for r in result.get('upload_results', []) if r['clip_number'] == 2), {})
+    content_ok = clip_2.get('file_id') in server.contents and len(server.contents[clip_2['file_id']]) == saved[2]['size']
+    finished = manifest.job()['status'] != 'running'
+    if result.get('links_file') and os.path.exists(result['links_file']):
+        os.remove(result['links_file'])
+    return (check(server, result, folder_id, files_before, expected_new=3)
+            and sorted(watcher.rendered) == [3, 4] and content_ok and finished)
+
+async def test_resume_done_chunk(server, processor, watcher: Watcher, source: str, directory: str) -> bool:
+    """Чанк готов: клипы 1-2 загружены, 3-4 целы на диске - без распознавания и рендера, грузятся только 3 и 4"""
+    print("🔍 Продолжение с готовым чанком...")
+    manifest, folder_id, _ = await partial_job(processor, source, directory, 'done', chunk_done=True,
+                                               uploaded={1, 2}, intact={3, 4}, damaged=set())
+    files_before = len(server.files)
+    watcher.rendered.clear()
+    transcribed = watcher.transcribed
+    result = await processor.resume_job(manifest.job_id)
+    print(f"   отрендерены клипы {sorted(watcher.rendered)}, распознаваний {watcher.transcribed - transcribed}")
+    if result.get('links_file') and os.path.exists(result['links_file']):
+        os.remove(result['links_file'])
+
+    repeated = await processor.resume_job(manifest.job_id)
+    print(f"   повторное продолжение: {repeated.get('error')}")
+    return (check(server, result, folder_id, files_before, expected_new=2)
+            and not watcher.rendered and watcher.transcribed == transcribed
+            and not repeated['success'])
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['JOB_MANIFEST_DB'] = os.path.join(directory, 'jobs.db')
+        os.environ['WORKSPACE_DIR'] = os.path.join(directory, 'work')
+        os.environ['DRIVE_UPLOAD_CHECKPOINTS'] = os.path.join(directory, 'checkpoints.db')
+        server = FakeDriveServer().start()
+        os.environ['GOOGLE_DRIVE_API_ENDPOINT'] = server.endpoint
+        try:
+            from video_processor import VideoProcessor
+
+            source = os.path.join(directory, 'source.mp4')
+            make_source(source)
+            processor = VideoProcessor()
+            watcher = Watcher(processor)
+            results = [
+                await test_resume_render(server, processor, watcher, source, directory),
+                await test_resume_done_chunk(server, processor, watcher, source, directory)
+            ]
+        finally:
+            server.stop()
+    print("✅ Задачи продолжаются по журналу" if all(results) else "❌ Есть ошибки продолжения задач")
+    return all(results)
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт метрик: формат Prometheus, эндпоинт /metrics и метрики стадий после обработки видео
+"""
+
+import os
+import re
+import asyncio
+import logging
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+from fake_drive_server import FakeDriveServer
+from metrics import MetricsRegistry, MetricsServer, metrics
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+CLIP_DURATION = 5
+SOURCE_DURATION = 15
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (\S+)$')
+
+def make_source(path: str):
+    subprocess.run([
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size=320x180:rate=25:duration={SOURCE_DURATION}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:duration={SOURCE_DURATION}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', '-y', path
+    ], check=True)
+
+def fake_subtitles(processor):
+    """Субтитры без Whisper: слово каждую секунду диапазона"""
+    from subtitle_track import SubtitleTrack
+
+    async def generate(video_path: str, start: float = None, duration: float = None, audio=None):
+        start = start or 0.0
+        duration = duration if duration is not None else SOURCE_DURATION - start
+        return SubtitleTrack.from_words([{'start': t, 'end': t + 0.8, 'text': f"слово{int(t)}"}
+                                         for t in range(int(start), int(start + duration))])
+
+    processor.subtitle_generator.generate = generate
+
+def fetch(url: str) -> tuple:
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.status, response.headers.get('Content-Type'), response.read().decode('utf-8')
+    except urllib.error.HTTPError as e:
+        return e.code, None, ''
+
+def parse(text: str) -> dict:
+    """{(имя, метки): значение}; бросает ValueError на строке не в формате Prometheus"""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = SAMPLE.match(line)
+        if not match:
+            raise ValueError(f"строка не в формате Prometheus: {line}")
+        samples[(match.group(1), match.group(2) or '')] = float(match.group(3))
+    return samples
+
+def test_format() -> bool:
+    """Счетчик, gauge с callback и гистограмма с накопительными корзинами"""
+    print("🔍 Формат метрик...")
+    registry = MetricsRegistry(prefix='test_')
+    counter = registry.counter('events_total', 'События', ('kind',))
+    counter.inc(kind='a')
+    counter.inc(2, kind='b "x"')
+    registry.gauge('ratio', 'Доля', callback=lambda: 0.25)
+    histogram = registry.histogram('seconds', 'Время', ('stage',), (1, 5))
+    for value in (0.5, 3, 3, 10):
+        histogram.observe(value, stage='render')
+
+    try:
+        samples = parse(registry.render())
+    except ValueError as e:
+        print(f"❌ {e}")
+        return False
+    buckets = [samples[('test_seconds_bucket', f'{{stage="render",le="{le}"}}')] for le in ('1', '5', '+Inf')]
+    total = samples[('test_seconds_sum', '{stage="render"}')]
+    print(f"   корзины {buckets}, сумма {total}")
+    return (samples[('test_events_total', '{kind="a"}')] == 1
+            and samples[('test_events_total', '{kind="b \\"x\\""}')] == 2
+            and samples[('test_ratio', '')] == 0.25
+            and buckets == [1, 3, 4]
+            and samples[('test_seconds_count', '{stage="render"}')] == 4
+            and total == 16.5
+            and registry.counter('events_total', 'События', ('kind',)) is counter)
+
+async def test_endpoint(directory: str) -> bool:
+    """После обработки видео /metrics отдает время и ошибки стадий, fps рендера, загрузки и кэши"""
+    print("🔍 Эндпоинт /metrics после обработки видео...")
+    from video_processor import VideoProcessor
+
+    source = os.path.join(directory, 'source.mp4')
+    make_source(source)
+    processor = VideoProcessor()
+    fake_subtitles(processor)
+    result = await processor.process_video_file(source, {'duration': CLIP_DURATION})
+    links_file = result.get('links_file')
+    if links_file and os.path.exists(links_file):
+        os.remove(links_file)
+
+    server = MetricsServer(metrics, port=0).start()
+    try:
+        status, content_type, text = fetch(server.endpoint)
+        missing, _, _ = fetch(server.endpoint.replace('/metrics', '/other'))
+    finally:
+        server.stop()
+    samples = parse(text)
+
+    def value(name: str, labels: str = '') -> float:
+        return samples.get(('clipbot_' + name, labels))
+
+    stages = {stage: value('stage_duration_seconds_count', f'{{stage="{stage}"}}')
+              for stage in ('probe', 'split', 'transcribe', 'render', 'upload')}
+    print(f"   HTTP {status} ({content_type}), 404 для другого пути: {missing == 404}")
+    print(f"   элементов по стадиям {stages}")
+    encodes = value('render_fps_count', '{kind="encode"}')
+    print(f"   fps рендера (запусков) {encodes}, "
+          f"отправлено {value('upload_bytes_total')} байт, ffmpeg сейчас {value('ffmpeg_processes')}, "
+          f"кэш probe {value('probe_cache_hit_ratio')}")
+    return (result['success'] and status == 200 and content_type.startswith('text/plain') and missing == 404
+            and all(stages.values())
+            and stages['render'] >= 1 and stages['upload'] == SOURCE_DURATION // CLIP_DURATION
+            and value('stage_duration_seconds_bucket', '{stage="render",le="+Inf"}') == stages['render']
+            and encodes
+            and value('upload_bytes_total') > 0
+            and value('ffmpeg_processes') == 0
+            and value('probe_cache_hit_ratio') is not None
+            and not value('stage_failures_total', '{stage="render"}'))
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['JOB_MANIFEST_DB'] = os.path.join(directory, 'jobs.db')
+        os.environ['WORKSPACE_DIR'] = os.path.join(directory, 'work')
+        drive = FakeDriveServer().start()
+        os.environ['GOOGLE_DRIVE_API_ENDPOINT'] = drive.endpoint
+        try:
+            results = [test_format(), await test_endpoint(directory)]
+        finally:
+            drive.stop()
+    print("✅ Метрики работают" if all(results) else "❌ Есть ошибки метрик")
+    return all(results)
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт шины прогресса: события ffmpeg каждой задачи, процент и оценка времени по ходу рендера,
+прогресс слияния потоков при скачивании
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+import subprocess
+from fake_drive_server import FakeDriveServer
+from ffmpeg_runner import run_ffmpeg
+from progress_bus import progress_bus
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+CLIP_DURATION = 10
+SOURCE_DURATION = 20
+
+def make_source(path: str, frequency: int):
+    subprocess.run([
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size=640x360:rate=25:duration={SOURCE_DURATION}",
+        '-f', 'lavfi', '-i', f"sine=frequency={frequency}:duration={SOURCE_DURATION}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', '-y', path
+    ], check=True)
+
+def fake_subtitles(processor):
+    """Субтитры без Whisper: слово каждые 2 секунды диапазона"""
+    from subtitle_track import SubtitleTrack
+
+    async def generate(video_path: str, start: float = None, duration: float = None, audio=None):
+        start = start or 0.0
+        duration = duration if duration is not None else SOURCE_DURATION - start
+        words = [{'start': t, 'end': t + 1.0, 'text': f"слово{int(t)}"}
+                 for t in range(int(start), int(start + duration) - 1, 2)]
+        return SubtitleTrack.from_words(words)
+
+    processor.subtitle_generator.generate = generate
+
+async def watched(processor, source: str, n: int) -> dict:
+    """Обработка с наблюдателем (как у бота): снимки прогресса каждые 0.5 сек"""
+    snapshots = []
+    with progress_bus.watch() as watch:
+        task = asyncio.create_task(processor.process_video_file(source, {'duration': CLIP_DURATION}, user_id=n))
+        while not task.done():
+            await asyncio.sleep(0.5)
+            snapshot = progress_bus.snapshot(watch.job_id) if watch.job_id else None
+            if snapshot:
+                snapshots.append(snapshot)
+        result = await task
+    return {'result': result, 'job_id': watch.job_id, 'snapshots': snapshots}
+
+async def test_jobs(processor, sources: list) -> bool:
+    """Две задачи одновременно: у каждой свои события ffmpeg, процент растет, есть оценка времени"""
+    print("🔍 Прогресс двух одновременных задач...")
+    events = []
+    unsubscribe = progress_bus.subscribe(events.append)
+    try:
+        runs = await asyncio.gather(*[watched(processor, source, n) for n, source in enumerate(sources)])
+    finally:
+        unsubscribe()
+
+    ok = True
+    for run in runs:
+        job_events = [e for e in events if e['job_id'] == run['job_id']]
+        render = [e for e in job_events if e['stage'] == 'render']
+        percents = [s['percent'] for s in run['snapshots'] if s['stage'] == 'render' and s['percent'] is not None]
+        rising = all(b >= a for a, b in zip(percents, percents[1:]))
+        has_eta = any(s['eta'] is not None for s in run['snapshots'])
+        print(f"   {run['job_id']}: событий ffmpeg {len(job_events)} (рендер {len(render)}), "
+              f"процент {percents[:1]}..{percents[-1:]}, оценка времени: {has_eta}")
+        ok = ok and (run['result']['success'] and render and max(e['fps'] for e in render) > 0
+                     and percents and rising and percents[-1] >= 50 and has_eta
+                     and progress_bus.snapshot(run['job_id']) is None)
+        links_file = run['result'].get('links_file')
+        if links_file and os.path.exists(links_file):
+            os.remove(links_file)
+    processes = [{e['process'] for e in events if e['job_id'] == run['job_id']} for run in runs]
+    return ok and not (processes[0] & processes[1])
+
+def test_merge(source: str, directory: str) -> bool:
+    """Слияние потоков при скачивании: процент стадии по out_time от длительности видео"""
+    print("🔍 Прогресс слияния потоков...")
+    progress_bus.start('merge')
+    try:
+        progress_bus.stage('merge', 'download')
+        reporter = progress_bus.ffmpeg_reporter(duration=SOURCE_DURATION)
+        percents = []
+        def on_progress(progress):
+            reporter(progress)
+            percents.append(progress_bus.snapshot('merge')['percent'])
+        run_ffmpeg(['ffmpeg', '-y', '-i', source, '-c:v', 'copy', '-c:a', 'aac', os.path.join(directory, 'merged.mp4')],
+                   on_progress=on_progress)
+        reporter.close()
+        snapshot = progress_bus.snapshot('merge')
+    finally:
+        progress_bus.finish('merge')
+    print(f"   стадия {snapshot['stage']}, процент {percents[-1]:.0f}, процессов после завершения {snapshot['processes']}")
+    return snapshot['stage'] == 'download' and percents[-1] >= 95 and snapshot['processes'] == 0
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['JOB_MANIFEST_DB'] = os.path.join(directory, 'jobs.db')
+        os.environ['WORKSPACE_DIR'] = os.path.join(directory, 'work')
+        server = FakeDriveServer().start()
+        os.environ['GOOGLE_DRIVE_API_ENDPOINT'] = server.endpoint
+        try:
+            from video_processor import VideoProcessor
+
+            sources = []
+            for n in range(2):
+                path = os.path.join(directory, f"source_{n}.mp4")
+                make_source(path, 300 + 100 * n)
+                sources.append(path)
+
+            processor = VideoProcessor()
+            fake_subtitles(processor)
+            results = [
+                await test_jobs(processor, sources),
+                test_merge(sources[0], directory)
+            ]
+        finally:
+            server.stop()
+    print("✅ Шина прогресса работает" if all(results) else "❌ Есть ошибки шины прогресса")
+    return all(results)
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт распределенного рендера: координатор и воркеры в отдельных процессах с общей
+SQLite очередью, повторная выдача задачи упавшего воркера, heartbeat'ы воркеров
+"""
+
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import tempfile
+import subprocess
+from workspace import JobWorkspace
+from media_probe import mp4_is_complete
+from subtitle_track import SubtitleTrack
+from render_queue import RenderTaskQueue, RenderCoordinator, LEASED
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+CLIP_DURATION = 3
+SOURCE_DURATION = 12
+LEASE = 3.0
+
+def make_source(path: str):
+    subprocess.run([
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size=320x180:rate=25:duration={SOURCE_DURATION}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:duration={SOURCE_DURATION}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', '-y', path
+    ], check=True)
+
+def start_worker(db: str, name: str) -> subprocess.Popen:
+    """Воркер - отдельный процесс в своей группе (убивается вместе с его ffmpeg)"""
+    return subprocess.Popen(
+        [sys.executable, 'render_worker.py', '--db', db, '--name', name, '--concurrency', '1', '--lease', str(LEASE)],
+        start_new_session=True
+    )
+
+def subtitles() -> SubtitleTrack:
+    return SubtitleTrack.from_words([
+        {'start': t + 0.2, 'end': t + 0.8, 'text': f"слово{t}"} for t in range(SOURCE_DURATION)
+    ])
+
+def make_editor(db: str):
+    from video_editor import VideoEditor
+
+    editor = VideoEditor()
+    editor.render_coordinator = RenderCoordinator(RenderTaskQueue(db), poll_interval=0.2, worker_timeout=LEASE,
+                                                  orphan_timeout=30)
+    return editor
+
+async def test_distributed(db: str, source: str, workspace: JobWorkspace) -> bool:
+    """Клипы чанка рендерят два воркера, результаты появляются в рабочей директории координатора"""
+    print("🔍 Рендер клипов двумя воркерами...")
+    editor = make_editor(db)
+    ready = []
+
+    async def on_clip_ready(clip_path: str, clip_number: int):
+        ready.append(clip_number)
+
+    clips = await editor.create_clips_parallel(source, CLIP_DURATION, subtitles(), config={'title': 'ТЕСТ'},
+                                               on_clip_ready=on_clip_ready, workspace=workspace)
+    queue = editor.render_coordinator.queue
+    workers = {row[0] for row in queue._conn.execute("SELECT worker FROM render_tasks WHERE status='done'")}
+    expected = SOURCE_DURATION // CLIP_DURATION
+    print(f"   клипов {len(clips)}, готовы {sorted(ready)}, воркеры {sorted(workers)}")
+    return (len(clips) == expected and sorted(ready) == list(range(1, expected + 1))
+            and all(mp4_is_complete(c) for c in clips) and len(workers) == 2)
+
+async def test_redelivery(db: str, source: str, workspace: JobWorkspace, victim: subprocess.Popen) -> bool:
+    """Воркер убит посреди рендера: задача после истечения аренды выдается живому воркеру"""
+    print("🔍 Падение воркера посреди задачи...")
+    editor = make_editor(db)
+    queue = editor.render_coordinator.queue
+    render = asyncio.create_task(editor.create_clips_parallel(
+        source, CLIP_DURATION, subtitles(), start_index=100, config={'title': 'ТЕСТ'}, workspace=workspace
+    ))
+
+    # Ждем, пока жертва возьмет задачу, и убиваем ее вместе с ffmpeg
+    victim_task = None
+    deadline = time.monotonic() + 60
+    while victim_task is None and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+        row = queue._conn.execute(
+            "SELECT id FROM render_tasks WHERE worker='victim' AND status=?", (LEASED,)
+        ).fetchone()
+        victim_task = row[0] if row else None
+    if victim_task is None:
+        print("❌ Воркер-жертва не взял задачу")
+        render.cancel()
+        return False
+    os.killpg(victim.pid, signal.SIGKILL)
+    victim.wait()
+    print(f"   воркер victim убит с задачей {victim_task}")
+
+    clips = await render
+    task = queue.tasks([victim_task])[victim_task]
+    live = queue.live_workers(LEASE)
+    print(f"   клипов {len(clips)}, задача {victim_task}: {task['status']} у {task['worker']}, "
+          f"попыток {task['attempts']}, живые воркеры {live}")
+    return (len(clips) == SOURCE_DURATION // CLIP_DURATION and task['status'] == 'done'
+            and task['worker'] != 'victim' and task['attempts'] == 2 and 'victim' not in live)
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        db = os.path.join(directory, 'render_tasks.db')
+        source = os.path.join(directory, 'source.mp4')
+        make_source(source)
+        RenderTaskQueue(db)
+        workers = [start_worker(db, 'worker-a'), start_worker(db, 'victim')]
+        try:
+            first = JobWorkspace(os.path.join(directory, 'work'), 'first')
+            second = JobWorkspace(os.path.join(directory, 'work'), 'second')
+            results = [await test_distributed(db, source, first)]
+            results.append(await test_redelivery(db, source, second, workers[1]))
+            stats = RenderTaskQueue(db).stats()
+            print(f"📊 выполнено {stats['done']}, выдано повторно {stats['redelivered']}, упало {stats['failed']}")
+        finally:
+            for worker in workers:
+                if worker.poll() is None:
+                    worker.send_signal(signal.SIGTERM)
+                    worker.wait(timeout=120)
+    print("✅ Распределенный рендер работает" if all(results) else "❌ Есть ошибки распределенного рендера")
+    return all(results)
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    raise SystemExit(0 if success else 1)
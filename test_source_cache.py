@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки кэша исходников: общая загрузка, попадания, LRU вытеснение с закреплением,
+отмена общей загрузки
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+from source_cache import SourceCache
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+MB = 1024 * 1024
+
+class FakeDownloader:
+    """Загрузчик с задержкой: пишет случайный файл нужного размера и считает запуски"""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.downloads = []
+
+    def __call__(self, name: str, size: int, success: bool = True):
+        async def download() -> dict:
+            self.downloads.append(name)
+            await asyncio.sleep(0.2)
+            if not success:
+                return {'success': False, 'error': 'нет сети'}
+            path = os.path.join(self.directory, f"{name}.mp4")
+            with open(path, 'wb') as f:
+                f.write(os.urandom(size))
+            return {'success': True, 'video_path': path, 'title': name, 'duration': 60}
+        return download
+
+async def test_inflight(cache: SourceCache, downloader: FakeDownloader) -> bool:
+    """Три одновременных запроса одной ссылки - одна загрузка, повторный запрос - из кэша"""
+    print("🔍 Одновременные запросы одного источника...")
+    results = await asyncio.gather(*[cache.fetch('Youtube:a', downloader('a', 8 * MB)) for _ in range(3)])
+    for _ in results:
+        cache.release('Youtube:a')
+    paths = {r['video_path'] for r in results}
+    print(f"   загрузок: {len(downloader.downloads)}, файлов: {len(paths)}")
+    if downloader.downloads != ['a'] or len(paths) != 1:
+        print("❌ Источник скачан больше одного раза")
+        return False
+
+    repeat = await cache.fetch('Youtube:a', downloader('a', 8 * MB))
+    cache.release('Youtube:a')
+    return repeat['cached'] and downloader.downloads == ['a']
+
+async def test_eviction(cache: SourceCache, downloader: FakeDownloader) -> bool:
+    """Бюджет превышен: вытесняется давно не использованный, закрепленный за задачей остается"""
+    print("🔍 LRU вытеснение...")
+    await cache.fetch('Youtube:b', downloader('b', 8 * MB))  # обрабатывается - закреплен
+    await cache.fetch('Youtube:c', downloader('c', 8 * MB))
+    cache.release('Youtube:c')
+    alive = [key for key in ('Youtube:a', 'Youtube:b', 'Youtube:c') if cache.lookup(key)]
+    print(f"   в кэше: {alive}")
+    cache.release('Youtube:b')
+    return alive == ['Youtube:b', 'Youtube:c']
+
+async def test_failure(cache: SourceCache, downloader: FakeDownloader) -> bool:
+    """Ошибка загрузки достается всем ожидающим и не попадает в кэш"""
+    print("🔍 Ошибка общей загрузки...")
+    results = await asyncio.gather(
+        cache.fetch('Youtube:x', downloader('x', MB, success=False)),
+        cache.fetch('Youtube:x', downloader('x', MB, success=False))
+    )
+    return all(not r['success'] for r in results) and cache.lookup('Youtube:x') is None
+
+async def test_cancelled(cache: SourceCache, downloader: FakeDownloader) -> bool:
+    """Задачу, которая скачивает, отменили: ожидающий не зависает и скачивает сам"""
+    print("🔍 Отмена общей загрузки...")
+    leader = asyncio.create_task(cache.fetch('Youtube:d', downloader('d', MB)))
+    await asyncio.sleep(0.05)
+    waiter = asyncio.create_task(cache.fetch('Youtube:d', downloader('d', MB)))
+    await asyncio.sleep(0.05)
+    leader.cancel()
+    try:
+        result = await asyncio.wait_for(waiter, timeout=5)
+    except asyncio.TimeoutError:
+        print("❌ Ожидающий завис после отмены загрузки")
+        return False
+    cache.release('Youtube:d')
+    print(f"   загрузок: {downloader.downloads.count('d')}, результат ожидающего: {result['success']}")
+    return (leader.cancelled() and result['success'] and not result['cached']
+            and downloader.downloads.count('d') == 2 and 'Youtube:d' not in cache._inflight)
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = SourceCache(os.path.join(directory, 'cache'), max_bytes=20 * MB)
+        downloader = FakeDownloader(directory)
+        results = [
+            await test_inflight(cache, downloader),
+            await test_eviction(cache, downloader),
+            await test_failure(cache, downloader),
+            await test_cancelled(cache, downloader)
+        ]
+        stats = cache.stats()
+        print(f"📊 попаданий {stats['hits']}, общих загрузок {stats['joined']}, "
+              f"сэкономлено {stats['bytes_saved'] / MB:.0f} МБ, вытеснено {stats['evictions']}")
+    print("✅ Кэш исходников работает" if all(results) else "❌ Есть ошибки кэша исходников")
+    return all(results)
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт трассировки задач: вложенные спаны задач asyncio и потоков рендера/загрузки,
+экспорт в Chrome trace JSON (Perfetto), критический путь и отстающий клип
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import tempfile
+import subprocess
+from fake_drive_server import FakeDriveServer
+from tracing import tracer
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+CLIP_DURATION = 5
+SOURCE_DURATION = 20
+
+def make_source(path: str):
+    subprocess.run([
+        'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size=320x180:rate=25:duration={SOURCE_DURATION}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:duration={SOURCE_DURATION}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', '-y', path
+    ], check=True)
+
+def fake_subtitles(processor):
+    """Субтитры без Whisper: слово каждую секунду диапазона"""
+    from subtitle_track import SubtitleTrack
+
+    async def generate(video_path: str, start: float = None, duration: float = None, audio=None):
+        start = start or 0.0
+        duration = duration if duration is not None else SOURCE_DURATION - start
+        return SubtitleTrack.from_words([{'start': t, 'end': t + 0.8, 'text': f"слово{int(t)}"}
+                                         for t in range(int(start), int(start + duration))])
+
+    processor.subtitle_generator.generate = generate
+
+def ancestors(event: dict, by_id: dict) -> list:
+    names = []
+    parent = event['args']['parent']
+    while parent is not None:
+        names.append(by_id[parent]['name'])
+        parent = by_id[parent]['args']['parent']
+    return names
+
+def nested_by_lane(events: list) -> bool:
+    """Спаны одной дорожки вложены друг в друга без частичных пересечений (требование формата X)"""
+    lanes = {}
+    for event in events:
+        lanes.setdefault(event['tid'], []).append(event)
+    for lane in lanes.values():
+        stack = []
+        for event in sorted(lane, key=lambda e: (e['ts'], -e['dur'])):
+            while stack and event['ts'] >= stack[-1]['ts'] + stack[-1]['dur']:
+                stack.pop()
+            if stack and event['ts'] + event['dur'] > stack[-1]['ts'] + stack[-1]['dur'] + 1:
+                print(f"❌ Пересечение на дорожке: {stack[-1]['name']} и {event['name']}")
+                return False
+            stack.append(event)
+    return True
+
+async def test_job_trace(directory: str) -> bool:
+    """Трасса задачи: спаны стадий, ffmpeg в потоках рендера, чанки Drive; файл открывается в Perfetto"""
+    print("🔍 Трасса задачи...")
+    from video_processor import VideoProcessor
+
+    source = os.path.join(directory, 'source.mp4')
+    make_source(source)
+    processor = VideoProcessor()
+    fake_subtitles(processor)
+
+    summaries = {}
+    finish = tracer.finish
+    tracer.finish = lambda job_id: summaries.setdefault(job_id, finish(job_id))
+    tracer.trace_dir = os.path.join(directory, 'traces')
+    try:
+        result = await processor.process_video_file(source, {'duration': CLIP_DURATION})
+    finally:
+        tracer.finish = finish
+        tracer.trace_dir = None
+    links_file = result.get('links_file')
+    if links_file and os.path.exists(links_file):
+        os.remove(links_file)
+
+    (job_id, summary), = summaries.items()
+    with open(summary['file'], encoding='utf-8') as f:
+        trace = json.load(f)
+    events = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+    lanes = [e['args']['name'] for e in trace['traceEvents'] if e['name'] == 'thread_name']
+    by_id = {e['args']['span_id']: e for e in events}
+    names = {e['name'] for e in events}
+    print(f"   {len(events)} спанов на {len(lanes)} дорожках: {sorted(names)}")
+
+    ffmpeg_parents = [ancestors(e, by_id) for e in events if e['name'] == 'ffmpeg' and e['args']['kind'] == 'encode']
+    upload_parents = [ancestors(e, by_id) for e in events if e['name'] in ('drive chunk', 'drive permission')]
+    clips = sorted(e['args']['clip'] for e in events if e['name'] == 'render clip')
+    expected = {'job', 'split', 'transcribe', 'render', 'render clip', 'render slot wait', 'ffmpeg',
+                'upload', 'upload slot wait', 'drive chunk', 'drive permission', 'drive folder'}
+    return (result['success'] and expected <= names and clips == list(range(1, SOURCE_DURATION // CLIP_DURATION + 1))
+            and ffmpeg_parents and all(p[:2] == ['render clip', 'render'] and p[-1] == 'job' for p in ffmpeg_parents)
+            and upload_parents and all('upload' in p for p in upload_parents)
+            and nested_by_lane(events)
+            and any(e['name'] == 'render clip' and e['tid'] != by_id[e['args']['parent']]['tid'] for e in events)
+            and covers(summary))
+
+def covers(summary: dict) -> bool:
+    """Отрезки критического пути в сумме дают время задачи"""
+    covered = sum(seconds for _, seconds, _ in summary['critical_path'])
+    print(f"   критический путь {covered:.1f} из {summary['total']:.1f} сек: " +
+          ", ".join(f"{name} {seconds:.1f}" for name, seconds, _ in summary['critical_path'][:5]))
+    return abs(covered - summary['total']) < 0.05 * summary['total'] + 0.1
+
+async def test_critical_path() -> bool:
+    """Три клипа параллельно (один отстает), затем загрузка: путь идет через отстающий клип"""
+    print("🔍 Критический путь и отстающий клип...")
+
+    async def clip(number: int, seconds: float):
+        with tracer.span('render clip', clip=number):
+            await asyncio.sleep(seconds)
+
+    async def job():
+        tracer.start('synthetic')
+        try:
+            with tracer.span('render'):
+                await asyncio.gather(clip(1, 0.2), clip(2, 1.0), clip(3, 0.2))
+            with tracer.span('upload'):
+                await asyncio.to_thread(time.sleep, 0.2)
+        finally:
+            summary = tracer.finish('synthetic')
+        return summary
+
+    summary = await asyncio.create_task(job())
+    path = dict((name, seconds) for name, seconds, _ in summary['critical_path'])
+    slow = summary['stragglers'][0] if summary['stragglers'] else {}
+    print(f"   путь {', '.join(f'{name} {seconds:.2f}' for name, seconds in path.items())}; "
+          f"отстающий {slow.get('name')} {slow.get('attrs')}")
+    return (covers(summary) and path.get('render clip', 0) >= 0.95 and path.get('upload', 0) >= 0.19
+            and slow.get('name') == 'render clip' and slow['attrs'].get('clip') == 2)
+
+def test_outside_job() -> bool:
+    """Вне задачи спаны не записываются"""
+    print("🔍 Спаны вне задачи...")
+    with tracer.span('orphan') as span:
+        span.set(ignored=True)
+    return tracer.current().set(x=1) is None and not tracer._traces
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['JOB_MANIFEST_DB'] = os.path.join(directory, 'jobs.db')
+        os.environ['WORKSPACE_DIR'] = os.path.join(directory, 'work')
+        drive = FakeDriveServer().start()
+        os.environ['GOOGLE_DRIVE_API_ENDPOINT'] = drive.endpoint
+        try:
+            results = [test_outside_job(), await test_critical_path(), await test_job_trace(directory)]
+        finally:
+            drive.stop()
+    print("✅ Трассировка работает" if all(results) else "❌ Есть ошибки трассировки")
+    return all(results)
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт распознавания всего звука (TRANSCRIBE_MODE=whole) пакетным выводом:
+границы окон в отсчетах, сегменты по своим окнам, слова на стыках окон - один раз
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+import numpy as np
+from types import SimpleNamespace
+from audio_pcm import SAMPLE_RATE, PcmAudio
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+DURATION = 100
+SILENCE = (28, 58)
+
+class FakeBatchedPipeline:
+    """
+    BatchedInferencePipeline как в faster-whisper 1.1: clip_timestamps - индексы отсчетов,
+    чанк - audio[start:end], seek сегмента - начало чанка в кадрах по 10 мс, времена - во времени исходника.
+    Слово в каждую секунду, где звук не тишина, сегменты по 5 слов.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, language=None, word_timestamps=False, batch_size=8, clip_timestamps=None):
+        self.calls.append(clip_timestamps)
+        chunks = [(audio[chunk['start']:chunk['end']], chunk['start'] / SAMPLE_RATE, chunk['end'] / SAMPLE_RATE)
+                  for chunk in clip_timestamps]
+        return self._segments(chunks), None
+
+    def _segments(self, chunks):
+        for samples, start, end in chunks:
+            seek = int(start * 100)
+            words = [SimpleNamespace(word=f" слово{t}", start=float(t), end=t + 0.5)
+                     for t in range(int(np.ceil(start)), int(end))
+                     if t + 0.5 <= end and samples[int((t - start) * SAMPLE_RATE)] != 0]
+            for i in range(0, len(words), 5):
+                group = words[i:i + 5]
+                yield SimpleNamespace(seek=seek, start=group[0].start, end=group[-1].end,
+                                      text=''.join(w.word for w in group), words=group)
+
+def make_audio(directory: str) -> PcmAudio:
+    samples = np.full(DURATION * SAMPLE_RATE, 0.1, dtype=np.float32)
+    samples[SILENCE[0] * SAMPLE_RATE:SILENCE[1] * SAMPLE_RATE] = 0
+    return PcmAudio(os.path.join(directory, 'audio.pcm'), samples)
+
+async def test_batched_windows(directory: str) -> bool:
+    """Окна пакетом: целые индексы отсчетов, пустое окно в тишине, каждое слово один раз"""
+    print("🔍 Пакетное распознавание окон...")
+    from subtitle_generator import SubtitleGenerator, TranscriptTimeline
+
+    generator = SubtitleGenerator()
+    pipeline = FakeBatchedPipeline()
+    generator.batched_pipeline = pipeline
+    generator._load_model = lambda: True
+    generator._batched_available = lambda: True
+    added = []
+
+    timeline = TranscriptTimeline()
+    add_window = timeline.add_window
+    timeline.add_window = lambda i, words: (added.append((i, [w['text'] for w in words])), add_window(i, words))
+    await generator.transcribe_whole(make_audio(directory), timeline)
+
+    (clips,) = pipeline.calls
+    windows = timeline.windows
+    expected = [f"слово{t}" for t in range(DURATION) if not SILENCE[0] <= t < SILENCE[1]]
+    texts = [word['text'] for word in timeline.words]
+    print(f"   окон {len(windows)}: {[(c['start'], c['end']) for c in clips]}")
+    print(f"   слов по окнам: {[(i, len(words)) for i, words in added]}, в дорожке {len(texts)}")
+
+    types_ok = all(type(c['start']) is int and type(c['end']) is int for c in clips)
+    bounds_ok = [(c['start'], c['end']) for c in clips] == [(int(s * SAMPLE_RATE), int(e * SAMPLE_RATE))
+                                                             for s, e in windows]
+    # Слова окна - только из его диапазона (сегмент не ушел в соседнее окно)
+    assigned_ok = all(windows[i][0] <= int(word[len('слово'):]) < windows[i][1] for i, words in added for word in words)
+    return (types_ok and bounds_ok and assigned_ok
+            and [i for i, _ in added] == list(range(len(windows)))
+            and not timeline.failed and texts == expected)
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['TRANSCRIPT_CACHE_DB'] = os.path.join(directory, 'transcripts.db')
+        results = [await test_batched_windows(directory)]
+    print("✅ Распознавание всего звука работает" if all(results) else "❌ Есть ошибки распознавания")
+    return all(results)
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    raise SystemExit(0 if success else 1)
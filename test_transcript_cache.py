@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки кэша расшифровок: повторное видео с другой /duration, LRU вытеснение
+"""
+
+import os
+import logging
+import tempfile
+from subtitle_track import SubtitleTrack
+from transcript_cache import TranscriptCache
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+SETTINGS = 'base|ru|openai-whisper'
+
+def words(start: float, end: float) -> list:
+    """Слово каждые 0.7 сек в диапазоне (как если бы Whisper распознал чанк)"""
+    result = []
+    t = 0.0
+    while t < end:
+        if t >= start and t + 0.5 <= end:
+            result.append({'start': t, 'end': t + 0.5, 'text': f"слово{t:.1f}"})
+        t = round(t + 0.7, 1)
+    return result
+
+def test_ranges(path: str) -> bool:
+    """Чанки по 300 сек в кэше - чанки по 270 сек после перезапуска собираются из них"""
+    print("🔍 Другие границы чанков после перезапуска...")
+    cache = TranscriptCache(path)
+    for start, duration in [(0, 300), (300, 300), (600, 100)]:
+        cache.put('audio1', SETTINGS, start, duration, SubtitleTrack.from_words(words(start, start + duration)))
+
+    cache = TranscriptCache(path)
+    for start, duration in [(0, 270), (270, 270), (540, 160)]:
+        track = cache.get('audio1', SETTINGS, start, duration)
+        if track is None:
+            print(f"❌ Промах для [{start}, {start + duration})")
+            return False
+        texts = [word.text for word in track]
+        if len(texts) != len(set(texts)) or not texts:
+            print(f"❌ Дубли или пустой диапазон [{start}, {start + duration})")
+            return False
+        print(f"   [{start}, {start + duration}): {len(texts)} слов")
+
+    if cache.get('audio1', 'small|ru|openai-whisper', 0, 270) is not None:
+        print("❌ Попадание для другой модели")
+        return False
+    if cache.get('audio1', SETTINGS, 0, 800) is not None:
+        print("❌ Попадание для непокрытого диапазона")
+        return False
+    stats = cache.stats()
+    print(f"   попаданий {stats['hits']}, промахов {stats['misses']}, {stats['bytes']} байт")
+    return stats['hits'] == 3 and stats['misses'] == 2
+
+def test_lru(path: str) -> bool:
+    """Превышение лимита: вытесняется давно не использованная запись"""
+    print("🔍 LRU вытеснение...")
+    cache = TranscriptCache(path)
+    for name in ('first', 'second', 'third'):
+        cache.put(name, SETTINGS, 0, 300, SubtitleTrack.from_words(words(0, 300)))
+    entry_size = cache.size() // 3
+    # Самая старая запись только что прочитана - вытесняться должны вторая и третья
+    cache.get('first', SETTINGS, 0, 300)
+    cache.max_bytes = entry_size * 2
+    cache.put('newest', SETTINGS, 0, 300, SubtitleTrack.from_words(words(0, 300)))
+
+    alive = [name for name in ('first', 'second', 'third', 'newest') if cache.get(name, SETTINGS, 0, 300) is not None]
+    print(f"   в кэше: {alive}, вытеснено {cache.evictions}")
+    return alive == ['first', 'newest']
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        results = [
+            test_ranges(os.path.join(directory, 'ranges.db')),
+            test_lru(os.path.join(directory, 'lru.db'))
+        ]
+    print("✅ Кэш расшифровок работает" if all(results) else "❌ Есть ошибки кэша расшифровок")
+    return all(results)
+
+if __name__ == "__main__":
+    success = main()
+    raise SystemExit(0 if success else 1)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки продолжения resumable загрузки после обрыва и перезапуска
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+from fake_drive_server import FakeDriveServer
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+MB = 1024 * 1024
+
+def check_uploaded(server, clip_path: str, result: dict, sent_limit: int) -> bool:
+    """Файл на сервере совпадает с клипом, а повторно отправлено не больше sent_limit байт"""
+    if not result['success']:
+        print(f"❌ Клип {result['clip_number']}: {result['error']}")
+        return False
+    with open(clip_path, 'rb') as f:
+        expected = f.read()
+    if server.file_content(result['file_id']) != expected:
+        print(f"❌ Клип {result['clip_number']}: содержимое на сервере не совпадает")
+        return False
+    print(f"   клип {result['clip_number']}: продолжен с {result['resumed_from'] / MB:.1f} МБ, "
+          f"сервер принял всего {server.bytes_received / MB:.1f} МБ")
+    if server.bytes_received > sent_limit:
+        print(f"❌ Отправлено больше, чем нужно ({server.bytes_received} > {sent_limit})")
+        return False
+    return True
+
+async def test_resume(directory: str) -> bool:
+    """Обрыв соединения посреди чанка: повторная попытка продолжает ту же сессию"""
+    print("🔍 Обрыв соединения посреди загрузки...")
+    server = FakeDriveServer(drop_after=3 * MB, drops=1).start()
+    os.environ['GOOGLE_DRIVE_API_ENDPOINT'] = server.endpoint
+    try:
+        from google_drive_uploader import GoogleDriveUploader
+
+        clip_path = os.path.join(directory, 'clip_resume.mp4')
+        with open(clip_path, 'wb') as f:
+            f.write(os.urandom(8 * MB))
+
+        uploader = GoogleDriveUploader()
+        await uploader.create_folder('Resume_Test')
+        result = await uploader.upload_clip(clip_path, 1)
+
+        # Без продолжения сервер получил бы 3 МБ + половину чанка + весь файл заново
+        ok = check_uploaded(server, clip_path, result, sent_limit=8 * MB + MB // 2)
+        stats = uploader.stats()
+        print(f"   сэкономлено {stats['bytes_saved'] / MB:.1f} МБ, продолжений: {stats['resumed']}")
+        return ok and stats['bytes_saved'] >= 3 * MB
+    finally:
+        server.stop()
+
+async def test_restart(directory: str) -> bool:
+    """Процесс упал посреди загрузки: новый загрузчик продолжает сессию из хранилища"""
+    print("🔍 Перезапуск процесса посреди загрузки...")
+    server = FakeDriveServer(drop_after=5 * MB, drops=1).start()
+    os.environ['GOOGLE_DRIVE_API_ENDPOINT'] = server.endpoint
+    try:
+        from google_drive_uploader import GoogleDriveUploader
+
+        clip_path = os.path.join(directory, 'clip_restart.mp4')
+        with open(clip_path, 'wb') as f:
+            f.write(os.urandom(9 * MB))
+
+        first = GoogleDriveUploader()
+        folder_id = await first.create_folder('Restart_Test')
+        try:
+            # Одна попытка без повторов - как если бы процесс завершился на обрыве
+            with first.pool.session() as service:
+                first._upload_with_service(service, clip_path, 1, folder_id)
+            print("❌ Обрыв не произошел")
+            return False
+        except Exception as e:
+            print(f"   первая попытка прервана: {type(e).__name__}")
+
+        # Новый экземпляр (как после перезапуска бота) с той же папкой и тем же файлом контрольных точек
+        second = GoogleDriveUploader()
+        second.folder_id = folder_id
+        result = await second.upload_clip(clip_path, 1)
+
+        ok = check_uploaded(server, clip_path, result, sent_limit=9 * MB + MB // 2)
+        return ok and result['resumed_from'] >= 5 * MB and second.checkpoints.count() == 0
+    finally:
+        server.stop()
+
+async def main():
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['DRIVE_UPLOAD_CHECKPOINTS'] = os.path.join(directory, 'checkpoints.db')
+        os.environ['DRIVE_UPLOAD_CHUNK_MB'] = '1'
+        os.environ.pop('GOOGLE_OAUTH_TOKEN_BASE64', None)
+
+        results = [await test_resume(directory), await test_restart(directory)]
+        print("✅ Загрузка продолжается с подтвержденного байта" if all(results) else "❌ Есть ошибки продолжения загрузки")
+        return all(results)
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    raise SystemExit(0 if success else 1)
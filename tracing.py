@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from pathlib import Path
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Трасса задачи и открытый спан кода, который сейчас выполняется (наследуются задачами asyncio
+# и потоками, запущенными через contextvars.copy_context)
+_trace = ContextVar('trace', default=None)
+_span = ContextVar('trace_span', default=None)
+
+class Span:
+    """Интервал работы: имя, атрибуты, родитель и дорожка (задача asyncio или поток)"""
+    __slots__ = ('id', 'parent', 'name', 'attrs', 'lane', 'start', 'end')
+
+    def __init__(self, span_id: int, parent: int, name: str, attrs: dict, lane: str):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+        self.lane = lane
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set(self, **attrs):
+        """Атрибуты, известные только по ходу работы (размер, число слов, код ответа)"""
+        self.attrs.update(attrs)
+
+class JobTrace:
+    """Спаны одной задачи (не больше max_spans, лишние отбрасываются с подсчетом)"""
+    def __init__(self, job_id: str, max_spans: int = 20000):
+        self.job_id = job_id
+        self.max_spans = max_spans
+        self.spans = []
+        self.dropped = 0
+        self.root = None
+        self._tokens = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def open(self, name: str, parent: Span, attrs: dict) -> Span:
+        span = Span(next(self._ids), parent.id if parent else None, name, attrs, _lane())
+        with self._lock:
+            if len(self.spans) >= self.max_spans:
+                self.dropped += 1
+                return span
+            self.spans.append(span)
+        return span
+
+    def to_chrome(self) -> dict:
+        """Chrome trace JSON (открывается в Perfetto / chrome://tracing): события X по дорожкам"""
+        with self._lock:
+            spans = list(self.spans)
+        origin = self.root.start if self.root else min((s.start for s in spans), default=0.0)
+        lanes = {}
+        events = []
+        for span in spans:
+            tid = lanes.setdefault(span.lane, len(lanes) + 1)
+            events.append({
+                'name': span.name,
+                'cat': span.name.split(' ')[0],
+                'ph': 'X',
+                'ts': round((span.start - origin) * 1e6, 1),
+                'dur': round(span.duration * 1e6, 1),
+                'pid': 1,
+                'tid': tid,
+                'args': dict(span.attrs, span_id=span.id, parent=span.parent)
+            })
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': f"job {self.job_id}"}})
+        for lane, tid in lanes.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': lane}})
+            events.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'sort_index': tid}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'job_id': self.job_id,
+                                                                            'dropped_spans': self.dropped}}
+
+    def critical_path(self) -> list:
+        """
+        Критический путь от корня: с конца спана назад берется дочерний спан, работавший последним
+        до текущей точки (закончившийся позже остальных или еще открытый в ней), и так рекурсивно.
+        Время спана между выбранными детьми - его собственная работа или ожидание.
+        [(имя, начало от старта задачи, длительность)] по порядку времени.
+        """
+        with self._lock:
+            spans = [s for s in self.spans if s.end is not None]
+        if self.root is None or self.root.end is None:
+            return []
+        children = {}
+        for span in spans:
+            children.setdefault(span.parent, []).append(span)
+        origin = self.root.start
+        path = []
+
+        def walk(span: Span, until: float):
+            point = min(until, span.end)
+            kids = children.get(span.id, [])
+            while True:
+                kids = [kid for kid in kids if kid.start < point]
+                if not kids:
+                    break
+                # При равенстве (несколько детей открыты в точке) - начавшийся раньше
+                kid = max(kids, key=lambda k: (min(k.end, point), -k.start))
+                kid_end = min(kid.end, point)
+                if point > kid_end:
+                    path.append((span.name, kid_end - origin, point - kid_end))
+                walk(kid, kid_end)
+                point = kid.start
+            if point > span.start:
+                path.append((span.name, span.start - origin, point - span.start))
+
+        walk(self.root, self.root.end)
+        return sorted(path, key=lambda segment: segment[1])
+
+    def summary(self, top: int = 8) -> dict:
+        """
+        {'total', 'critical_path': [(имя, секунды, доля)], 'stragglers': [...], 'gaps': [...]}:
+        куда ушло время критического пути, спаны заметно дольше медианы своего имени
+        (клип-отстающий) и самые длинные участки без дочерней работы
+        """
+        path = self.critical_path()
+        total = self.root.duration if self.root else 0.0
+        by_name = {}
+        for name, _, seconds in path:
+            by_name[name] = by_name.get(name, 0.0) + seconds
+        critical = sorted(by_name.items(), key=lambda item: item[1], reverse=True)[:top]
+
+        with self._lock:
+            spans = [s for s in self.spans if s.end is not None]
+        groups = {}
+        for span in spans:
+            groups.setdefault(span.name, []).append(span)
+        stragglers = []
+        for name, group in groups.items():
+            if len(group) < 3:
+                continue
+            durations = sorted(s.duration for s in group)
+            median = durations[len(durations) // 2]
+            slowest = max(group, key=lambda s: s.duration)
+            if median > 0 and slowest.duration > 2 * median:
+                stragglers.append({'name': name, 'seconds': slowest.duration, 'median': median,
+                                   'attrs': dict(slowest.attrs)})
+        stragglers.sort(key=lambda s: s['seconds'] - s['median'], reverse=True)
+
+        own = [segment for segment in path if segment[0] == self.root.name] if self.root else []
+        gaps = sorted(own, key=lambda segment: segment[2], reverse=True)[:3]
+        return {
+            'total': total,
+            'critical_path': [(name, seconds, seconds / total if total else 0.0) for name, seconds in critical],
+            'stragglers': stragglers[:top],
+            'gaps': [(start, seconds) for _, start, seconds in gaps]
+        }
+
+class SpanScope:
+    """with tracer.span(...) as span: открытие и закрытие спана в текущем контексте"""
+    def __init__(self, trace: JobTrace, name: str, attrs: dict):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.span = None
+
+    def __enter__(self) -> Span:
+        if self.trace is None:
+            return _NULL_SPAN
+        self.span = self.trace.open(self.name, _span.get(), self.attrs)
+        self._token = _span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is None:
+            return False
+        self.span.end = time.perf_counter()
+        if exc_type is not None:
+            self.span.attrs['error'] = exc_type.__name__
+        _span.reset(self._token)
+        return False
+
+class Tracer:
+    """
+    Трассировка задач по спанам.
+
+    - VideoProcessor открывает трассу задачи (start/finish), стадии и вызовы внутри открывают
+      вложенные спаны tracer.span(имя, **атрибуты)
+    - родитель спана - открытый спан контекста: задачи asyncio наследуют его при создании, потоки
+      executor - если запущены через contextvars.copy_context().run
+    - вне задачи span() ничего не записывает
+    - по завершении задачи в лог пишется сводка критического пути, при TRACE_DIR трасса сохраняется
+      в Chrome trace JSON ({TRACE_DIR}/{job_id}.trace.json, открывается в ui.perfetto.dev)
+    """
+    def __init__(self, trace_dir: str = None, max_spans: int = 20000):
+        self.trace_dir = trace_dir
+        self.max_spans = max_spans
+        self._traces = {}
+        self._lock = threading.Lock()
+
+    def start(self, job_id: str) -> JobTrace:
+        """Трасса задачи и корневой спан job в текущем контексте"""
+        trace = JobTrace(job_id, self.max_spans)
+        with self._lock:
+            self._traces[job_id] = trace
+        trace_token = _trace.set(trace)
+        trace.root = trace.open('job', None, {'job_id': job_id})
+        trace._tokens = (trace_token, _span.set(trace.root))
+        return trace
+
+    def span(self, name: str, **attrs) -> SpanScope:
+        return SpanScope(_trace.get(), name, attrs)
+
+    def current(self) -> Span:
+        """Открытый спан контекста (для атрибутов по ходу работы) или пустой спан вне задачи"""
+        span = _span.get()
+        return span if span is not None and _trace.get() is not None else _NULL_SPAN
+
+    def get(self, job_id: str) -> JobTrace:
+        return self._traces.get(job_id)
+
+    def finish(self, job_id: str) -> dict:
+        """Конец задачи (в том же контексте, что и start): сводка в лог, экспорт трассы; сводка или None"""
+        with self._lock:
+            trace = self._traces.pop(job_id, None)
+        if trace is None:
+            return None
+        trace.root.end = time.perf_counter()
+        _span.reset(trace._tokens[1])
+        _trace.reset(trace._tokens[0])
+
+        summary = trace.summary()
+        self._log_summary(trace, summary)
+        if self.trace_dir:
+            try:
+                summary['file'] = self.export(trace, Path(self.trace_dir) / f"{job_id}.trace.json")
+            except OSError as e:
+                logger.warning(f"⚠️ Трасса задачи {job_id} не сохранена: {e}")
+        return summary
+
+    def export(self, trace: JobTrace, path: Path) -> str:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trace.to_chrome(), f, ensure_ascii=False)
+        logger.info(f"🧭 Трасса задачи {trace.job_id}: {path} ({len(trace.spans)} спанов)")
+        return str(path)
+
+    def _log_summary(self, trace: JobTrace, summary: dict):
+        logger.info(f"🧭 КРИТИЧЕСКИЙ ПУТЬ задачи {trace.job_id} ({summary['total']:.1f} сек):")
+        for name, seconds, share in summary['critical_path']:
+            logger.info(f"   {name:<24} {seconds:7.1f} сек {share * 100:5.1f}%")
+        for straggler in summary['stragglers']:
+            attrs = ', '.join(f"{k}={v}" for k, v in straggler['attrs'].items())
+            logger.info(f"   🐢 {straggler['name']}: {straggler['seconds']:.1f} сек при медиане "
+                        f"{straggler['median']:.1f} сек ({attrs})")
+        for start, seconds in summary['gaps']:
+            if seconds >= 1.0:
+                logger.info(f"   ⏸️ простой задачи {seconds:.1f} сек с {start:.1f} сек")
+
+class _NullSpan:
+    """Спан вне задачи: атрибуты не сохраняются"""
+    def set(self, **attrs):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+def _lane() -> str:
+    """Дорожка трассы: имя задачи asyncio в потоке цикла событий, иначе имя потока"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return task.get_name()
+    return threading.current_thread().name
+
+# Общий трассировщик процесса
+tracer = Tracer(
+    trace_dir=os.getenv('TRACE_DIR') or None,
+    max_spans=int(os.getenv('TRACE_MAX_SPANS', '20000'))
+)
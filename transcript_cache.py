@@ -0,0 +1,135 @@
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from subtitle_track import SubtitleTrack
+
+logger = logging.getLogger(__name__)
+
+class TranscriptCache:
+    """
+    Дисковый кэш расшифровок Whisper (SQLite).
+
+    - ключ: отпечаток декодированного звука (SHA-256 PCM) + настройки (модель, язык, бэкенд)
+    - запись: диапазон звука [start, start + duration) и дорожка слов во времени исходника
+      (SubtitleTrack.to_bytes, сжатая zlib)
+    - диапазон собирается из нескольких записей: после смены /duration чанки режутся по-другому,
+      но расшифровки прошлых чанков вместе покрывают весь звук
+    - LRU вытеснение при превышении max_bytes, счетчики попаданий/промахов
+    """
+    def __init__(self, path: str = 'transcripts.db', max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    fingerprint TEXT NOT NULL,
+                    settings TEXT NOT NULL,
+                    start REAL NOT NULL,
+                    duration REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (fingerprint, settings, start, duration)
+                )
+            """)
+
+    def get(self, fingerprint: str, settings: str, start: float, duration: float) -> SubtitleTrack:
+        """Дорожка диапазона (время исходника) из записей, которые вместе его покрывают, или None"""
+        end = start + duration
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT start, duration FROM transcripts WHERE fingerprint=? AND settings=? "
+                "AND start < ? AND start + duration > ? ORDER BY start",
+                (fingerprint, settings, end, start)
+            ).fetchall()
+
+        # Жадное покрытие: из записей, начинающихся не позже покрытого, берем доходящую дальше всех
+        chosen = []
+        covered = start
+        i = 0
+        while covered < end - 1e-3:
+            best = None
+            while i < len(rows) and rows[i][0] <= covered + 1e-3:
+                if best is None or sum(rows[i]) > sum(best):
+                    best = rows[i]
+                i += 1
+            if best is None or sum(best) <= covered + 1e-3:
+                self.misses += 1
+                return None
+            chosen.append(best)
+            covered = sum(best)
+
+        words = []
+        now = time.time()
+        with self._lock, self._conn:
+            for index, (row_start, row_duration) in enumerate(chosen):
+                data = self._conn.execute(
+                    "SELECT data FROM transcripts WHERE fingerprint=? AND settings=? AND start=? AND duration=?",
+                    (fingerprint, settings, row_start, row_duration)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "UPDATE transcripts SET last_used=? WHERE fingerprint=? AND settings=? AND start=? AND duration=?",
+                    (now, fingerprint, settings, row_start, row_duration)
+                )
+                # Слова записи до начала следующей (перекрытие берется из более поздней записи)
+                row_end = chosen[index + 1][0] if index + 1 < len(chosen) else row_start + row_duration
+                track = SubtitleTrack.from_bytes(zlib.decompress(data))
+                words.extend(word for word in track if row_start <= word.start < row_end)
+        self.hits += 1
+        return SubtitleTrack.from_words(words).restrict(start, duration)
+
+    def put(self, fingerprint: str, settings: str, start: float, duration: float, track: SubtitleTrack):
+        """Сохранение расшифровки диапазона (время исходника) с вытеснением давно не используемых"""
+        data = zlib.compress(track.to_bytes())
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transcripts (fingerprint, settings, start, duration, size, data, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint, settings, start, duration, len(data), data, now, now)
+            )
+        self._evict()
+
+    def _evict(self):
+        """LRU: удаляем давно не используемые записи, пока кэш больше max_bytes"""
+        with self._lock, self._conn:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self._conn.execute(
+                "SELECT rowid, size FROM transcripts ORDER BY last_used"
+            ).fetchall()
+            evicted = []
+            for rowid, size in rows:
+                if total <= self.max_bytes:
+                    break
+                evicted.append((rowid,))
+                total -= size
+            self._conn.executemany("DELETE FROM transcripts WHERE rowid=?", evicted)
+        self.evictions += len(evicted)
+        logger.info(f"🧹 Кэш расшифровок: вытеснено {len(evicted)} записей, занято {total / 1024 / 1024:.1f} МБ")
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts").fetchone()
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,96 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+class UploadCheckpointStore:
+    """
+    Хранилище контрольных точек resumable загрузок (SQLite).
+
+    - ключ: (абсолютный путь, размер, mtime_ns, папка, имя на Drive) - измененный файл заново
+    - значение: URI сессии загрузки и последний подтвержденный сервером байт
+    - сессии Drive живут около недели, более старые записи считаются недействительными
+    """
+    def __init__(self, path: str = 'upload_checkpoints.db', max_age: float = 6 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    file_path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    folder_id TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    session_uri TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (file_path, size, mtime_ns, folder_id, file_name)
+                )
+            """)
+
+    def _key(self, file_path: str, folder_id: str, file_name: str) -> tuple:
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, folder_id or '', file_name)
+
+    def get(self, file_path: str, folder_id: str, file_name: str) -> dict:
+        """Контрольная точка файла: {'session_uri', 'offset'} или None"""
+        key = self._key(file_path, folder_id, file_name)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT session_uri, offset, created FROM checkpoints "
+                "WHERE file_path=? AND size=? AND mtime_ns=? AND folder_id=? AND file_name=?", key
+            ).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[2] > self.max_age:
+            self.delete(file_path, folder_id, file_name)
+            return None
+        return {'session_uri': row[0], 'offset': row[1]}
+
+    def save(self, file_path: str, folder_id: str, file_name: str, session_uri: str, offset: int):
+        """Сохранение URI сессии и подтвержденного смещения (время создания сессии сохраняется)"""
+        key = self._key(file_path, folder_id, file_name)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO checkpoints (file_path, size, mtime_ns, folder_id, file_name, session_uri, offset, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (file_path, size, mtime_ns, folder_id, file_name) DO UPDATE SET "
+                "offset=excluded.offset, updated=excluded.updated, "
+                "created=CASE WHEN session_uri=excluded.session_uri THEN created ELSE excluded.created END, "
+                "session_uri=excluded.session_uri",
+                key + (session_uri, offset, now, now)
+            )
+
+    def delete(self, file_path: str, folder_id: str, file_name: str):
+        """Удаление контрольной точки (загрузка завершена или сессия недействительна)"""
+        try:
+            key = self._key(file_path, folder_id, file_name)
+        except FileNotFoundError:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM checkpoints WHERE file_path=? AND size=? AND mtime_ns=? AND folder_id=? AND file_name=?", key
+            )
+
+    def purge(self) -> int:
+        """Удаление устаревших сессий и записей удаленных файлов"""
+        with self._lock:
+            rows = self._conn.execute("SELECT file_path, created FROM checkpoints").fetchall()
+        stale = [path for path, created in rows if time.time() - created > self.max_age or not os.path.exists(path)]
+        if stale:
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM checkpoints WHERE file_path=?", [(path,) for path in stale])
+            logger.info(f"🧹 Удалено устаревших контрольных точек загрузки: {len(stale)}")
+        return len(stale)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
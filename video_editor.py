@@ -1,9 +1,19 @@
 import os
+import base64
 import asyncio
 import logging
 import ffmpeg
 import json
 from pathlib import Path
+from ass_subtitles import AssSubtitleWriter
+from subtitle_track import SubtitleTrack
+from media_probe import probe_cache, mp4_is_complete
+from capabilities import get_capabilities
+from render_scheduler import render_scheduler, RenderSlot
+from render_queue import RenderTaskQueue, RenderCoordinator
+from progress_bus import progress_bus
+from metrics import stage_failures
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -16,27 +26,31 @@ class VideoEditor:
         self.font_path = "Obelix Pro.ttf"  # Путь к шрифту
         self.title_color = "red"
         self.subtitle_color = "red"
+        self.title_start_time = 8.0
+        
+        # Режим рендера клипов: per_clip (ffmpeg на каждый клип) или single_pass (один проход на чанк)
+        self.render_mode = os.getenv('RENDER_MODE', 'per_clip')
+        
+        # Рендер субтитров: drawtext (фильтр на каждое слово) или ass (один файл libass на чанк)
+        self.subtitle_backend = os.getenv('SUBTITLE_BACKEND', 'drawtext')
+        self.temp_dir = Path("temp")
+        self.segment_poll_interval = 0.5  # Период опроса списка сегментов в однопроходном режиме
+        
+        # Все запуски ffmpeg идут через общий планировщик (параллельность и потоки подбираются на лету)
+        self.scheduler = render_scheduler
+        
+        # RENDER_BACKEND=distributed: клипы рендерят воркеры render_worker.py (этот или другие узлы)
+        self.render_coordinator = None
+        if os.getenv('RENDER_BACKEND', 'local') == 'distributed':
+            self.render_coordinator = RenderCoordinator(
+                RenderTaskQueue(os.getenv('RENDER_QUEUE_DB', 'render_tasks.db')),
+                orphan_timeout=float(os.getenv('RENDER_ORPHAN_TIMEOUT_SEC', '300'))
+            )
     
     def get_video_info(self, video_path: str) -> dict:
-        """Получение информации о видео"""
+        """Получение информации о видео (через общий кэш probe)"""
         try:
-            probe = ffmpeg.probe(video_path)
-            video_stream = next((stream for stream in probe['streams'] if stream['codec_type'] == 'video'), None)
-            
-            if not video_stream:
-                raise ValueError("Видео поток не найден")
-            
-            duration = float(probe['format']['duration'])
-            width = int(video_stream['width'])
-            height = int(video_stream['height'])
-            fps = eval(video_stream['r_frame_rate'])
-            
-            return {
-                'duration': duration,
-                'width': width,
-                'height': height,
-                'fps': fps
-            }
+            return probe_cache.probe(video_path)
             
         except Exception as e:
             logger.error(f"Ошибка получения информации о видео: {e}")
@@ -45,33 +59,50 @@ class VideoEditor:
     async def extract_segment(self, input_path: str, output_path: str, start_time: float, duration: float) -> bool:
         """Извлечение сегмента видео"""
         try:
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                self._extract_segment_sync,
-                input_path, output_path, start_time, duration
-            )
+            await self._render(self._extract_segment_sync, input_path, output_path, start_time, duration)
             return True
             
         except Exception as e:
             logger.error(f"Ошибка извлечения сегмента: {e}")
             return False
     
-    def _extract_segment_sync(self, input_path: str, output_path: str, start_time: float, duration: float):
+    def _extract_segment_sync(self, input_path: str, output_path: str, start_time: float, duration: float,
+                              slot: RenderSlot = None):
         """Синхронное извлечение сегмента"""
-        (
+        self.scheduler.execute(
             ffmpeg
             .input(input_path, ss=start_time, t=duration)
-            .output(output_path, vcodec='libx264', acodec='aac')
-            .overwrite_output()
-            .run(quiet=True)
+            .output(output_path, vcodec='libx264', acodec='aac', threads=slot.threads if slot else 0)
+            .overwrite_output(),
+            slot
         )
     
-    async def create_clips_parallel(self, video_path: str, clip_duration: int, subtitles: list, start_index: int = 0, config: dict = None, max_parallel: int = 4) -> list:
-        """ПАРАЛЛЕЛЬНОЕ создание клипов с максимальным использованием GPU"""
+    async def _render(self, func, input_path: str, *args):
+        """Запуск синхронного рендера через планировщик с учетом разрешения исходника и GPU"""
+        video_info = self.get_video_info(input_path)
+        return await self.scheduler.run(
+            func, input_path, *args,
+            width=video_info['width'],
+            height=video_info['height'],
+            gpu=self._check_gpu_support()
+        )
+    
+    async def create_clips_parallel(self, video_path: str, clip_duration: int, subtitles: SubtitleTrack, start_index: int = 0, config: dict = None, max_parallel: int = None,
+                                    on_clip_ready=None, skip_clips: set = None, offset: float = 0.0, duration: float = None,
+                                    workspace=None) -> list:
+        """
+        ПАРАЛЛЕЛЬНОЕ создание клипов с максимальным использованием GPU.
+        on_clip_ready(clip_path, clip_number) - async колбэк для каждого дописанного клипа, сразу после рендера.
+        skip_clips - номера клипов, которые уже готовы (продолжение задачи) и не рендерятся.
+        offset/duration - чанк как диапазон времени исходника (субтитры во времени исходника).
+        workspace - рабочая директория задачи (output_dir/temp_dir), по умолчанию общие output/ и temp/.
+        """
         try:
-            video_info = self.get_video_info(video_path)
-            total_duration = video_info['duration']
+            dirs = workspace or self
+            total_duration = duration if duration is not None else self.get_video_info(video_path)['duration'] - offset
+            
+            # ASS бэкенд: один файл субтитров на весь чанк
+            subtitles_file = self._prepare_subtitles_file(subtitles, config, f"chunk_{start_index:03d}", dirs.temp_dir)
             
             # Планируем все клипы заранее
             clip_tasks = []
@@ -86,27 +117,35 @@ class VideoEditor:
                     logger.info(f"Пропущен последний кусок: {remaining_time:.1f} сек < {clip_duration} сек")
                     break
                 
-                clip_path = self.output_dir / f"clip_{clip_index:03d}.mp4"
+                clip_path = dirs.output_dir / f"clip_{clip_index:03d}.mp4"
+                
+                if skip_clips and clip_index + 1 in skip_clips:
+                    current_time += clip_duration
+                    clip_index += 1
+                    continue
                 
                 # Добавляем задачу в список
                 clip_tasks.append({
                     'input_path': video_path,
                     'output_path': str(clip_path),
-                    'start_time': current_time,
+                    'start_time': offset + current_time,
                     'duration': clip_duration,
-                    'subtitles': subtitles,
+                    # Только слова своего клипа, а не вся дорожка чанка
+                    'subtitles': subtitles.restrict(offset + current_time, clip_duration),
                     'clip_number': clip_index + 1,
-                    'config': config
+                    'config': config,
+                    'subtitles_file': subtitles_file
                 })
                 
                 current_time += clip_duration
                 clip_index += 1
             
-            logger.info(f"🚀 ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА: {len(clip_tasks)} клипов, макс. параллельно: {max_parallel}")
+            logger.info(f"🚀 ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА: {len(clip_tasks)} клипов, параллельность подбирает планировщик"
+                        + (f" (не более {max_parallel})" if max_parallel else ""))
             
-            # Обрабатываем клипы пакетами для максимального использования GPU
+            # Параллельность ограничивает планировщик рендера, max_parallel - дополнительный потолок
             clips = []
-            semaphore = asyncio.Semaphore(max_parallel)  # Ограничиваем количество параллельных задач
+            semaphore = asyncio.Semaphore(max_parallel or len(clip_tasks) or 1)
             
             async def process_clip_task(task):
                 async with semaphore:
@@ -117,14 +156,20 @@ class VideoEditor:
                         task['duration'],
                         task['subtitles'],
                         task['clip_number'],
-                        task['config']
+                        task['config'],
+                        task['subtitles_file']
                     )
-                    if success:
-                        return task['output_path']
+                if not success:
+                    return None
+                if not await self._clip_ready(task['output_path'], task['clip_number'], on_clip_ready):
                     return None
+                return task['output_path']
             
             # Запускаем все задачи параллельно
-            results = await asyncio.gather(*[process_clip_task(task) for task in clip_tasks], return_exceptions=True)
+            try:
+                results = await asyncio.gather(*[process_clip_task(task) for task in clip_tasks], return_exceptions=True)
+            finally:
+                self._remove_subtitles_file(subtitles_file)
             
             # Собираем успешные результаты
             for result in results:
@@ -140,9 +185,11 @@ class VideoEditor:
             logger.error(f"Ошибка параллельного создания клипов: {e}")
             return []
 
-    async def create_clips(self, video_path: str, clip_duration: int, subtitles: list, start_index: int = 0, config: dict = None) -> list:
+    async def create_clips(self, video_path: str, clip_duration: int, subtitles: SubtitleTrack, start_index: int = 0, config: dict = None,
+                           on_clip_ready=None, workspace=None) -> list:
         """Создание клипов из видео со строгим таймлайном"""
         try:
+            dirs = workspace or self
             video_info = self.get_video_info(video_path)
             total_duration = video_info['duration']
             
@@ -150,6 +197,7 @@ class VideoEditor:
             current_time = 0
             clip_index = start_index
             skipped_clips = 0
+            subtitles_file = self._prepare_subtitles_file(subtitles, config, f"chunk_{start_index:03d}", dirs.temp_dir)
             
             while current_time < total_duration:
                 end_time = current_time + clip_duration
@@ -163,7 +211,7 @@ class VideoEditor:
                     skipped_clips += 1
                     break
                 
-                clip_path = self.output_dir / f"clip_{clip_index:03d}.mp4"
+                clip_path = dirs.output_dir / f"clip_{clip_index:03d}.mp4"
                 
                 # Создаем клип с точной длительностью
                 success = await self.create_styled_clip(
@@ -173,10 +221,11 @@ class VideoEditor:
                     clip_duration,  # Всегда используем точную длительность
                     subtitles,
                     clip_index + 1,
-                    config
+                    config,
+                    subtitles_file
                 )
                 
-                if success:
+                if success and await self._clip_ready(str(clip_path), clip_index + 1, on_clip_ready):
                     clips.append(str(clip_path))
                     logger.info(f"Создан клип {clip_index + 1}: {current_time:.1f}-{current_time + clip_duration:.1f} сек ({clip_duration} сек)")
                     clip_index += 1
@@ -185,6 +234,8 @@ class VideoEditor:
                 
                 current_time += clip_duration
             
+            self._remove_subtitles_file(subtitles_file)
+            
             # Детальная статистика
             expected_clips = int(total_duration // clip_duration)
             logger.info(f"📊 СТАТИСТИКА СОЗДАНИЯ КЛИПОВ:")
@@ -201,34 +252,277 @@ class VideoEditor:
             return []
     
     async def create_styled_clip(self, input_path: str, output_path: str, start_time: float, 
-                               duration: float, subtitles: list, clip_number: int, config: dict = None) -> bool:
-        """Создание стилизованного клипа"""
-        try:
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                self._create_styled_clip_sync,
-                input_path, output_path, start_time, duration, subtitles, clip_number, config
-            )
-            return True
+                               duration: float, subtitles: SubtitleTrack, clip_number: int, config: dict = None,
+                               subtitles_file: str = None) -> bool:
+        """Создание стилизованного клипа (локально или воркером распределенного рендера)"""
+        with tracer.span('render clip', clip=clip_number, distributed=bool(self.render_coordinator)):
+            try:
+                if self.render_coordinator:
+                    success = await self.render_coordinator.render(
+                        self._render_task_payload(input_path, output_path, start_time, duration, subtitles,
+                                                  clip_number, config, subtitles_file),
+                        clip_number
+                    )
+                    if success:
+                        # ffmpeg воркера не виден шине прогресса этого процесса - засчитываем готовый клип
+                        progress_bus.rendered(duration)
+                    else:
+                        stage_failures.inc(stage='render')
+                    return success
+                await self._render(
+                    self._create_styled_clip_sync,
+                    input_path, output_path, start_time, duration, subtitles, clip_number, config, subtitles_file
+                )
+                return True
             
-        except Exception as e:
-            logger.error(f"Ошибка создания стилизованного клипа: {e}")
-            return False
+            except Exception as e:
+                stage_failures.inc(stage='render')
+                logger.error(f"Ошибка создания стилизованного клипа: {e}")
+                return False
+    
+    def _render_task_payload(self, input_path: str, output_path: str, start_time: float, duration: float,
+                             subtitles: SubtitleTrack, clip_number: int, config: dict = None,
+                             subtitles_file: str = None) -> dict:
+        """Задача рендера клипа для воркера: абсолютные пути на общем хранилище, субтитры клипа в base64"""
+        return {
+            'input_path': os.path.abspath(input_path),
+            'output_path': os.path.abspath(output_path),
+            'start_time': start_time,
+            'duration': duration,
+            # С ASS файлом слова уже в нем, drawtext нужны только слова клипа
+            'subtitles': base64.b64encode(subtitles.restrict(start_time, duration).to_bytes()).decode('ascii')
+            if subtitles and not subtitles_file else None,
+            'clip_number': clip_number,
+            'config': config,
+            'subtitles_file': os.path.abspath(subtitles_file) if subtitles_file else None
+        }
     
     def _create_styled_clip_sync(self, input_path: str, output_path: str, start_time: float,
-                               duration: float, subtitles: list, clip_number: int, config: dict = None):
+                               duration: float, subtitles: SubtitleTrack, clip_number: int, config: dict = None,
+                               subtitles_file: str = None, slot: RenderSlot = None):
         """Синхронное создание стилизованного клипа с GPU ускорением"""
         
         gpu_available = self._check_gpu_support()
         video_info = self.get_video_info(input_path)
+        layout = self._plan_layout(video_info, clip_number)
+
+        # --- Выбор пайплайна: GPU или CPU ---
+        if gpu_available:
+            logger.info(f"   🚀 Используем GPU-ускоренный пайплайн")
+            main_video = ffmpeg.input(input_path, ss=start_time, t=duration, **{'c:v': 'h264_cuvid'})
+        else:
+            logger.info(f"   💻 Используем CPU-пайплайн")
+            main_video = ffmpeg.input(input_path, ss=start_time, t=duration)
+
+        video_with_bg = self._compose_background(main_video, layout, gpu_available)
+
+        # --- Общая часть для рендеринга текста и субтитров (на CPU) ---
+        title_template, subtitle_template, custom_title, custom_subtitle = self._get_title_settings(config)
+        title_text = title_template if custom_title else f"{title_template} {clip_number}"
+        subtitle_text = subtitle_template if custom_subtitle else f"{subtitle_template} {clip_number}"
+        
+        video_with_text = self._add_titles(
+            video_with_bg, title_text, subtitle_text,
+            enable=f'between(t,{self.title_start_time},{duration})'
+        )
+        
+        if subtitles_file:
+            final_video = self._burn_ass_subtitles(video_with_text, subtitles_file, start_time)
+        else:
+            final_video = self._add_animated_subtitles(video_with_text, subtitles, start_time, duration)
+        audio = main_video.audio
+        
+        # Финальное масштабирование и вывод
+        final_video_scaled, output_params = self._finalize_output(final_video, gpu_available, slot)
+        self.scheduler.execute(ffmpeg.output(final_video_scaled, audio, output_path, **output_params).overwrite_output(), slot)
+        if gpu_available:
+            logger.info(f"   ✅ Клип {clip_number} создан с GPU ускорением (1080x1920)")
+        else:
+            logger.info(f"   ✅ Клип {clip_number} создан с CPU (1080x1920)")
+
+    async def create_clips_single_pass(self, video_path: str, clip_duration: int, subtitles: SubtitleTrack, start_index: int = 0, config: dict = None,
+                                       on_clip_ready=None, offset: float = 0.0, duration: float = None,
+                                       workspace=None) -> list:
+        """
+        Создание всех клипов чанка за ОДИН проход ffmpeg (одно декодирование и кодирование).
+        on_clip_ready(clip_path, clip_number) вызывается, как только segment-муксер закрыл клип, не дожидаясь конца прохода.
+        offset/duration - чанк как диапазон времени исходника (субтитры во времени исходника).
+        workspace - рабочая директория задачи (output_dir/temp_dir), по умолчанию общие output/ и temp/.
+        """
+        try:
+            dirs = workspace or self
+            total_duration = duration if duration is not None else self.get_video_info(video_path)['duration'] - offset
+            
+            # СТРОГИЙ ТАЙМЛАЙН: только клипы точной длительности
+            num_clips = int(total_duration // clip_duration)
+            if num_clips == 0:
+                logger.info(f"Пропущен кусок: {total_duration:.1f} сек < {clip_duration} сек")
+                return []
+            
+            skipped = total_duration - num_clips * clip_duration
+            if skipped > 0:
+                logger.info(f"Пропущен последний кусок: {skipped:.1f} сек < {clip_duration} сек")
+            
+            logger.info(f"🚀 ОДНОПРОХОДНЫЙ РЕНДЕР: {num_clips} клипов по {clip_duration} сек")
+            
+            subtitles_file = self._prepare_subtitles_file(subtitles, config, f"chunk_{start_index:03d}", dirs.temp_dir)
+            
+            # Муксер дописывает строку в список сегментов, когда клип закрыт - по нему отдаем готовые клипы
+            dirs.temp_dir.mkdir(parents=True, exist_ok=True)
+            segment_list = dirs.temp_dir / f"chunk_{start_index:03d}.segments.csv"
+            if segment_list.exists():
+                segment_list.unlink()
+            
+            clips = []
+            announced = set()
+            
+            async def announce(clip_index: int):
+                clip_path = str(dirs.output_dir / f"clip_{clip_index:03d}.mp4")
+                if clip_index in announced:
+                    return
+                announced.add(clip_index)
+                if await self._clip_ready(clip_path, clip_index + 1, on_clip_ready):
+                    clips.append(clip_path)
+            
+            try:
+                render = asyncio.ensure_future(self._render(
+                    self._render_chunk_single_pass_sync,
+                    video_path, clip_duration, num_clips, subtitles, start_index, config, subtitles_file, str(segment_list), offset,
+                    str(dirs.output_dir)
+                ))
+                try:
+                    while not render.done():
+                        await asyncio.wait({render}, timeout=self.segment_poll_interval)
+                        for clip_index in self._read_segment_list(segment_list):
+                            await announce(clip_index)
+                    await render
+                except asyncio.CancelledError:
+                    render.cancel()
+                    raise
+                except Exception as e:
+                    logger.error(f"Ошибка однопроходного рендера: {e}")
+            finally:
+                self._remove_subtitles_file(subtitles_file)
+                if segment_list.exists():
+                    segment_list.unlink()
+            
+            # Клипы, не попавшие в список (например, последний сегмент) проверяем по имени
+            for clip_index in range(start_index, start_index + num_clips):
+                if (dirs.output_dir / f"clip_{clip_index:03d}.mp4").exists():
+                    await announce(clip_index)
+                elif clip_index not in announced:
+                    logger.warning(f"Не удалось создать клип {clip_index + 1}")
+            
+            clips.sort()
+            logger.info(f"✅ ЗА ОДИН ПРОХОД создано {len(clips)}/{num_clips} клипов")
+            return clips
+            
+        except Exception as e:
+            logger.error(f"Ошибка однопроходного создания клипов: {e}")
+            return []
+
+    def _render_chunk_single_pass_sync(self, input_path: str, clip_duration: int, num_clips: int,
+                                       subtitles: SubtitleTrack, start_index: int, config: dict = None,
+                                       subtitles_file: str = None, segment_list: str = None, offset: float = 0.0,
+                                       output_dir: str = None, slot: RenderSlot = None):
+        """Синхронный однопроходный рендер: композиция всего чанка и нарезка segment-муксером"""
+        gpu_available = self._check_gpu_support()
+        video_info = self.get_video_info(input_path)
+        layout = self._plan_layout(video_info, f"{start_index + 1}-{start_index + num_clips}")
+        render_duration = num_clips * clip_duration
+
+        # Чанк - диапазон исходника: переход на начало диапазона без промежуточного файла
+        input_options = {'ss': offset} if offset else {}
+        if gpu_available:
+            logger.info(f"   🚀 Используем GPU-ускоренный пайплайн (один проход)")
+            main_video = ffmpeg.input(input_path, t=render_duration, **input_options, **{'c:v': 'h264_cuvid'})
+        else:
+            logger.info(f"   💻 Используем CPU-пайплайн (один проход)")
+            main_video = ffmpeg.input(input_path, t=render_duration, **input_options)
+
+        video_with_bg = self._compose_background(main_video, layout, gpu_available)
+
+        # Номер клипа вычисляется из времени: trunc(t / длительность клипа) + номер первого клипа
+        title_template, subtitle_template, custom_title, custom_subtitle = self._get_title_settings(config)
+        # Шаблоны экранируем вручную: выражение %{eif:...} должно дойти до drawtext как есть
+        title_template = self._escape_drawtext(title_template)
+        subtitle_template = self._escape_drawtext(subtitle_template)
+        clip_number_expr = f"%{{eif:trunc(t/{clip_duration})+{start_index + 1}:d}}"
+        title_text = title_template if custom_title else f"{title_template} {clip_number_expr}"
+        subtitle_text = subtitle_template if custom_subtitle else f"{subtitle_template} {clip_number_expr}"
+
+        video_with_text = self._add_titles(
+            video_with_bg, title_text, subtitle_text,
+            enable=f'gte(mod(t,{clip_duration}),{self.title_start_time})',
+            escape_text=False
+        )
+
+        if subtitles_file:
+            final_video = self._burn_ass_subtitles(video_with_text, subtitles_file, offset)
+        else:
+            final_video = self._add_animated_subtitles(video_with_text, subtitles, offset, render_duration)
+        final_video_scaled, output_params = self._finalize_output(final_video, gpu_available, slot)
+
+        # Ключевые кадры строго на границах клипов, segment-муксер режет без перекодирования
+        output_params.update({
+            'force_key_frames': f'expr:gte(t,n_forced*{clip_duration})',
+            'f': 'segment',
+            'segment_time': clip_duration,
+            'segment_start_number': start_index,
+            'segment_format': 'mp4',
+            'reset_timestamps': 1,
+        })
+        if segment_list:
+            output_params.update({'segment_list': segment_list, 'segment_list_type': 'csv'})
+        if gpu_available:
+            output_params['forced-idr'] = 1
+
+        output_pattern = str(Path(output_dir or self.output_dir) / "clip_%03d.mp4")
+        self.scheduler.execute(
+            ffmpeg.output(final_video_scaled, main_video.audio, output_pattern, **output_params).overwrite_output(),
+            slot
+        )
+        logger.info(f"   ✅ Клипы {start_index + 1}-{start_index + num_clips} созданы за один проход (1080x1920)")
+
+    async def _clip_ready(self, clip_path: str, clip_number: int, on_clip_ready=None) -> bool:
+        """Сигнал готовности клипа: файл дописан (moov на месте), затем колбэк потребителя"""
+        if not mp4_is_complete(clip_path):
+            logger.warning(f"Клип {clip_number} не дописан или поврежден: {clip_path}")
+            return False
+        if on_clip_ready:
+            try:
+                await on_clip_ready(clip_path, clip_number)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика готового клипа {clip_number}: {e}")
+        return True
+    
+    def _read_segment_list(self, segment_list: Path) -> list:
+        """Индексы клипов из CSV списка segment-муксера (только дописанные строки)"""
+        try:
+            with open(segment_list, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            return []
+        
+        indices = []
+        for line in content.splitlines(keepends=True):
+            if not line.endswith('\n'):
+                break
+            name = Path(line.split(',')[0]).stem
+            try:
+                indices.append(int(name.split('_')[-1]))
+            except ValueError:
+                continue
+        return indices
+    
+    def _plan_layout(self, video_info: dict, clip_label) -> dict:
+        """Расчет геометрии вертикального кадра 1080x1920 для исходного видео"""
         original_width = video_info['width']
         original_height = video_info['height']
         original_fps = video_info['fps']
         is_large_video = original_width >= 2160 or original_height >= 2160
 
-        # --- Общая логика для GPU и CPU ---
-        logger.info(f"🎬 ОБРАБОТКА КЛИПА {clip_number}:")
+        logger.info(f"🎬 ОБРАБОТКА КЛИПА {clip_label}:")
         logger.info(f"   📐 Исходное разрешение: {original_width}x{original_height} ({original_height}p)")
         logger.info(f"   🎞️  FPS: {original_fps}")
         logger.info(f"   🎯 Целевое разрешение: 1080x1920 (вертикальный формат)")
@@ -247,6 +541,7 @@ class VideoEditor:
         center_video_height = int(target_screen_height * 0.8)
         
         crop_needed = False
+        crop_width = crop_height = None
         if original_aspect > target_aspect:
             target_height = center_video_height
             target_width = int(target_height * original_aspect)
@@ -261,12 +556,18 @@ class VideoEditor:
         target_width -= target_width % 2
         target_height -= target_height % 2
 
-        # --- Выбор пайплайна: GPU или CPU ---
+        return {
+            'target_width': target_width,
+            'target_height': target_height,
+            'crop_needed': crop_needed,
+            'crop_width': crop_width,
+            'crop_height': crop_height,
+            'is_large_video': is_large_video
+        }
+
+    def _compose_background(self, main_video, layout: dict, gpu_available: bool):
+        """Размытый фон на весь экран + основное видео по центру"""
         if gpu_available:
-            logger.info(f"   🚀 Используем GPU-ускоренный пайплайн")
-            input_kwargs = {'ss': start_time, 't': duration, 'c:v': 'h264_cuvid'}
-            main_video = ffmpeg.input(input_path, **input_kwargs)
-            
             # Пайплайн для размытого фона на GPU
             blurred_bg = (
                 main_video.video
@@ -278,18 +579,10 @@ class VideoEditor:
             # Пайплайн для основного видео на GPU
             main_scaled = (
                 main_video.video
-                .filter('scale_npp', target_width, target_height, interp_algo='lanczos' if is_large_video else 'bicubic')
+                .filter('scale_npp', layout['target_width'], layout['target_height'],
+                        interp_algo='lanczos' if layout['is_large_video'] else 'bicubic')
             )
-            if crop_needed:
-                main_scaled = main_scaled.filter('crop', crop_width, crop_height, x='(iw-ow)/2', y='(ih-oh)/2')
-            
-            # Наложение. ffmpeg-python должен сам разобраться с hwdownload/hwupload
-            video_with_bg = ffmpeg.filter([blurred_bg, main_scaled], 'overlay', x='(W-w)/2', y='(H-h)/2')
-
         else:
-            logger.info(f"   💻 Используем CPU-пайплайн")
-            main_video = ffmpeg.input(input_path, ss=start_time, t=duration)
-            
             blurred_bg = (
                 main_video.video
                 .filter('scale', 1080, 1920, force_original_aspect_ratio='increase')
@@ -297,37 +590,42 @@ class VideoEditor:
                 .filter('gblur', sigma=20)
             )
             
-            main_scaled = main_video.video.filter('scale', target_width, target_height, flags='lanczos' if is_large_video else 'bicubic')
-            if crop_needed:
-                main_scaled = main_scaled.filter('crop', crop_width, crop_height, x='(iw-ow)/2', y='(ih-oh)/2')
+            main_scaled = main_video.video.filter('scale', layout['target_width'], layout['target_height'],
+                                                  flags='lanczos' if layout['is_large_video'] else 'bicubic')
 
-            video_with_bg = ffmpeg.filter([blurred_bg, main_scaled], 'overlay', x='(W-w)/2', y='(H-h)/2')
+        if layout['crop_needed']:
+            main_scaled = main_scaled.filter('crop', layout['crop_width'], layout['crop_height'], x='(iw-ow)/2', y='(ih-oh)/2')
 
-        # --- Общая часть для рендеринга текста и субтитров (на CPU) ---
+        # Наложение. ffmpeg-python должен сам разобраться с hwdownload/hwupload
+        return ffmpeg.filter([blurred_bg, main_scaled], 'overlay', x='(W-w)/2', y='(H-h)/2')
+
+    def _get_title_settings(self, config: dict = None) -> tuple:
+        """Шаблоны заголовка и подзаголовка из настроек пользователя"""
         if config:
-            title_template = config.get('title', 'ФРАГМЕНТ')
-            subtitle_template = config.get('subtitle', 'Часть')
-            custom_title = config.get('custom_title', False)
-            custom_subtitle = config.get('custom_subtitle', False)
-        else:
-            title_template, subtitle_template, custom_title, custom_subtitle = 'ФРАГМЕНТ', 'Часть', False, False
+            return (
+                config.get('title', 'ФРАГМЕНТ'),
+                config.get('subtitle', 'Часть'),
+                config.get('custom_title', False),
+                config.get('custom_subtitle', False)
+            )
+        return 'ФРАГМЕНТ', 'Часть', False, False
 
-        title_text = title_template if custom_title else f"{title_template} {clip_number}"
-        subtitle_text = subtitle_template if custom_subtitle else f"{subtitle_template} {clip_number}"
-        
-        title_start_time = 8.0
-        video_with_text = video_with_bg.drawtext(
+    def _add_titles(self, video, title_text: str, subtitle_text: str, enable: str, escape_text: bool = True):
+        """Заголовок и подзаголовок сверху кадра"""
+        return video.drawtext(
             text=title_text, fontfile=self.font_path, fontsize=60, fontcolor=self.title_color,
-            x='(w-text_w)/2', y='100', enable=f'between(t,{title_start_time},{duration})'
+            x='(w-text_w)/2', y='100', enable=enable, escape_text=escape_text
         ).drawtext(
             text=subtitle_text, fontfile=self.font_path, fontsize=80, fontcolor=self.subtitle_color,
-            x='(w-text_w)/2', y='200', enable=f'between(t,{title_start_time},{duration})'
+            x='(w-text_w)/2', y='200', enable=enable, escape_text=escape_text
         )
-        
-        final_video = self._add_animated_subtitles(video_with_text, subtitles, start_time, duration)
-        audio = main_video.audio
-        
-        # Финальное масштабирование и вывод
+
+    def _escape_drawtext(self, text: str) -> str:
+        """Экранирование текста для drawtext (как делает ffmpeg-python при escape_text=True)"""
+        return text.replace('\\', '\\\\').replace("'", "\\'").replace('%', '\\%')
+
+    def _finalize_output(self, final_video, gpu_available: bool, slot: RenderSlot = None) -> tuple:
+        """Финальное масштабирование и параметры кодировщика (потоки x264 из слота планировщика)"""
         if gpu_available:
             final_video_scaled = final_video.filter('hwupload_cuda').filter('scale_npp', 1080, 1920)
             output_params = {
@@ -336,40 +634,23 @@ class VideoEditor:
                 'maxrate': '18M', 'bufsize': '24M', 'threads': '0', 'bf': '4', 'refs': '4',
                 'profile:v': 'high', 'level': '4.1'
             }
-            ffmpeg.output(final_video_scaled, audio, output_path, **output_params).overwrite_output().run(quiet=True)
-            logger.info(f"   ✅ Клип {clip_number} создан с GPU ускорением (1080x1920)")
         else:
             final_video_scaled = final_video.filter('scale', 1080, 1920)
             output_params = {
                 'vcodec': 'libx264', 'acodec': 'aac', 'preset': 'medium', 'crf': 20,
                 'pix_fmt': 'yuv420p', 'profile': 'high', 'level': '4.1', 'b:a': '192k',
-                'maxrate': '10M', 'bufsize': '15M', 'bf': '3', 'refs': '3'
+                'maxrate': '10M', 'bufsize': '15M', 'bf': '3', 'refs': '3',
+                'threads': slot.threads if slot else 0
             }
-            ffmpeg.output(final_video_scaled, audio, output_path, **output_params).overwrite_output().run(quiet=True)
-            logger.info(f"   ✅ Клип {clip_number} создан с CPU (1080x1920)")
+        return final_video_scaled, output_params
     
-    def _add_animated_subtitles(self, video, subtitles: list, start_time: float, duration: float):
+    def _add_animated_subtitles(self, video, subtitles: SubtitleTrack, start_time: float, duration: float):
         """Добавление анимированных субтитров"""
         if not subtitles:
             return video
         
-        # Фильтруем субтитры для текущего сегмента
-        segment_subtitles = []
-        for sub in subtitles:
-            sub_start = sub['start'] - start_time
-            sub_end = sub['end'] - start_time
-            
-            # Проверяем, попадает ли субтитр в текущий сегмент
-            if sub_end > 0 and sub_start < duration:
-                # Корректируем время для сегмента
-                adjusted_start = max(0, sub_start)
-                adjusted_end = min(duration, sub_end)
-                
-                segment_subtitles.append({
-                    'text': sub['text'],
-                    'start': adjusted_start,
-                    'end': adjusted_end
-                })
+        # Субтитры текущего сегмента (бинарный поиск, время уже скорректировано для сегмента)
+        segment_subtitles = subtitles.window(start_time, duration)
         
         # Добавляем каждый субтитр с анимацией подпрыгивания
         result_video = video
@@ -378,7 +659,7 @@ class VideoEditor:
             bounce_y = f"h-600-20*sin(2*PI*t*3)"  # Подпрыгивание выше
             
             result_video = result_video.drawtext(
-                text=sub['text'],
+                text=sub.text,
                 fontfile=self.font_path if os.path.exists(self.font_path) else None,
                 fontsize=70,  # Увеличил размер субтитров
                 fontcolor='white',
@@ -386,31 +667,46 @@ class VideoEditor:
                 borderw=3,  # Увеличил толщину обводки
                 x='(w-text_w)/2',
                 y=bounce_y,
-                enable=f"between(t,{sub['start']},{sub['end']})"
+                enable=f"between(t,{sub.start},{sub.end})"
             )
         
         return result_video
     
-    def _check_gpu_support(self) -> bool:
-        """Проверка поддержки GPU для ffmpeg"""
-        try:
-            import subprocess
-            
-            # Проверяем доступность NVENC (NVIDIA GPU кодировщик)
-            result = subprocess.run(
-                ['ffmpeg', '-hide_banner', '-encoders'], 
-                capture_output=True, 
-                text=True, 
-                timeout=10
+    def _prepare_subtitles_file(self, subtitles: SubtitleTrack, config: dict, name: str, temp_dir: Path = None) -> str:
+        """Запись ASS файла для чанка, если выбран бэкенд ass"""
+        backend = (config or {}).get('subtitle_backend', self.subtitle_backend)
+        if backend != 'ass' or not subtitles:
+            return None
+        if not get_capabilities().libass:
+            logger.warning("⚠️ ffmpeg собран без libass, субтитры рендерятся через drawtext")
+            return None
+        
+        temp_dir = temp_dir or self.temp_dir
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        writer = AssSubtitleWriter(self.font_path)
+        return writer.write(subtitles, str(temp_dir / f"{name}.ass"))
+    
+    def _remove_subtitles_file(self, subtitles_file: str):
+        """Удаление ASS файла чанка после рендера"""
+        if subtitles_file and os.path.exists(subtitles_file):
+            try:
+                os.remove(subtitles_file)
+            except Exception as e:
+                logger.warning(f"Не удалось удалить файл субтитров {subtitles_file}: {e}")
+    
+    def _burn_ass_subtitles(self, video, subtitles_file: str, start_time: float):
+        """Вжигание субтитров чанка одним фильтром ass"""
+        writer = AssSubtitleWriter(self.font_path)
+        if start_time:
+            # Время в ASS файле отсчитывается от начала чанка: сдвигаем PTS клипа и возвращаем обратно
+            return (
+                video
+                .filter('setpts', f'PTS+{start_time}/TB')
+                .filter('ass', subtitles_file, fontsdir=writer.fonts_dir)
+                .filter('setpts', 'PTS-STARTPTS')
             )
-            
-            if 'h264_nvenc' in result.stdout:
-                logger.info("✅ GPU поддержка (NVENC) доступна для ffmpeg")
-                return True
-            else:
-                logger.info("❌ GPU поддержка недоступна, используем CPU")
-                return False
-                
-        except Exception as e:
-            logger.warning(f"Ошибка проверки GPU: {e}, используем CPU")
-            return False
\ No newline at end of file
+        return video.filter('ass', subtitles_file, fontsdir=writer.fonts_dir)
+    
+    def _check_gpu_support(self) -> bool:
+        """Проверка поддержки GPU пайплайна (cuvid + scale_npp + NVENC) по возможностям узла"""
+        return get_capabilities().gpu_pipeline
@@ -1,12 +1,26 @@
 import os
+import uuid
 import asyncio
+import subprocess
 import logging
 import ffmpeg
 from pathlib import Path
 from youtube_downloader import YouTubeDownloader
 from video_editor import VideoEditor
-from subtitle_generator import SubtitleGenerator
+from subtitle_generator import SubtitleGenerator, TranscriptTimeline
 from google_drive_uploader import GoogleDriveUploader
+from media_probe import probe_cache
+from source_cache import source_cache
+from capabilities import get_capabilities
+from render_scheduler import render_scheduler, RenderSlot
+from ffmpeg_runner import FFmpegError
+from pipeline import Pipeline
+from job_manifest import JobManifestStore, STATUS_DONE, STATUS_FAILED, file_sha256
+from job_registry import JobRegistry
+from workspace import WorkspaceManager, WorkspaceQuotaError
+from progress_bus import progress_bus
+from metrics import stage_failures
+from tracing import tracer
 
 
 logger = logging.getLogger(__name__)
@@ -18,158 +32,750 @@ class VideoProcessor:
         self.subtitle_generator = SubtitleGenerator()
         self.drive_uploader = GoogleDriveUploader()
         
+        # Однократная проверка возможностей узла (ffmpeg, GPU, CPU) при старте
+        self.capabilities = get_capabilities()
+        self.scheduler = render_scheduler
+        
+        # Журнал задач: после перезапуска задача продолжается с первого незавершенного чанка/клипа/загрузки
+        self.manifests = JobManifestStore(os.getenv('JOB_MANIFEST_DB', 'jobs.db'))
+        self.active_jobs = set()
+        
+        # Одинаковые запросы (источник + действующие настройки) разных пользователей - одна обработка
+        self.registry = JobRegistry(
+            os.getenv('JOB_MANIFEST_DB', 'jobs.db'),
+            max_age=float(os.getenv('JOB_RESULT_TTL_HOURS', '168')) * 3600
+        )
+        
+        # Чанки: virtual - диапазоны времени исходника (без временных файлов), files - нарезка в temp/chunk_N.mp4
+        self.chunk_mode = os.getenv('CHUNK_MODE', 'virtual')
+        
         # Создаем рабочие директории
         self.temp_dir = Path("temp")
         self.output_dir = Path("output")
         self.temp_dir.mkdir(exist_ok=True)
         self.output_dir.mkdir(exist_ok=True)
+        
+        # У каждой задачи своя рабочая директория (temp и output) с квотой: задачи выполняются одновременно
+        self.workspaces = WorkspaceManager(
+            os.getenv('WORKSPACE_DIR', 'work'),
+            quota_bytes=int(float(os.getenv('WORKSPACE_QUOTA_GB', '20')) * 1024 ** 3)
+        )
+        # Директории прерванных задач остаются для /resume, остальные остались от прошлых запусков
+        self.workspaces.sweep({manifest.job_id for manifest in self.manifests.unfinished()})
     
-    async def process_youtube_video(self, url: str, config: dict) -> dict:
-        """Обработка YouTube видео"""
+    async def process_youtube_video(self, url: str, config: dict, user_id: int = None, chat_id: int = None) -> dict:
+        """Обработка YouTube видео (скачивание - первая стадия конвейера)"""
         try:
-            # 1. Скачиваем видео (автоматически использует cookies если доступны)
             logger.info(f"Скачивание YouTube видео: {url}")
-            download_result = await self.youtube_downloader.download_with_cookies(url)
-            
-            if not download_result['success']:
-                return {'success': False, 'error': download_result['error']}
-            
-            video_path = download_result['video_path']
-            
-            # 2. Обрабатываем видео
-            result = await self.process_video_file(video_path, config)
-            
-            # 3. Удаляем скачанное видео
-            if os.path.exists(video_path):
-                os.remove(video_path)
-            
-            return result
+            manifest = self.manifests.create({'url': url}, config, user_id, chat_id)
+            return await self._run_pipeline({'url': url}, config, manifest)
             
         except Exception as e:
             logger.error(f"Ошибка обработки YouTube видео: {e}")
             return {'success': False, 'error': str(e)}
     
-    async def process_video_file(self, video_path: str, config: dict) -> dict:
+    async def process_video_file(self, video_path: str, config: dict, user_id: int = None, chat_id: int = None) -> dict:
         """Обработка видео файла"""
         try:
-            duration = config.get('duration', 30)
-            
-            # 1. Получаем информацию о видео
-            video_info = self.video_editor.get_video_info(video_path)
-            total_duration = video_info['duration']
+            manifest = self.manifests.create({'path': video_path}, config, user_id, chat_id)
+            manifest.set_video(video_path)
+            return await self._run_pipeline({'path': video_path}, config, manifest)
+        except Exception as e:
+            logger.error(f"Ошибка обработки видео: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    def effective_config(self, config: dict) -> dict:
+        """Настройки, от которых зависит результат: пользовательские + режим рендера и модель субтитров"""
+        effective = {
+            'duration': config.get('duration', 30),
+            'title': config.get('title', 'ФРАГМЕНТ'),
+            'subtitle': config.get('subtitle', 'Часть'),
+            'custom_title': config.get('custom_title', False),
+            'custom_subtitle': config.get('custom_subtitle', False),
+            'render_mode': config.get('render_mode', self.video_editor.render_mode),
+            'subtitle_backend': config.get('subtitle_backend', self.video_editor.subtitle_backend),
+            'whisper': f"{self.subtitle_generator.model_name}|{self.subtitle_generator.language}"
+        }
+        # Прочие флаги пользователя тоже различают задачи
+        effective.update({k: v for k, v in config.items() if k not in effective})
+        return effective
+    
+    def unfinished_jobs(self, user_id: int = None) -> list:
+        """Прерванные задачи пользователя (новые первыми): [{'job_id', 'source', 'created', 'progress'}]"""
+        jobs = []
+        for manifest in self.manifests.unfinished(user_id):
+            if manifest.job_id in self.active_jobs:
+                # Выполняется сейчас, а не прервана
+                continue
+            job = manifest.job()
+            jobs.append({
+                'job_id': manifest.job_id,
+                'source': job['source'],
+                'created': job['created'],
+                'progress': manifest.progress()
+            })
+        return jobs
+    
+    async def resume_job(self, job_id: str) -> dict:
+        """Продолжение прерванной задачи: готовые чанки, клипы и загрузки не повторяются"""
+        try:
+            manifest = self.manifests.open(job_id)
+            if manifest is None:
+                return {'success': False, 'error': f"Задача {job_id} не найдена"}
             
-            logger.info(f"🎮 Обработка видео длительностью {total_duration} секунд")
+            stored = manifest.job()
+            if stored['status'] != 'running':
+                return {'success': False, 'error': f"Задача {job_id} уже завершена"}
+            if job_id in self.active_jobs:
+                return {'success': False, 'error': f"Задача {job_id} уже выполняется"}
             
-            # 2. Если видео больше 5 минут, нарезаем на чанки
-            chunks = []
-            if total_duration > 300:  # 5 минут
-                logger.info(f"🔪 Видео {total_duration:.1f} сек > 300 сек, нарезаем на чанки")
-                chunks = await self.split_into_chunks(video_path, chunk_duration=300)
-                logger.info(f"📦 Создано чанков: {len(chunks)}")
+            if manifest.video_available():
+                # Видео уже скачано/получено - скачивание пропускаем
+                source = {'path': stored['video_path']}
+            elif 'url' in stored['source']:
+                source = stored['source']
             else:
-                logger.info(f"📹 Видео {total_duration:.1f} сек <= 300 сек, обрабатываем целиком")
-                chunks = [video_path]
-        
-            # КРИТИЧЕСКАЯ ПРОВЕРКА: убеждаемся что все чанки существуют
-            existing_chunks = []
-            for i, chunk_path in enumerate(chunks):
-                if os.path.exists(chunk_path):
-                    chunk_info = self.video_editor.get_video_info(chunk_path)
-                    existing_chunks.append(chunk_path)
-                    logger.info(f"✅ Чанк {i+1} существует: {chunk_path} ({chunk_info['duration']:.1f} сек)")
+                return {'success': False, 'error': "Исходный файл задачи не найден, отправьте видео заново"}
+            
+            progress = manifest.progress()
+            logger.info(f"♻️ Продолжение задачи {job_id}: чанков готово {progress['chunks_done']}/{progress['chunks']}, "
+                        f"клипов загружено {progress['uploaded']}")
+            return await self._run_pipeline(source, stored['config'], manifest, resume=True)
+            
+        except Exception as e:
+            logger.error(f"Ошибка продолжения задачи {job_id}: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    async def _run_pipeline(self, source: dict, config: dict, manifest=None, resume: bool = False) -> dict:
+        """
+        Конвейер задачи: скачивание -> нарезка на чанки -> субтитры -> рендер -> загрузка.
+        Субтитры чанка N+1 готовятся, пока рендерится чанк N, а загрузка идет параллельно рендеру.
+        Ход задачи пишется в журнал (manifest); при resume готовое берется из журнала.
+        """
+        job_id = manifest.job_id if manifest else uuid.uuid4().hex[:12]
+        job = {
+            'job_id': job_id,
+            'config': config,
+            'duration': config.get('duration', 30),
+            'error': None,
+            'downloaded_path': None,
+            'source_key': None,
+            'total_duration': 0,
+            'chunks': 0,
+            'expected_clips': 0,
+            'clips': [],
+            'upload_results': [],
+            'folder_created': False,
+            'folder_lock': asyncio.Lock(),
+            'links_file': self._start_links_file(manifest.job_id if manifest else None),
+            'workspace': self.workspaces.create(job_id),
+            'folder_id': None,
+            'manifest': manifest,
+            'plan': {},
+            'saved_clips': {},
+            'uploaded': {},
+            'audio': None,
+            'transcript': None,
+            'transcription': None
+        }
+        
+        # Стадии, процент и оценка времени задачи для статуса пользователю (progress_bus.py),
+        # спаны задачи и сводка критического пути (tracing.py)
+        progress_bus.start(job_id)
+        tracer.start(job_id)
+        try:
+            return await self._run_job(job, source, manifest, resume)
+        finally:
+            tracer.finish(job_id)
+            progress_bus.finish(job_id)
+    
+    async def _run_job(self, job: dict, source: dict, manifest=None, resume: bool = False) -> dict:
+        """Стадии конвейера и итог задачи (job - состояние задачи из _run_pipeline)"""
+        if resume:
+            await self._prepare_resume(job)
+            if 'url' in manifest.job()['source'] and 'path' in source:
+                key = source_cache.key_for_path(source['path'])
+                if key:
+                    # Видео из кэша исходников: закрепляем на время обработки
+                    source_cache.acquire(key)
+                    job['source_key'] = key
                 else:
-                    logger.error(f"❌ Чанк {i+1} НЕ СУЩЕСТВУЕТ: {chunk_path}")
+                    # Скачанное до перезапуска видео удаляется по завершении, как и при обычной обработке
+                    job['downloaded_path'] = source['path']
+        
+        pipeline = Pipeline("обработка видео")
+        if 'url' in source:
+            pipeline.add_stage('download', lambda item, emit: self._stage_download(job, item, emit))
+        pipeline.add_stage('split', lambda item, emit: self._stage_split(job, item, emit))
+        pipeline.add_stage('transcribe', lambda item, emit: self._stage_transcribe(job, item, emit), queue_size=1)
+        # Два чанка в рендере: хвост одного добирает свободные слоты планировщика, пока стартует следующий
+        pipeline.add_stage('render', lambda item, emit: self._stage_render(job, item, emit), workers=2, queue_size=1)
+        # Клипы уходят на загрузку сразу после рендера, до DRIVE_UPLOAD_CONCURRENCY одновременно (сколько из них
+        # реально передается, решает UploadThrottle); очередь ограничивает клипы, ждущие на диске
+        pipeline.add_stage('upload', lambda item, emit: self._stage_upload(job, item, emit),
+                           workers=self.drive_uploader.throttle.max_concurrency, queue_size=16)
+        
+        # Если процесс упадет посреди конвейера, скачанное видео остается на диске для продолжения задачи
+        if manifest:
+            self.active_jobs.add(manifest.job_id)
+        try:
+            run = await pipeline.run([source.get('url') or source['path']])
+        finally:
+            if manifest:
+                self.active_jobs.discard(manifest.job_id)
+            await self._release_audio(job)
+        
+        # Видео из кэша исходников остается для повторных запросов, остальное скачанное удаляем
+        if job['source_key']:
+            source_cache.release(job['source_key'])
+        downloaded_path = job['downloaded_path']
+        if downloaded_path and os.path.exists(downloaded_path):
+            os.remove(downloaded_path)
+        
+        if job['error']:
+            if manifest:
+                manifest.finish(STATUS_FAILED, job['error'])
+            # Упавшую задачу нельзя продолжить - рабочая директория и файл ссылок больше не нужны
+            self.workspaces.release(job['workspace'])
+            if os.path.exists(job['links_file']):
+                os.remove(job['links_file'])
+            return {'success': False, 'error': job['error']}
+        
+        all_clips = job['clips']
+        upload_results = sorted(job['upload_results'], key=lambda r: r.get('clip_number', 0))
+        total_expected_clips = job['expected_clips']
+        
+        # ФИНАЛЬНАЯ СТАТИСТИКА
+        logger.info(f"🏁 ФИНАЛЬНАЯ СТАТИСТИКА ОБРАБОТКИ:")
+        logger.info(f"   📹 Исходное видео: {job['total_duration']:.1f} сек")
+        logger.info(f"   📦 Обработано чанков: {job['chunks']}")
+        logger.info(f"   🎯 Ожидалось клипов: {total_expected_clips}")
+        logger.info(f"   ✅ Создано клипов: {len(all_clips)}")
+        logger.info(f"   📊 Эффективность: {len(all_clips)/total_expected_clips*100:.1f}%" if total_expected_clips > 0 else "   📊 Эффективность: 0%")
+        cache_stats = probe_cache.stats()
+        logger.info(f"   🗂️  Кэш probe: {cache_stats['hits']} попаданий, {cache_stats['misses']} промахов ({cache_stats['hit_ratio']*100:.0f}%)")
+        source_stats = source_cache.stats()
+        logger.info(f"   📦 Кэш исходников: {source_stats['hits']} попаданий, {source_stats['joined']} общих загрузок, "
+                    f"сэкономлено {source_stats['bytes_saved'] / 1024 / 1024:.1f} МБ")
+        registry_stats = self.registry.stats()
+        logger.info(f"   🔗 Реестр задач: {registry_stats['joined']} подписок на идущие задачи, "
+                    f"{registry_stats['replayed']} ответов из записанных результатов")
+        transcript_stats = self.subtitle_generator.cache.stats()
+        logger.info(f"   📒 Кэш расшифровок: {transcript_stats['hits']} попаданий, {transcript_stats['misses']} промахов, "
+                    f"{transcript_stats['entries']} записей, {transcript_stats['bytes'] / 1024 / 1024:.1f} МБ")
+        workspace_stats = self.workspaces.stats()
+        logger.info(f"   🗂️  Рабочая директория: пик {job['workspace'].peak_bytes / 1024 / 1024:.1f} МБ, "
+                    f"задач на узле {workspace_stats['active']}, занято {workspace_stats['bytes'] / 1024 / 1024:.1f} МБ")
+        scheduler_stats = self.scheduler.stats()
+        logger.info(f"   ⚙️  Рендер: {scheduler_stats['limit']} параллельно x {scheduler_stats['threads']} потоков, "
+                    f"{scheduler_stats['fps']:.0f} fps, подстроек: {scheduler_stats['adjustments']}")
+        if self.video_editor.render_coordinator:
+            render_stats = self.video_editor.render_coordinator.stats()
+            logger.info(f"   🛠️  Распределенный рендер: живых воркеров {render_stats['workers']}, "
+                        f"выполнено {render_stats['done']}, выдано повторно {render_stats['redelivered']}, "
+                        f"упало {render_stats['failed']}")
+        
+        # Файл со ссылками дописывался по мере загрузки, добавляем итог
+        links_file = self._finish_links_file(job['links_file'], upload_results)
+        
+        # Успешно загруженные клипы уже удалены, незагруженные остаются для повторной попытки
+        successful_uploads = sum(1 for r in upload_results if r.get('success', False))
+        if successful_uploads > 0:
+            logger.info(f"Успешно загружено {successful_uploads}/{len(all_clips)} клипов")
+        else:
+            logger.warning("Ни один клип не был загружен, файлы сохранены для повторной попытки")
+        
+        if manifest:
+            manifest.finish(STATUS_DONE)
+        # Временные файлы удаляются, незагруженные клипы остаются до следующего запуска
+        self.workspaces.release(job['workspace'], keep_output=successful_uploads < len(all_clips))
+        
+        return {
+            'success': True,
+            'job_id': manifest.job_id if manifest else None,
+            'total_clips': len(all_clips),
+            'links_file': links_file,
+            'upload_results': upload_results,
+            'stages': run['stages']
+        }
+    
+    async def _stage_download(self, job: dict, url: str, emit):
+        """Стадия скачивания (автоматически использует cookies если доступны)"""
+        progress_bus.stage(job['job_id'], 'download')
+        try:
+            with tracer.span('source key'):
+                key = await asyncio.get_running_loop().run_in_executor(None, self.youtube_downloader.source_key, url)
+        except Exception as e:
+            logger.warning(f"Ключ кэша исходников не определен: {e}")
+            key = None
+        
+        # Файлы скачивания - во временной директории задачи (одинаковые имена форматов у разных видео)
+        temp_dir = str(job['workspace'].temp_dir)
+        try:
+            if key:
+                # Повторная ссылка берется из кэша, одновременные запросы ждут одну загрузку
+                download_result = await source_cache.fetch(
+                    key, lambda: self.youtube_downloader.download_with_cookies(url, temp_dir=temp_dir)
+                )
+            else:
+                download_result = await self.youtube_downloader.download_with_cookies(url, temp_dir=temp_dir)
+        except Exception as e:
+            logger.error(f"Ошибка скачивания видео: {e}")
+            download_result = {'success': False, 'error': str(e)}
+        if not download_result['success']:
+            stage_failures.inc(stage='download')
+            job['error'] = download_result['error']
+            return
+        
+        if key:
+            job['source_key'] = key
+        else:
+            job['downloaded_path'] = download_result['video_path']
+        if job['manifest']:
+            job['manifest'].set_video(download_result['video_path'])
+        await emit(download_result['video_path'])
+    
+    async def _prepare_resume(self, job: dict):
+        """
+        Состояние прерванной задачи из журнала: план чанков, целые локальные клипы и загрузки.
+        Готовый чанк, у которого пропал незагруженный клип, рендерится заново.
+        """
+        manifest = job['manifest']
+        stored = manifest.job()
+        plan = manifest.chunks()
+        uploaded = manifest.uploaded()
+        records = manifest.clips()
+        
+        # Проверка размера и хэша локальных клипов (чтение файлов - в пуле потоков)
+        loop = asyncio.get_running_loop()
+        saved_clips = {}
+        for number, record in records.items():
+            if number in uploaded:
+                continue
+            if await loop.run_in_executor(None, manifest.clip_intact, record):
+                saved_clips[number] = record['path']
+            else:
+                logger.warning(f"Клип {number} поврежден или удален, будет отрендерен заново")
+        
+        for chunk in plan.values():
+            numbers = range(chunk['start_index'] + 1, chunk['start_index'] + chunk['expected_clips'] + 1)
+            missing = [n for n in numbers if n not in uploaded and n not in saved_clips and n in records]
+            if chunk['done'] and missing:
+                chunk['done'] = False
+                manifest.chunk_done(chunk['index'], False)
+        
+        job['plan'] = plan
+        job['uploaded'] = uploaded
+        job['saved_clips'] = saved_clips
+        job['expected_clips'] = sum(chunk['expected_clips'] for chunk in plan.values())
+        job['total_duration'] = stored['total_duration'] or 0
+        
+        # Загруженные до перезапуска клипы сразу попадают в итог и файл со ссылками
+        for number in sorted(uploaded):
+            job['upload_results'].append(uploaded[number])
+            job['clips'].append(records[number]['path'] if number in records else uploaded[number].get('file_name'))
+            self._append_link(job['links_file'], uploaded[number])
+            progress_bus.uploaded(job['job_id'])
+        
+        if stored['folder_id']:
+            # Клипы догружаются в папку задачи, созданную до перезапуска
+            job['folder_id'] = stored['folder_id']
+            job['folder_created'] = True
+    
+    async def _stage_split(self, job: dict, video_path: str, emit):
+        """Стадия нарезки: ошибка (битый или нечитаемый исходник) останавливает задачу"""
+        progress_bus.stage(job['job_id'], 'split')
+        try:
+            await self._split_video(job, video_path, emit)
+        except Exception as e:
+            stage_failures.inc(stage='split')
+            logger.error(f"❌ Ошибка нарезки видео: {e}")
+            job['error'] = f"Не удалось обработать видео: {e}"
+    
+    async def _split_video(self, job: dict, video_path: str, emit):
+        """Нарезка: чанки передаются дальше по мере готовности, по порядку"""
+        duration = job['duration']
+        
+        # 1. Получаем информацию о видео
+        video_info = self.video_editor.get_video_info(video_path)
+        total_duration = video_info['duration']
+        job['total_duration'] = total_duration
+        manifest = job['manifest']
+        if manifest:
+            manifest.set_duration(total_duration)
+        
+        logger.info(f"🎮 Обработка видео длительностью {total_duration} секунд")
+        # Оценка объема рендера для процента; уточняется, когда все чанки запланированы
+        progress_bus.plan(job['job_id'], job['expected_clips'] or int(total_duration // duration), duration)
+        
+        # Готовые до перезапуска чанки не режутся и не рендерятся, дальше идут только их незагруженные клипы
+        plan = job['plan']
+        done_chunks = {index for index, chunk in plan.items() if chunk['done']}
+        
+        # Звук исходника декодируется один раз, параллельно с нарезкой: стадия субтитров берет срезы буфера
+        if not plan or len(done_chunks) < len(plan):
+            job['audio'] = asyncio.ensure_future(self._extract_audio(job, video_path))
+            transcribe_mode = job['config'].get('transcribe_mode', self.subtitle_generator.transcribe_mode)
+            if transcribe_mode == 'whole':
+                # Весь звук распознается одним проходом окнами, чанки берут срезы общей дорожки
+                job['transcript'] = TranscriptTimeline()
+                job['transcription'] = asyncio.ensure_future(self._transcribe_whole(job))
+        for index in sorted(done_chunks):
+            job['chunks'] += 1
+            await emit({
+                'number': index + 1,
+                'index': index,
+                'path': None,
+                'is_source': True,
+                'start_index': plan[index]['start_index'],
+                'expected_clips': plan[index]['expected_clips'],
+                'done': True
+            })
+        if done_chunks:
+            logger.info(f"♻️ Пропущено готовых чанков: {len(done_chunks)}")
+        
+        async def emit_chunk(chunk_path: str, index: int = 0, offset: float = None, chunk_duration: float = None):
+            # КРИТИЧЕСКАЯ ПРОВЕРКА: убеждаемся что чанк существует
+            if not os.path.exists(chunk_path):
+                logger.error(f"❌ Чанк {index + 1} НЕ СУЩЕСТВУЕТ: {chunk_path}")
+                return
+            if chunk_duration is None:
+                chunk_duration = self.video_editor.get_video_info(chunk_path)['duration']
+            is_source = chunk_path == video_path
             
-            logger.info(f"📊 ИТОГО готовых чанков: {len(existing_chunks)}/{len(chunks)}")
-            chunks = existing_chunks
+            recorded = plan.get(index)
+            if recorded:
+                # Номера клипов чанка зарезервированы до перезапуска
+                start_index = recorded['start_index']
+                expected_clips_in_chunk = recorded['expected_clips']
+            else:
+                # Номера клипов резервируются заранее, чтобы чанки могли рендериться параллельно
+                expected_clips_in_chunk = int(chunk_duration // duration)
+                start_index = job['expected_clips']
+                job['expected_clips'] += expected_clips_in_chunk
+                if manifest:
+                    start_time = offset if offset is not None else (0 if is_source else index * 300)
+                    manifest.add_chunk(index, start_time, chunk_duration, start_index, expected_clips_in_chunk, is_source)
             
-            # 3. Обрабатываем каждый чанк
-            all_clips = []
-            total_expected_clips = 0
+            job['chunks'] += 1
+            if not is_source:
+                self._check_workspace(job)
+            logger.info(f"✅ Чанк {index + 1} готов: {chunk_path} ({chunk_duration:.1f} сек, ожидается клипов: {expected_clips_in_chunk})")
             
-            for i, chunk_path in enumerate(chunks):
-                logger.info(f"🎬 НАЧИНАЕМ обработку чанка {i+1}/{len(chunks)}: {chunk_path}")
-                
-                try:
-                    # Получаем информацию о чанке
-                    chunk_info = self.video_editor.get_video_info(chunk_path)
-                    chunk_duration = chunk_info['duration']
-                    expected_clips_in_chunk = int(chunk_duration // duration)
-                    total_expected_clips += expected_clips_in_chunk
-                    
-                    logger.info(f"   📏 Длительность чанка: {chunk_duration:.1f} сек")
-                    logger.info(f"   🎯 Ожидается клипов: {expected_clips_in_chunk}")
-                    
-                    # Генерируем субтитры для чанка
-                    logger.info(f"   🎤 Генерируем субтитры...")
-                    subtitles = await self.subtitle_generator.generate(chunk_path)
-                    logger.info(f"   ✅ Субтитры готовы: {len(subtitles)} фраз")
-                    
-                    # Нарезаем чанк на клипы
-                    logger.info(f"   ✂️  Нарезаем на клипы...")
-                    # Используем МАКСИМАЛЬНУЮ параллельную обработку для Tesla T4
-                    clips = await self.video_editor.create_clips_parallel(
-                        chunk_path, 
-                        duration, 
-                        subtitles,
-                        start_index=len(all_clips),
-                        config=config,
-                        max_parallel=32  # МАКСИМАЛЬНАЯ параллельность для Tesla T4 (15GB памяти)
-                    )
-                    
-                    logger.info(f"   🎉 Создано клипов из чанка {i+1}: {len(clips)}")
-                    all_clips.extend(clips)
-                    
-                except Exception as e:
-                    logger.error(f"❌ ОШИБКА обработки чанка {i+1}: {e}")
-                    continue
-                
-                # Удаляем временный чанк (если это не оригинальный файл)
-                if chunk_path != video_path and os.path.exists(chunk_path):
-                    os.remove(chunk_path)
-                    logger.info(f"   🗑️  Удален временный чанк: {chunk_path}")
-            
-            # ФИНАЛЬНАЯ СТАТИСТИКА
-            logger.info(f"🏁 ФИНАЛЬНАЯ СТАТИСТИКА ОБРАБОТКИ:")
-            logger.info(f"   📹 Исходное видео: {total_duration:.1f} сек")
-            logger.info(f"   📦 Обработано чанков: {len(chunks)}")
-            logger.info(f"   🎯 Ожидалось клипов: {total_expected_clips}")
-            logger.info(f"   ✅ Создано клипов: {len(all_clips)}")
-            logger.info(f"   📊 Эффективность: {len(all_clips)/total_expected_clips*100:.1f}%" if total_expected_clips > 0 else "   📊 Эффективность: 0%")
-            
-            # 4. Ждем завершения записи всех файлов
-            import time
-            logger.info("Ожидание завершения записи файлов...")
-            time.sleep(3)  # Даем время на завершение записи
-            
-            # 5. Загружаем все клипы на Google Drive
-            logger.info(f"Загрузка {len(all_clips)} клипов на Google Drive")
-            upload_results = await self.drive_uploader.upload_clips(all_clips)
-            
-            # 5. Создаем файл со ссылками
-            links_file = await self.create_links_file(upload_results)
-            
-            # 6. Очищаем временные файлы ТОЛЬКО после успешной загрузки
-            successful_uploads = sum(1 for r in upload_results if r.get('success', False))
-            if successful_uploads > 0:
-                logger.info(f"Успешно загружено {successful_uploads}/{len(all_clips)} клипов, очищаем файлы")
-                # Удаляем только успешно загруженные файлы
-                self.cleanup_successful_files(all_clips, upload_results)
+            if offset is not None:
+                audio_start = offset
+            elif is_source:
+                audio_start = 0.0
             else:
-                logger.warning("Ни один клип не был загружен, файлы сохранены для повторной попытки")
+                audio_start = self._file_chunk_start(video_path, index * 300)
             
-            return {
-                'success': True,
-                'total_clips': len(all_clips),
-                'links_file': links_file,
-                'upload_results': upload_results
+            chunk = {
+                'number': index + 1,
+                'index': index,
+                'path': chunk_path,
+                'is_source': is_source,
+                'start_index': start_index,
+                'expected_clips': expected_clips_in_chunk,
+                # Виртуальный чанк: диапазон исходника, субтитры и рендер читают его напрямую
+                'offset': offset,
+                'duration': chunk_duration if offset is not None else None,
+                # Диапазон исходника, который покрывает чанк (срез общего звукового буфера)
+                'audio_start': audio_start,
+                'audio_duration': chunk_duration
             }
+            await emit(chunk)
+        
+        # 2. Если видео больше 5 минут, нарезаем на чанки
+        chunk_mode = job['config'].get('chunk_mode', self.chunk_mode)
+        if total_duration > 300 and chunk_mode == 'virtual':
+            logger.info(f"🧩 Видео {total_duration:.1f} сек > 300 сек, делим на виртуальные чанки (без временных файлов)")
+            for chunk_range in self.plan_virtual_chunks(video_path, duration, chunk_duration=300):
+                if chunk_range['index'] in done_chunks:
+                    continue
+                await emit_chunk(video_path, chunk_range['index'], chunk_range['offset'], chunk_range['duration'])
+        elif total_duration > 300:  # 5 минут
+            logger.info(f"🔪 Видео {total_duration:.1f} сек > 300 сек, нарезаем на чанки")
+            chunks = await self.split_into_chunks(video_path, chunk_duration=300, on_chunk=emit_chunk, skip=done_chunks,
+                                                  temp_dir=job['workspace'].temp_dir)
+            logger.info(f"📦 Создано чанков: {len(chunks)}")
+        elif 0 not in done_chunks:
+            logger.info(f"📹 Видео {total_duration:.1f} сек <= 300 сек, обрабатываем целиком")
+            await emit_chunk(video_path, 0)
+        if job['expected_clips']:
+            progress_bus.plan(job['job_id'], job['expected_clips'], duration)
+    
+    async def _stage_transcribe(self, job: dict, chunk: dict, emit):
+        """Стадия субтитров (Whisper), работает параллельно с рендером предыдущего чанка"""
+        progress_bus.stage(job['job_id'], 'transcribe')
+        tracer.current().set(chunk=chunk['number'])
+        if chunk.get('done'):
+            await emit(chunk)
+            return
+        if job['error']:
+            # Задача уже остановлена (квота) - чанк не обрабатывается
+            self._remove_chunk(chunk)
+            return
+        
+        logger.info(f"🎤 Генерируем субтитры для чанка {chunk['number']}...")
+        try:
+            audio = await job['audio'] if job['audio'] else None
+            transcript = job['transcript']
+            chunk_end = chunk['audio_start'] + chunk['audio_duration']
+            if transcript is not None and await transcript.wait_for(chunk_end):
+                track = transcript.track()
+                if chunk.get('offset') is not None:
+                    # Виртуальный чанк: субтитры во времени исходника
+                    chunk['subtitles'] = track.restrict(chunk['audio_start'], chunk['audio_duration'])
+                else:
+                    chunk['subtitles'] = track.window(chunk['audio_start'], chunk['audio_duration'])
+            elif audio is not None:
+                subtitles = await self.subtitle_generator.generate(
+                    chunk['path'], chunk['audio_start'], chunk['audio_duration'], audio=audio
+                )
+                if chunk.get('offset') is None and chunk['audio_start']:
+                    # Файловый чанк рендерится от своего начала - переводим субтитры во время чанка
+                    subtitles = subtitles.shift(-chunk['audio_start'])
+                chunk['subtitles'] = subtitles
+            else:
+                chunk['subtitles'] = await self.subtitle_generator.generate(chunk['path'], chunk.get('offset'), chunk.get('duration'))
+        except Exception:
+            self._remove_chunk(chunk)
+            raise
+        logger.info(f"✅ Субтитры чанка {chunk['number']} готовы: {len(chunk['subtitles'])} фраз")
+        await emit(chunk)
+    
+    async def _stage_render(self, job: dict, chunk: dict, emit):
+        """Стадия рендера клипов чанка"""
+        progress_bus.stage(job['job_id'], 'render')
+        tracer.current().set(chunk=chunk['number'])
+        duration = job['duration']
+        config = job['config']
+        manifest = job['manifest']
+        
+        # Клипы чанка, готовые до перезапуска: загруженные пропускаются, целые локальные идут сразу на загрузку
+        numbers = range(chunk['start_index'] + 1, chunk['start_index'] + chunk['expected_clips'] + 1)
+        saved = {n: job['saved_clips'][n] for n in numbers if n in job['saved_clips']}
+        skip_clips = set(saved) | {n for n in numbers if n in job['uploaded']}
+        progress_bus.rendered(duration * (chunk['expected_clips'] if chunk.get('done') else len(skip_clips)), job['job_id'])
+        for clip_number, clip_path in sorted(saved.items()):
+            job['clips'].append(clip_path)
+            await emit({'path': clip_path, 'clip_number': clip_number})
+        
+        if chunk.get('done'):
+            return
+        if job['error']:
+            self._remove_chunk(chunk)
+            return
+        
+        logger.info(f"✂️  Нарезаем чанк {chunk['number']} на клипы...")
+        
+        async def on_clip_ready(clip_path: str, clip_number: int):
+            if manifest:
+                # Размер и хэш клипа - для проверки при продолжении задачи
+                sha256 = await asyncio.get_running_loop().run_in_executor(None, file_sha256, clip_path)
+                manifest.add_clip(clip_number, chunk['index'], clip_path, os.path.getsize(clip_path), sha256)
+            # Готовый клип сразу уходит в очередь загрузки, не дожидаясь остальных клипов чанка
+            await emit({'path': clip_path, 'clip_number': clip_number})
+        
+        try:
+            render_mode = config.get('render_mode', self.video_editor.render_mode)
+            # Воркерам распределенного рендера раздаются отдельные клипы, однопроходный режим только локальный
+            if render_mode == 'single_pass' and not skip_clips and not self.video_editor.render_coordinator:
+                # Один проход ffmpeg на весь чанк, клипы режет segment-муксер
+                clips = await self.video_editor.create_clips_single_pass(
+                    chunk['path'],
+                    duration,
+                    chunk['subtitles'],
+                    start_index=chunk['start_index'],
+                    config=config,
+                    on_clip_ready=on_clip_ready,
+                    offset=chunk.get('offset') or 0.0,
+                    duration=chunk.get('duration'),
+                    workspace=job['workspace']
+                )
+            else:
+                # Параллельность и потоки ffmpeg подбирает планировщик рендера
+                # (и после перезапуска: проход segment-муксера перезаписал бы уже готовые клипы чанка)
+                clips = await self.video_editor.create_clips_parallel(
+                    chunk['path'], 
+                    duration, 
+                    chunk['subtitles'],
+                    start_index=chunk['start_index'],
+                    config=config,
+                    on_clip_ready=on_clip_ready,
+                    skip_clips=skip_clips,
+                    offset=chunk.get('offset') or 0.0,
+                    duration=chunk.get('duration'),
+                    workspace=job['workspace']
+                )
+        finally:
+            self._remove_chunk(chunk)
+        self._check_workspace(job)
+        
+        if manifest:
+            manifest.chunk_done(chunk['index'])
+        logger.info(f"🎉 Создано клипов из чанка {chunk['number']}: {len(clips)}")
+        job['clips'].extend(clips)
+    
+    async def _stage_upload(self, job: dict, clip: dict, emit):
+        """Стадия загрузки одного клипа на Google Drive (в общую папку задачи)"""
+        progress_bus.stage(job['job_id'], 'upload')
+        tracer.current().set(clip=clip['clip_number'])
+        if await self._ensure_job_folder(job):
+            result = await self.drive_uploader.upload_clip(clip['path'], clip['clip_number'], job['folder_id'])
+        else:
+            # Без папки задачи клип не грузится: текущая папка загрузчика общая для одновременных задач
+            result = {'success': False, 'error': 'Папка задачи на Google Drive не создана',
+                      'clip_number': clip['clip_number']}
+        job['upload_results'].append(result)
+        if job['manifest']:
+            job['manifest'].add_upload(result)
+        
+        if result.get('success'):
+            progress_bus.uploaded(job['job_id'])
+            self._append_link(job['links_file'], result)
+            # Локальный клип больше не нужен
+            try:
+                os.remove(clip['path'])
+                logger.info(f"Удален успешно загруженный файл: {clip['path']}")
+            except OSError as e:
+                logger.warning(f"Не удалось удалить файл {clip['path']}: {e}")
+        else:
+            stage_failures.inc(stage='upload')
+        await emit(result)
+    
+    async def _ensure_job_folder(self, job: dict) -> bool:
+        """
+        Одна папка на Drive под все клипы задачи: первый воркер загрузки создает, остальные ждут ее.
+        False - папку создать не удалось (следующий клип попробует снова).
+        """
+        async with job['folder_lock']:
+            if job['folder_created']:
+                return True
+            try:
+                # Число клипов известно заранее по строгому таймлайну
+                folder_id = await self.drive_uploader.create_folder(f"Video_Clips_{int(job['total_duration'] // job['duration'])}_clips")
+            except Exception as e:
+                logger.error(f"Ошибка создания папки на Google Drive: {e}")
+                return False
+            if not folder_id:
+                logger.error("Папка задачи на Google Drive не создана, клип не загружается")
+                return False
+            job['folder_id'] = folder_id
+            job['folder_created'] = True
+            if job['manifest']:
+                job['manifest'].set_folder(folder_id)
+            return True
+    
+    async def _extract_audio(self, job: dict, video_path: str):
+        """Звук исходника для всех чанков задачи; при ошибке субтитры декодируют чанки сами"""
+        name = job['manifest'].job_id if job['manifest'] else uuid.uuid4().hex[:12]
+        try:
+            with tracer.span('audio extract'):
+                return await self.subtitle_generator.extract_audio(video_path, str(job['workspace'].temp_dir / f"audio_{name}.f32"))
         except Exception as e:
-            logger.error(f"Ошибка обработки видео: {e}")
-            return {'success': False, 'error': str(e)}
+            logger.warning(f"⚠️ Не удалось извлечь звук одним проходом, чанки декодируются по отдельности: {e}")
+            return None
+    
+    async def _transcribe_whole(self, job: dict):
+        """Распознавание всего звука задачи (TRANSCRIBE_MODE=whole)"""
+        audio = await job['audio']
+        if audio is None:
+            # Без общего буфера чанки распознаются по отдельности
+            job['transcript'].finish(failed=True)
+            return
+        with tracer.span('transcribe whole', seconds=round(audio.duration, 1)):
+            await self.subtitle_generator.transcribe_whole(audio, job['transcript'])
     
-    async def split_into_chunks(self, video_path: str, chunk_duration: int = 300) -> list:
-        """МАКСИМАЛЬНО БЫСТРАЯ нарезка видео на чанки (как в вашем примере + параллельность)"""
+    async def _release_audio(self, job: dict):
+        """Удаление звукового буфера задачи (распознавание всего звука останавливается)"""
+        if job['transcription']:
+            job['transcript'].cancel()
+            await job['transcription']
+            job['transcription'] = None
+        if not job['audio']:
+            return
+        audio = await job['audio']
+        job['audio'] = None
+        if audio is not None:
+            audio.close()
+    
+    def _file_chunk_start(self, video_path: str, start_time: float) -> float:
+        """
+        Фактическое начало файлового чанка в исходнике: нарезка stream copy (CPU) начинается
+        с ключевого кадра не позже start_time, перекодирование (NVENC) - точно с start_time.
+        """
+        if self._check_gpu_support():
+            return float(start_time)
+        try:
+            return probe_cache.keyframe_index(video_path).seek_point(start_time)
+        except Exception as e:
+            logger.warning(f"Не удалось определить ключевой кадр начала чанка: {e}")
+            return float(start_time)
+    
+    def _check_workspace(self, job: dict):
+        """Квота рабочей директории: при превышении задача останавливается с ошибкой"""
+        try:
+            self.workspaces.check(job['workspace'])
+        except WorkspaceQuotaError as e:
+            if not job['error']:
+                job['error'] = str(e)
+                logger.error(f"❌ {e}")
+            raise
+    
+    def _remove_chunk(self, chunk: dict):
+        """Удаление временного чанка (если это не оригинальный файл)"""
+        if not chunk['is_source'] and chunk['path'] and os.path.exists(chunk['path']):
+            os.remove(chunk['path'])
+            logger.info(f"   🗑️  Удален временный чанк: {chunk['path']}")
+    
+    def _clip_number(self, clip_path: str) -> int:
+        """Номер клипа по имени файла clip_NNN.mp4 (индекс с нуля -> номер с единицы)"""
+        return int(Path(clip_path).stem.split('_')[-1]) + 1
+    
+    def plan_virtual_chunks(self, video_path: str, clip_duration: int, chunk_duration: int = 300) -> list:
+        """
+        Виртуальные чанки - диапазоны времени исходника по индексу ключевых кадров (один проход ffprobe).
+        Длина чанка кратна длительности клипа: клипы не теряются на границах чанков.
+        """
+        index = probe_cache.keyframe_index(video_path)
+        clips_per_chunk = max(1, int(chunk_duration // clip_duration))
+        step = clips_per_chunk * clip_duration
+        
+        ranges = []
+        offset = 0.0
+        while index.duration - offset >= clip_duration:
+            ranges.append({
+                'index': len(ranges),
+                'offset': offset,
+                'duration': float(min(step, index.duration - offset)),
+                # Ключевой кадр, с которого ffmpeg начнет декодирование при переходе на начало чанка
+                'seek': index.seek_point(offset)
+            })
+            offset += step
+        
+        lead = max((r['offset'] - r['seek'] for r in ranges), default=0.0)
+        logger.info(f"🧩 План: {len(ranges)} виртуальных чанков по {step} сек, ключевых кадров {len(index.keyframes)}, "
+                    f"декодирование до начала чанка не более {lead:.1f} сек")
+        return ranges
+    
+    async def split_into_chunks(self, video_path: str, chunk_duration: int = 300, on_chunk=None, skip: set = None,
+                                temp_dir: Path = None) -> list:
+        """
+        МАКСИМАЛЬНО БЫСТРАЯ нарезка видео на чанки (как в вашем примере + параллельность).
+        on_chunk(path, index) - async колбэк, вызывается для каждого готового чанка по порядку, не дожидаясь остальных.
+        skip - индексы чанков, которые не нужно резать (готовы до перезапуска).
+        temp_dir - директория чанков (рабочая директория задачи), по умолчанию temp/.
+        """
+        successful_chunks = []
+        skip = skip or set()
+        temp_dir = Path(temp_dir) if temp_dir else self.temp_dir
+        
+        async def chunk_ready(chunk_path: str, index: int = 0):
+            successful_chunks.append(chunk_path)
+            if on_chunk:
+                await on_chunk(chunk_path, index)
+        
         try:
             video_info = self.video_editor.get_video_info(video_path)
             total_duration = int(video_info['duration'])
@@ -177,7 +783,8 @@ class VideoProcessor:
             # Если видео короткое - не делим на части (как в вашем примере)
             if total_duration <= chunk_duration:
                 logger.info(f"Видео {total_duration} сек <= {chunk_duration} сек, не делим на чанки")
-                return [video_path]
+                await chunk_ready(video_path)
+                return successful_chunks
             
             # Вычисляем количество частей (как в вашем примере)
             import math
@@ -189,9 +796,11 @@ class VideoProcessor:
             chunk_paths = []
             
             for i in range(num_chunks):
+                if i in skip:
+                    continue
                 start_time = i * chunk_duration
                 actual_duration = min(chunk_duration, total_duration - start_time)
-                chunk_path = self.temp_dir / f"chunk_{i}.mp4"
+                chunk_path = temp_dir / f"chunk_{i}.mp4"
                 
                 chunk_tasks.append({
                     'input_path': video_path,
@@ -204,45 +813,45 @@ class VideoProcessor:
             
             logger.info(f"Начинаем СУПЕР БЫСТРУЮ параллельную нарезку {len(chunk_tasks)} чанков...")
             
-            # ПАРАЛЛЕЛЬНО создаем все чанки с прямыми командами ffmpeg
+            # ПАРАЛЛЕЛЬНО создаем все чанки с прямыми командами ffmpeg (число процессов ограничивает планировщик)
             tasks = [
-                self._create_chunk_ultra_fast(task) 
+                asyncio.ensure_future(self._create_chunk_ultra_fast(task))
                 for task in chunk_tasks
             ]
             
-            # Ждем завершения всех задач
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Проверяем результаты
-            successful_chunks = []
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    logger.error(f"Ошибка создания чанка {i}: {result}")
-                elif result:
-                    successful_chunks.append(chunk_paths[i])
-                    logger.info(f"✅ Чанк {i+1}/{num_chunks} готов: {chunk_tasks[i]['duration']} сек")
-                else:
-                    logger.warning(f"❌ Не удалось создать чанк {i}")
-            
-            logger.info(f"🚀 СУПЕР БЫСТРО создано {len(successful_chunks)}/{num_chunks} чанков")
-            
-            # КРИТИЧЕСКАЯ ДИАГНОСТИКА: проверяем каждый чанк
-            logger.info(f"🔍 ДИАГНОСТИКА СОЗДАННЫХ ЧАНКОВ:")
+            # Забираем результаты по порядку: готовый чанк сразу уходит дальше, остальные еще режутся
+            # КРИТИЧЕСКАЯ ДИАГНОСТИКА: проверяем каждый чанк до передачи (потребитель может его удалить)
             total_chunks_duration = 0
-            for i, chunk_path in enumerate(successful_chunks):
-                try:
-                    if os.path.exists(chunk_path):
-                        chunk_info = self.video_editor.get_video_info(chunk_path)
-                        chunk_duration = chunk_info['duration']
-                        total_chunks_duration += chunk_duration
-                        logger.info(f"   ✅ Чанк {i+1}: {chunk_duration:.1f} сек - {chunk_path}")
-                    else:
-                        logger.error(f"   ❌ Чанк {i+1}: ФАЙЛ НЕ СУЩЕСТВУЕТ - {chunk_path}")
-                except Exception as e:
-                    logger.error(f"   ❌ Чанк {i+1}: ОШИБКА ЧТЕНИЯ - {e}")
+            try:
+                for chunk_task, chunk_path, task in zip(chunk_tasks, chunk_paths, tasks):
+                    i = chunk_task['index']
+                    try:
+                        result = await task
+                    except Exception as e:
+                        logger.error(f"Ошибка создания чанка {i}: {e}")
+                        continue
+                    if not result:
+                        logger.warning(f"❌ Не удалось создать чанк {i}")
+                        continue
+                    
+                    try:
+                        chunk_duration = self.video_editor.get_video_info(chunk_path)['duration']
+                    except Exception as e:
+                        logger.error(f"   ❌ Чанк {i+1}: ОШИБКА ЧТЕНИЯ - {e}")
+                        continue
+                    total_chunks_duration += chunk_duration
+                    logger.info(f"✅ Чанк {i+1}/{num_chunks} готов: {chunk_duration:.1f} сек - {chunk_path}")
+                    await chunk_ready(chunk_path, i)
+            finally:
+                for task in tasks:
+                    task.cancel()
+            
+            logger.info(f"🚀 СУПЕР БЫСТРО создано {len(successful_chunks)}/{len(chunk_tasks)} чанков")
             
-            logger.info(f"📊 ИТОГО длительность чанков: {total_chunks_duration:.1f} сек из {total_duration:.1f} сек")
-            coverage = (total_chunks_duration / total_duration) * 100 if total_duration > 0 else 0
+            # Пропущенные (готовые) чанки в покрытие не входят
+            planned_duration = sum(task['duration'] for task in chunk_tasks)
+            logger.info(f"📊 ИТОГО длительность чанков: {total_chunks_duration:.1f} сек из {planned_duration:.1f} сек")
+            coverage = (total_chunks_duration / planned_duration) * 100 if planned_duration > 0 else 100
             logger.info(f"📈 Покрытие видео чанками: {coverage:.1f}%")
             
             if coverage < 95:
@@ -252,26 +861,32 @@ class VideoProcessor:
             
         except Exception as e:
             logger.error(f"Ошибка супер быстрой нарезки на чанки: {e}")
-            return [video_path]  # Возвращаем оригинальный файл
+            if successful_chunks:
+                # Часть чанков уже передана дальше - оригинал целиком не возвращаем, чтобы не дублировать клипы
+                return successful_chunks
+            await chunk_ready(video_path)  # Возвращаем оригинальный файл
+            return successful_chunks
     
     async def _create_chunk_ultra_fast(self, task: dict) -> bool:
         """СУПЕР БЫСТРОЕ создание чанка с таймаутом и fallback"""
         try:
             logger.info(f"🚀 Начинаем создание чанка {task['index']}: {task['start_time']}-{task['start_time'] + task['duration']} сек")
             
-            loop = asyncio.get_event_loop()
+            video_info = self.video_editor.get_video_info(task['input_path'])
+            gpu_available = self._check_gpu_support()
             
-            # Добавляем таймаут 60 секунд для каждого чанка
-            await asyncio.wait_for(
-                loop.run_in_executor(
-                    None,
-                    self._create_chunk_direct_command,
-                    task['input_path'],
-                    task['output_path'], 
-                    task['start_time'],
-                    task['duration']
-                ),
-                timeout=60.0  # 60 секунд таймаут
+            # Таймаут 60 секунд на сам ffmpeg (ожидание слота планировщика не считается)
+            await self.scheduler.run(
+                self._create_chunk_direct_command,
+                task['input_path'],
+                task['output_path'], 
+                task['start_time'],
+                task['duration'],
+                60.0,
+                width=video_info['width'],
+                height=video_info['height'],
+                gpu=gpu_available,
+                copy=not gpu_available  # На CPU нарезка без перекодирования
             )
             
             # Проверяем, что файл действительно создался
@@ -283,21 +898,20 @@ class VideoProcessor:
                 logger.error(f"❌ Чанк {task['index']} НЕ СОЗДАЛСЯ: файл отсутствует")
                 return False
             
-        except asyncio.TimeoutError:
+        except subprocess.TimeoutExpired:
             logger.warning(f"⏰ Таймаут создания чанка {task['index']}, пробуем CPU fallback")
             # Пробуем CPU fallback
             try:
-                loop = asyncio.get_event_loop()
-                await asyncio.wait_for(
-                    loop.run_in_executor(
-                        None,
-                        self._create_chunk_cpu_fallback,
-                        task['input_path'],
-                        task['output_path'], 
-                        task['start_time'],
-                        task['duration']
-                    ),
-                    timeout=120.0  # 2 минуты для CPU
+                video_info = self.video_editor.get_video_info(task['input_path'])
+                await self.scheduler.run(
+                    self._create_chunk_cpu_fallback,
+                    task['input_path'],
+                    task['output_path'], 
+                    task['start_time'],
+                    task['duration'],
+                    120.0,  # 2 минуты для CPU
+                    width=video_info['width'],
+                    height=video_info['height']
                 )
                 logger.info(f"✅ Чанк {task['index']} создан через CPU fallback")
                 return True
@@ -310,10 +924,9 @@ class VideoProcessor:
             logger.error(f"   Параметры чанка: start={task['start_time']}, duration={task['duration']}, output={task['output_path']}")
             return False
     
-    def _create_chunk_direct_command(self, input_path: str, output_path: str, start_time: int, duration: int):
+    def _create_chunk_direct_command(self, input_path: str, output_path: str, start_time: int, duration: int,
+                                     timeout: float = None, slot: RenderSlot = None):
         """Прямая команда ffmpeg с GPU ускорением для максимальной скорости"""
-        import subprocess
-        
         # Проверяем доступность GPU
         gpu_available = self._check_gpu_support()
         
@@ -361,65 +974,26 @@ class VideoProcessor:
             ]
             logger.info(f"💻 Используем CPU для нарезки чанка")
         
-        # Запускаем команду с правильной кодировкой для Windows
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True,
-            encoding='utf-8',  # Принудительно используем UTF-8
-            errors='ignore',   # Игнорируем ошибки кодировки
-            check=False        # Не бросаем исключение при ошибке
-        )
-        
-        if result.returncode != 0:
-            logger.error(f"Ошибка ffmpeg: {result.stderr}")
+        # Запускаем команду через планировщик (прогресс, таймаут)
+        try:
+            self.scheduler.execute(cmd, slot, timeout=timeout)
+        except FFmpegError as e:
+            logger.error(f"Ошибка ffmpeg: {e.stderr}")
             # Если GPU команда не сработала, пробуем CPU
             if gpu_available:
                 logger.warning("GPU команда не сработала, пробуем CPU...")
-                return self._create_chunk_cpu_fallback(input_path, output_path, start_time, duration)
-            else:
-                raise Exception(f"ffmpeg завершился с кодом {result.returncode}")
+                return self._create_chunk_cpu_fallback(input_path, output_path, start_time, duration, timeout, slot)
+            raise
     
     def _check_gpu_support(self) -> bool:
-        """Проверка поддержки GPU для ffmpeg"""
-        try:
-            import subprocess
-            
-            # Проверяем наличие NVIDIA GPU
-            result = subprocess.run(
-                ['nvidia-smi'], 
-                capture_output=True, 
-                text=True, 
-                encoding='utf-8',
-                errors='ignore',
-                check=False
-            )
-            if result.returncode != 0:
-                return False
-            
-            # Проверяем поддержку NVENC в ffmpeg
-            result = subprocess.run(
-                ['ffmpeg', '-encoders'], 
-                capture_output=True, 
-                text=True,
-                encoding='utf-8',
-                errors='ignore',
-                check=False
-            )
-            if 'h264_nvenc' in result.stdout:
-                logger.info("✅ GPU поддержка (NVENC) доступна")
-                return True
-            else:
-                logger.info("❌ GPU поддержка (NVENC) недоступна")
-                return False
-                
-        except Exception as e:
-            logger.warning(f"Ошибка проверки GPU: {e}")
-            return False
+        """Проверка поддержки GPU (NVENC) для ffmpeg по возможностям узла"""
+        return get_capabilities().nvenc
     
-    def _create_chunk_cpu_fallback(self, input_path: str, output_path: str, start_time: int, duration: int):
+    def _create_chunk_cpu_fallback(self, input_path: str, output_path: str, start_time: int, duration: int,
+                                   timeout: float = None, slot: RenderSlot = None):
         """Резервная CPU команда если GPU не работает - МАКСИМАЛЬНОЕ КАЧЕСТВО"""
-        import subprocess
+        # Потоки x264 из слота планировщика (stream copy слот кодированию не подходит - тогда авто)
+        threads = slot.threads if slot and not slot.copy else 0
         
         # CPU команда с высоким качеством
         cmd = [
@@ -438,45 +1012,39 @@ class VideoProcessor:
             '-bufsize', '12M',            # Размер буфера
             '-bf', '3',                   # B-кадры для лучшего сжатия
             '-refs', '3',                 # Референсные кадры
+            '-threads', str(threads),     # Потоки кодировщика от планировщика
             '-avoid_negative_ts', 'make_zero',
             '-y',
             output_path
         ]
         
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            encoding='utf-8',
-            errors='ignore',
-            check=False
-        )
-        
-        if result.returncode != 0:
-            logger.error(f"Ошибка CPU fallback: {result.stderr}")
-            raise Exception(f"CPU fallback завершился с кодом {result.returncode}")
+        try:
+            self.scheduler.execute(cmd, slot, timeout=timeout)
+        except FFmpegError as e:
+            logger.error(f"Ошибка CPU fallback: {e.stderr}")
+            raise Exception(f"CPU fallback завершился с кодом {e.returncode}")
     
     async def _create_chunk_fast(self, task: dict) -> bool:
         """Быстрое создание одного чанка (старый метод через python-ffmpeg)"""
         try:
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
+            await self.scheduler.run(
                 self._create_chunk_sync_fast,
                 task['input_path'],
                 task['output_path'], 
                 task['start_time'],
-                task['duration']
+                task['duration'],
+                copy=True
             )
             return True
         except Exception as e:
             logger.error(f"Ошибка создания чанка {task['index']}: {e}")
             return False
     
-    def _create_chunk_sync_fast(self, input_path: str, output_path: str, start_time: float, duration: float):
+    def _create_chunk_sync_fast(self, input_path: str, output_path: str, start_time: float, duration: float,
+                                slot: RenderSlot = None):
         """Синхронное быстрое создание чанка с максимальной оптимизацией"""
         # МАКСИМАЛЬНО БЫСТРАЯ нарезка с stream copy
-        (
+        self.scheduler.execute(
             ffmpeg
             .input(input_path, 
                    ss=start_time,           # Точное время начала
@@ -488,34 +1056,53 @@ class VideoProcessor:
                    avoid_negative_ts='make_zero',  # Избегаем проблем с таймингом
                    map_metadata=0,          # Копируем метаданные
                    movflags='faststart')    # Оптимизация для быстрого старта
-            .overwrite_output()
-            .run(quiet=True, capture_stdout=True, capture_stderr=True)
+            .overwrite_output(),
+            slot
         )
     
-    async def create_links_file(self, upload_results: list) -> str:
-        """Создание файла со ссылками на скачивание"""
+    def _start_links_file(self, job_id: str = None) -> str:
+        """Новый файл со ссылками (заголовок), ссылки дописываются по мере загрузки"""
+        # У каждой задачи свой файл: одновременные задачи не перезаписывают ссылки друг друга
+        links_file = self.output_dir / (f"video_links_{job_id}.txt" if job_id else "video_links.txt")
+        with open(links_file, 'w', encoding='utf-8') as f:
+            f.write("🎬 ССЫЛКИ НА СКАЧИВАНИЕ ШОТСОВ\n")
+            f.write("=" * 50 + "\n\n")
+        return str(links_file)
+    
+    def _append_link(self, links_file: str, result: dict):
+        """Дописывание ссылки на загруженный клип"""
         try:
-            links_file = self.output_dir / "video_links.txt"
-            
-            with open(links_file, 'w', encoding='utf-8') as f:
-                f.write("🎬 ССЫЛКИ НА СКАЧИВАНИЕ ШОТСОВ\n")
-                f.write("=" * 50 + "\n\n")
-                
-                for i, result in enumerate(upload_results, 1):
-                    if result['success']:
-                        f.write(f"Фрагмент {i:03d}: {result['download_url']}\n")
-                
+            with open(links_file, 'a', encoding='utf-8') as f:
+                f.write(f"Фрагмент {result['clip_number']:03d}: {result['download_url']}\n")
+        except Exception as e:
+            logger.error(f"Ошибка записи ссылки в файл: {e}")
+    
+    def _finish_links_file(self, links_file: str, upload_results: list) -> str:
+        """Итоговая статистика в конце файла со ссылками"""
+        try:
+            with open(links_file, 'a', encoding='utf-8') as f:
                 f.write(f"\n📊 Всего создано: {len(upload_results)} шотсов\n")
                 f.write(f"✅ Успешно загружено: {sum(1 for r in upload_results if r['success'])}\n")
-            
-            return str(links_file)
+            return links_file
+        except Exception as e:
+            logger.error(f"Ошибка создания файла ссылок: {e}")
+            return None
+    
+    async def create_links_file(self, upload_results: list) -> str:
+        """Создание файла со ссылками на скачивание"""
+        try:
+            links_file = self._start_links_file()
+            for result in upload_results:
+                if result['success']:
+                    self._append_link(links_file, result)
+            return self._finish_links_file(links_file, upload_results)
             
         except Exception as e:
             logger.error(f"Ошибка создания файла ссылок: {e}")
             return None
     
-    def cleanup_successful_files(self, clip_paths: list, upload_results: list):
-        """Очистка только успешно загруженных файлов"""
+    def cleanup_successful_files(self, clip_paths: list, upload_results: list, workspace=None):
+        """Очистка только успешно загруженных файлов (временные - только своей задачи, если передан workspace)"""
         try:
             import time
             import gc
@@ -551,7 +1138,9 @@ class VideoProcessor:
                     logger.warning(f"Ошибка удаления файла {clip_path}: {e}")
             
             # Очищаем временную директорию от вспомогательных файлов
-            for file in self.temp_dir.glob("*"):
+            # (общий temp/ может использоваться другими задачами - при наличии берем директорию задачи)
+            temp_dir = workspace.temp_dir if workspace else self.temp_dir
+            for file in temp_dir.glob("*"):
                 try:
                     if file.is_file() and not file.name.startswith('clip_'):
                         file.unlink()
@@ -561,8 +1150,8 @@ class VideoProcessor:
         except Exception as e:
             logger.error(f"Ошибка очистки успешно загруженных файлов: {e}")
 
-    def cleanup_temp_files(self, clip_paths: list):
-        """Очистка всех временных файлов (используется при ошибках)"""
+    def cleanup_temp_files(self, clip_paths: list, workspace=None):
+        """Очистка всех временных файлов (используется при ошибках; с workspace - только файлов своей задачи)"""
         try:
             import time
             import gc
@@ -591,7 +1180,8 @@ class VideoProcessor:
                     logger.warning(f"Ошибка удаления файла {clip_path}: {e}")
             
             # Очищаем временную директорию
-            for file in self.temp_dir.glob("*"):
+            temp_dir = workspace.temp_dir if workspace else self.temp_dir
+            for file in temp_dir.glob("*"):
                 try:
                     if file.is_file():
                         file.unlink()
@@ -0,0 +1,148 @@
+import os
+import shutil
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+class WorkspaceQuotaError(Exception):
+    """Задача заняла на диске больше своей квоты"""
+    pass
+
+def directory_size(path: Path) -> int:
+    """Суммарный размер файлов директории (рекурсивно); пропавшие во время обхода файлы пропускаются"""
+    total = 0
+    stack = [str(path)]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+            except FileNotFoundError:
+                continue
+    return total
+
+class JobWorkspace:
+    """
+    Рабочая директория задачи: work/<job_id>/temp (чанки, звук, субтитры, скачивание)
+    и work/<job_id>/output (клипы). Одновременные задачи не пересекаются по путям и не удаляют
+    файлы друг друга; после перезапуска задача продолжается в той же директории.
+    """
+    def __init__(self, root: Path, job_id: str, quota_bytes: int = 0):
+        self.job_id = job_id
+        self.path = Path(root) / job_id
+        self.temp_dir = self.path / 'temp'
+        self.output_dir = self.path / 'output'
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.quota_bytes = quota_bytes
+        self.peak_bytes = 0
+
+    def usage(self) -> int:
+        """Занято на диске сейчас (пик запоминается для статистики)"""
+        size = directory_size(self.path)
+        self.peak_bytes = max(self.peak_bytes, size)
+        return size
+
+    def check_quota(self):
+        """WorkspaceQuotaError, если задача заняла больше квоты (0 - без ограничения)"""
+        size = self.usage()
+        if self.quota_bytes and size > self.quota_bytes:
+            raise WorkspaceQuotaError(
+                f"Задача {self.job_id} заняла {size / 1024 ** 3:.2f} ГБ при квоте {self.quota_bytes / 1024 ** 3:.2f} ГБ"
+            )
+
+    def cleanup(self, keep_output: bool = False):
+        """
+        Удаление временных файлов задачи; output удаляется, если пуст или keep_output=False
+        (незагруженные клипы успешной задачи остаются до очистки при следующем запуске).
+        """
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        if keep_output and self.output_dir.exists() and any(self.output_dir.iterdir()):
+            logger.info(f"🗂️ Рабочая директория {self.path}: незагруженные клипы оставлены")
+            return
+        shutil.rmtree(self.path, ignore_errors=True)
+
+class WorkspaceManager:
+    """
+    Рабочие директории задач узла: создание, учет занятого места и очистка.
+
+    - у каждой задачи своя директория (work/<job_id>) с квотой quota_bytes
+    - по завершении или ошибке задачи директория удаляется
+    - при запуске удаляются директории задач, которые нельзя продолжить (sweep)
+    """
+    def __init__(self, root: str = 'work', quota_bytes: int = 0):
+        self.root = Path(root)
+        self.root.mkdir(exist_ok=True)
+        self.quota_bytes = quota_bytes
+        self.created = 0
+        self.released = 0
+        self.quota_errors = 0
+        self.peak_bytes = 0
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id: str) -> JobWorkspace:
+        """Директория задачи (существующая после перезапуска используется повторно)"""
+        workspace = JobWorkspace(self.root, job_id, self.quota_bytes)
+        with self._lock:
+            self._active[job_id] = workspace
+            self.created += 1
+        return workspace
+
+    def check(self, workspace: JobWorkspace):
+        """Проверка квоты задачи с учетом счетчиков узла"""
+        try:
+            workspace.check_quota()
+        except WorkspaceQuotaError:
+            with self._lock:
+                self.quota_errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.peak_bytes = max(self.peak_bytes, sum(w.peak_bytes for w in self._active.values()))
+
+    def release(self, workspace: JobWorkspace, keep_output: bool = False):
+        """Очистка директории завершенной (или упавшей) задачи"""
+        workspace.usage()
+        workspace.cleanup(keep_output)
+        with self._lock:
+            self._active.pop(workspace.job_id, None)
+            self.released += 1
+        logger.info(f"🧹 Рабочая директория задачи {workspace.job_id} очищена "
+                    f"(пик {workspace.peak_bytes / 1024 / 1024:.1f} МБ)")
+
+    def sweep(self, keep: set):
+        """Удаление директорий задач не из keep (завершенные и неизвестные задачи прошлых запусков)"""
+        removed = 0
+        for path in self.root.iterdir():
+            if not path.is_dir() or path.name in keep or path.name in self._active:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+        if removed:
+            logger.info(f"🧹 Удалено рабочих директорий прошлых задач: {removed}")
+        return removed
+
+    def usage(self) -> int:
+        """Занято всеми рабочими директориями узла"""
+        return directory_size(self.root)
+
+    def stats(self) -> dict:
+        with self._lock:
+            active = len(self._active)
+        return {
+            'active': active,
+            'bytes': self.usage(),
+            'peak_bytes': self.peak_bytes,
+            'created': self.created,
+            'released': self.released,
+            'quota_errors': self.quota_errors
+        }
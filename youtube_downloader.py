@@ -2,8 +2,11 @@ import os
 import asyncio
 import logging
 import yt_dlp
-import subprocess
+import contextvars
 from pathlib import Path
+from ffmpeg_runner import run_ffmpeg, FFmpegError
+from progress_bus import progress_bus
+from tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -19,8 +22,74 @@ class YouTubeDownloader:
     def __init__(self):
         self.temp_dir = Path("temp")
         self.temp_dir.mkdir(exist_ok=True)
+        self._extractors = None
+        self._source_keys = {}
     
-    async def download(self, url: str, use_cookies: bool = False) -> dict:
+    def source_key(self, url: str, depth: int = 0) -> str:
+        """
+        Ключ источника для кэша: "экстрактор:id" yt-dlp (разные формы одной ссылки дают один ключ).
+        Сначала id берется из ссылки без сети; для плейлистов и неизвестных сайтов - через extract_info
+        без обработки форматов. None - ключ определить не удалось (кэш не используется).
+        """
+        entry = self._source_keys.get(url)
+        if entry is not None:
+            # Ключ уже определен (реестр задач и стадия скачивания спрашивают одну ссылку)
+            return entry['key']
+        key = self._offline_key(url)
+        if key:
+            self._source_keys[url] = {'key': key}
+            return key
+        return self.source_info(url, depth)['key']
+    
+    def source_info(self, url: str, depth: int = 0) -> dict:
+        """
+        Ключ источника и длительность видео (сек) одним extract_info без обработки форматов:
+        {'key', 'duration'}, None - не удалось определить. Результат запоминается вместе с ключом ссылки.
+        """
+        entry = self._source_keys.get(url)
+        if entry is not None and 'duration' in entry:
+            return entry
+        key = entry['key'] if entry else self._offline_key(url)
+        
+        try:
+            with yt_dlp.YoutubeDL({'noplaylist': True, 'quiet': True, 'no_warnings': True}) as ydl:
+                info = ydl.extract_info(url, download=False, process=False)
+        except Exception as e:
+            logger.warning(f"Не удалось получить сведения о видео: {e}")
+            return {'key': key, 'duration': None}
+        
+        duration = info.get('duration')
+        redirect = info.get('_type') in ('url', 'url_transparent') and info.get('url') and info['url'] != url
+        if redirect and depth < 2 and (not key or duration is None):
+            # Ссылка ведет на другую страницу (сокращенная ссылка, встроенный плеер) - сведения берем с нее
+            target = self.source_info(info['url'], depth + 1)
+            key = key or target['key']
+            duration = duration if duration is not None else target['duration']
+        elif not key and info.get('id') and info.get('extractor_key'):
+            key = f"{info['extractor_key']}:{info['id']}"
+        
+        entry = {'key': key, 'duration': duration}
+        if key:
+            self._source_keys[url] = entry
+        return entry
+    
+    def _offline_key(self, url: str) -> str:
+        """Ключ по ссылке без сети (экстрактор yt-dlp и id из ссылки) или None"""
+        if self._extractors is None:
+            from yt_dlp.extractor import gen_extractor_classes
+            self._extractors = list(gen_extractor_classes())
+        
+        extractor = next((ie for ie in self._extractors if ie.suitable(url)), None)
+        if extractor is not None:
+            ie_key = extractor.ie_key()
+            # Ссылка на видео внутри плейлиста (watch?v=...&list=...) скачивается как видео (noplaylist)
+            if ie_key != 'Generic' and 'Tab' not in ie_key and 'Playlist' not in ie_key:
+                video_id = extractor.get_temp_id(url)
+                if video_id:
+                    return f"{ie_key}:{video_id}"
+        return None
+    
+    async def download(self, url: str, use_cookies: bool = False, temp_dir: str = None) -> dict:
         """
         Скачивание видео с поддерживаемых платформ - раздельно видео и аудио с объединением
         
@@ -34,15 +103,20 @@ class YouTubeDownloader:
         Args:
             url: URL видео с любой поддерживаемой платформы
             use_cookies: Использовать cookies для авторизации
+            temp_dir: Директория для файлов скачивания (рабочая директория задачи), по умолчанию temp/
         """
         try:
             # Запускаем скачивание в отдельном потоке
             loop = asyncio.get_event_loop()
+            # Контекст задачи (шина прогресса, трасса) переходит в поток скачивания
+            context = contextvars.copy_context()
             result = await loop.run_in_executor(
                 None, 
+                context.run,
                 self._download_separate_and_merge, 
                 url, 
-                use_cookies
+                use_cookies,
+                Path(temp_dir) if temp_dir else self.temp_dir
             )
             
             return result
@@ -51,7 +125,7 @@ class YouTubeDownloader:
             logger.error(f"Ошибка скачивания YouTube: {e}")
             return {'success': False, 'error': str(e)}
     
-    def _download_separate_and_merge(self, url: str, use_cookies: bool = False) -> dict:
+    def _download_separate_and_merge(self, url: str, use_cookies: bool, temp_dir: Path) -> dict:
         """Скачивание видео и аудио отдельно с последующим объединением"""
         try:
             # Базовые настройки для yt-dlp с обходом блокировок
@@ -96,7 +170,8 @@ class YouTubeDownloader:
             
             # Получаем информацию о видео
             with yt_dlp.YoutubeDL(base_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
+                with tracer.span('yt-dlp extract'):
+                    info = ydl.extract_info(url, download=False)
                 title = info.get('title', 'video')
                 duration = info.get('duration', 0)
                 
@@ -132,11 +207,11 @@ class YouTubeDownloader:
                 if not video_formats or not audio_formats:
                     logger.warning("Не найдены отдельные видео или аудио потоки, пробуем альтернативные методы")
                     # Сначала пробуем альтернативные методы
-                    alt_result = self._try_alternative_methods(url, safe_title, title, duration)
+                    alt_result = self._try_alternative_methods(url, safe_title, title, duration, temp_dir)
                     if alt_result['success']:
                         return alt_result
                     # Если альтернативные методы не сработали, пробуем комбинированный формат
-                    return self._download_combined_format(url, base_opts, safe_title, title, duration)
+                    return self._download_combined_format(url, base_opts, safe_title, title, duration, temp_dir)
                 
                 # Выбираем лучшее качество видео (приоритет 4K/1440p/1080p)
                 def video_quality_key(x):
@@ -224,9 +299,9 @@ class YouTubeDownloader:
                 logger.info(f"   🌍 Язык: {best_audio.get('language', 'неизвестно')}")
                 
                 # Пути для временных файлов - используем более простые имена
-                video_temp = self.temp_dir / f"video_{best_video.get('format_id')}.{best_video.get('ext', 'mp4')}"
-                audio_temp = self.temp_dir / f"audio_{best_audio.get('format_id')}.{best_audio.get('ext', 'm4a')}"
-                final_output = self.temp_dir / f"{safe_title}.mp4"
+                video_temp = temp_dir / f"video_{best_video.get('format_id')}.{best_video.get('ext', 'mp4')}"
+                audio_temp = temp_dir / f"audio_{best_audio.get('format_id')}.{best_audio.get('ext', 'm4a')}"
+                final_output = temp_dir / f"{safe_title}.mp4"
                 
                 # СНАЧАЛА скачиваем аудио (для лучшего качества)
                 audio_opts = base_opts.copy()
@@ -239,7 +314,7 @@ class YouTubeDownloader:
                 
                 logger.info(f"Скачивание аудио в: {audio_temp}")
                 try:
-                    with yt_dlp.YoutubeDL(audio_opts) as ydl:
+                    with yt_dlp.YoutubeDL(audio_opts) as ydl, tracer.span('yt-dlp audio', format=audio_opts['format']):
                         ydl.download([url])
                 except Exception as e:
                     logger.error(f"Ошибка скачивания аудио: {e}")
@@ -248,7 +323,7 @@ class YouTubeDownloader:
                         logger.info("Пробуем альтернативный аудио формат...")
                         # Берем второй лучший аудио формат
                         alt_audio = sorted(audio_formats, key=audio_quality_key, reverse=True)[1]
-                        audio_temp_alt = self.temp_dir / f"audio_{alt_audio.get('format_id')}.{alt_audio.get('ext', 'm4a')}"
+                        audio_temp_alt = temp_dir / f"audio_{alt_audio.get('format_id')}.{alt_audio.get('ext', 'm4a')}"
                         
                         audio_opts_alt = base_opts.copy()
                         audio_opts_alt.update({
@@ -278,7 +353,7 @@ class YouTubeDownloader:
                 
                 logger.info(f"Скачивание видео в: {video_temp}")
                 try:
-                    with yt_dlp.YoutubeDL(video_opts) as ydl:
+                    with yt_dlp.YoutubeDL(video_opts) as ydl, tracer.span('yt-dlp video', format=video_opts['format']):
                         ydl.download([url])
                 except Exception as e:
                     logger.error(f"Ошибка скачивания видео: {e}")
@@ -286,7 +361,7 @@ class YouTubeDownloader:
                     if not video_temp.exists():
                         # Ищем по паттерну
                         video_pattern = f"video_{best_video.get('format_id')}.*"
-                        video_files = list(self.temp_dir.glob(video_pattern))
+                        video_files = list(temp_dir.glob(video_pattern))
                         if not video_files:
                             return {'success': False, 'error': f'Ошибка скачивания видео: {e}'}
                         else:
@@ -297,13 +372,13 @@ class YouTubeDownloader:
                 
                 # Проверяем что файлы скачались и ищем их если имена изменились
                 logger.info(f"Проверка файлов...")
-                logger.info(f"Содержимое temp папки: {list(self.temp_dir.glob('*'))}")
+                logger.info(f"Содержимое temp папки: {list(temp_dir.glob('*'))}")
                 
                 # Ищем видео файл
                 if not video_temp.exists():
                     # Ищем по паттерну
                     video_pattern = f"video_{best_video.get('format_id')}.*"
-                    video_files = list(self.temp_dir.glob(video_pattern))
+                    video_files = list(temp_dir.glob(video_pattern))
                     if video_files:
                         video_temp = video_files[0]
                         logger.info(f"Найден видео файл: {video_temp}")
@@ -315,7 +390,7 @@ class YouTubeDownloader:
                 if not audio_temp.exists():
                     # Ищем по паттерну
                     audio_pattern = f"audio_{best_audio.get('format_id')}.*"
-                    audio_files = list(self.temp_dir.glob(audio_pattern))
+                    audio_files = list(temp_dir.glob(audio_pattern))
                     if audio_files:
                         audio_temp = audio_files[0]
                         logger.info(f"Найден аудио файл: {audio_temp}")
@@ -335,11 +410,17 @@ class YouTubeDownloader:
                     str(final_output)
                 ]
                 
-                result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-                
-                if result.returncode != 0:
-                    logger.error(f"Ошибка FFmpeg: {result.stderr}")
-                    return {'success': False, 'error': f'Ошибка объединения: {result.stderr}'}
+                # Прогресс слияния идет на шину прогресса задачи (процент от длительности видео)
+                reporter = progress_bus.ffmpeg_reporter(duration=duration)
+                try:
+                    with tracer.span('merge'):
+                        run_ffmpeg(ffmpeg_cmd, on_progress=reporter)
+                except FFmpegError as e:
+                    logger.error(f"Ошибка FFmpeg: {e.stderr}")
+                    return {'success': False, 'error': f'Ошибка объединения: {e.stderr}'}
+                finally:
+                    if reporter:
+                        reporter.close()
                 
                 # Удаляем временные файлы
                 try:
@@ -373,7 +454,7 @@ class YouTubeDownloader:
                     safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()[:50]
                 
                 logger.info("Основной метод не сработал, пробуем альтернативные...")
-                alt_result = self._try_alternative_methods(url, safe_title, title, duration)
+                alt_result = self._try_alternative_methods(url, safe_title, title, duration, temp_dir)
                 if alt_result['success']:
                     return alt_result
                     
@@ -382,7 +463,7 @@ class YouTubeDownloader:
             
             return {'success': False, 'error': str(e)}
     
-    def _try_alternative_methods(self, url: str, safe_title: str, title: str, duration: int) -> dict:
+    def _try_alternative_methods(self, url: str, safe_title: str, title: str, duration: int, temp_dir: Path) -> dict:
         """Альтернативные методы скачивания для проблемных видео"""
         logger.info("Пробуем альтернативные методы скачивания...")
         
@@ -397,7 +478,7 @@ class YouTubeDownloader:
                 }
             },
             'format': 'best[ext=mp4]/best',
-            'outtmpl': str(self.temp_dir / f"{safe_title}_android.%(ext)s"),
+            'outtmpl': str(temp_dir / f"{safe_title}_android.%(ext)s"),
             'http_headers': {
                 'User-Agent': 'com.google.android.youtube/17.36.4 (Linux; U; Android 12; GB) gzip',
             },
@@ -408,7 +489,7 @@ class YouTubeDownloader:
             with yt_dlp.YoutubeDL(android_opts) as ydl:
                 ydl.download([url])
             
-            video_files = list(self.temp_dir.glob(f"{safe_title}_android.*"))
+            video_files = list(temp_dir.glob(f"{safe_title}_android.*"))
             if video_files:
                 return {
                     'success': True,
@@ -430,7 +511,7 @@ class YouTubeDownloader:
                 }
             },
             'format': 'best[ext=mp4]/best',
-            'outtmpl': str(self.temp_dir / f"{safe_title}_ios.%(ext)s"),
+            'outtmpl': str(temp_dir / f"{safe_title}_ios.%(ext)s"),
             'http_headers': {
                 'User-Agent': 'com.google.ios.youtube/17.36.4 (iPhone14,3; U; CPU iOS 15_6 like Mac OS X)',
             },
@@ -441,7 +522,7 @@ class YouTubeDownloader:
             with yt_dlp.YoutubeDL(ios_opts) as ydl:
                 ydl.download([url])
             
-            video_files = list(self.temp_dir.glob(f"{safe_title}_ios.*"))
+            video_files = list(temp_dir.glob(f"{safe_title}_ios.*"))
             if video_files:
                 return {
                     'success': True,
@@ -463,7 +544,7 @@ class YouTubeDownloader:
                 }
             },
             'format': 'worst[ext=mp4]/worst',  # Берем худшее качество, но рабочее
-            'outtmpl': str(self.temp_dir / f"{safe_title}_embed.%(ext)s"),
+            'outtmpl': str(temp_dir / f"{safe_title}_embed.%(ext)s"),
         }
         
         # Пробуем embed URL
@@ -474,7 +555,7 @@ class YouTubeDownloader:
             with yt_dlp.YoutubeDL(embed_opts) as ydl:
                 ydl.download([embed_url])
             
-            video_files = list(self.temp_dir.glob(f"{safe_title}_embed.*"))
+            video_files = list(temp_dir.glob(f"{safe_title}_embed.*"))
             if video_files:
                 return {
                     'success': True,
@@ -487,7 +568,8 @@ class YouTubeDownloader:
         
         return {'success': False, 'error': 'Все альтернативные методы не сработали'}
 
-    def _download_combined_format(self, url: str, base_opts: dict, safe_title: str, title: str, duration: int) -> dict:
+    def _download_combined_format(self, url: str, base_opts: dict, safe_title: str, title: str, duration: int,
+                                  temp_dir: Path) -> dict:
         """Fallback метод для скачивания комбинированного формата"""
         try:
             logger.info("Используем комбинированный формат...")
@@ -509,7 +591,7 @@ class YouTubeDownloader:
                     # Любые доступные с приоритетом MP4
                     'best[ext=mp4]/best'
                 ),
-                'outtmpl': str(self.temp_dir / f"{safe_title}.%(ext)s"),
+                'outtmpl': str(temp_dir / f"{safe_title}.%(ext)s"),
                 'merge_output_format': 'mp4',
                 # Дополнительные настройки качества
                 'writesubtitles': False,  # Не скачиваем субтитры для скорости
@@ -525,7 +607,7 @@ class YouTubeDownloader:
                 ydl.download([url])
             
             # Ищем скачанный файл
-            video_files = list(self.temp_dir.glob(f"{safe_title}.*"))
+            video_files = list(temp_dir.glob(f"{safe_title}.*"))
             video_files = [f for f in video_files if f.suffix in ['.mp4', '.mkv', '.webm']]
             
             if not video_files:
@@ -547,11 +629,11 @@ class YouTubeDownloader:
             logger.error(f"Ошибка скачивания комбинированного формата: {e}")
             return {'success': False, 'error': str(e)}
     
-    def download_with_cookies(self, url: str, cookies_file: str = 'cookies.txt') -> dict:
+    def download_with_cookies(self, url: str, cookies_file: str = 'cookies.txt', temp_dir: str = None) -> dict:
         """Скачивание с использованием cookies для различных платформ"""
         if not os.path.exists(cookies_file):
             logger.warning(f"Файл cookies не найден: {cookies_file}")
-            return self.download(url, use_cookies=False)
+            return self.download(url, use_cookies=False, temp_dir=temp_dir)
         
         # Проверяем что cookies файл не пустой
         try:
@@ -559,7 +641,7 @@ class YouTubeDownloader:
                 content = f.read().strip()
                 if not content or content == '# No cookies':
                     logger.info("Cookies файл пустой, скачиваем без cookies")
-                    return self.download(url, use_cookies=False)
+                    return self.download(url, use_cookies=False, temp_dir=temp_dir)
                 
                 # Определяем платформу по URL и проверяем соответствующие cookies
                 url_lower = url.lower()
@@ -583,11 +665,11 @@ class YouTubeDownloader:
                         platform_detected = True
                 
                 if platform_detected:
-                    return self.download(url, use_cookies=True)
+                    return self.download(url, use_cookies=True, temp_dir=temp_dir)
                 else:
                     logger.info("Соответствующие cookies не найдены, скачиваем без cookies")
-                    return self.download(url, use_cookies=False)
+                    return self.download(url, use_cookies=False, temp_dir=temp_dir)
                     
         except Exception as e:
             logger.error(f"Ошибка чтения cookies файла: {e}")
-            return self.download(url, use_cookies=False)
\ No newline at end of file
+            return self.download(url, use_cookies=False, temp_dir=temp_dir)
\ No newline at end of file